@@ -12,12 +12,27 @@ class Config:
     # ============== SECURITY ==============
     MAX_LOGIN_ATTEMPTS = int(os.getenv('MAX_LOGIN_ATTEMPTS', '5'))
     LOGIN_LOCKOUT_DURATION = int(os.getenv('LOGIN_LOCKOUT_DURATION', '900'))  # 15 minutes
+    TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '1'))  # reverse proxies appending X-Forwarded-For (nginx)
     SESSION_TIMEOUT = int(os.getenv('SESSION_TIMEOUT', '2592000'))  # 30 days in seconds
+    LOGIN_AUDIT_FLUSH_INTERVAL = float(os.getenv('LOGIN_AUDIT_FLUSH_INTERVAL', '2.0'))  # seconds
+    LOGIN_AUDIT_MAX_PENDING = int(os.getenv('LOGIN_AUDIT_MAX_PENDING', '500'))  # attempts before early flush
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '4'))  # concurrent bcrypt ops per worker (eventlet.tpool)
+    PASSWORD_REHASH_ON_LOGIN = os.getenv('PASSWORD_REHASH_ON_LOGIN', 'false').lower() == 'true'  # upgrade cost/legacy hashes
     
     # ============== DATABASE ==============
     DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN', '5'))
     DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX', '50'))
     DB_QUERY_TIMEOUT = int(os.getenv('DB_QUERY_TIMEOUT', '30'))  # seconds
+    DB_POOL_VALIDATE_AFTER_IDLE = float(os.getenv('DB_POOL_VALIDATE_AFTER_IDLE', '30'))  # seconds idle before SELECT 1
+    DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', '1800'))  # 30 minutes, then recycle
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+    # Server-side PREPARE: disattivato di default (incompatibile con PgBouncer in transaction mode)
+    DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'false').lower() == 'true'
+    DB_PREPARE_THRESHOLD = int(os.getenv('DB_PREPARE_THRESHOLD', '3'))  # uses before PREPARE
+    # psycopg2 cooperativo con eventlet (wait callback): le query non bloccano il worker
+    DB_GREEN_QUERIES = os.getenv('DB_GREEN_QUERIES', 'true').lower() == 'true'
+    DB_FANOUT_CONCURRENCY = int(os.getenv('DB_FANOUT_CONCURRENCY', '4'))  # connections per query_many
     
     # ============== DOMAIN & URLS ==============
     DOMAIN_URL = os.getenv('DOMAIN', 'http://localhost:5000')
@@ -33,6 +48,26 @@ class Config:
     CACHE_TTL_SCHOOL = int(os.getenv('CACHE_TTL_SCHOOL', '600'))  # 10 minutes
     CACHE_TTL_FEATURES = int(os.getenv('CACHE_TTL_FEATURES', '3600'))  # 1 hour
     CACHE_MAX_ITEMS = int(os.getenv('CACHE_MAX_ITEMS', '10000'))
+    MEMBERSHIP_CACHE_MAX_ITEMS = int(os.getenv('MEMBERSHIP_CACHE_MAX_ITEMS', '20000'))
+    MEMBERSHIP_CACHE_LOCAL_TTL = int(os.getenv('MEMBERSHIP_CACHE_LOCAL_TTL', '30'))  # per-worker staleness bound
+    MEMBERSHIP_CACHE_REDIS_TTL = int(os.getenv('MEMBERSHIP_CACHE_REDIS_TTL', '600'))  # 10 minutes
+    CHAT_HISTORY_BUFFER_SIZE = int(os.getenv('CHAT_HISTORY_BUFFER_SIZE', '100'))  # messages per chat
+    CHAT_HISTORY_MAX_CHATS = int(os.getenv('CHAT_HISTORY_MAX_CHATS', '2000'))
+    CHAT_HISTORY_LOCAL_TTL = int(os.getenv('CHAT_HISTORY_LOCAL_TTL', '60'))  # without Redis
+    STUDENT_DASHBOARD_REFRESH_INTERVAL = float(os.getenv('STUDENT_DASHBOARD_REFRESH_INTERVAL', '2.0'))  # seconds
+    STUDENT_DASHBOARD_MAX_AGE = int(os.getenv('STUDENT_DASHBOARD_MAX_AGE', '3600'))  # recompute on read after 1 hour
+    BI_SNAPSHOT_TTL = int(os.getenv('BI_SNAPSHOT_TTL', '300'))  # per-school BI dashboard snapshot
+    FEATURE_FLAGS_RECHECK_INTERVAL = float(os.getenv('FEATURE_FLAGS_RECHECK_INTERVAL', '30'))  # seconds between Redis version checks
+    AI_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv('AI_CACHE_LOCAL_MAX_ENTRIES', '2000'))
+    AI_CACHE_LOCAL_MAX_BYTES = int(os.getenv('AI_CACHE_LOCAL_MAX_BYTES', str(16 * 1024 * 1024)))  # 16 MB per worker
+    AI_CACHE_LOCAL_TTL = int(os.getenv('AI_CACHE_LOCAL_TTL', '3600'))  # seconds (also Redis TTL)
+    AI_CACHE_HIT_FLUSH_INTERVAL = float(os.getenv('AI_CACHE_HIT_FLUSH_INTERVAL', '5.0'))  # seconds
+    AI_SEMANTIC_CACHE = os.getenv('AI_SEMANTIC_CACHE', 'true').lower() == 'true'  # near-duplicate questions
+    AI_SEMANTIC_THRESHOLD = float(os.getenv('AI_SEMANTIC_THRESHOLD', '0.7'))  # Jaccard similarity 0-1
+    AI_SEMANTIC_MAX_ENTRIES = int(os.getenv('AI_SEMANTIC_MAX_ENTRIES', '20000'))  # indexed questions per worker
+    GEMINI_MAX_CONCURRENT = int(os.getenv('GEMINI_MAX_CONCURRENT', '8'))  # outstanding Gemini calls per worker
+    GEMINI_MAX_QUEUE = int(os.getenv('GEMINI_MAX_QUEUE', '32'))  # waiting calls before shedding
+    GEMINI_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', '10.0'))  # seconds
     
     # ============== API LIMITS ==============
     API_RATE_LIMIT_LOGIN = os.getenv('API_RATE_LIMIT_LOGIN', '5 per minute')
@@ -54,11 +89,32 @@ class Config:
     REDIS_CONNECT_TIMEOUT = int(os.getenv('REDIS_CONNECT_TIMEOUT', '2'))
     REDIS_SOCKET_TIMEOUT = int(os.getenv('REDIS_SOCKET_TIMEOUT', '5'))
     
+    # Socket.IO multi-worker: message queue (default: Redis sopra) e canale pub/sub
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'skajla-socketio')
+    
     # ============== MONITORING ==============
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     ENABLE_PERFORMANCE_MONITORING = os.getenv('ENABLE_MONITORING', 'true').lower() == 'true'
     METRICS_BATCH_SIZE = int(os.getenv('METRICS_BATCH_SIZE', '100'))
     
+    # ============== TELEMETRY ==============
+    TELEMETRY_ASYNC = os.getenv('TELEMETRY_ASYNC', 'true').lower() == 'true'
+    TELEMETRY_QUEUE_SIZE = int(os.getenv('TELEMETRY_QUEUE_SIZE', '10000'))
+    TELEMETRY_BATCH_SIZE = int(os.getenv('TELEMETRY_BATCH_SIZE', '500'))
+    TELEMETRY_FLUSH_INTERVAL = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', '1.0'))  # seconds
+    TELEMETRY_ENQUEUE_TIMEOUT = float(os.getenv('TELEMETRY_ENQUEUE_TIMEOUT', '0.05'))  # seconds before drop
+    
+    # ============== MESSAGING ==============
+    READ_RECEIPTS_FLUSH_INTERVAL = float(os.getenv('READ_RECEIPTS_FLUSH_INTERVAL', '0.5'))  # seconds
+    READ_RECEIPTS_MAX_PENDING = int(os.getenv('READ_RECEIPTS_MAX_PENDING', '5000'))  # receipts before early flush
+    
+    # ============== GAMIFICATION ==============
+    XP_WRITE_BEHIND = os.getenv('XP_WRITE_BEHIND', 'false').lower() == 'true'  # PostgreSQL only
+    XP_FLUSH_INTERVAL = float(os.getenv('XP_FLUSH_INTERVAL', '2.0'))  # seconds
+    XP_FLUSH_MAX_PENDING = int(os.getenv('XP_FLUSH_MAX_PENDING', '2000'))  # awards before early flush
+    XP_MULTIPLIER_CACHE_TTL = int(os.getenv('XP_MULTIPLIER_CACHE_TTL', '60'))  # seconds
+    
     # ============== EMAIL ==============
     EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '50'))
     EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '30'))
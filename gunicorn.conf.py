@@ -16,6 +16,35 @@ import multiprocessing
 cpu_count = multiprocessing.cpu_count()
 workers = min((cpu_count * 2) + 1, 4)  # Max 4 workers per Replit
 
+
+def _socketio_queue_available():
+    """I broadcast Socket.IO tra worker richiedono la message queue Redis"""
+    if os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        return True
+    try:
+        import redis
+        redis.Redis(
+            host=os.getenv('REDIS_HOST', 'localhost'),
+            port=int(os.getenv('REDIS_PORT', '6379')),
+            socket_connect_timeout=1
+        ).ping()
+        return True
+    except Exception:
+        return False
+
+
+# Senza message queue ogni worker avrebbe le sue stanze: un solo worker
+if workers > 1 and not _socketio_queue_available():
+    workers = 1
+
+# Gunicorn non instrada un client sempre allo stesso worker: le richieste
+# long-polling di una sessione Socket.IO finiscono su worker che non la
+# conoscono ("Invalid session"). Con più worker Socket.IO accetta solo
+# websocket (una connessione, un worker), a meno che il load balancer davanti
+# a gunicorn sia sticky (es. nginx ip_hash con più istanze) e lo dichiari
+# SOCKETIO_STICKY_SESSIONS=true.
+SOCKETIO_STICKY_SESSIONS = os.getenv('SOCKETIO_STICKY_SESSIONS', 'false').lower() == 'true'
+
 # Eventlet worker per async I/O + SocketIO support
 worker_class = "eventlet"
 worker_connections = 1000  # Connessioni per worker
@@ -60,6 +89,16 @@ def when_ready(server):
     """Server ready callback - monkey patching now handled in wsgi.py"""
     server.log.info("SKAJLA Server ready - eventlet monkey patching handled in wsgi.py")
 
+def post_worker_init(worker):
+    """Con più worker e senza sticky session: Socket.IO solo su websocket"""
+    # worker.cfg.workers include l'eventuale --workers da riga di comando
+    if worker.cfg.workers <= 1 or SOCKETIO_STICKY_SESSIONS:
+        return
+    socketio = getattr(worker.wsgi, 'extensions', {}).get('socketio')
+    if socketio is not None:
+        socketio.server.eio.transports = ['websocket']
+        worker.log.info("Socket.IO: %s worker senza sticky session - solo websocket", worker.cfg.workers)
+
 def worker_int(worker):
     """Graceful shutdown per SocketIO connections"""
     worker.log.info("Worker ricevuto SIGINT - graceful shutdown SocketIO")
@@ -15,6 +15,7 @@ from datetime import timedelta
 from flask import Flask, render_template, redirect, session, make_response, request, g, flash
 from flask_socketio import SocketIO
 from flask_compress import Compress
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # Import moduli personalizzati
 from services.database.database_manager import db_manager
@@ -35,6 +36,9 @@ from services.ai.ai_chatbot import AISkailaBot
 from services.reports.report_scheduler import ReportScheduler
 from services.calendar.calendar_system import calendar_system
 from services.telemetry.telemetry_engine import telemetry_engine
+from services.redis_service import redis_manager
+from services.messaging.socket_metrics import socket_emit_metrics
+from config import config
 
 # Import routes modulari
 from routes.auth_routes import auth_bp
@@ -111,6 +115,10 @@ class SkailaApp:
         flask_config = env_manager.get_flask_config()
         self.app.config.update(flask_config)
 
+        # remote_addr = hop aggiunto dal proxy fidato, non il primo X-Forwarded-For (scelto dal client)
+        if config.TRUSTED_PROXY_COUNT > 0:
+            self.app.wsgi_app = ProxyFix(self.app.wsgi_app, x_for=config.TRUSTED_PROXY_COUNT)
+
         # Abilita compressione response
         Compress(self.app)
         
@@ -354,17 +362,33 @@ class SkailaApp:
             allowed_origins = env_manager.get_allowed_origins()
             cors_origins = self._generate_socketio_cors_origins(allowed_origins)
 
+        # Message queue: gli emit verso le stanze raggiungono i socket di
+        # tutti i worker Gunicorn (pub/sub Redis). Senza Redis resta il
+        # manager in-process e gunicorn.conf.py limita a un solo worker.
+        message_queue = config.SOCKETIO_MESSAGE_QUEUE or (
+            redis_manager.get_url() if redis_manager.use_redis else None
+        )
+        socket_emit_metrics.message_queue = message_queue
+        if message_queue:
+            print(f"📡 Socket.IO message queue: {message_queue.split('@')[-1]} (canale {config.SOCKETIO_CHANNEL})")
+        else:
+            print("⚠️ Socket.IO senza message queue: broadcast limitati al worker corrente")
+
         self.socketio = SocketIO(
             self.app,
             cors_allowed_origins=cors_origins,
             logger=False,
             engineio_logger=False,
             allow_upgrades=True,
+            # Con più worker gunicorn senza sticky session post_worker_init
+            # (gunicorn.conf.py) riduce i transport al solo websocket
             transports=['websocket', 'polling'],
             async_mode='eventlet',  # Eventlet per compatibilità con worker Gunicorn
             ping_timeout=60,
             ping_interval=25,
-            max_http_buffer_size=1000000
+            max_http_buffer_size=1000000,
+            message_queue=message_queue,
+            channel=config.SOCKETIO_CHANNEL
         )
 
         # Registra eventi Socket.IO
@@ -472,9 +496,36 @@ class SkailaApp:
                 except Exception as e:
                     print(f"⚠️ Instant Groups init failed: {e}")
 
+                # Contatori hub messaggistica (messaggi, ultimo messaggio, non letti)
+                from services.messaging.chat_summary import chat_summary
+                if chat_summary.init_schema():
+                    print("💬 Chat summary counters ready")
+
+                # Read model dashboard studente/genitore (aggregati per studente)
+                from services.dashboard.student_read_model import student_dashboard
+                if student_dashboard.init_schema():
+                    print("📊 Student dashboard read model ready")
+
+                # Punteggi di rischio precalcolati (job notturno del report scheduler)
+                from services.ai.risk_engine import risk_engine
+                risk_engine.init_schema()
+
+                # Vincolo unico per l'upsert multi-riga dell'appello di classe
+                from services.school.registro_elettronico import registro
+                if registro.init_schema():
+                    print("📋 Bulk class attendance ready")
+
                 # Crea indici database ottimizzati
                 db_manager.create_optimized_indexes()
 
+                # Contatori early-warning: senza Redis vanno ricostruiti dallo storico
+                try:
+                    from services.redis_service import redis_manager
+                    if not redis_manager.use_redis:
+                        telemetry_engine.early_warning.rebuild_from_history()
+                except Exception as e:
+                    print(f"⚠️ Early-warning counters rebuild failed: {e}")
+
                 # Inizializza scheduler report automatici (con app context)
                 try:
                     with self.app.app_context():
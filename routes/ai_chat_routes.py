@@ -7,6 +7,7 @@ from flask import Blueprint, jsonify, session, request
 from services.ai.gemini_chatbot import gemini_chatbot
 from shared.middleware.feature_guard import check_feature_enabled, Features
 from services.tenant_guard import get_current_school_id
+from shared.error_handling.exceptions import AIOverloadedError
 from shared.error_handling.structured_logger import get_logger
 from services.telemetry.telemetry_engine import telemetry_engine
 
@@ -108,6 +109,15 @@ def chat_with_ai():
             'timestamp': 'now'
         })
     
+    except AIOverloadedError as e:
+        response = jsonify({
+            'success': False,
+            'error': e.display_message,
+            'retry_after': e.retry_after
+        })
+        response.headers['Retry-After'] = str(int(e.retry_after + 0.5))
+        return response, 503
+    
     except Exception as e:
         logger.error(
             event_type='ai_chat_error',
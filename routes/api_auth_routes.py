@@ -10,6 +10,7 @@ from services.email_validator import validate_email, normalize_email
 from school_system import school_system
 from gamification import gamification_system
 from database_manager import db_manager
+from services.messaging.membership_cache import membership_cache
 from shared.middleware.auth import api_auth_required
 
 api_auth_bp = Blueprint('api_auth', __name__, url_prefix='/api')
@@ -139,6 +140,7 @@ def api_register():
                         "INSERT INTO partecipanti_chat (chat_id, utente_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
                         (chat_room['id'], user_id)
                     )
+                    membership_cache.invalidate_member(chat_room['id'], user_id)
             except Exception as e:
                 print(f"⚠️ Errore creazione chat classe (non-blocking): {e}")
         
@@ -183,6 +185,7 @@ def api_register():
 
 
 @api_auth_bp.route('/login', methods=['POST'])
+@auth_service.rate_limit_login
 def api_login():
     """
     POST /api/login
@@ -217,10 +220,7 @@ def api_login():
             }), 400
         
         if auth_service.is_locked_out(email):
-            import time
-            last_attempt = auth_service.login_attempts.get(email, {}).get('last_attempt', 0)
-            time_since_last_attempt = time.time() - last_attempt
-            time_remaining = max(0, auth_service.lockout_duration - time_since_last_attempt)
+            time_remaining = auth_service.lockout_remaining(email)
             minutes_left = max(1, int(time_remaining / 60))
             
             return jsonify({
@@ -5,7 +5,6 @@ Gestisce login, logout, registrazione e sessioni
 """
 
 import secrets
-import bcrypt
 from datetime import datetime, timedelta
 from flask import Blueprint, render_template, request, redirect, session, flash, url_for
 from csrf_protection import csrf_protect
@@ -16,11 +15,13 @@ from services.email_validator import validate_email, normalize_email
 from gamification import gamification_system  
 from school_system import school_system
 from database_manager import db_manager
+from services.messaging.membership_cache import membership_cache
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 @csrf_protect
+@auth_service.rate_limit_login
 def login():
     if request.method == 'POST':
         email = request.form.get('email', '').strip()
@@ -31,10 +32,7 @@ def login():
         
         # Verifica lockout
         if auth_service.is_locked_out(email):
-            import time
-            last_attempt = auth_service.login_attempts.get(email, {}).get('last_attempt', 0)
-            time_since_last_attempt = time.time() - last_attempt
-            time_remaining = max(0, auth_service.lockout_duration - time_since_last_attempt)
+            time_remaining = auth_service.lockout_remaining(email)
             minutes_left = max(1, int(time_remaining / 60))  # Minimo 1 minuto per evitare confusione
             flash(f'⚠️ Troppi tentativi falliti. Riprova tra {minutes_left} minuti.', 'error')
             print(f"🔒 Login locked out: {email} - {minutes_left} minuti rimanenti")
@@ -391,6 +389,7 @@ def register():
                                 INSERT INTO partecipanti_chat (chat_id, utente_id, joined_at)
                                 VALUES (%s, %s, CURRENT_TIMESTAMP)
                             ''', (chat_id, user_id))
+                            membership_cache.invalidate_member(chat_id, user_id)
                             print(f"✅ Utente {user_id} aggiunto a chat {chat_id}")
                             flash(f'🎉 Sei stato automaticamente aggiunto alla chat della tua classe!', 'success')
                         
@@ -498,7 +497,7 @@ def reset_password(token):
             flash(f'Password non valida: {message}', 'error')
             return render_template('reset_password.html', token_valid=True)
         
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = auth_service.hash_password(password)
         
         db_manager.execute(
             'UPDATE utenti SET password = %s WHERE id = %s',
@@ -544,7 +543,7 @@ def change_password_required():
             flash(f'Password non valida: {message}', 'error')
             return render_template('force_password_change.html', user_nome=user_nome)
         
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = auth_service.hash_password(new_password)
         
         db_manager.execute('''
             UPDATE utenti 
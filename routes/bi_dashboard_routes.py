@@ -7,6 +7,7 @@ Dashboard BI per dirigenti e professori con organigrammi visuali
 from flask import Blueprint, render_template, session, redirect, jsonify
 from database_manager import db_manager
 from services.tenant_guard import get_current_school_id, TenantGuardException
+from services.analytics.school_bi_snapshot import school_bi_snapshot
 from shared.middleware.auth import require_login
 from shared.error_handling import get_logger
 from datetime import datetime, timedelta
@@ -223,147 +224,15 @@ def api_studente_dashboard(student_id):
 
 def get_organization_tree(school_id, ruolo, user_id):
     """Costruisce albero organizzazione gerarchico"""
-    
-    # Root: Scuola
-    scuola = db_manager.query('''
-        SELECT nome FROM scuole WHERE id = %s
-    ''', (school_id,), one=True)
-    
-    tree = {
-        'name': scuola['nome'],
-        'type': 'scuola',
-        'id': school_id,
-        'children': []
-    }
-    
-    # Livello 1: Classi
-    if ruolo == 'dirigente':
-        # Dirigente vede tutte le classi
-        classi = db_manager.query('''
-            SELECT DISTINCT classe, COUNT(DISTINCT id) as studenti_count
-            FROM utenti
-            WHERE scuola_id = %s AND ruolo = 'studente' AND classe IS NOT NULL
-            GROUP BY classe
-            ORDER BY classe
-        ''', (school_id,))
-    else:
-        # Professore vede solo sue classi (placeholder - da implementare con docenti_classi)
-        classi = db_manager.query('''
-            SELECT DISTINCT classe, COUNT(DISTINCT id) as studenti_count
-            FROM utenti
-            WHERE scuola_id = %s AND ruolo = 'studente' AND classe IS NOT NULL
-            GROUP BY classe
-            ORDER BY classe
-        ''', (school_id,))
-    
-    for classe_row in classi:
-        classe_name = classe_row['classe']
-        
-        # Statistiche classe
-        classe_stats = db_manager.query('''
-            SELECT 
-                COUNT(DISTINCT u.id) as studenti,
-                ROUND(AVG(CASE WHEN rv.voto IS NOT NULL THEN rv.voto ELSE 0 END), 2) as media_voti,
-                COUNT(DISTINCT CASE WHEN rp.status = 'presente' THEN 1 END) * 100.0 / 
-                    NULLIF(COUNT(DISTINCT rp.id), 0) as presenze_perc
-            FROM utenti u
-            LEFT JOIN registro_voti rv ON u.id = rv.student_id
-            LEFT JOIN registro_presenze rp ON u.id = rp.student_id
-            WHERE u.classe = %s AND u.scuola_id = %s AND u.ruolo = 'studente'
-        ''', (classe_name, school_id), one=True)
-        
-        classe_node = {
-            'name': f'Classe {classe_name}',
-            'type': 'classe',
-            'id': classe_name,
-            'stats': classe_stats,
-            'children': []
-        }
-        
-        # Livello 2: Studenti (solo nomi, privacy)
-        studenti = db_manager.query('''
-            SELECT id, nome, cognome
-            FROM utenti
-            WHERE classe = %s AND scuola_id = %s AND ruolo = 'studente'
-            ORDER BY cognome, nome
-        ''', (classe_name, school_id))
-        
-        for studente in studenti:
-            # Stats aggregate studente (no dettagli personali)
-            student_stats = db_manager.query('''
-                SELECT 
-                    ROUND(AVG(voto), 2) as media_voti,
-                    COUNT(DISTINCT date) as giorni_voti
-                FROM registro_voti
-                WHERE student_id = %s
-            ''', (studente['id'],), one=True)
-            
-            studente_node = {
-                'name': f"{studente['nome']} {studente['cognome'][0]}.",
-                'type': 'studente',
-                'id': studente['id'],
-                'stats': student_stats
-            }
-            
-            classe_node['children'].append(studente_node)
-        
-        tree['children'].append(classe_node)
-    
-    return tree
+    # Professore vede per ora le stesse classi del dirigente (placeholder - da implementare con docenti_classi)
+    return school_bi_snapshot.get_organization_tree(school_id)
 
 
 def get_school_kpi(school_id):
     """KPI principali scuola"""
-    kpi = db_manager.query('''
-        SELECT 
-            COUNT(DISTINCT CASE WHEN ruolo = 'studente' THEN id END) as totale_studenti,
-            COUNT(DISTINCT CASE WHEN ruolo = 'professore' THEN id END) as totale_professori,
-            COUNT(DISTINCT classe) as totale_classi,
-            ROUND(AVG(CASE WHEN ruolo = 'studente' AND EXISTS(
-                SELECT 1 FROM registro_voti rv WHERE rv.student_id = utenti.id
-            ) THEN (
-                SELECT AVG(voto) FROM registro_voti WHERE student_id = utenti.id
-            ) END), 2) as media_generale_scuola
-        FROM utenti
-        WHERE scuola_id = %s AND attivo = true
-    ''', (school_id,), one=True)
-    
-    # Tasso presenze scuola (ultimi 30 giorni)
-    presenze_kpi = db_manager.query('''
-        SELECT 
-            COUNT(*) as totale_registrazioni,
-            COUNT(CASE WHEN status = 'presente' THEN 1 END) * 100.0 / 
-                NULLIF(COUNT(*), 0) as tasso_presenze
-        FROM registro_presenze rp
-        JOIN utenti u ON rp.student_id = u.id
-        WHERE u.scuola_id = %s AND rp.date >= CURRENT_DATE - INTERVAL '30 days'
-    ''', (school_id,), one=True)
-    
-    return {
-        **kpi,
-        'tasso_presenze': round(presenze_kpi['tasso_presenze'] or 0, 1)
-    }
+    return school_bi_snapshot.get_school_kpi(school_id)
 
 
 def get_classes_statistics(school_id, ruolo, user_id):
-    """Statistiche dettagliate per classi"""
-    
-    classi_stats = db_manager.query('''
-        SELECT 
-            u.classe,
-            COUNT(DISTINCT u.id) as studenti_count,
-            ROUND(AVG(CASE WHEN rv.voto IS NOT NULL THEN rv.voto END), 2) as media_classe,
-            COUNT(DISTINCT rv.id) as voti_registrati,
-            COUNT(DISTINCT CASE WHEN rp.status = 'presente' THEN rp.id END) * 100.0 / 
-                NULLIF(COUNT(DISTINCT rp.id), 0) as tasso_presenze
-        FROM utenti u
-        LEFT JOIN registro_voti rv ON u.id = rv.student_id 
-            AND rv.date >= CURRENT_DATE - INTERVAL '30 days'
-        LEFT JOIN registro_presenze rp ON u.id = rp.student_id
-            AND rp.date >= CURRENT_DATE - INTERVAL '30 days'
-        WHERE u.scuola_id = %s AND u.ruolo = 'studente' AND u.classe IS NOT NULL
-        GROUP BY u.classe
-        ORDER BY u.classe
-    ''', (school_id,))
-    
-    return classi_stats
+    """Statistiche dettagliate per classi (ultimi 30 giorni)"""
+    return school_bi_snapshot.get_classes_statistics(school_id)
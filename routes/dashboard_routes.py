@@ -11,6 +11,7 @@ from ai_chatbot import AISkailaBot
 from ai_insights_engine import ai_insights_engine
 from shared.middleware.auth import require_login, require_auth, require_teacher
 from services.dashboard.dashboard_service import dashboard_service
+from services.dashboard.student_read_model import student_dashboard
 from services.school.school_features_manager import school_features_manager
 from shared.error_handling.structured_logger import get_logger
 
@@ -47,59 +48,40 @@ def dashboard_studente():
     # Ottieni feature abilitate per questa scuola
     enabled_features = school_features_manager.get_school_features(school_id)
 
-    # ========== VOTI REALI DAL DATABASE (TENANT-ISOLATED) ==========
-    # Ultimi voti dello studente - filtro per scuola_id per isolamento tenant
-    voti = db_manager.query('''
-        SELECT materia, voto, tipo_valutazione, data, note
-        FROM voti 
-        WHERE studente_id = %s AND scuola_id = %s
-        ORDER BY data DESC 
-        LIMIT 10
-    ''', (user_id, school_id)) or []
-
-    # Media voti per materia - filtro per scuola_id
-    medie_materie = db_manager.query('''
-        SELECT materia, 
-               ROUND(AVG(voto)::numeric, 2) as media, 
-               COUNT(*) as num_voti,
-               MAX(data) as ultimo_voto
-        FROM voti
-        WHERE studente_id = %s AND scuola_id = %s
-        GROUP BY materia
-        ORDER BY materia
-    ''', (user_id, school_id)) or []
-
-    # Media generale - filtro per scuola_id
-    media_generale = db_manager.query('''
-        SELECT ROUND(AVG(voto)::numeric, 2) as media_generale,
-               COUNT(*) as totale_voti
-        FROM voti
-        WHERE studente_id = %s AND scuola_id = %s
-    ''', (user_id, school_id), one=True) or {'media_generale': 0, 'totale_voti': 0}
-
-    # Trend voti ultimi 90 giorni per grafico - filtro per scuola_id
-    voti_trend = db_manager.query('''
-        SELECT data, voto, materia
-        FROM voti
-        WHERE studente_id = %s AND scuola_id = %s
-        AND data >= CURRENT_DATE - INTERVAL '90 days'
-        ORDER BY data ASC
-    ''', (user_id, school_id)) or []
-
-    # ========== PRESENZE/ASSENZE DAL DATABASE (TENANT-ISOLATED) ==========
-    presenze_stats = db_manager.query('''
-        SELECT 
-            COUNT(*) as giorni_totali,
-            SUM(CASE WHEN presente = true THEN 1 ELSE 0 END) as presenze,
-            SUM(CASE WHEN presente = false THEN 1 ELSE 0 END) as assenze,
-            SUM(CASE WHEN giustificato = true THEN 1 ELSE 0 END) as giustificate,
-            SUM(CASE WHEN ritardo > 0 THEN 1 ELSE 0 END) as ritardi
-        FROM presenze
-        WHERE studente_id = %s AND scuola_id = %s
-    ''', (user_id, school_id), one=True) or {
-        'giorni_totali': 0, 'presenze': 0, 'assenze': 0, 
-        'giustificate': 0, 'ritardi': 0
-    }
+    # ========== AGGREGATI STUDENTE (READ MODEL, TENANT-ISOLATED) ==========
+    # Voti, medie, trend, presenze e attività precalcolati: una lookup per chiave
+    model = student_dashboard.get(user_id, school_id)
+    voti = model['voti'][:10]
+    medie_materie = model['medie_materie']
+    media_generale = model['media_generale']
+    voti_trend = model['voti_trend']
+    presenze_stats = model['presenze_stats']
+    ultime_presenze = model['ultime_presenze']
+    daily_analytics = model['daily_analytics']
+
+    data = db_manager.query_many({
+        # Prossimi eventi (verifiche, compiti, scadenze)
+        'upcoming_events': ('''
+            SELECT id, title, description, event_type, start_datetime, end_datetime
+            FROM calendar_events
+            WHERE (user_id = %s OR is_school_wide = true)
+            AND start_datetime >= CURRENT_TIMESTAMP
+            ORDER BY start_datetime ASC
+            LIMIT 5
+        ''', (user_id,)),
+        # SKAJLA Connect - Aziende disponibili
+        'companies': ('''
+            SELECT id, nome, settore, descrizione, logo, citta, posizione_offerta, 
+                   tipo_opportunita, requisiti, retribuzione
+            FROM skaila_connect_companies 
+            WHERE attiva = true 
+            ORDER BY created_at DESC 
+            LIMIT 3
+        ''', None),
+    })
+
+    upcoming_events = data['upcoming_events'] or []
+    companies = data['companies'] or []
 
     # Calcola percentuale presenze
     percentuale_presenze = 0
@@ -108,25 +90,6 @@ def dashboard_studente():
             (presenze_stats['presenze'] or 0) / presenze_stats['giorni_totali'] * 100, 1
         )
 
-    # Ultime presenze/assenze - filtro per scuola_id
-    ultime_presenze = db_manager.query('''
-        SELECT data, presente, giustificato, ritardo, note
-        FROM presenze
-        WHERE studente_id = %s AND scuola_id = %s
-        ORDER BY data DESC
-        LIMIT 10
-    ''', (user_id, school_id)) or []
-
-    # ========== PROSSIMI EVENTI (verifiche, compiti, scadenze) ==========
-    upcoming_events = db_manager.query('''
-        SELECT id, title, description, event_type, start_datetime, end_datetime
-        FROM calendar_events
-        WHERE (user_id = %s OR is_school_wide = true)
-        AND start_datetime >= CURRENT_TIMESTAMP
-        ORDER BY start_datetime ASC
-        LIMIT 5
-    ''', (user_id,)) or []
-
     # ========== DATI GAMIFICATION ==========
     gamification_data = None
     profile = {}
@@ -160,16 +123,6 @@ def dashboard_studente():
         'giorni_totali': presenze_stats['giorni_totali'] or 0
     }
 
-    # SKAJLA Connect - Aziende disponibili
-    companies = db_manager.query('''
-        SELECT id, nome, settore, descrizione, logo, citta, posizione_offerta, 
-               tipo_opportunita, requisiti, retribuzione
-        FROM skaila_connect_companies 
-        WHERE attiva = true 
-        ORDER BY created_at DESC 
-        LIMIT 3
-    ''') or []
-
     # AI Insights
     ai_insights = []
 
@@ -186,15 +139,6 @@ def dashboard_studente():
             'timestamp': ach['unlocked_at']
         })
 
-    # Attività da daily analytics
-    daily_analytics = db_manager.query('''
-        SELECT date, quizzes_completed, messages_sent, ai_interactions, xp_earned
-        FROM daily_analytics
-        WHERE user_id = %s AND date >= CURRENT_DATE - INTERVAL '7 days'
-        ORDER BY date DESC
-        LIMIT 5
-    ''', (user_id,)) or []
-
     for stat in daily_analytics:
         if stat['quizzes_completed'] and stat['quizzes_completed'] > 0:
             recent_activities_list.append({
@@ -330,45 +274,11 @@ def dashboard_genitore():
     
     student_id = linked_student['id']
     
-    voti = db_manager.query('''
-        SELECT materia, voto, tipo_valutazione, data, note
-        FROM voti
-        WHERE studente_id = %s AND scuola_id = %s
-        ORDER BY data DESC
-        LIMIT 15
-    ''', (student_id, school_id)) or []
-    
-    medie_materie = db_manager.query('''
-        SELECT materia, 
-               ROUND(AVG(voto)::numeric, 2) as media, 
-               COUNT(*) as num_voti
-        FROM voti
-        WHERE studente_id = %s AND scuola_id = %s
-        GROUP BY materia
-        ORDER BY materia
-    ''', (student_id, school_id)) or []
-    
-    presenze_stats = db_manager.query('''
-        SELECT 
-            COUNT(*) as giorni_totali,
-            SUM(CASE WHEN presente = true THEN 1 ELSE 0 END) as presenze,
-            SUM(CASE WHEN presente = false THEN 1 ELSE 0 END) as assenze,
-            SUM(CASE WHEN giustificato = true THEN 1 ELSE 0 END) as giustificate,
-            SUM(CASE WHEN ritardo > 0 THEN 1 ELSE 0 END) as ritardi
-        FROM presenze
-        WHERE studente_id = %s AND scuola_id = %s
-    ''', (student_id, school_id), one=True) or {
-        'giorni_totali': 0, 'presenze': 0, 'assenze': 0, 
-        'giustificate': 0, 'ritardi': 0
-    }
-    
-    ultime_presenze = db_manager.query('''
-        SELECT data, presente, giustificato, ritardo, note
-        FROM presenze
-        WHERE studente_id = %s AND scuola_id = %s
-        ORDER BY data DESC
-        LIMIT 10
-    ''', (student_id, school_id)) or []
+    model = student_dashboard.get(student_id, school_id)
+    voti = model['voti']
+    medie_materie = model['medie_materie']
+    presenze_stats = model['presenze_stats']
+    ultime_presenze = model['ultime_presenze']
     
     return render_template('dashboard_genitore.html', 
                          user=session,
@@ -604,36 +514,171 @@ def dashboard_dirigente():
         session.clear()
         return redirect('/login')
     
+    # ========== QUERY INDIPENDENTI IN PARALLELO ==========
+    # Tutte le query della dashboard dipendono solo da school_id
+    data = db_manager.query_many({
+        'total_students': ('''
+            SELECT COUNT(*) as count FROM utenti 
+            WHERE scuola_id = %s AND ruolo = 'studente' AND attivo = true
+        ''', (school_id,), True),
+        'total_teachers': ('''
+            SELECT COUNT(*) as count FROM utenti 
+            WHERE scuola_id = %s AND ruolo = 'professore' AND attivo = true
+        ''', (school_id,), True),
+        'total_classes': ('''
+            SELECT COUNT(*) as count FROM classi 
+            WHERE scuola_id = %s
+        ''', (school_id,), True),
+        'active_users_today': ('''
+            SELECT COUNT(DISTINCT da.user_id) as count 
+            FROM daily_analytics da
+            JOIN utenti u ON da.user_id = u.id
+            WHERE da.date = CURRENT_DATE AND u.scuola_id = %s
+        ''', (school_id,), True),
+        'classes_data': ('''
+            SELECT 
+                c.id,
+                c.nome as class_name,
+                c.anno_scolastico,
+                COUNT(DISTINCT u.id) as student_count
+            FROM classi c
+            LEFT JOIN utenti u ON u.classe_id = c.id AND u.ruolo = 'studente' AND u.attivo = true
+            WHERE c.scuola_id = %s
+            GROUP BY c.id, c.nome, c.anno_scolastico
+            ORDER BY c.nome
+        ''', (school_id,)),
+        'class_grades': ('''
+            SELECT 
+                u.classe_id,
+                ROUND(AVG(v.voto)::numeric, 2) as avg_grade
+            FROM voti v
+            JOIN utenti u ON v.studente_id = u.id
+            WHERE u.scuola_id = %s AND u.ruolo = 'studente'
+            GROUP BY u.classe_id
+        ''', (school_id,)),
+        'class_attendance': ('''
+            SELECT 
+                u.classe_id,
+                ROUND(
+                    (SUM(CASE WHEN p.presente = true THEN 1 ELSE 0 END)::numeric / 
+                    NULLIF(COUNT(*)::numeric, 0)) * 100, 1
+                ) as attendance_rate
+            FROM presenze p
+            JOIN utenti u ON p.studente_id = u.id
+            WHERE u.scuola_id = %s AND u.ruolo = 'studente'
+            GROUP BY u.classe_id
+        ''', (school_id,)),
+        'teachers_data': ('''
+            SELECT 
+                u.id,
+                u.nome,
+                u.cognome,
+                u.email,
+                'Materie varie' as subject
+            FROM utenti u
+            WHERE u.scuola_id = %s AND u.ruolo = 'professore' AND u.attivo = true
+            ORDER BY u.cognome, u.nome
+        ''', (school_id,)),
+        'teacher_ratings': ('''
+            SELECT 
+                teacher_id,
+                ROUND(AVG(rating)::numeric, 2) as avg_rating,
+                COUNT(*) as rating_count
+            FROM teacher_ratings
+            WHERE scuola_id = %s
+            GROUP BY teacher_id
+        ''', (school_id,)),
+        'school_subscription': ('''
+            SELECT attiva FROM scuole WHERE id = %s
+        ''', (school_id,), True),
+        'active_last_7_days': ('''
+            SELECT COUNT(DISTINCT da.user_id) as count 
+            FROM daily_analytics da
+            JOIN utenti u ON da.user_id = u.id
+            WHERE da.date >= CURRENT_DATE - INTERVAL '7 days' AND u.scuola_id = %s
+        ''', (school_id,), True),
+        'ai_usage': ('''
+            SELECT 
+                COUNT(*) as total_interactions,
+                COUNT(DISTINCT ac.utente_id) as unique_users
+            FROM ai_conversations ac
+            JOIN utenti u ON ac.utente_id = u.id
+            WHERE ac.timestamp >= CURRENT_DATE - INTERVAL '30 days' AND u.scuola_id = %s
+        ''', (school_id,), True),
+        'gamification_participants': ('''
+            SELECT COUNT(DISTINCT xl.user_id) as count 
+            FROM xp_logs xl
+            JOIN utenti u ON xl.user_id = u.id
+            WHERE xl.created_at >= CURRENT_DATE - INTERVAL '30 days' AND u.scuola_id = %s
+        ''', (school_id,), True),
+        'parent_count': ('''
+            SELECT COUNT(*) as count FROM utenti 
+            WHERE scuola_id = %s AND ruolo = 'genitore' AND attivo = true
+        ''', (school_id,), True),
+        'active_parents': ('''
+            SELECT COUNT(DISTINCT u.id) as count 
+            FROM utenti u
+            JOIN daily_analytics da ON da.user_id = u.id
+            WHERE u.scuola_id = %s AND u.ruolo = 'genitore' 
+            AND da.date >= CURRENT_DATE - INTERVAL '7 days'
+        ''', (school_id,), True),
+        'attendance_trend': ('''
+            SELECT 
+                data as date,
+                COUNT(*) as total,
+                SUM(CASE WHEN presente = true THEN 1 ELSE 0 END) as present,
+                ROUND(
+                    (SUM(CASE WHEN presente = true THEN 1 ELSE 0 END)::numeric / 
+                    NULLIF(COUNT(*)::numeric, 0)) * 100, 1
+                ) as rate
+            FROM presenze p
+            JOIN utenti u ON p.studente_id = u.id
+            WHERE u.scuola_id = %s AND p.data >= CURRENT_DATE - INTERVAL '30 days'
+            GROUP BY p.data
+            ORDER BY p.data
+        ''', (school_id,)),
+        'grade_distribution': ('''
+            SELECT 
+                CASE 
+                    WHEN voto >= 9 THEN 'Eccellente (9-10)'
+                    WHEN voto >= 7 THEN 'Buono (7-8)'
+                    WHEN voto >= 6 THEN 'Sufficiente (6)'
+                    ELSE 'Insufficiente (<6)'
+                END as category,
+                COUNT(*) as count
+            FROM voti v
+            JOIN utenti u ON v.studente_id = u.id
+            WHERE u.scuola_id = %s
+            GROUP BY 1
+            ORDER BY MIN(voto) DESC
+        ''', (school_id,)),
+        'school_avg_grade': ('''
+            SELECT ROUND(AVG(voto)::numeric, 2) as avg_grade
+            FROM voti v
+            JOIN utenti u ON v.studente_id = u.id
+            WHERE u.scuola_id = %s
+        ''', (school_id,), True),
+        'school_info': ('''
+            SELECT nome FROM scuole WHERE id = %s
+        ''', (school_id,), True),
+    })
+    
     # ========== SCHOOL OVERVIEW SECTION ==========
     # Total students count
-    total_students = db_manager.query('''
-        SELECT COUNT(*) as count FROM utenti 
-        WHERE scuola_id = %s AND ruolo = 'studente' AND attivo = true
-    ''', (school_id,), one=True)
+    total_students = data['total_students']
     
     # Total teachers count
-    total_teachers = db_manager.query('''
-        SELECT COUNT(*) as count FROM utenti 
-        WHERE scuola_id = %s AND ruolo = 'professore' AND attivo = true
-    ''', (school_id,), one=True)
+    total_teachers = data['total_teachers']
     
     # Total classes count
-    total_classes = db_manager.query('''
-        SELECT COUNT(*) as count FROM classi 
-        WHERE scuola_id = %s
-    ''', (school_id,), one=True)
+    total_classes = data['total_classes']
     
     # Average student age - use default value since data_nascita column may not exist
     # In a real scenario, schools would have this data from student records
     avg_student_age = {'avg_age': 15.5}  # Default average age for Italian high schools
     
     # Active users today (filtered by school - join with utenti for tenant isolation)
-    active_users_today = db_manager.query('''
-        SELECT COUNT(DISTINCT da.user_id) as count 
-        FROM daily_analytics da
-        JOIN utenti u ON da.user_id = u.id
-        WHERE da.date = CURRENT_DATE AND u.scuola_id = %s
-    ''', (school_id,), one=True)
+    active_users_today = data['active_users_today']
     
     overview_stats = {
         'total_students': total_students['count'] if total_students else 0,
@@ -645,45 +690,15 @@ def dashboard_dirigente():
     
     # ========== CLASSES SECTION ==========
     # List of classes with student count, average grade, and attendance rate
-    classes_data = db_manager.query('''
-        SELECT 
-            c.id,
-            c.nome as class_name,
-            c.anno_scolastico,
-            COUNT(DISTINCT u.id) as student_count
-        FROM classi c
-        LEFT JOIN utenti u ON u.classe_id = c.id AND u.ruolo = 'studente' AND u.attivo = true
-        WHERE c.scuola_id = %s
-        GROUP BY c.id, c.nome, c.anno_scolastico
-        ORDER BY c.nome
-    ''', (school_id,)) or []
+    classes_data = data['classes_data'] or []
     
     # Get average grades per class
-    class_grades = db_manager.query('''
-        SELECT 
-            u.classe_id,
-            ROUND(AVG(v.voto)::numeric, 2) as avg_grade
-        FROM voti v
-        JOIN utenti u ON v.studente_id = u.id
-        WHERE u.scuola_id = %s AND u.ruolo = 'studente'
-        GROUP BY u.classe_id
-    ''', (school_id,)) or []
+    class_grades = data['class_grades'] or []
     
     grade_map = {g['classe_id']: g['avg_grade'] for g in class_grades}
     
     # Get attendance rate per class
-    class_attendance = db_manager.query('''
-        SELECT 
-            u.classe_id,
-            ROUND(
-                (SUM(CASE WHEN p.presente = true THEN 1 ELSE 0 END)::numeric / 
-                NULLIF(COUNT(*)::numeric, 0)) * 100, 1
-            ) as attendance_rate
-        FROM presenze p
-        JOIN utenti u ON p.studente_id = u.id
-        WHERE u.scuola_id = %s AND u.ruolo = 'studente'
-        GROUP BY u.classe_id
-    ''', (school_id,)) or []
+    class_attendance = data['class_attendance'] or []
     
     attendance_map = {a['classe_id']: a['attendance_rate'] for a in class_attendance}
     
@@ -693,28 +708,10 @@ def dashboard_dirigente():
         cls['attendance_rate'] = attendance_map.get(cls['id'], 0) or 0
     
     # ========== TEACHERS SECTION WITH RATINGS ==========
-    teachers_data = db_manager.query('''
-        SELECT 
-            u.id,
-            u.nome,
-            u.cognome,
-            u.email,
-            'Materie varie' as subject
-        FROM utenti u
-        WHERE u.scuola_id = %s AND u.ruolo = 'professore' AND u.attivo = true
-        ORDER BY u.cognome, u.nome
-    ''', (school_id,)) or []
+    teachers_data = data['teachers_data'] or []
     
     # Get teacher ratings
-    teacher_ratings = db_manager.query('''
-        SELECT 
-            teacher_id,
-            ROUND(AVG(rating)::numeric, 2) as avg_rating,
-            COUNT(*) as rating_count
-        FROM teacher_ratings
-        WHERE scuola_id = %s
-        GROUP BY teacher_id
-    ''', (school_id,)) or []
+    teacher_ratings = data['teacher_ratings'] or []
     
     rating_map = {r['teacher_id']: {'avg_rating': r['avg_rating'], 'count': r['rating_count']} for r in teacher_ratings}
     
@@ -729,9 +726,7 @@ def dashboard_dirigente():
     PRICE_PER_MONTH = 599
     
     # Check if THIS school has an active subscription (tenant-isolated)
-    school_subscription = db_manager.query('''
-        SELECT attiva FROM scuole WHERE id = %s
-    ''', (school_id,), one=True)
+    school_subscription = data['school_subscription']
     
     is_active = school_subscription['attiva'] if school_subscription else True
     subscription_count = 1 if is_active else 0  # Only count THIS school
@@ -763,52 +758,26 @@ def dashboard_dirigente():
     # ========== ADDITIONAL KPIs ==========
     # Platform engagement rate (filtered by school)
     total_users = overview_stats['total_students'] + overview_stats['total_teachers']
-    active_last_7_days = db_manager.query('''
-        SELECT COUNT(DISTINCT da.user_id) as count 
-        FROM daily_analytics da
-        JOIN utenti u ON da.user_id = u.id
-        WHERE da.date >= CURRENT_DATE - INTERVAL '7 days' AND u.scuola_id = %s
-    ''', (school_id,), one=True)
+    active_last_7_days = data['active_last_7_days']
     
     engagement_rate = 0
     if total_users > 0 and active_last_7_days:
         engagement_rate = round((active_last_7_days['count'] / max(total_users, 1)) * 100, 1)
     
     # AI Coach usage statistics (filtered by school)
-    ai_usage = db_manager.query('''
-        SELECT 
-            COUNT(*) as total_interactions,
-            COUNT(DISTINCT ac.utente_id) as unique_users
-        FROM ai_conversations ac
-        JOIN utenti u ON ac.utente_id = u.id
-        WHERE ac.timestamp >= CURRENT_DATE - INTERVAL '30 days' AND u.scuola_id = %s
-    ''', (school_id,), one=True) or {'total_interactions': 0, 'unique_users': 0}
+    ai_usage = data['ai_usage'] or {'total_interactions': 0, 'unique_users': 0}
     
     # Gamification participation rate (filtered by school)
-    gamification_participants = db_manager.query('''
-        SELECT COUNT(DISTINCT xl.user_id) as count 
-        FROM xp_logs xl
-        JOIN utenti u ON xl.user_id = u.id
-        WHERE xl.created_at >= CURRENT_DATE - INTERVAL '30 days' AND u.scuola_id = %s
-    ''', (school_id,), one=True)
+    gamification_participants = data['gamification_participants']
     
     gamification_rate = 0
     if overview_stats['total_students'] > 0 and gamification_participants:
         gamification_rate = round((gamification_participants['count'] / max(overview_stats['total_students'], 1)) * 100, 1)
     
     # Parent engagement rate
-    parent_count = db_manager.query('''
-        SELECT COUNT(*) as count FROM utenti 
-        WHERE scuola_id = %s AND ruolo = 'genitore' AND attivo = true
-    ''', (school_id,), one=True)
-    
-    active_parents = db_manager.query('''
-        SELECT COUNT(DISTINCT u.id) as count 
-        FROM utenti u
-        JOIN daily_analytics da ON da.user_id = u.id
-        WHERE u.scuola_id = %s AND u.ruolo = 'genitore' 
-        AND da.date >= CURRENT_DATE - INTERVAL '7 days'
-    ''', (school_id,), one=True)
+    parent_count = data['parent_count']
+    
+    active_parents = data['active_parents']
     
     parent_engagement = 0
     if parent_count and parent_count['count'] > 0 and active_parents:
@@ -824,51 +793,16 @@ def dashboard_dirigente():
     }
     
     # ========== ATTENDANCE TREND (Last 30 days) ==========
-    attendance_trend = db_manager.query('''
-        SELECT 
-            data as date,
-            COUNT(*) as total,
-            SUM(CASE WHEN presente = true THEN 1 ELSE 0 END) as present,
-            ROUND(
-                (SUM(CASE WHEN presente = true THEN 1 ELSE 0 END)::numeric / 
-                NULLIF(COUNT(*)::numeric, 0)) * 100, 1
-            ) as rate
-        FROM presenze p
-        JOIN utenti u ON p.studente_id = u.id
-        WHERE u.scuola_id = %s AND p.data >= CURRENT_DATE - INTERVAL '30 days'
-        GROUP BY p.data
-        ORDER BY p.data
-    ''', (school_id,)) or []
+    attendance_trend = data['attendance_trend'] or []
     
     # ========== GRADE DISTRIBUTION ==========
-    grade_distribution = db_manager.query('''
-        SELECT 
-            CASE 
-                WHEN voto >= 9 THEN 'Eccellente (9-10)'
-                WHEN voto >= 7 THEN 'Buono (7-8)'
-                WHEN voto >= 6 THEN 'Sufficiente (6)'
-                ELSE 'Insufficiente (<6)'
-            END as category,
-            COUNT(*) as count
-        FROM voti v
-        JOIN utenti u ON v.studente_id = u.id
-        WHERE u.scuola_id = %s
-        GROUP BY 1
-        ORDER BY MIN(voto) DESC
-    ''', (school_id,)) or []
+    grade_distribution = data['grade_distribution'] or []
     
     # School average grade
-    school_avg_grade = db_manager.query('''
-        SELECT ROUND(AVG(voto)::numeric, 2) as avg_grade
-        FROM voti v
-        JOIN utenti u ON v.studente_id = u.id
-        WHERE u.scuola_id = %s
-    ''', (school_id,), one=True)
+    school_avg_grade = data['school_avg_grade']
     
     # School name
-    school_info = db_manager.query('''
-        SELECT nome FROM scuole WHERE id = %s
-    ''', (school_id,), one=True)
+    school_info = data['school_info']
     
     return render_template('dashboard_dirigente_new.html',
                          user=session,
@@ -7,6 +7,7 @@ Part of Feature #1: Smart AI-Tutoring & Early-Warning Engine
 from flask import Blueprint, request, jsonify, session, render_template
 from services.telemetry.telemetry_engine import telemetry_engine
 from services.database.database_manager import db_manager
+from services.ai.risk_engine import risk_engine
 from shared.middleware.auth import require_login, require_role
 from shared.error_handling import get_logger
 
@@ -75,6 +76,37 @@ def get_alerts_api():
         }), 500
 
 
+@early_warning_bp.route('/api/risk-scores', methods=['GET'])
+@require_login
+@require_role('docente')
+def get_risk_scores_api():
+    """Punteggi di rischio dell'ultimo precalcolo notturno (per classe opzionale)"""
+    try:
+        school_id = session.get('scuola_id')
+        class_name = request.args.get('classe')
+        min_risk_score = request.args.get('min_score', 0, type=int)
+        
+        scores = risk_engine.get_precomputed(school_id, class_name, min_risk_score)
+        
+        return jsonify({
+            "success": True,
+            "students": scores,
+            "count": len(scores)
+        })
+        
+    except Exception as e:
+        logger.error(
+            event_type='get_risk_scores_api_failed',
+            domain='early_warning',
+            error=str(e),
+            exc_info=True
+        )
+        return jsonify({
+            "success": False,
+            "error": "Failed to fetch risk scores"
+        }), 500
+
+
 @early_warning_bp.route('/api/alert/<int:alert_id>/acknowledge', methods=['POST'])
 @require_login
 @require_role('docente')
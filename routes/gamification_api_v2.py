@@ -11,6 +11,7 @@ from services.database.database_manager import db_manager
 from services.gamification.xp_manager_v2 import xp_manager_v2
 from services.gamification.challenge_manager_v2 import challenge_manager_v2
 from services.gamification.advanced_gamification import RANK_CONFIG, RANK_ORDER
+from services.gamification.leaderboard_engine import leaderboard_engine, PERIOD_COLUMNS
 from shared.error_handling.structured_logger import get_logger
 
 logger = get_logger(__name__)
@@ -215,65 +216,112 @@ def get_badges():
 # LEADERBOARDS
 # =============================================================================
 
+def _leaderboard_scope():
+    """(scuola_id, classe) for ?scope=scuola (default) or ?scope=classe"""
+    school_id, classe = leaderboard_engine.get_user_scope(request.user_id)
+    if request.args.get('scope', 'scuola') != 'classe':
+        classe = None
+    return school_id, classe
+
+
+def _scope_filter(school_id, classe):
+    """SQL filter on utenti (alias ut) for the SQL fallback"""
+    if school_id is None:
+        return '', ()
+    if classe:
+        return 'AND ut.scuola_id = %s AND ut.classe = %s', (school_id, classe)
+    return 'AND ut.scuola_id = %s', (school_id,)
+
+
+def _load_leaderboard_profiles(cursor, user_ids):
+    """Display data for the users of a ZSET page (single IN query)"""
+    if not user_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    cursor.execute(f'''
+        SELECT u.user_id, u.rango, u.avatar_id, u.titolo, ut.nome, ut.cognome
+        FROM user_gamification_v2 u
+        LEFT JOIN utenti ut ON u.user_id = ut.id
+        WHERE u.user_id IN ({placeholders})
+    ''', tuple(user_ids))
+    return {row[0]: row for row in cursor.fetchall()}
+
+
+def _leaderboard_entry(user_id, xp, profile):
+    rango, avatar_id, titolo, nome, cognome = profile[1:] if profile else (None, None, None, None, None)
+    return {
+        'user_id': user_id,
+        'xp': xp,
+        'rango': rango,
+        'avatar_id': avatar_id,
+        'titolo': titolo,
+        'nome': f"{nome or ''} {cognome or ''}".strip() or f"Utente {user_id}",
+        'is_you': user_id == request.user_id
+    }
+
+
 @gamification_api_bp.route('/leaderboard/<tipo>', methods=['GET'])
 @require_auth
 def get_leaderboard(tipo):
     """
     Get leaderboard
     Types: 'giornaliera', 'settimanale', 'mensile', 'stagionale', 'lifetime'
+    Scope: ?scope=scuola (default) or ?scope=classe
     """
     try:
         limit = request.args.get('limit', 50, type=int)
         
-        xp_columns = {
-            'giornaliera': 'xp_giornaliero',
-            'settimanale': 'xp_settimanale',
-            'mensile': 'xp_mensile',
-            'stagionale': 'xp_stagionale',
-            'lifetime': 'xp_lifetime'
-        }
-        
-        xp_col = xp_columns.get(tipo, 'xp_lifetime')
+        period = tipo if tipo in PERIOD_COLUMNS else 'lifetime'
+        xp_col = PERIOD_COLUMNS[period]
+        school_id, classe = _leaderboard_scope()
         
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get leaderboard entries
-            cursor.execute(f'''
-                SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
-                       ut.nome, ut.cognome
-                FROM leaderboards_v2 l
-                JOIN user_gamification_v2 u ON l.user_id = u.user_id
-                LEFT JOIN utenti ut ON l.user_id = ut.id
-                ORDER BY l.{xp_col} DESC
-                LIMIT %s
-            ''', (limit,))
-            
-            leaderboard = []
-            for idx, row in enumerate(cursor.fetchall()):
-                leaderboard.append({
-                    'posizione': idx + 1,
-                    'user_id': row[0],
-                    'xp': row[1],
-                    'rango': row[2],
-                    'avatar_id': row[3],
-                    'titolo': row[4],
-                    'nome': f"{row[5] or ''} {row[6] or ''}".strip() or f"Utente {row[0]}",
-                    'is_you': row[0] == request.user_id
-                })
-            
-            # Get current user's position
-            cursor.execute(f'''
-                SELECT COUNT(*) + 1 FROM leaderboards_v2
-                WHERE {xp_col} > (SELECT {xp_col} FROM leaderboards_v2 WHERE user_id = %s)
-            ''', (request.user_id,))
-            user_position = cursor.fetchone()[0]
-            
-            cursor.execute(f'''
-                SELECT {xp_col} FROM leaderboards_v2 WHERE user_id = %s
-            ''', (request.user_id,))
-            user_xp_row = cursor.fetchone()
-            user_xp = user_xp_row[0] if user_xp_row else 0
+            top = leaderboard_engine.get_top(period, school_id, classe, limit)
+            ranked = leaderboard_engine.get_position(period, school_id, classe, request.user_id)
+            
+            if top is not None and ranked is not None:
+                profiles = _load_leaderboard_profiles(cursor, [user_id for user_id, _ in top])
+                leaderboard = []
+                for user_id, xp in top:
+                    if user_id in profiles:
+                        entry = _leaderboard_entry(user_id, xp, profiles[user_id])
+                        leaderboard.append({'posizione': len(leaderboard) + 1, **entry})
+                user_position, user_xp = ranked
+            else:
+                scope_sql, scope_params = _scope_filter(school_id, classe)
+                
+                # Get leaderboard entries
+                cursor.execute(f'''
+                    SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
+                           ut.nome, ut.cognome
+                    FROM leaderboards_v2 l
+                    JOIN user_gamification_v2 u ON l.user_id = u.user_id
+                    LEFT JOIN utenti ut ON l.user_id = ut.id
+                    WHERE 1 = 1 {scope_sql}
+                    ORDER BY l.{xp_col} DESC
+                    LIMIT %s
+                ''', scope_params + (limit,))
+                
+                leaderboard = []
+                for idx, row in enumerate(cursor.fetchall()):
+                    entry = _leaderboard_entry(row[0], row[1], (row[0],) + tuple(row[2:7]))
+                    leaderboard.append({'posizione': idx + 1, **entry})
+                
+                # Get current user's position
+                cursor.execute(f'''
+                    SELECT {xp_col} FROM leaderboards_v2 WHERE user_id = %s
+                ''', (request.user_id,))
+                user_xp_row = cursor.fetchone()
+                user_xp = user_xp_row[0] if user_xp_row else 0
+                
+                cursor.execute(f'''
+                    SELECT COUNT(*) + 1 FROM leaderboards_v2 l
+                    LEFT JOIN utenti ut ON l.user_id = ut.id
+                    WHERE l.{xp_col} > %s {scope_sql}
+                ''', (user_xp,) + scope_params)
+                user_position = cursor.fetchone()[0]
             
             return jsonify({
                 'tipo': tipo,
@@ -295,121 +343,36 @@ def get_smart_leaderboard():
     try:
         tipo = request.args.get('tipo', 'lifetime')
         
-        xp_columns = {
-            'settimanale': 'xp_settimanale',
-            'mensile': 'xp_mensile',
-            'stagionale': 'xp_stagionale',
-            'lifetime': 'xp_lifetime'
-        }
-        
-        xp_col = xp_columns.get(tipo, 'xp_lifetime')
+        period = tipo if tipo in PERIOD_COLUMNS and tipo != 'giornaliera' else 'lifetime'
+        xp_col = PERIOD_COLUMNS[period]
+        school_id, classe = _leaderboard_scope()
         
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get top 3
-            cursor.execute(f'''
-                SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
-                       ut.nome, ut.cognome
-                FROM leaderboards_v2 l
-                JOIN user_gamification_v2 u ON l.user_id = u.user_id
-                LEFT JOIN utenti ut ON l.user_id = ut.id
-                ORDER BY l.{xp_col} DESC
-                LIMIT 3
-            ''')
-            
-            top3 = []
-            for idx, row in enumerate(cursor.fetchall()):
-                top3.append({
-                    'posizione': idx + 1,
-                    'user_id': row[0],
-                    'xp': row[1],
-                    'rango': row[2],
-                    'avatar_id': row[3],
-                    'titolo': row[4],
-                    'nome': f"{row[5] or ''} {row[6] or ''}".strip() or f"Utente {row[0]}",
-                    'is_you': row[0] == request.user_id
-                })
-            
-            # Get user position
-            cursor.execute(f'''
-                SELECT {xp_col} FROM leaderboards_v2 WHERE user_id = %s
-            ''', (request.user_id,))
-            user_xp_row = cursor.fetchone()
-            user_xp = user_xp_row[0] if user_xp_row else 0
-            
-            cursor.execute(f'''
-                SELECT COUNT(*) + 1 FROM leaderboards_v2
-                WHERE {xp_col} > %s
-            ''', (user_xp,))
-            user_position = cursor.fetchone()[0]
-            
-            # Get 2 above and 2 below
-            cursor.execute(f'''
-                SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
-                       ut.nome, ut.cognome
-                FROM leaderboards_v2 l
-                JOIN user_gamification_v2 u ON l.user_id = u.user_id
-                LEFT JOIN utenti ut ON l.user_id = ut.id
-                WHERE l.{xp_col} > %s
-                ORDER BY l.{xp_col} ASC
-                LIMIT 2
-            ''', (user_xp,))
-            above = list(cursor.fetchall())
-            
-            cursor.execute(f'''
-                SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
-                       ut.nome, ut.cognome
-                FROM leaderboards_v2 l
-                JOIN user_gamification_v2 u ON l.user_id = u.user_id
-                LEFT JOIN utenti ut ON l.user_id = ut.id
-                WHERE l.{xp_col} < %s
-                ORDER BY l.{xp_col} DESC
-                LIMIT 2
-            ''', (user_xp,))
-            below = list(cursor.fetchall())
-            
-            nearby = []
-            for row in reversed(above):
-                nearby.append({
-                    'user_id': row[0],
-                    'xp': row[1],
-                    'rango': row[2],
-                    'avatar_id': row[3],
-                    'titolo': row[4],
-                    'nome': f"{row[5] or ''} {row[6] or ''}".strip() or f"Utente {row[0]}",
-                    'is_you': False
-                })
-            
-            # Add current user
-            cursor.execute('''
-                SELECT u.avatar_id, u.titolo, ut.nome, ut.cognome, u.rango
-                FROM user_gamification_v2 u
-                LEFT JOIN utenti ut ON u.user_id = ut.id
-                WHERE u.user_id = %s
-            ''', (request.user_id,))
-            user_row = cursor.fetchone()
-            if user_row:
-                nearby.append({
-                    'user_id': request.user_id,
-                    'xp': user_xp,
-                    'rango': user_row[4],
-                    'avatar_id': user_row[0],
-                    'titolo': user_row[1],
-                    'nome': f"{user_row[2] or ''} {user_row[3] or ''}".strip() or f"Utente {request.user_id}",
-                    'is_you': True
-                })
-            
-            for row in below:
-                nearby.append({
-                    'user_id': row[0],
-                    'xp': row[1],
-                    'rango': row[2],
-                    'avatar_id': row[3],
-                    'titolo': row[4],
-                    'nome': f"{row[5] or ''} {row[6] or ''}".strip() or f"Utente {row[0]}",
-                    'is_you': False
-                })
+            top = leaderboard_engine.get_top(period, school_id, classe, 3)
+            ranked = leaderboard_engine.get_position(period, school_id, classe, request.user_id)
+            near = leaderboard_engine.get_nearby(period, school_id, classe, ranked[1]) if ranked else None
+            
+            if top is not None and ranked is not None and near is not None:
+                user_position, user_xp = ranked
+                above, below = near
+                user_ids = [user_id for user_id, _ in top + above + below] + [request.user_id]
+                profiles = _load_leaderboard_profiles(cursor, user_ids)
+                
+                top3 = [
+                    {'posizione': idx + 1, **_leaderboard_entry(user_id, xp, profiles.get(user_id))}
+                    for idx, (user_id, xp) in enumerate(top)
+                ]
+                
+                nearby = [_leaderboard_entry(user_id, xp, profiles.get(user_id)) for user_id, xp in reversed(above)]
+                if request.user_id in profiles:
+                    nearby.append(_leaderboard_entry(request.user_id, user_xp, profiles[request.user_id]))
+                nearby.extend(_leaderboard_entry(user_id, xp, profiles.get(user_id)) for user_id, xp in below)
+            else:
+                top3, nearby, user_position, user_xp = _smart_leaderboard_sql(
+                    cursor, xp_col, school_id, classe
+                )
             
             return jsonify({
                 'tipo': tipo,
@@ -424,6 +387,84 @@ def get_smart_leaderboard():
         return jsonify({'error': str(e)}), 500
 
 
+def _smart_leaderboard_sql(cursor, xp_col, school_id, classe):
+    """SQL fallback for the smart leaderboard (Redis unavailable or rebuilding)"""
+    scope_sql, scope_params = _scope_filter(school_id, classe)
+    
+    # Get top 3
+    cursor.execute(f'''
+        SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
+               ut.nome, ut.cognome
+        FROM leaderboards_v2 l
+        JOIN user_gamification_v2 u ON l.user_id = u.user_id
+        LEFT JOIN utenti ut ON l.user_id = ut.id
+        WHERE 1 = 1 {scope_sql}
+        ORDER BY l.{xp_col} DESC
+        LIMIT 3
+    ''', scope_params)
+    
+    top3 = []
+    for idx, row in enumerate(cursor.fetchall()):
+        entry = _leaderboard_entry(row[0], row[1], (row[0],) + tuple(row[2:7]))
+        top3.append({'posizione': idx + 1, **entry})
+    
+    # Get user position
+    cursor.execute(f'''
+        SELECT {xp_col} FROM leaderboards_v2 WHERE user_id = %s
+    ''', (request.user_id,))
+    user_xp_row = cursor.fetchone()
+    user_xp = user_xp_row[0] if user_xp_row else 0
+    
+    cursor.execute(f'''
+        SELECT COUNT(*) + 1 FROM leaderboards_v2 l
+        LEFT JOIN utenti ut ON l.user_id = ut.id
+        WHERE l.{xp_col} > %s {scope_sql}
+    ''', (user_xp,) + scope_params)
+    user_position = cursor.fetchone()[0]
+    
+    # Get 2 above and 2 below
+    cursor.execute(f'''
+        SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
+               ut.nome, ut.cognome
+        FROM leaderboards_v2 l
+        JOIN user_gamification_v2 u ON l.user_id = u.user_id
+        LEFT JOIN utenti ut ON l.user_id = ut.id
+        WHERE l.{xp_col} > %s {scope_sql}
+        ORDER BY l.{xp_col} ASC
+        LIMIT 2
+    ''', (user_xp,) + scope_params)
+    above = list(cursor.fetchall())
+    
+    cursor.execute(f'''
+        SELECT l.user_id, l.{xp_col}, u.rango, u.avatar_id, u.titolo,
+               ut.nome, ut.cognome
+        FROM leaderboards_v2 l
+        JOIN user_gamification_v2 u ON l.user_id = u.user_id
+        LEFT JOIN utenti ut ON l.user_id = ut.id
+        WHERE l.{xp_col} < %s {scope_sql}
+        ORDER BY l.{xp_col} DESC
+        LIMIT 2
+    ''', (user_xp,) + scope_params)
+    below = list(cursor.fetchall())
+    
+    nearby = [
+        _leaderboard_entry(row[0], row[1], (row[0],) + tuple(row[2:7]))
+        for row in reversed(above)
+    ]
+    
+    # Add current user
+    profile = _load_leaderboard_profiles(cursor, [request.user_id]).get(request.user_id)
+    if profile:
+        nearby.append(_leaderboard_entry(request.user_id, user_xp, profile))
+    
+    nearby.extend(
+        _leaderboard_entry(row[0], row[1], (row[0],) + tuple(row[2:7]))
+        for row in below
+    )
+    
+    return top3, nearby, user_position, user_xp
+
+
 # =============================================================================
 # KUDOS (Peer Recognition)
 # =============================================================================
@@ -3,8 +3,10 @@ SKAJLA - Messaging API Routes
 API endpoints per sistema messaggistica
 """
 
-from flask import Blueprint, jsonify, session
+from flask import Blueprint, jsonify, request, session
 from database_manager import db_manager
+from services.messaging.message_history import get_chat_history, page_cursors
+from services.tenant_guard import verify_chat_membership
 
 messaging_api_bp = Blueprint('messaging_api', __name__, url_prefix='/api')
 
@@ -16,31 +18,23 @@ def get_chat_messages(chat_id):
         return jsonify({'error': 'Non autenticato'}), 401
     
     # Verifica che l'utente sia membro della chat
-    is_member = db_manager.query('''
-        SELECT 1 FROM partecipanti_chat 
-        WHERE chat_id = %s AND utente_id = %s
-    ''', (chat_id, session['user_id']), one=True)
+    is_member = verify_chat_membership(chat_id, session['user_id'])
     
     if not is_member:
         return jsonify({'error': 'Non autorizzato'}), 403
     
-    # Carica ultimi 100 messaggi
-    messages = db_manager.query('''
-        SELECT m.*, u.nome, u.cognome, u.username, u.ruolo
-        FROM messaggi m
-        JOIN utenti u ON m.utente_id = u.id
-        WHERE m.chat_id = %s
-        ORDER BY m.timestamp DESC
-        LIMIT 100
-    ''', (chat_id,)) or []
-    
-    # Reverse per mostrare dal più vecchio al più recente
-    messages.reverse()
+    # Paginazione keyset: ?before_id= (messaggi precedenti), ?after_id= (nuovi)
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', 100, type=int)
+
+    page = get_chat_history(chat_id, before_id=before_id, after_id=after_id, limit=limit)
     
     return jsonify({
         'success': True,
-        'messages': messages,
-        'chat_id': chat_id
+        'messages': page['messages'],
+        'chat_id': chat_id,
+        **page_cursors(page)
     })
 
 
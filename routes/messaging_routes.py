@@ -5,7 +5,9 @@ Sistema messaggistica granulare: 1-to-1, gruppi materia, chat classe
 
 from flask import Blueprint, render_template, session, redirect, request, jsonify
 from database_manager import db_manager
-from services.tenant_guard import get_current_school_id
+from services.messaging.chat_summary import SUMMARY_COLUMNS, SUMMARY_JOINS, chat_summary
+from services.messaging.message_history import get_chat_history, history_buffer, page_cursors
+from services.tenant_guard import get_current_school_id, verify_chat_membership
 from gamification import gamification_system
 from shared.middleware.auth import require_login
 
@@ -18,49 +20,41 @@ def chat_hub():
     user_id = session['user_id']
     school_id = get_current_school_id()
     
+    # Contatori da chat_summary/chat_letture: nessuna aggregazione su messaggi
     # Chat classe (ordinata per ultimo messaggio)
-    chat_classe = db_manager.query('''
-        SELECT c.*, 
-               COUNT(DISTINCT m.id) as message_count,
-               MAX(m.timestamp) as ultimo_messaggio
+    chat_classe = db_manager.query(f'''
+        SELECT c.*, {SUMMARY_COLUMNS}
         FROM chat c
-        LEFT JOIN messaggi m ON c.id = m.chat_id
+        {SUMMARY_JOINS}
         WHERE c.scuola_id = %s AND c.classe = %s AND c.tipo = 'classe'
-        GROUP BY c.id
         ORDER BY ultimo_messaggio DESC NULLS LAST
-    ''', (school_id, session.get('classe', '')))
+    ''', (user_id, school_id, session.get('classe', '')))
     
     # Gruppi materia (chat per materia, ordinata per ultimo messaggio - più recente in cima)
-    gruppi_materia = db_manager.query('''
-        SELECT DISTINCT ON (c.id) c.*, 
-               COUNT(DISTINCT m.id) as message_count,
-               MAX(m.timestamp) as ultimo_messaggio
+    gruppi_materia = db_manager.query(f'''
+        SELECT c.*, {SUMMARY_COLUMNS}
         FROM chat c
-        LEFT JOIN messaggi m ON c.id = m.chat_id
         JOIN partecipanti_chat pc ON c.id = pc.chat_id
+        {SUMMARY_JOINS}
         WHERE c.scuola_id = %s AND c.tipo = 'materia' AND pc.utente_id = %s
-        GROUP BY c.id
-        ORDER BY c.id, ultimo_messaggio DESC NULLS LAST
-    ''', (school_id, user_id))
+        ORDER BY ultimo_messaggio DESC NULLS LAST
+    ''', (user_id, school_id, user_id))
     
     # Conversazioni 1-to-1 (ordinate per ultimo messaggio)
-    conversazioni_private = db_manager.query('''
+    conversazioni_private = db_manager.query(f'''
         SELECT c.*, 
                u.nome, 
                u.cognome, 
                u.ruolo,
-               COUNT(DISTINCT m.id) as message_count,
-               MAX(m.timestamp) as ultimo_messaggio
+               {SUMMARY_COLUMNS}
         FROM chat c
-        JOIN partecipanti_chat pc ON c.id = pc.chat_id
+        JOIN partecipanti_chat me ON c.id = me.chat_id AND me.utente_id = %s
+        JOIN partecipanti_chat pc ON c.id = pc.chat_id AND pc.utente_id != %s
         JOIN utenti u ON pc.utente_id = u.id
-        LEFT JOIN messaggi m ON c.id = m.chat_id
-        WHERE c.scuola_id = %s AND c.tipo = 'privata' 
-        AND c.id IN (SELECT chat_id FROM partecipanti_chat WHERE utente_id = %s)
-        AND u.id != %s
-        GROUP BY c.id, u.id, u.nome, u.cognome, u.ruolo
+        {SUMMARY_JOINS}
+        WHERE c.scuola_id = %s AND c.tipo = 'privata'
         ORDER BY ultimo_messaggio DESC NULLS LAST
-    ''', (school_id, user_id, user_id))
+    ''', (user_id, user_id, user_id, school_id))
     
     # 🚀 GRUPPI ISTANTANEI - Nuova sezione
     # Miei gruppi istantanei
@@ -227,10 +221,7 @@ def chat_room(chat_id):
     school_id = get_current_school_id()
     
     # Verifica accesso
-    is_participant = db_manager.query('''
-        SELECT 1 FROM partecipanti_chat
-        WHERE chat_id = %s AND utente_id = %s
-    ''', (chat_id, user_id), one=True)
+    is_participant = verify_chat_membership(chat_id, user_id)
     
     # O è admin/professore della scuola
     is_authorized = is_participant or session.get('ruolo') in ['admin', 'professore']
@@ -413,6 +404,9 @@ def send_message():
         message_id = cursor.fetchone()[0]
         conn.commit()
     
+    # Riga non disponibile nel formato del buffer: gli altri lettori ricaricano
+    history_buffer.record_message(chat_id, message_id)
+    chat_summary.record_message(chat_id, user_id, message_id, content)
 
     # Award XP per partecipazione
     gamification_system.award_xp(user_id, 'message_sent', 5)
@@ -429,29 +423,31 @@ def get_chat_messages(chat_id):
     user_id = session['user_id']
     school_id = get_current_school_id()
     
-    is_participant = db_manager.query('''
-        SELECT 1 FROM partecipanti_chat
-        WHERE chat_id = %s AND utente_id = %s
-    ''', (chat_id, user_id), one=True)
+    is_participant = verify_chat_membership(chat_id, user_id)
     
     is_authorized = is_participant or session.get('ruolo') in ['admin', 'professore', 'dirigente']
     
     if not is_authorized:
         return jsonify({'success': False, 'error': 'Non autorizzato'}), 403
     
-    messages = db_manager.query('''
-        SELECT m.id, m.contenuto, m.timestamp, m.utente_id as mittente_id,
-               u.nome || ' ' || u.cognome as mittente_nome
-        FROM messaggi m
-        JOIN utenti u ON m.utente_id = u.id
-        WHERE m.chat_id = %s
-        ORDER BY m.timestamp ASC
-        LIMIT 200
-    ''', (chat_id,))
+    page = get_chat_history(
+        chat_id,
+        before_id=request.args.get('before_id', type=int),
+        after_id=request.args.get('after_id', type=int),
+        limit=request.args.get('limit', history_buffer.capacity, type=int)
+    )
+    messages = [{
+        'id': m['id'],
+        'contenuto': m['contenuto'],
+        'timestamp': m['timestamp'],
+        'mittente_id': m['utente_id'],
+        'mittente_nome': f"{m['nome']} {m['cognome']}"
+    } for m in page['messages']]
     
     return jsonify({
         'success': True,
-        'messages': messages or []
+        'messages': messages,
+        **page_cursors(page)
     })
 
 
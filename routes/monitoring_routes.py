@@ -145,6 +145,27 @@ def metrics_endpoint():
         "skaila_environment_production": 1 if env_manager.is_production() else 0,
         "skaila_ai_enabled": 1 if env_manager.get_ai_status()['mode'] == 'live' else 0
     }
+
+    # Pool metrics: attese di checkout e validazioni (SELECT 1 solo dopo idle)
+    pool_stats = db_manager.pool_stats
+    app_metrics.update({
+        "skaila_db_pool_checkouts_total": pool_stats['checkouts'],
+        "skaila_db_pool_checkout_wait_avg_ms": pool_stats['checkout_wait_avg_ms'],
+        "skaila_db_pool_checkout_wait_max_ms": pool_stats['checkout_wait_max_ms'],
+        "skaila_db_pool_validations_total": pool_stats['validations'],
+        "skaila_db_pool_validations_skipped_total": pool_stats['validations_skipped'],
+        "skaila_db_pool_validation_failures_total": pool_stats['validation_failures'],
+        "skaila_db_pool_recycled_total": pool_stats['recycled_max_lifetime'],
+    })
+    
+    # Latenza emit Socket.IO per tipo di stanza (chat, school, user, class)
+    from services.messaging.socket_metrics import socket_emit_metrics
+    emit_stats = socket_emit_metrics.get_stats(top_rooms=0)
+    app_metrics["skaila_socketio_message_queue"] = 1 if socket_emit_metrics.message_queue else 0
+    for kind, stats in emit_stats['by_kind'].items():
+        app_metrics[f"skaila_socketio_emit_{kind}_total"] = stats['count']
+        app_metrics[f"skaila_socketio_emit_{kind}_latency_avg_ms"] = stats['avg_ms']
+        app_metrics[f"skaila_socketio_emit_{kind}_latency_max_ms"] = stats['max_ms']
     
     # Formato Prometheus
     output = []
@@ -182,6 +203,28 @@ def metrics_json():
     except Exception as e:
         db_info["status"] = f"error: {str(e)}"
         db_info["response_time_ms"] = -1
+
+    db_info["pool"] = db_manager.pool_stats
+
+    # Telemetry pipeline (solo se l'engine è già stato inizializzato)
+    from services.telemetry.telemetry_engine import telemetry_engine
+    telemetry_info = telemetry_engine.pipeline.get_stats() if telemetry_engine._initialized else None
+
+    from services.messaging.membership_cache import membership_cache
+    from services.gamification.xp_accumulator import xp_accumulator
+    from services.gamification.badge_rule_index import badge_rule_index
+    from services.gamification.leaderboard_engine import leaderboard_engine
+    from services.messaging.socket_metrics import socket_emit_metrics
+    from services.messaging.message_history import history_buffer
+    from services.messaging.read_receipts import read_receipts
+    from services.dashboard.student_read_model import student_dashboard
+    from services.analytics.school_bi_snapshot import school_bi_snapshot
+    from services.school.feature_flag_cache import feature_flag_cache
+    from services.security.login_audit import login_audit
+    from services.security.password_hasher import password_hasher
+    from services.ai.response_cache import ai_response_tier
+    from services.ai.semantic_cache import semantic_cache_index
+    from services.ai.llm_limiter import gemini_limiter
     
     # Environment info
     env_info = env_manager.get_system_status()
@@ -213,6 +256,22 @@ def metrics_json():
             }
         },
         "database": db_info,
+        "telemetry_pipeline": telemetry_info,
+        "membership_cache": membership_cache.get_stats(),
+        "xp_accumulator": xp_accumulator.get_stats(),
+        "badge_rule_index": badge_rule_index.get_stats(),
+        "leaderboard_engine": leaderboard_engine.get_stats(),
+        "socketio_emits": socket_emit_metrics.get_stats(),
+        "chat_history_buffer": history_buffer.get_stats(),
+        "read_receipts": read_receipts.get_stats(),
+        "student_dashboard": student_dashboard.get_stats(),
+        "bi_snapshot": school_bi_snapshot.get_stats(),
+        "feature_flags": feature_flag_cache.get_stats(),
+        "login_audit": login_audit.get_stats(),
+        "password_hasher": password_hasher.get_stats(),
+        "ai_response_cache": ai_response_tier.get_stats(),
+        "ai_semantic_cache": semantic_cache_index.get_stats(),
+        "gemini_limiter": gemini_limiter.get_stats(),
         "environment": env_info,
         "application": {
             "name": "SKAJLA",
@@ -7,12 +7,21 @@ Eventi real-time per chat, notifiche e presenza avanzata (Redis-Optimized)
 import time
 from datetime import datetime
 from flask_socketio import emit, join_room, leave_room
-from flask import session
+from flask import request, session
 from database_manager import db_manager
 from gamification import gamification_system
-from services.tenant_guard import verify_chat_belongs_to_school, get_current_school_id, TenantGuardException
+from services.tenant_guard import (
+    verify_chat_belongs_to_school, verify_chat_membership, get_current_school_id, TenantGuardException
+)
 from ai_chatbot import ai_bot
+from services.ai.gemini_chatbot import gemini_chatbot
+from shared.error_handling.exceptions import AIOverloadedError
+from shared.middleware.feature_guard import check_feature_enabled, Features
 from services.redis_service import redis_manager
+from services.messaging.chat_summary import chat_summary
+from services.messaging.message_history import history_buffer
+from services.messaging.read_receipts import read_receipts
+from services.messaging.socket_metrics import emit_room
 
 def register_socket_events(socketio):
     """Registra tutti gli eventi Socket.IO"""
@@ -31,7 +40,7 @@ def register_socket_events(socketio):
                 redis_manager.set_presence(session['user_id'], True, school_id)
 
                 # Emit solo alla scuola dell'utente
-                emit('user_connected', {
+                emit_room('user_connected', {
                     'user_id': session['user_id'],
                     'nome': session['nome'],
                     'cognome': session['cognome'],
@@ -51,7 +60,7 @@ def register_socket_events(socketio):
                 # REDIS OPTIMIZATION: Set presence offline
                 redis_manager.set_presence(session['user_id'], False, school_id)
 
-                emit('user_disconnected', {
+                emit_room('user_disconnected', {
                     'user_id': session['user_id'],
                     'nome': session['nome'],
                     'cognome': session['cognome']
@@ -100,10 +109,7 @@ def register_socket_events(socketio):
             emit('error', {'message': 'Errore di autenticazione scuola'})
             return
 
-        is_member = db_manager.query('''
-            SELECT 1 FROM partecipanti_chat 
-            WHERE chat_id = %s AND utente_id = %s
-        ''', (conversation_id, session['user_id']), one=True)
+        is_member = verify_chat_membership(conversation_id, session['user_id'])
 
         if not is_member:
             emit('error', {'message': 'Non autorizzato ad accedere a questa chat'})
@@ -143,43 +149,48 @@ def register_socket_events(socketio):
             emit('error', {'message': 'Messaggio vuoto'})
             return
 
-        try:
-            school_id = get_current_school_id()
-            if not verify_chat_belongs_to_school(conversation_id, school_id):
-                emit('error', {'message': 'Chat non appartiene alla tua scuola'})
+        # Unit of work: tenant check, membership, INSERT e SELECT su una sola
+        # connessione con un solo commit
+        with db_manager.unit_of_work():
+            try:
+                school_id = get_current_school_id()
+                if not verify_chat_belongs_to_school(conversation_id, school_id):
+                    emit('error', {'message': 'Chat non appartiene alla tua scuola'})
+                    return
+            except TenantGuardException:
+                emit('error', {'message': 'Errore di autenticazione scuola'})
                 return
-        except TenantGuardException:
-            emit('error', {'message': 'Errore di autenticazione scuola'})
-            return
 
-        is_member = db_manager.query('''
-            SELECT 1 FROM partecipanti_chat 
-            WHERE chat_id = %s AND utente_id = %s
-        ''', (conversation_id, session['user_id']), one=True)
+            is_member = verify_chat_membership(conversation_id, session['user_id'])
 
-        if not is_member:
-            emit('error', {'message': 'Non autorizzato a inviare messaggi in questa chat'})
-            return
+            if not is_member:
+                emit('error', {'message': 'Non autorizzato a inviare messaggi in questa chat'})
+                return
 
-        with db_manager.get_connection() as conn:
-            cursor = conn.execute('''
+            cursor = db_manager.execute('''
                 INSERT INTO messaggi (chat_id, utente_id, contenuto, tipo, file_allegato, timestamp)
                 VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
             ''', (conversation_id, user_id, contenuto, msg_type, attachment_url))
 
             message_id = cursor.lastrowid
 
-            messaggio = conn.execute('''
+            messaggio = db_manager.query('''
                 SELECT m.*, u.nome, u.cognome, u.username, u.ruolo,
                        m.timestamp as data_invio
                 FROM messaggi m
                 JOIN utenti u ON m.utente_id = u.id
                 WHERE m.id = %s
-            ''', (message_id,)).fetchone()
+            ''', (message_id,), one=True)
+
+        # Write-through nel ring buffer dopo il commit della unit of work
+        history_buffer.record_message(conversation_id, message_id, dict(messaggio))
+        chat_summary.record_message(conversation_id, user_id, message_id, contenuto, msg_type)
 
+        # XP fuori dalla unit of work: un errore di gamification non deve
+        # annullare l'invio del messaggio
         gamification_system.award_xp(session['user_id'], 'message_sent', multiplier=1.0, context="Messaggio in chat")
 
-        emit('new_message', dict(messaggio), to=f"chat_{conversation_id}")
+        emit_room('new_message', dict(messaggio), to=f"chat_{conversation_id}")
 
     @socketio.on('typing_start')
     def handle_typing_start(data):
@@ -188,7 +199,7 @@ def register_socket_events(socketio):
         if not conversation_id: return
         
         # Room based broadcast is enough security check if client joined room legitimately
-        emit('user_typing', {
+        emit_room('user_typing', {
             'conversation_id': conversation_id,
             'user_name': session['nome'],
             'typing': True
@@ -200,7 +211,7 @@ def register_socket_events(socketio):
         conversation_id = data.get('conversation_id')
         if not conversation_id: return
         
-        emit('user_typing', {
+        emit_room('user_typing', {
             'conversation_id': conversation_id,
             'user_name': session['nome'],
             'typing': False
@@ -245,6 +256,83 @@ def register_socket_events(socketio):
                 'message': 'Errore durante la generazione della risposta. Riprova.'
             })
 
+    @socketio.on('ai_stream_message')
+    def handle_ai_stream_message(data):
+        """SKAJLA Coach in streaming: i chunk arrivano nella stanza dell'utente man mano che Gemini li genera"""
+        if 'user_id' not in session:
+            emit('ai_error', {'message': 'Non autorizzato'})
+            return
+        
+        data = data or {}
+        message = data.get('message', '').strip()
+        request_id = data.get('request_id')
+        if not message:
+            emit('ai_error', {'message': 'Messaggio vuoto', 'request_id': request_id})
+            return
+        
+        user_id = session['user_id']
+        room = f"user_{user_id}"
+        
+        try:
+            if not check_feature_enabled(get_current_school_id(), Features.AI_COACH):
+                emit('ai_error', {
+                    'message': 'AI Coach non è disponibile per la tua scuola.',
+                    'request_id': request_id
+                })
+                return
+        except TenantGuardException:
+            emit('ai_error', {'message': 'Non autorizzato', 'request_id': request_id})
+            return
+        
+        emit_room('ai_stream_start', {'request_id': request_id, 'timestamp': time.time()}, to=room)
+        
+        sid = request.sid
+        
+        def push_chunk(text):
+            # Client disconnesso: lo stream si interrompe (niente token sprecati, niente XP)
+            if not socketio.server.manager.is_connected(sid, '/'):
+                raise ConnectionAbortedError('client disconnected')
+            emit_room('ai_stream_chunk', {'request_id': request_id, 'text': text}, to=room)
+        
+        try:
+            result = gemini_chatbot.stream_response(
+                message=message,
+                user_id=user_id,
+                user_name=session.get('nome', 'Studente'),
+                on_chunk=push_chunk
+            )
+        except AIOverloadedError as e:
+            emit_room('ai_stream_error', {
+                'request_id': request_id,
+                'message': e.display_message,
+                'retry_after': e.retry_after
+            }, to=room)
+            return
+        except Exception as e:
+            print(f"Errore AI stream: {e}")
+            emit_room('ai_stream_error', {
+                'request_id': request_id,
+                'message': 'Errore durante la generazione della risposta. Riprova.'
+            }, to=room)
+            return
+        
+        emit_room('ai_stream_end', {
+            'request_id': request_id,
+            'response': result['response'],
+            'ai_mode': result['ai_mode'],
+            'complete': result['complete'],
+            'timestamp': time.time()
+        }, to=room)
+        
+        # XP solo a stream completato: niente punti per risposte interrotte, e le
+        # scritture di gamification non ritardano la risposta
+        try:
+            reward = gemini_chatbot.award_stream(user_id, message, result)
+            if reward is not None:
+                emit_room('ai_xp_update', {'request_id': request_id, **reward}, to=room)
+        except Exception as e:
+            print(f"Errore XP AI stream: {e}")
+
     # ========== HEARTBEAT / PING-PONG ==========
     
     @socketio.on('heartbeat')
@@ -280,25 +368,22 @@ def register_socket_events(socketio):
         if not conversation_id: return
         
         user_id = session['user_id']
+
+        if not verify_chat_membership(conversation_id, user_id): return
         
         # Async notification (Optimistic UI)
-        emit('messages_read', {
+        emit_room('messages_read', {
             'conversation_id': conversation_id,
             'reader_id': user_id,
             'reader_name': session.get('nome', '')
         }, to=f"chat_{conversation_id}", include_self=False)
 
-        # Background DB update could be moved to Celery task in future
+        # Scrittura asincrona a batch: il flusher coalesce le ricevute per (chat, utente)
         if message_ids:
-            for msg_id in message_ids:
-                db_manager.execute('''
-                    INSERT INTO messaggi_letti (messaggio_id, utente_id, letto_at)
-                    VALUES (%s, %s, NOW())
-                    ON CONFLICT (messaggio_id, utente_id) DO NOTHING
-                ''', (msg_id, user_id))
+            read_receipts.submit(conversation_id, user_id, message_ids)
         else:
-             # Mark all as read
-             pass # Complex query omitted for brevity in optimized version
+            # Mark all as read
+            read_receipts.submit_all(conversation_id, user_id)
 
     # ========== NOTIFICATIONS SYSTEM ==========
     
@@ -319,13 +404,13 @@ def register_socket_events(socketio):
         }
         
         if target_type == 'user':
-            emit('notification', notification_data, to=f"user_{target_id}")
+            emit_room('notification', notification_data, to=f"user_{target_id}")
         elif target_type == 'class':
-            emit('notification', notification_data, to=f"class_{target_id}")
+            emit_room('notification', notification_data, to=f"class_{target_id}")
         elif target_type == 'school':
             try:
                  school_id = get_current_school_id()
-                 emit('notification', notification_data, to=f"school_{school_id}")
+                 emit_room('notification', notification_data, to=f"school_{school_id}")
             except: pass
 
     @socketio.on('broadcast_announcement')
@@ -432,15 +517,12 @@ def register_socket_events(socketio):
         except TenantGuardException:
             return
         
-        is_member = db_manager.query('''
-            SELECT 1 FROM partecipanti_chat 
-            WHERE chat_id = %s AND utente_id = %s
-        ''', (conversation_id, session['user_id']), one=True)
+        is_member = verify_chat_membership(conversation_id, session['user_id'])
         
         if not is_member:
             return
         
-        emit('message_delivered', {
+        emit_room('message_delivered', {
             'message_id': message_id,
             'receiver_id': session['user_id'],
             'delivered_at': time.time()
@@ -4,6 +4,8 @@ Handles behavioral telemetry tracking and early warning system
 Part of Feature #1: Smart AI-Tutoring & Early-Warning Engine
 """
 
+import math
+
 from flask import Blueprint, request, jsonify, session, render_template
 from services.telemetry.telemetry_engine import telemetry_engine
 from services.database.database_manager import db_manager
@@ -14,6 +16,10 @@ logger = get_logger(__name__)
 
 telemetry_bp = Blueprint('telemetry', __name__, url_prefix='/api/telemetry')
 
+# Limiti delle colonne di behavioral_telemetry
+MAX_EVENT_TYPE_LENGTH = 50  # event_type VARCHAR(50)
+MAX_DURATION_SECONDS = 2147483647  # duration_seconds INTEGER
+
 
 def _validate_user_exists(user_id: int) -> bool:
     """Check if user exists in database to prevent ForeignKey violations"""
@@ -80,8 +86,11 @@ def track_single_event():
         if context is None:
             return jsonify({"success": False, "error": "Invalid context data"}), 400
         
-        duration = context.get('duration_seconds')
-        accuracy = context.get('accuracy')
+        error, duration, accuracy = _coerce_event_fields(
+            event_type, context.get('duration_seconds'), context.get('accuracy')
+        )
+        if error:
+            return jsonify({"success": False, "error": error}), 400
         
         context['session_id'] = session.get('telemetry_session_id')
         context['device_type'] = _get_device_type(request.user_agent.string)
@@ -205,8 +214,18 @@ def track_batch_events():
                     })
                     continue
                 
-                duration = event_data.get('duration_seconds') or context.get('duration_seconds')
-                accuracy = event_data.get('accuracy_score') or context.get('accuracy')
+                error, duration, accuracy = _coerce_event_fields(
+                    event_type,
+                    event_data.get('duration_seconds') or context.get('duration_seconds'),
+                    event_data.get('accuracy_score') or context.get('accuracy')
+                )
+                if error:
+                    failed_events.append({
+                        "client_event_id": client_event_id,
+                        "reason": error,
+                        "event_type": str(event_type)[:MAX_EVENT_TYPE_LENGTH]
+                    })
+                    continue
                 
                 context['session_id'] = session.get('telemetry_session_id')
                 context['device_type'] = _get_device_type(request.user_agent.string)
@@ -353,6 +372,43 @@ def start_session():
         }), 500
 
 
+def _coerce_event_fields(event_type, duration, accuracy):
+    """
+    Validate and cast event fields before enqueue.
+    The async pipeline acknowledges the event before writing it, so any
+    value the database would reject must be refused here.
+    Returns (error_reason, duration, accuracy); error_reason is None if valid.
+    """
+    if not isinstance(event_type, str) or len(event_type) > MAX_EVENT_TYPE_LENGTH:
+        return 'invalid_event_type', None, None
+    
+    try:
+        if duration is None or duration == '':
+            duration = None
+        elif isinstance(duration, bool):
+            raise ValueError('boolean duration')
+        else:
+            duration = int(float(duration))
+            if not 0 <= duration <= MAX_DURATION_SECONDS:
+                raise ValueError('duration out of range')
+    except (TypeError, ValueError, OverflowError):
+        return 'invalid_duration', None, None
+    
+    try:
+        if accuracy is None or accuracy == '':
+            accuracy = None
+        elif isinstance(accuracy, bool):
+            raise ValueError('boolean accuracy')
+        else:
+            accuracy = round(float(accuracy), 2)
+            if not math.isfinite(accuracy) or not 0 <= accuracy <= 100:
+                raise ValueError('accuracy out of range')
+    except (TypeError, ValueError):
+        return 'invalid_accuracy', None, None
+    
+    return None, duration, accuracy
+
+
 def _validate_and_sanitize_context(context: dict, user_id: int) -> dict:
     """
     Validate and sanitize context data to prevent JSONB bloat
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Precalcola i punteggi di rischio degli studenti (student_risk_scores).
+Normalmente eseguito ogni notte dal report scheduler; utile dopo import
+massivi di voti/presenze o per popolare la tabella al primo deploy.
+
+Uso:
+    python scripts/precompute_risk_scores.py          # tutte le scuole attive
+    python scripts/precompute_risk_scores.py 3 7      # solo queste scuole
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.ai.risk_engine import risk_engine
+
+
+def precompute(school_ids=None):
+    print("🔧 Precalcolo punteggi di rischio...")
+    if school_ids:
+        risk_engine.init_schema()
+        students = sum(risk_engine.precompute_school(school_id) for school_id in school_ids)
+        print(f"✅ Rischio calcolato per {students} studenti in {len(school_ids)} scuole")
+        return students
+    summary = risk_engine.precompute_all()
+    print(f"✅ Rischio calcolato per {summary['students']} studenti in {summary['schools']} scuole "
+          f"({summary['failed']} errori)")
+    return summary['students']
+
+
+if __name__ == "__main__":
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    precompute(ids)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Ricostruisce i contatori dell'hub messaggistica (chat_summary) da messaggi.
+Da eseguire se i contatori risultano disallineati (es. errori durante l'invio).
+
+Uso:
+    python scripts/rebuild_chat_summaries.py            # tutte le chat
+    python scripts/rebuild_chat_summaries.py 12 34 56   # solo queste chat
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.messaging.chat_summary import chat_summary
+
+
+def rebuild_summaries(chat_ids=None):
+    print("🔧 Ricostruzione contatori chat...")
+    rebuilt = chat_summary.rebuild(chat_ids)
+    print(f"✅ Contatori ricostruiti per {rebuilt} chat")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    rebuild_summaries(ids)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Ricostruisce i contatori early-warning (ultimi 7 giorni) da behavioral_telemetry.
+Da eseguire dopo un riavvio senza Redis o dopo un flush di Redis.
+
+Uso:
+    python scripts/rebuild_early_warning_counters.py            # tutti gli utenti
+    python scripts/rebuild_early_warning_counters.py 12 34 56   # solo questi utenti
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.telemetry.telemetry_engine import telemetry_engine
+
+
+def rebuild_counters(user_ids=None):
+    print("🔧 Ricostruzione contatori early-warning...")
+    rebuilt = telemetry_engine.early_warning.rebuild_from_history(user_ids)
+    stats = telemetry_engine.early_warning.get_stats()
+    print(f"✅ Contatori ricostruiti per {rebuilt} utenti (backend: {stats['backend']})")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    rebuild_counters(ids)
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Ricostruisce le classifiche Redis (ZSET per scuola e classe) da leaderboards_v2.
+Da eseguire dopo un flush di Redis, uno spostamento di classi o una migrazione.
+
+Uso:
+    python scripts/rebuild_leaderboards.py          # tutte le scuole
+    python scripts/rebuild_leaderboards.py 3 7      # solo queste scuole
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.gamification.leaderboard_engine import leaderboard_engine
+
+
+def rebuild_leaderboards(school_ids=None):
+    if not leaderboard_engine.available:
+        print("⚠️ Redis non disponibile: le classifiche usano il fallback SQL")
+        return 0
+
+    print("🔧 Ricostruzione classifiche...")
+    if school_ids:
+        loaded = sum(leaderboard_engine.rebuild(school_id) for school_id in school_ids)
+    else:
+        loaded = leaderboard_engine.rebuild()
+    print(f"✅ Classifiche ricostruite: {loaded} utenti")
+    return loaded
+
+
+if __name__ == "__main__":
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    rebuild_leaderboards(ids)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Popola o riallinea il read model delle dashboard studente/genitore
+(student_dashboard_model) da voti, presenze e daily_analytics.
+Da eseguire al primo deploy e dopo import massivi di voti o presenze.
+
+Uso:
+    python scripts/rebuild_student_dashboards.py            # tutti gli studenti attivi
+    python scripts/rebuild_student_dashboards.py 12 34 56   # solo questi studenti
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from services.dashboard.student_read_model import student_dashboard
+
+
+def rebuild_dashboards(student_ids=None):
+    print("🔧 Ricostruzione read model dashboard studenti...")
+    rebuilt = student_dashboard.rebuild(student_ids)
+    print(f"✅ Dashboard ricostruite per {rebuilt} studenti")
+    return rebuilt
+
+
+if __name__ == "__main__":
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    rebuild_dashboards(ids)
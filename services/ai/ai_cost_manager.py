@@ -10,6 +10,10 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import hashlib
 from shared.error_handling import get_logger, log_ai_request
+from services.ai.response_cache import ai_response_tier
+from services.ai.semantic_cache import semantic_cache_index
+from services.ai.subjects import detect_subject
+from config import config
 
 logger = get_logger(__name__)
 
@@ -55,6 +59,11 @@ class AICostManager:
                 )
             ''')
             
+            # Materia della domanda (ambito della ricerca per similarità)
+            db_manager.execute('''
+                ALTER TABLE ai_response_cache ADD COLUMN IF NOT EXISTS subject VARCHAR(50)
+            ''')
+            
             # Tabella per budget limits per utente
             db_manager.execute('''
                 CREATE TABLE IF NOT EXISTS ai_user_limits (
@@ -136,30 +145,32 @@ class AICostManager:
         combined = f"{normalized_msg}|{user_context}"
         return hashlib.md5(combined.encode()).hexdigest()
 
-    def get_cached_response(self, message: str, user_context: str) -> Optional[str]:
-        """Cerca una risposta nella cache"""
+    def get_cached_response(self, message: str, user_context: str,
+                            subject: Optional[str] = None) -> Optional[str]:
+        """Cerca una risposta nella cache (memoria/Redis, poi DB, poi domande simili)"""
         try:
             request_hash = self.generate_request_hash(message, user_context)
             
+            # Livello in memoria/Redis: nessun round trip verso il DB
+            response = ai_response_tier.get(request_hash)
+            if response is not None:
+                ai_response_tier.record_hit(request_hash)
+                return response
+            
             # Cerca nella cache (non più vecchia di cache_duration_hours)
             cached = db_manager.query('''
                 SELECT response, id FROM ai_response_cache 
                 WHERE request_hash = %s 
                 AND timestamp > NOW() - INTERVAL '1 hour' * %s
-                ORDER BY hit_count DESC, last_accessed DESC
-                LIMIT 1
             ''', (request_hash, self.cache_duration_hours), one=True)
             
             if cached:
                 response = cached.get('response')
                 cache_id = cached.get('id')
                 
-                # Aggiorna statistiche cache
-                db_manager.execute('''
-                    UPDATE ai_response_cache 
-                    SET hit_count = hit_count + 1, last_accessed = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                ''', (cache_id,))
+                # Statistiche cache aggiornate a blocchi in background
+                ai_response_tier.record_hit(request_hash)
+                ai_response_tier.put(request_hash, response)
                 
                 logger.info(
                     event_type='ai_cache_hit',
@@ -170,6 +181,8 @@ class AICostManager:
                 )
                 return response
                 
+            if config.AI_SEMANTIC_CACHE:
+                return self._get_similar_response(message, user_context, subject, request_hash)
             return None
             
         except Exception as e:
@@ -183,24 +196,65 @@ class AICostManager:
             )
             return None
 
-    def cache_response(self, message: str, response: str, user_context: str, model_used: str):
+    def _get_similar_response(self, message: str, user_context: str, subject: Optional[str],
+                              request_hash: str) -> Optional[str]:
+        """Risposta di una domanda quasi uguale dello stesso contesto e materia"""
+        user_context_hash = hashlib.md5(user_context.encode()).hexdigest()
+        match = semantic_cache_index.match(message, user_context_hash, subject or detect_subject(message))
+        if not match:
+            return None
+        
+        match_hash, similarity = match
+        response = ai_response_tier.get(match_hash)
+        if response is None:
+            cached = db_manager.query('''
+                SELECT response FROM ai_response_cache 
+                WHERE request_hash = %s 
+                AND timestamp > NOW() - INTERVAL '1 hour' * %s
+            ''', (match_hash, self.cache_duration_hours), one=True)
+            if not cached:
+                semantic_cache_index.remove(match_hash)
+                return None
+            response = cached.get('response')
+            ai_response_tier.put(match_hash, response)
+        
+        ai_response_tier.record_hit(match_hash)
+        # La stessa formulazione la prossima volta è un hit esatto in memoria
+        ai_response_tier.put(request_hash, response, share=False)
+        
+        logger.info(
+            event_type='ai_cache_semantic_hit',
+            message=f'Cache hit per domanda simile: {message[:30]}...',
+            domain='ai',
+            request_hash=request_hash,
+            matched_hash=match_hash,
+            similarity=round(similarity, 3)
+        )
+        return response
+
+    def cache_response(self, message: str, response: str, user_context: str, model_used: str,
+                       subject: Optional[str] = None):
         """Salva una risposta nella cache"""
         try:
             request_hash = self.generate_request_hash(message, user_context)
             user_context_hash = hashlib.md5(user_context.encode()).hexdigest()
+            subject = subject or detect_subject(message)
             
             # Inserisci o aggiorna cache (PostgreSQL UPSERT)
             db_manager.execute('''
                 INSERT INTO ai_response_cache 
-                (request_hash, user_context_hash, message, response, model_used, timestamp, last_accessed)
-                VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                (request_hash, user_context_hash, message, response, model_used, subject, timestamp, last_accessed)
+                VALUES (%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
                 ON CONFLICT (request_hash) DO UPDATE SET
                     response = EXCLUDED.response,
                     model_used = EXCLUDED.model_used,
+                    subject = EXCLUDED.subject,
                     timestamp = CURRENT_TIMESTAMP,
                     last_accessed = CURRENT_TIMESTAMP,
                     hit_count = ai_response_cache.hit_count + 1
-            ''', (request_hash, user_context_hash, message, response, model_used))
+            ''', (request_hash, user_context_hash, message, response, model_used, subject))
+            ai_response_tier.put(request_hash, response)
+            semantic_cache_index.add(request_hash, message, user_context_hash, subject)
             
             logger.info(
                 event_type='ai_response_cached',
@@ -436,6 +490,9 @@ class AICostManager:
     def optimize_cache(self):
         """Ottimizza la cache rimuovendo vecchie entry"""
         try:
+            # Hit in sospeso scritti prima di scegliere cosa tenere
+            ai_response_tier.flush_hits()
+            
             # Rimuovi cache più vecchia di 7 giorni
             result = db_manager.execute('''
                 DELETE FROM ai_response_cache 
@@ -447,14 +504,15 @@ class AICostManager:
             total_count = total_cache.get('count') if total_cache else 0
             
             if total_count > 1000:
-                # Mantieni solo le 800 entry più utilizzate
+                # Mantieni solo le 800 entry più utilizzate (scarta dalla posizione 800 in poi)
                 db_manager.execute('''
-                    DELETE FROM ai_response_cache 
-                    WHERE id NOT IN (
+                    DELETE FROM ai_response_cache c
+                    USING (
                         SELECT id FROM ai_response_cache 
                         ORDER BY hit_count DESC, last_accessed DESC 
-                        LIMIT 800
-                    )
+                        OFFSET 800
+                    ) old
+                    WHERE c.id = old.id
                 ''')
                 
             logger.info(
@@ -489,9 +547,7 @@ def analyze_message_complexity(message: str) -> str:
 
 def optimize_ai_costs(message, user_profile, user_id):
     """Funzione principale per ottimizzare i costi AI"""
-    cost_manager = AICostManager()
-    
-    # 1. Controllo cache
+    # 1. Controllo cache (istanza globale: niente DDL a ogni richiesta)
     user_context = f"{user_profile.get('conversation_style', '')}{user_profile.get('learning_preferences', '')}"
     cached_response = cost_manager.get_cached_response(message, user_context)
     if cached_response:
@@ -7,6 +7,7 @@ from typing import Dict, List, Optional
 from datetime import datetime, date, timedelta
 from database_manager import db_manager
 from registro_elettronico import registro
+from services.ai.risk_engine import risk_engine, build_analysis, performance_trend, action_plan
 from shared.error_handling.structured_logger import get_logger
 
 logger = get_logger(__name__)
@@ -61,110 +62,19 @@ class AIRegistroIntelligence:
             }
         
         # Calculate risk score (0-100, higher = more risk)
-        risk_score = 0
-        risk_factors = []
-        
-        # Attendance risk
-        if attendance['percentuale_presenza'] < 75:
-            risk_score += 30
-            risk_factors.append({
-                'category': 'presenze',
-                'severity': 'alta',
-                'description': f"Presenza critica: {attendance['percentuale_presenza']}%",
-                'recommendation': 'Contattare famiglia urgentemente'
-            })
-        elif attendance['percentuale_presenza'] < 85:
-            risk_score += 15
-            risk_factors.append({
-                'category': 'presenze',
-                'severity': 'media',
-                'description': f"Presenza bassa: {attendance['percentuale_presenza']}%",
-                'recommendation': 'Monitorare assenze e comunicare con famiglia'
-            })
-        
-        # Unjustified absences
-        if attendance['assenze_non_giustificate'] > 5:
-            risk_score += 20
-            risk_factors.append({
-                'category': 'assenze',
-                'severity': 'alta',
-                'description': f"{attendance['assenze_non_giustificate']} assenze non giustificate",
-                'recommendation': 'Richiedere giustificazioni immediate'
-            })
-        
-        # Academic performance
-        failing_subjects = [a for a in averages if a['average'] < 6]
-        if len(failing_subjects) > 2:
-            risk_score += 25
-            subjects_str = ', '.join([s['subject'] for s in failing_subjects[:3]])
-            risk_factors.append({
-                'category': 'rendimento',
-                'severity': 'alta',
-                'description': f"{len(failing_subjects)} materie insufficienti: {subjects_str}",
-                'recommendation': 'Piano recupero personalizzato urgente'
-            })
-        elif len(failing_subjects) > 0:
-            risk_score += 10
-            risk_factors.append({
-                'category': 'rendimento',
-                'severity': 'media',
-                'description': f"Insufficienza in {failing_subjects[0]['subject']}",
-                'recommendation': 'Supporto didattico mirato'
-            })
-        
-        # Disciplinary
-        if report['disciplinary_notes'] > 3:
-            risk_score += 15
-            risk_factors.append({
-                'category': 'disciplina',
-                'severity': 'media',
-                'description': f"{report['disciplinary_notes']} note disciplinari",
-                'recommendation': 'Colloquio con coordinatore e famiglia'
-            })
-        
-        # Performance trend
-        trend = self._analyze_performance_trend(student_id)
-        if trend == 'declining':
-            risk_score += 20
-            risk_factors.append({
-                'category': 'trend',
-                'severity': 'alta',
-                'description': 'Rendimento in calo significativo',
-                'recommendation': 'Intervento immediato: analisi cause e supporto'
-            })
-        
-        # Determine risk level
-        if risk_score >= 50:
-            risk_level = 'critico'
-            priority = 'urgente'
-        elif risk_score >= 30:
-            risk_level = 'alto'
-            priority = 'alta'
-        elif risk_score >= 15:
-            risk_level = 'medio'
-            priority = 'media'
-        else:
-            risk_level = 'basso'
-            priority = 'normale'
-        
-        return {
-            'student_id': student_id,
-            'risk_score': risk_score,
-            'risk_level': risk_level,
-            'priority': priority,
-            'risk_factors': risk_factors,
-            'suggested_actions': self._generate_action_plan(risk_factors),
-            'analysis_date': datetime.now().isoformat()
-        }
+        return build_analysis(
+            student_id,
+            attendance,
+            averages,
+            report['disciplinary_notes'],
+            self._analyze_performance_trend(student_id)
+        )
     
     def identify_students_at_risk(self, class_name: str, min_risk_score: int = 30) -> List[Dict]:
         """Identifica tutti gli studenti a rischio in una classe"""
         
         try:
-            students = db_manager.query('''
-                SELECT id, nome, cognome FROM utenti 
-                WHERE classe = %s AND ruolo = 'studente'
-            ''', (class_name,))
+            analyses = risk_engine.analyze_class(class_name)
         except Exception as e:
             logger.error(
                 event_type='class_students_query_failed',
@@ -176,43 +86,24 @@ class AIRegistroIntelligence:
             )
             return []
         
-        at_risk = []
-        
-        for student in students:
-            try:
-                analysis = self.analyze_student_risk(student['id'])
-                
-                if analysis['risk_score'] >= min_risk_score:
-                    at_risk.append({
-                        'student_id': student['id'],
-                        'nome': f"{student['nome']} {student['cognome']}",
-                        'risk_score': analysis['risk_score'],
-                        'risk_level': analysis['risk_level'],
-                        'priority': analysis['priority'],
-                        'main_issues': [rf['category'] for rf in analysis['risk_factors'][:3]]
-                    })
-            except Exception as e:
-                logger.warning(
-                    event_type='student_risk_check_failed',
-                    message=f'Failed to check risk for student',
-                    domain='ai',
-                    student_id=student['id'],
-                    class_name=class_name,
-                    error=str(e)
-                )
-                continue
-        
-        try:
-            at_risk.sort(key=lambda x: x['risk_score'], reverse=True)
-        except Exception as e:
-            logger.warning(
-                event_type='risk_sorting_failed',
-                message='Failed to sort at-risk students',
-                domain='ai',
-                class_name=class_name,
-                error=str(e)
-            )
-        
+        return self._students_at_risk(analyses, min_risk_score)
+    
+    def _students_at_risk(self, analyses: List[Dict], min_risk_score: int) -> List[Dict]:
+        """Filtra e ordina le analisi batch (dal rischio più alto)"""
+        
+        at_risk = [
+            {
+                'student_id': analysis['student_id'],
+                'nome': f"{analysis['nome']} {analysis['cognome']}",
+                'risk_score': analysis['risk_score'],
+                'risk_level': analysis['risk_level'],
+                'priority': analysis['priority'],
+                'main_issues': [rf['category'] for rf in analysis['risk_factors'][:3]]
+            }
+            for analysis in analyses
+            if analysis['risk_score'] >= min_risk_score
+        ]
+        at_risk.sort(key=lambda x: x['risk_score'], reverse=True)
         return at_risk
     
     def detect_performance_anomalies(self, student_id: int) -> List[Dict]:
@@ -400,7 +291,7 @@ class AIRegistroIntelligence:
             grades = db_manager.query('''
                 SELECT voto, date FROM registro_voti
                 WHERE student_id = %s AND date >= %s
-                ORDER BY date ASC
+                ORDER BY date ASC, id ASC
             ''', (student_id, date.today() - timedelta(days=90)))
         except Exception as e:
             logger.error(
@@ -413,25 +304,8 @@ class AIRegistroIntelligence:
             )
             return 'insufficient_data'
         
-        if len(grades) < 6:
-            return 'insufficient_data'
-        
         try:
-            mid = len(grades) // 2
-            recent = grades[mid:]
-            older = grades[:mid]
-            
-            recent_avg = sum(float(g['voto']) for g in recent) / len(recent)
-            older_avg = sum(float(g['voto']) for g in older) / len(older)
-            
-            diff = recent_avg - older_avg
-            
-            if diff > 0.5:
-                return 'improving'
-            elif diff < -0.5:
-                return 'declining'
-            else:
-                return 'stable'
+            return performance_trend([float(g['voto']) for g in grades])
         except (ValueError, ZeroDivisionError, KeyError) as e:
             logger.warning(
                 event_type='trend_calculation_failed',
@@ -444,27 +318,7 @@ class AIRegistroIntelligence:
     
     def _generate_action_plan(self, risk_factors: List[Dict]) -> List[str]:
         """Genera piano azioni"""
-        
-        actions = []
-        
-        categories = {rf['category'] for rf in risk_factors}
-        
-        if 'presenze' in categories:
-            actions.append("📞 Contatto immediato famiglia per gestione assenze")
-        
-        if 'rendimento' in categories:
-            actions.append("📚 Attivazione piano recupero con tutoraggio")
-        
-        if 'disciplina' in categories:
-            actions.append("👥 Colloquio studente-coordinatore-famiglia")
-        
-        if 'trend' in categories:
-            actions.append("🔍 Analisi approfondita cause calo rendimento")
-        
-        if not actions:
-            actions.append("✅ Monitoraggio standard - situazione sotto controllo")
-        
-        return actions
+        return action_plan(risk_factors)
     
     def _define_success_indicators(self, risk: Dict, report: Dict) -> List[str]:
         """Definisci indicatori successo"""
@@ -524,9 +378,8 @@ class AIRegistroIntelligence:
         """Report salute classe"""
         
         try:
-            students = db_manager.query('''
-                SELECT id FROM utenti WHERE classe = %s AND ruolo = 'studente'
-            ''', (class_name,))
+            # Una sola analisi batch per totale, studenti a rischio e critici
+            analyses = risk_engine.analyze_class(class_name)
         except Exception as e:
             logger.error(
                 event_type='class_health_students_query_failed',
@@ -548,8 +401,8 @@ class AIRegistroIntelligence:
                 'error': 'Query fallita'
             }
         
-        total = len(students)
-        at_risk = self.identify_students_at_risk(class_name, min_risk_score=30)
+        total = len(analyses)
+        at_risk = self._students_at_risk(analyses, min_risk_score=30)
         
         try:
             critical = [s for s in at_risk if s['risk_level'] == 'critico']
@@ -6,12 +6,14 @@ Uses Google Gemini API for intelligent tutoring with XP rewards
 import os
 import json
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, Optional, List, Union, Callable
 from google import genai
 from google.genai import types
+from services.ai.llm_limiter import gemini_limiter
 from services.database.database_manager import DatabaseManager
 from services.gamification.xp_manager_v2 import XPManagerV2
 from services.gamification.challenge_manager_v2 import ChallengeManagerV2
+from shared.error_handling.exceptions import AIOverloadedError
 from shared.error_handling.structured_logger import get_logger
 
 logger = get_logger(__name__)
@@ -123,11 +125,20 @@ GAMIFICATION:
 
 Rispondi come un amico esperto che vuole davvero aiutare lo studente a migliorare."""
     
+    def _generation_config(self, system_prompt: str) -> 'types.GenerateContentConfig':
+        return types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            temperature=0.7,
+            max_output_tokens=2048,
+            top_p=0.95
+        )
+    
     def generate_response(self, message: str, user_id: int, 
                          user_name: Optional[str] = None, user_role: str = 'studente') -> Dict[str, Any]:
         """
         Generate AI response with gamification integration.
         Awards XP and returns personalized response.
+        Raises AIOverloadedError when the worker has too many Gemini calls outstanding.
         """
         if not user_name:
             user_name = self._get_user_name(user_id)
@@ -138,22 +149,16 @@ Rispondi come un amico esperto che vuole davvero aiutare lo studente a migliorar
             try:
                 system_prompt = self._build_system_prompt(user_name, gamification)
                 
-                response = self.client.models.generate_content(
-                    model='gemini-2.0-flash',
-                    contents=message,
-                    config=types.GenerateContentConfig(
-                        system_instruction=system_prompt,
-                        temperature=0.7,
-                        max_output_tokens=2048,
-                        top_p=0.95
+                with gemini_limiter.slot():
+                    response = self.client.models.generate_content(
+                        model='gemini-2.0-flash',
+                        contents=message,
+                        config=self._generation_config(system_prompt)
                     )
-                )
                 
                 ai_response = response.text or self._get_fallback_response(user_name, gamification)
                 
-                xp_result = self._award_chat_xp(user_id, message, ai_response)
-                
-                updated_gamification = self._get_gamification_context(user_id)
+                reward = self.award_interaction(user_id, message, ai_response)
                 
                 logger.info(
                     event_type='gemini_response_generated',
@@ -161,19 +166,18 @@ Rispondi come un amico esperto che vuole davvero aiutare lo studente a migliorar
                     user_id=user_id,
                     message_length=len(message),
                     response_length=len(ai_response),
-                    xp_awarded=xp_result.get('xp_assegnati', 0)
+                    xp_awarded=reward['xp_awarded']
                 )
                 
                 return {
                     'success': True,
                     'response': ai_response,
-                    'xp_awarded': xp_result.get('xp_assegnati', 0),
-                    'rank_up': xp_result.get('rank_up', False),
-                    'new_rank': xp_result.get('nuovo_rango'),
-                    'gamification': updated_gamification,
+                    **reward,
                     'ai_mode': 'gemini'
                 }
                 
+            except AIOverloadedError:
+                raise
             except Exception as e:
                 logger.error(
                     event_type='gemini_response_failed',
@@ -186,6 +190,111 @@ Rispondi come un amico esperto che vuole davvero aiutare lo studente a migliorar
         else:
             return self._mock_response(message, user_name, user_id, gamification)
     
+    def stream_response(self, message: str, user_id: int, on_chunk: Callable[[str], None],
+                        user_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Stream the AI response: on_chunk(text) is called for every partial chunk
+        as Gemini produces it; an exception from on_chunk (client gone) stops
+        the stream. XP is NOT awarded here - call award_stream() once the
+        stream has been delivered. 'complete' is False when the stream was
+        cut off or failed.
+        Raises AIOverloadedError when the worker has too many Gemini calls outstanding.
+        """
+        if not user_name:
+            user_name = self._get_user_name(user_id)
+        
+        gamification = self._get_gamification_context(user_id)
+        
+        if not (self.gemini_available and self.client):
+            text = self._mock_text(message, user_name, gamification)
+            delivered = self._deliver_chunk(on_chunk, text)
+            return {'success': True, 'response': text, 'ai_mode': 'mock', 'complete': delivered}
+        
+        parts: List[str] = []
+        try:
+            system_prompt = self._build_system_prompt(user_name, gamification)
+            
+            with gemini_limiter.slot():
+                stream = self.client.models.generate_content_stream(
+                    model='gemini-2.0-flash',
+                    contents=message,
+                    config=self._generation_config(system_prompt)
+                )
+                for chunk in stream:
+                    text = chunk.text
+                    if text:
+                        parts.append(text)
+                        on_chunk(text)
+        except AIOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(
+                event_type='gemini_stream_failed',
+                domain='ai',
+                user_id=user_id,
+                chunks_sent=len(parts),
+                error=str(e),
+                exc_info=True
+            )
+            if parts:
+                return {'success': True, 'response': ''.join(parts), 'ai_mode': 'gemini', 'complete': False}
+            text = self._mock_text(message, user_name, gamification)
+            self._deliver_chunk(on_chunk, text)
+            return {'success': True, 'response': text, 'ai_mode': 'mock', 'complete': False}
+        
+        complete = True
+        if not parts:
+            text = self._get_fallback_response(user_name, gamification)
+            complete = self._deliver_chunk(on_chunk, text)
+            parts.append(text)
+        
+        ai_response = ''.join(parts)
+        logger.info(
+            event_type='gemini_stream_completed',
+            domain='ai',
+            user_id=user_id,
+            message_length=len(message),
+            response_length=len(ai_response),
+            chunks=len(parts)
+        )
+        return {'success': True, 'response': ai_response, 'ai_mode': 'gemini', 'complete': complete}
+    
+    def _deliver_chunk(self, on_chunk: Callable[[str], None], text: str) -> bool:
+        """Send a single-chunk reply; False if the client could not receive it"""
+        try:
+            on_chunk(text)
+            return True
+        except Exception as e:
+            logger.info(
+                event_type='gemini_stream_chunk_undelivered',
+                domain='ai',
+                error=str(e)
+            )
+            return False
+    
+    def award_stream(self, user_id: int, message: str, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Award XP for a streamed reply only if the stream completed normally"""
+        if not result.get('complete'):
+            logger.info(
+                event_type='gemini_stream_xp_skipped',
+                domain='ai',
+                user_id=user_id,
+                ai_mode=result.get('ai_mode'),
+                response_length=len(result.get('response', ''))
+            )
+            return None
+        return self.award_interaction(user_id, message, result['response'])
+    
+    def award_interaction(self, user_id: int, message: str, response: str) -> Dict[str, Any]:
+        """Award chat XP and return the updated gamification snapshot"""
+        xp_result = self._award_chat_xp(user_id, message, response)
+        return {
+            'xp_awarded': xp_result.get('xp_assegnati', 0),
+            'rank_up': xp_result.get('rank_up', False),
+            'new_rank': xp_result.get('nuovo_rango'),
+            'gamification': self._get_gamification_context(user_id)
+        }
+    
     def _award_chat_xp(self, user_id: int, message: str, response: str) -> Dict:
         """Award XP based on chat interaction quality and update gamification"""
         try:
@@ -343,9 +452,8 @@ Rispondi come un amico esperto che vuole davvero aiutare lo studente a migliorar
         base += "Come posso aiutarti oggi con lo studio?"
         return base
     
-    def _mock_response(self, message: str, user_name: str, user_id: int, 
-                       gamification: Dict) -> Dict[str, Any]:
-        """Generate mock response when Gemini is not available"""
+    def _mock_text(self, message: str, user_name: str, gamification: Dict) -> str:
+        """Mock reply text when Gemini is not available"""
         rank = gamification.get('rank', 'Germoglio')
         streak = gamification.get('streak_days', 0)
         xp_total = gamification.get('xp_total', 0)
@@ -371,17 +479,17 @@ Rispondi come un amico esperto che vuole davvero aiutare lo studente a migliorar
         if streak > 0:
             response += f" PS: Il tuo streak di {streak} giorni e fantastico!"
         
-        xp_result = self._award_chat_xp(user_id, message, response)
-        
-        updated_gamification = self._get_gamification_context(user_id)
+        return response
+    
+    def _mock_response(self, message: str, user_name: str, user_id: int, 
+                       gamification: Dict) -> Dict[str, Any]:
+        """Generate mock response when Gemini is not available"""
+        response = self._mock_text(message, user_name, gamification)
         
         return {
             'success': True,
             'response': response,
-            'xp_awarded': xp_result.get('xp_assegnati', 0),
-            'rank_up': xp_result.get('rank_up', False),
-            'new_rank': xp_result.get('nuovo_rango'),
-            'gamification': updated_gamification,
+            **self.award_interaction(user_id, message, response),
             'ai_mode': 'mock'
         }
     
@@ -0,0 +1,133 @@
+"""
+SKAJLA - LLM Call Limiter
+Limita le chiamate LLM contemporanee di un worker.
+
+Una chiamata a Gemini resta aperta per secondi (molti di più in streaming):
+senza limite un picco di richieste apre centinaia di connessioni verso
+l'API, consuma la quota e allunga la latenza per tutti. Il limiter concede
+al massimo GEMINI_MAX_CONCURRENT chiamate in corso; le altre attendono in
+coda (greenlet sospesi) fino a GEMINI_QUEUE_TIMEOUT secondi.
+
+Shedding: se la coda ha già GEMINI_MAX_QUEUE richieste in attesa, o
+l'attesa scade, la richiesta viene rifiutata subito con AIOverloadedError
+invece di accumularsi.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from config import config
+from shared.error_handling import AIOverloadedError, get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMCallLimiter:
+    """Semaforo + coda limitata per le chiamate LLM in corso"""
+
+    def __init__(self, name: str, max_concurrent: int = 8, max_queue: int = 32,
+                 queue_timeout: float = 10.0):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+
+        self.stats: Dict[str, float] = {
+            'admitted': 0,
+            'completed': 0,
+            'shed_queue_full': 0,
+            'shed_timeout': 0,
+            'max_waiting': 0,
+            'max_in_flight': 0,
+            'total_wait_ms': 0.0,
+            'total_call_ms': 0.0,
+            'max_call_ms': 0.0,
+        }
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Tiene uno slot per tutta la chiamata (AIOverloadedError se scartata)"""
+        start = time.perf_counter()
+        with self._lock:
+            if self._in_flight >= self.max_concurrent and self._waiting >= self.max_queue:
+                self.stats['shed_queue_full'] += 1
+                self._shed('queue_full')
+            self._waiting += 1
+            self.stats['max_waiting'] = max(self.stats['max_waiting'], self._waiting)
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self.stats['shed_timeout'] += 1
+                self._shed('timeout')
+            self._in_flight += 1
+            self.stats['admitted'] += 1
+            self.stats['total_wait_ms'] += waited * 1000
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+
+        call_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - call_start) * 1000
+            with self._lock:
+                self._in_flight -= 1
+                self.stats['completed'] += 1
+                self.stats['total_call_ms'] += elapsed
+                self.stats['max_call_ms'] = max(self.stats['max_call_ms'], elapsed)
+            self._slots.release()
+
+    def _shed(self, reason: str):
+        """Chiamato con _lock acquisito"""
+        logger.warning(
+            event_type='llm_call_shed',
+            domain='ai',
+            limiter=self.name,
+            reason=reason,
+            in_flight=self._in_flight,
+            waiting=self._waiting
+        )
+        raise AIOverloadedError(
+            retry_after=self.retry_after(),
+            context={'limiter': self.name, 'reason': reason}
+        )
+
+    def retry_after(self) -> float:
+        """Stima dei secondi prima che si liberi uno slot (durata media di una chiamata)"""
+        completed = self.stats['completed']
+        if not completed:
+            return 5.0
+        return round(max(1.0, self.stats['total_call_ms'] / completed / 1000), 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        admitted = stats['admitted']
+        shed = stats['shed_queue_full'] + stats['shed_timeout']
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / admitted, 2) if admitted else 0.0
+        stats['avg_call_ms'] = round(stats['total_call_ms'] / stats['completed'], 2) if stats['completed'] else 0.0
+        stats['shed_rate'] = round(shed / (admitted + shed) * 100, 1) if admitted + shed else 0.0
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 2)
+        stats['total_call_ms'] = round(stats['total_call_ms'], 2)
+        stats['max_call_ms'] = round(stats['max_call_ms'], 2)
+        stats['in_flight'] = self._in_flight
+        stats['waiting'] = self._waiting
+        stats['max_concurrent'] = self.max_concurrent
+        stats['max_queue'] = self.max_queue
+        return stats
+
+
+gemini_limiter = LLMCallLimiter(
+    'gemini',
+    max_concurrent=config.GEMINI_MAX_CONCURRENT,
+    max_queue=config.GEMINI_MAX_QUEUE,
+    queue_timeout=config.GEMINI_QUEUE_TIMEOUT,
+)
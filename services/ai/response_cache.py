@@ -0,0 +1,243 @@
+"""
+SKAJLA - AI Response Cache Tier
+Livello in memoria davanti alla tabella ai_response_cache, indicizzato da
+AICostManager.generate_request_hash.
+
+    L1  dizionario per processo, limitato per numero di voci e per byte;
+        in eviction si scarta, tra le voci meno recenti, quella con meno
+        hit per byte (LRU + frequenza + dimensione)
+    L2  Redis ai:cache:{hash} con TTL, se attivo (condiviso tra i worker)
+    DB  ai_response_cache, letta solo se L1 e L2 mancano
+
+Gli hit non aggiornano il DB a ogni lookup: si accumulano per hash e un
+thread in background li scrive con un solo UPDATE multi-riga.
+"""
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional
+
+from config import config
+from database_manager import db_manager
+from services.redis_service import redis_manager
+from shared.background_flusher import BackgroundFlusher
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+# Voci meno recenti esaminate per scegliere quale scartare
+EVICTION_SAMPLE = 8
+
+
+class _Entry:
+    __slots__ = ('response', 'size', 'expires_at', 'hits')
+
+    def __init__(self, response: str, ttl: float):
+        self.response = response
+        self.size = len(response.encode('utf-8'))
+        self.expires_at = time.time() + ttl
+        self.hits = 1
+
+
+class AIResponseCacheTier(BackgroundFlusher):
+    """L1 in memoria + L2 Redis + contatori di hit scritti a blocchi"""
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 3600, flush_interval: float = 5.0):
+        super().__init__('ai_cache_hits', 'ai', flush_interval)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._pending_hits: Dict[str, int] = defaultdict(int)
+        self._hits_lock = threading.Lock()
+
+        self.stats.update({
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expired': 0,
+            'hit_updates_written': 0,
+            'hit_flush_failed': 0,
+            'redis_errors': 0,
+        })
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def get(self, request_hash: str) -> Optional[str]:
+        """Risposta da L1 o L2 (None se va letta dal DB)"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(request_hash)
+            if entry is not None:
+                if entry.expires_at > now:
+                    entry.hits += 1
+                    self._entries.move_to_end(request_hash)
+                    self.stats['local_hits'] += 1
+                    return entry.response
+                self._remove(request_hash)
+                self.stats['expired'] += 1
+
+        if redis_manager.use_redis:
+            try:
+                response = redis_manager.redis_client.get(f'ai:cache:{request_hash}')
+            except Exception as e:
+                response = None
+                self._redis_failed(e)
+            if response is not None:
+                self.stats['redis_hits'] += 1
+                self._store(request_hash, response)
+                return response
+
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, request_hash: str, response: str, share: bool = True):
+        """Salva la risposta in L1 (e in L2 se share)"""
+        if not response:
+            return
+        self._store(request_hash, response)
+        if share and redis_manager.use_redis:
+            try:
+                redis_manager.redis_client.setex(f'ai:cache:{request_hash}', int(self.ttl), response)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def _store(self, request_hash: str, response: str):
+        entry = _Entry(response, self.ttl)
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(request_hash, None)
+            if previous is not None:
+                self._bytes -= previous.size
+                entry.hits = previous.hits
+            self._entries[request_hash] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict_one(keep=request_hash)
+
+    def _remove(self, request_hash: str):
+        entry = self._entries.pop(request_hash, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict_one(self, keep: str):
+        """Tra le voci meno recenti scarta quella con meno hit per byte"""
+        now = time.time()
+        victim, victim_score = None, None
+        for index, (key, entry) in enumerate(self._entries.items()):
+            if index >= EVICTION_SAMPLE:
+                break
+            if key == keep:
+                continue
+            if entry.expires_at <= now:
+                victim = key
+                break
+            score = entry.hits / entry.size if entry.size else float(entry.hits)
+            if victim_score is None or score < victim_score:
+                victim, victim_score = key, score
+        if victim is None:
+            victim = next(iter(self._entries))
+        self._remove(victim)
+        self.stats['evictions'] += 1
+
+    def invalidate(self, request_hash: str):
+        with self._lock:
+            self._remove(request_hash)
+        if redis_manager.use_redis:
+            try:
+                redis_manager.redis_client.delete(f'ai:cache:{request_hash}')
+            except Exception as e:
+                self._redis_failed(e)
+
+    def _redis_failed(self, error: Exception):
+        self.stats['redis_errors'] += 1
+        logger.warning(
+            event_type='ai_cache_redis_error',
+            domain='ai',
+            error=str(error)
+        )
+
+    # ------------------------------------------------------------------
+    # Contatori di hit (scritti a blocchi)
+    # ------------------------------------------------------------------
+
+    def record_hit(self, request_hash: str):
+        """Accoda l'incremento di hit_count/last_accessed per la riga del DB"""
+        self._ensure_started()
+        with self._hits_lock:
+            self._pending_hits[request_hash] += 1
+
+    def flush(self) -> int:
+        return self.flush_hits()
+
+    def flush_hits(self) -> int:
+        """Scrive subito gli hit in sospeso con un solo UPDATE"""
+        with self._flush_lock:
+            with self._hits_lock:
+                pending, self._pending_hits = self._pending_hits, defaultdict(int)
+            if not pending:
+                return 0
+
+            rows = list(pending.items())
+            try:
+                with self._measure(), db_manager.get_connection() as conn:
+                    cursor = conn.cursor()
+                    if db_manager.db_type == 'postgresql':
+                        from psycopg2.extras import execute_values
+                        execute_values(cursor, '''
+                            UPDATE ai_response_cache AS c
+                            SET hit_count = c.hit_count + v.hits,
+                                last_accessed = CURRENT_TIMESTAMP
+                            FROM (VALUES %s) AS v(request_hash, hits)
+                            WHERE c.request_hash = v.request_hash
+                        ''', rows, page_size=len(rows))
+                    else:
+                        cursor.executemany('''
+                            UPDATE ai_response_cache
+                            SET hit_count = hit_count + ?, last_accessed = CURRENT_TIMESTAMP
+                            WHERE request_hash = ?
+                        ''', [(hits, request_hash) for request_hash, hits in rows])
+                    conn.commit()
+                self.stats['hit_updates_written'] += len(rows)
+                return len(rows)
+            except Exception as e:
+                self.stats['hit_flush_failed'] += len(rows)
+                with self._hits_lock:
+                    for request_hash, hits in rows:
+                        self._pending_hits[request_hash] += hits
+                logger.error(
+                    event_type='ai_cache_hit_flush_failed',
+                    domain='ai',
+                    error=str(e),
+                    exc_info=True
+                )
+                return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.flusher_stats()
+        hits = stats['local_hits'] + stats['redis_hits']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = round(hits / lookups * 100, 1) if lookups else 0.0
+        stats['entries'] = len(self._entries)
+        stats['bytes'] = self._bytes
+        stats['pending_hits'] = len(self._pending_hits)
+        stats['backend'] = 'redis' if redis_manager.use_redis else 'local'
+        return stats
+
+
+ai_response_tier = AIResponseCacheTier(
+    max_entries=config.AI_CACHE_LOCAL_MAX_ENTRIES,
+    max_bytes=config.AI_CACHE_LOCAL_MAX_BYTES,
+    ttl=config.AI_CACHE_LOCAL_TTL,
+    flush_interval=config.AI_CACHE_HIT_FLUSH_INTERVAL,
+)
@@ -0,0 +1,454 @@
+"""
+SKAJLA Batch Risk Engine
+Rischio studenti calcolato per un'intera classe o scuola con poche query
+aggregate (presenze, assenze non giustificate, medie ponderate, note,
+voti recenti) invece di un report completo per ogni studente.
+
+Le regole di punteggio sono funzioni pure condivise con
+AIRegistroIntelligence.analyze_student_risk: analisi singola e batch
+producono gli stessi risultati.
+
+Il precalcolo notturno salva i risultati in student_risk_scores, letto
+dalla dashboard early-warning (/early-warning/api/risk-scores).
+"""
+
+import json
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from database_manager import db_manager
+from shared.error_handling.structured_logger import get_logger
+
+logger = get_logger(__name__)
+
+# Finestra dell'analisi (come get_student_report(months=3))
+ANALYSIS_DAYS = 90
+
+
+# ----------------------------------------------------------------------
+# Regole di punteggio (condivise con l'analisi per singolo studente)
+# ----------------------------------------------------------------------
+
+def performance_trend(voti: List[float]) -> str:
+    """Trend da voti in ordine cronologico: seconda metà vs prima metà"""
+    if len(voti) < 6:
+        return 'insufficient_data'
+
+    mid = len(voti) // 2
+    older = voti[:mid]
+    recent = voti[mid:]
+    diff = sum(recent) / len(recent) - sum(older) / len(older)
+
+    if diff > 0.5:
+        return 'improving'
+    elif diff < -0.5:
+        return 'declining'
+    return 'stable'
+
+
+def score_risk(attendance: Dict[str, Any], averages: List[Dict[str, Any]],
+               disciplinary_notes: int, trend: str) -> Tuple[int, List[Dict[str, str]]]:
+    """Punteggio di rischio (0-100) e fattori che lo compongono"""
+    risk_score = 0
+    risk_factors = []
+
+    # Attendance risk
+    if attendance['percentuale_presenza'] < 75:
+        risk_score += 30
+        risk_factors.append({
+            'category': 'presenze',
+            'severity': 'alta',
+            'description': f"Presenza critica: {attendance['percentuale_presenza']}%",
+            'recommendation': 'Contattare famiglia urgentemente'
+        })
+    elif attendance['percentuale_presenza'] < 85:
+        risk_score += 15
+        risk_factors.append({
+            'category': 'presenze',
+            'severity': 'media',
+            'description': f"Presenza bassa: {attendance['percentuale_presenza']}%",
+            'recommendation': 'Monitorare assenze e comunicare con famiglia'
+        })
+
+    # Unjustified absences
+    if attendance['assenze_non_giustificate'] > 5:
+        risk_score += 20
+        risk_factors.append({
+            'category': 'assenze',
+            'severity': 'alta',
+            'description': f"{attendance['assenze_non_giustificate']} assenze non giustificate",
+            'recommendation': 'Richiedere giustificazioni immediate'
+        })
+
+    # Academic performance
+    failing_subjects = [a for a in averages if a['average'] < 6]
+    if len(failing_subjects) > 2:
+        risk_score += 25
+        subjects_str = ', '.join([s['subject'] for s in failing_subjects[:3]])
+        risk_factors.append({
+            'category': 'rendimento',
+            'severity': 'alta',
+            'description': f"{len(failing_subjects)} materie insufficienti: {subjects_str}",
+            'recommendation': 'Piano recupero personalizzato urgente'
+        })
+    elif len(failing_subjects) > 0:
+        risk_score += 10
+        risk_factors.append({
+            'category': 'rendimento',
+            'severity': 'media',
+            'description': f"Insufficienza in {failing_subjects[0]['subject']}",
+            'recommendation': 'Supporto didattico mirato'
+        })
+
+    # Disciplinary
+    if disciplinary_notes > 3:
+        risk_score += 15
+        risk_factors.append({
+            'category': 'disciplina',
+            'severity': 'media',
+            'description': f"{disciplinary_notes} note disciplinari",
+            'recommendation': 'Colloquio con coordinatore e famiglia'
+        })
+
+    # Performance trend
+    if trend == 'declining':
+        risk_score += 20
+        risk_factors.append({
+            'category': 'trend',
+            'severity': 'alta',
+            'description': 'Rendimento in calo significativo',
+            'recommendation': 'Intervento immediato: analisi cause e supporto'
+        })
+
+    return risk_score, risk_factors
+
+
+def risk_level(risk_score: int) -> Tuple[str, str]:
+    """(livello, priorità) dal punteggio"""
+    if risk_score >= 50:
+        return 'critico', 'urgente'
+    elif risk_score >= 30:
+        return 'alto', 'alta'
+    elif risk_score >= 15:
+        return 'medio', 'media'
+    return 'basso', 'normale'
+
+
+def action_plan(risk_factors: List[Dict]) -> List[str]:
+    """Azioni suggerite per categoria di rischio"""
+    actions = []
+    categories = {rf['category'] for rf in risk_factors}
+
+    if 'presenze' in categories:
+        actions.append("📞 Contatto immediato famiglia per gestione assenze")
+    if 'rendimento' in categories:
+        actions.append("📚 Attivazione piano recupero con tutoraggio")
+    if 'disciplina' in categories:
+        actions.append("👥 Colloquio studente-coordinatore-famiglia")
+    if 'trend' in categories:
+        actions.append("🔍 Analisi approfondita cause calo rendimento")
+    if not actions:
+        actions.append("✅ Monitoraggio standard - situazione sotto controllo")
+
+    return actions
+
+
+def build_analysis(student_id: int, attendance: Dict[str, Any], averages: List[Dict[str, Any]],
+                   disciplinary_notes: int, trend: str) -> Dict[str, Any]:
+    """Risultato nel formato di analyze_student_risk"""
+    score, factors = score_risk(attendance, averages, disciplinary_notes, trend)
+    level, priority = risk_level(score)
+    return {
+        'student_id': student_id,
+        'risk_score': score,
+        'risk_level': level,
+        'priority': priority,
+        'risk_factors': factors,
+        'suggested_actions': action_plan(factors),
+        'analysis_date': datetime.now().isoformat()
+    }
+
+
+# ----------------------------------------------------------------------
+# Motore batch
+# ----------------------------------------------------------------------
+
+class BatchRiskEngine:
+    """Analisi rischio per classe/scuola con query aggregate"""
+
+    SCOPES = {
+        'class': "u.classe = %s AND u.ruolo = 'studente'",
+        'school': "u.scuola_id = %s AND u.ruolo = 'studente'",
+    }
+
+    def __init__(self):
+        self.stats: Dict[str, float] = {
+            'batches': 0,
+            'students_scored': 0,
+            'precomputed_schools': 0,
+            'last_batch_ms': 0.0,
+        }
+
+    def analyze_class(self, class_name: str) -> List[Dict[str, Any]]:
+        """Analisi di tutti gli studenti della classe"""
+        return self._analyze('class', class_name)
+
+    def analyze_school(self, school_id: int) -> List[Dict[str, Any]]:
+        """Analisi di tutti gli studenti della scuola"""
+        return self._analyze('school', school_id)
+
+    def _analyze(self, scope: str, value: Any) -> List[Dict[str, Any]]:
+        """
+        Sei query per l'intero gruppo; ogni risultato è quello di
+        analyze_student_risk più nome, classe e scuola dello studente.
+        """
+        start = time.perf_counter()
+        where = self.SCOPES[scope]
+        since = date.today() - timedelta(days=ANALYSIS_DAYS)
+
+        data = db_manager.query_many({
+            'students': (f'''
+                SELECT u.id, u.nome, u.cognome, u.classe, u.scuola_id
+                FROM utenti u
+                WHERE {where}
+                ORDER BY u.id
+            ''', (value,)),
+            'attendance': (f'''
+                SELECT rp.student_id,
+                       COUNT(*) as total_days,
+                       SUM(CASE WHEN rp.status = 'presente' THEN 1 ELSE 0 END) as presenti
+                FROM registro_presenze rp
+                JOIN utenti u ON rp.student_id = u.id
+                WHERE {where} AND rp.date >= %s
+                GROUP BY rp.student_id
+            ''', (value, since)),
+            'unjustified': (f'''
+                SELECT ag.student_id, COUNT(*) as count
+                FROM registro_assenze_giustificate ag
+                JOIN utenti u ON ag.student_id = u.id
+                WHERE {where} AND ag.absence_date >= %s AND ag.justified_by_parent = FALSE
+                GROUP BY ag.student_id
+            ''', (value, since)),
+            'averages': (f'''
+                SELECT rv.student_id, rv.subject,
+                       SUM(rv.voto * rv.peso) as weighted_sum,
+                       SUM(rv.peso) as total_weight,
+                       COUNT(*) as grade_count
+                FROM registro_voti rv
+                JOIN utenti u ON rv.student_id = u.id
+                WHERE {where}
+                GROUP BY rv.student_id, rv.subject
+            ''', (value,)),
+            'notes': (f'''
+                SELECT rnd.student_id, COUNT(*) as count
+                FROM registro_note_disciplinari rnd
+                JOIN utenti t ON rnd.teacher_id = t.id
+                JOIN utenti u ON rnd.student_id = u.id
+                WHERE {where} AND rnd.date >= %s
+                GROUP BY rnd.student_id
+            ''', (value, since)),
+            'recent_grades': (f'''
+                SELECT rv.student_id, rv.voto
+                FROM registro_voti rv
+                JOIN utenti u ON rv.student_id = u.id
+                WHERE {where} AND rv.date >= %s
+                ORDER BY rv.student_id, rv.date, rv.id
+            ''', (value, since)),
+        })
+
+        students = data['students'] or []
+        attendance = {r['student_id']: r for r in data['attendance'] or []}
+        unjustified = {r['student_id']: int(r['count'] or 0) for r in data['unjustified'] or []}
+        notes = {r['student_id']: int(r['count'] or 0) for r in data['notes'] or []}
+
+        averages: Dict[int, List[Dict[str, Any]]] = {}
+        for r in data['averages'] or []:
+            weight = float(r['total_weight'] or 0)
+            average = float(r['weighted_sum'] or 0) / weight if weight > 0 else 0
+            averages.setdefault(r['student_id'], []).append({
+                'subject': r['subject'],
+                'average': round(average, 2),
+                'grade_count': int(r['grade_count'] or 0)
+            })
+        for subject_list in averages.values():
+            subject_list.sort(key=lambda a: (-a['average'], a['subject'] or ''))
+
+        # Voti recenti in colonne (già ordinati per studente e data): una fetta per studente
+        grade_students = [r['student_id'] for r in data['recent_grades'] or []]
+        grade_values = [float(r['voto']) for r in data['recent_grades'] or []]
+        trends: Dict[int, str] = {}
+        begin = 0
+        for i in range(1, len(grade_students) + 1):
+            if i == len(grade_students) or grade_students[i] != grade_students[begin]:
+                trends[grade_students[begin]] = performance_trend(grade_values[begin:i])
+                begin = i
+
+        results = []
+        for student in students:
+            student_id = student['id']
+            stats = attendance.get(student_id, {})
+            total_days = int(stats.get('total_days') or 0)
+            presenti = int(stats.get('presenti') or 0)
+            attendance_summary = {
+                'percentuale_presenza': round(presenti / total_days * 100, 1) if total_days > 0 else 0,
+                'assenze_non_giustificate': unjustified.get(student_id, 0)
+            }
+
+            analysis = build_analysis(
+                student_id,
+                attendance_summary,
+                averages.get(student_id, []),
+                notes.get(student_id, 0),
+                trends.get(student_id, 'insufficient_data')
+            )
+            analysis.update({
+                'nome': student['nome'],
+                'cognome': student['cognome'],
+                'classe': student['classe'],
+                'scuola_id': student['scuola_id']
+            })
+            results.append(analysis)
+
+        elapsed = round((time.perf_counter() - start) * 1000, 2)
+        self.stats['batches'] += 1
+        self.stats['students_scored'] += len(results)
+        self.stats['last_batch_ms'] = elapsed
+        return results
+
+    # ------------------------------------------------------------------
+    # Precalcolo notturno
+    # ------------------------------------------------------------------
+
+    def init_schema(self) -> bool:
+        """Crea la tabella dei punteggi precalcolati"""
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS student_risk_scores (
+                        student_id INTEGER PRIMARY KEY,
+                        scuola_id INTEGER,
+                        classe TEXT,
+                        nome TEXT,
+                        risk_score INTEGER DEFAULT 0,
+                        risk_level TEXT,
+                        priority TEXT,
+                        risk_factors TEXT,
+                        suggested_actions TEXT,
+                        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_student_risk_scores_school
+                    ON student_risk_scores(scuola_id, risk_score)
+                ''')
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(
+                event_type='risk_scores_init_failed',
+                domain='ai',
+                error=str(e)
+            )
+            return False
+
+    def precompute_school(self, school_id: int) -> int:
+        """Analizza la scuola e sostituisce i punteggi salvati"""
+        results = self.analyze_school(school_id)
+        rows = [
+            (r['student_id'], r['scuola_id'], r['classe'], f"{r['nome']} {r['cognome']}",
+             r['risk_score'], r['risk_level'], r['priority'],
+             json.dumps(r['risk_factors']), json.dumps(r['suggested_actions']))
+            for r in results
+        ]
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            placeholder = '%s' if db_manager.db_type == 'postgresql' else '?'
+            cursor.execute(
+                f'DELETE FROM student_risk_scores WHERE scuola_id = {placeholder}', (school_id,)
+            )
+            upsert = '''
+                INSERT INTO student_risk_scores
+                (student_id, scuola_id, classe, nome, risk_score, risk_level, priority,
+                 risk_factors, suggested_actions, computed_at)
+                VALUES %s
+                ON CONFLICT (student_id) DO UPDATE SET
+                    scuola_id = excluded.scuola_id,
+                    classe = excluded.classe,
+                    nome = excluded.nome,
+                    risk_score = excluded.risk_score,
+                    risk_level = excluded.risk_level,
+                    priority = excluded.priority,
+                    risk_factors = excluded.risk_factors,
+                    suggested_actions = excluded.suggested_actions,
+                    computed_at = excluded.computed_at
+            '''
+            if rows:
+                if db_manager.db_type == 'postgresql':
+                    from psycopg2.extras import execute_values
+                    execute_values(cursor, upsert, rows,
+                                   template='(%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)')
+                else:
+                    cursor.executemany(
+                        upsert.replace('VALUES %s', 'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)'),
+                        rows
+                    )
+            conn.commit()
+
+        self.stats['precomputed_schools'] += 1
+        return len(rows)
+
+    def precompute_all(self) -> Dict[str, int]:
+        """Precalcolo notturno per tutte le scuole attive"""
+        self.init_schema()
+        schools = db_manager.query('SELECT id FROM scuole WHERE attiva = true ORDER BY id') or []
+
+        summary = {'schools': 0, 'students': 0, 'failed': 0}
+        for school in schools:
+            try:
+                summary['students'] += self.precompute_school(school['id'])
+                summary['schools'] += 1
+            except Exception as e:
+                summary['failed'] += 1
+                logger.error(
+                    event_type='risk_precompute_failed',
+                    domain='ai',
+                    school_id=school['id'],
+                    error=str(e),
+                    exc_info=True
+                )
+
+        logger.info(
+            event_type='risk_precompute_completed',
+            domain='ai',
+            **summary
+        )
+        return summary
+
+    def get_precomputed(self, school_id: int, class_name: Optional[str] = None,
+                        min_risk_score: int = 0) -> List[Dict[str, Any]]:
+        """Punteggi dell'ultimo precalcolo, dal più a rischio"""
+        sql = '''
+            SELECT student_id, classe, nome, risk_score, risk_level, priority,
+                   risk_factors, suggested_actions, computed_at
+            FROM student_risk_scores
+            WHERE scuola_id = %s AND risk_score >= %s
+        '''
+        params: List[Any] = [school_id, min_risk_score]
+        if class_name:
+            sql += ' AND classe = %s'
+            params.append(class_name)
+
+        rows = db_manager.query(sql + ' ORDER BY risk_score DESC, student_id', tuple(params)) or []
+        for row in rows:
+            row['risk_factors'] = json.loads(row['risk_factors'] or '[]')
+            row['suggested_actions'] = json.loads(row['suggested_actions'] or '[]')
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+risk_engine = BatchRiskEngine()
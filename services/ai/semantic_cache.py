@@ -0,0 +1,255 @@
+"""
+SKAJLA - Semantic AI Cache Index
+Riconosce domande quasi uguali già in ai_response_cache senza modelli
+esterni: "come si fa un'equazione di secondo grado?" e "come risolvo
+equazioni di secondo grado" devono dare la stessa risposta in cache.
+
+Ogni domanda diventa un insieme di feature: radici delle parole (minuscole,
+senza stopword, troncate a 6 caratteri), numeri, operatori e simboli di una
+lettera (x, y, n...). Una firma MinHash con LSH a bande trova i candidati in
+tempo costante; il candidato viene accettato solo se la similarità di
+Jaccard esatta supera AI_SEMANTIC_THRESHOLD e se numeri e simboli
+compaiono identici, nello stesso ordine, nelle due domande: "derivata di
+x^2" e "derivata di x^3" sono esercizi diversi.
+
+Ambito: lo stesso contesto utente (user_context_hash) e la stessa materia.
+Se la materia di una delle due domande non è riconosciuta, la materia non
+esclude il candidato.
+
+L'indice è per processo; al primo uso viene caricato dalle righe recenti
+di ai_response_cache.
+"""
+
+import hashlib
+import random
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from config import config
+from database_manager import db_manager
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+STOPWORDS = frozenset('''
+    a ad al ai agli all alla alle allo c che chi ci come con cos cosa d da dal dalla dalle dai
+    dei del della delle dello degli di e è ed fa fai fare faccio gli ha hai ho i il in io l
+    la le li lo ma me mi mio mia ne nel nella nelle nei o per più può posso puoi qual quale
+    quali quando quanto questo questa quello quella se si sia sono su sul sulla sui te ti tra
+    tu un una uno vorrei spiega spiegami aiuto aiutami dimmi sai sapere
+'''.split())
+
+STEM_LENGTH = 6
+NUM_PERM = 32
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MIN_FEATURES = 3
+
+# Numeri (anche decimali), parole, operatori
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|[^\W\d_]+|[-+*/^=<>%√π²³]")
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240917)
+_COEFFS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+Scope = str  # user_context_hash
+
+
+def _tokens(text: str) -> List[str]:
+    return [token.replace(',', '.') for token in _TOKEN_RE.findall((text or '').lower())]
+
+
+def _is_exact(token: str) -> bool:
+    """Numeri, operatori e simboli di una lettera: devono coincidere esattamente"""
+    return len(token) == 1 or token[0].isdigit()
+
+
+def _split(text: str) -> Tuple[FrozenSet[str], Tuple[str, ...]]:
+    """(feature per MinHash, sequenza di numeri/simboli)"""
+    feature_set, exact = set(), []
+    for token in _tokens(text):
+        if token in STOPWORDS:
+            continue
+        if _is_exact(token):
+            exact.append(token)
+            feature_set.add(token)
+        else:
+            feature_set.add(token[:STEM_LENGTH])
+    return frozenset(feature_set), tuple(exact)
+
+
+def features(text: str) -> FrozenSet[str]:
+    """Radici significative, numeri e simboli della domanda"""
+    return _split(text)[0]
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def signature(feature_set: FrozenSet[str]) -> List[int]:
+    """Firma MinHash (NUM_PERM permutazioni universali)"""
+    hashes = [_token_hash(f) for f in feature_set]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _COEFFS]
+
+
+class _Entry:
+    __slots__ = ('scope', 'subject', 'features', 'exact', 'bands')
+
+    def __init__(self, scope: Scope, subject: Optional[str], feature_set: FrozenSet[str],
+                 exact: Tuple[str, ...], bands: List[Tuple]):
+        self.scope = scope
+        self.subject = subject
+        self.features = feature_set
+        self.exact = exact
+        self.bands = bands
+
+
+class SemanticCacheIndex:
+    """MinHash/LSH sulle domande in cache, per contesto utente e materia"""
+
+    def __init__(self, threshold: float = 0.7, max_entries: int = 20000, warm_rows: int = 5000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.warm_rows = warm_rows
+
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()  # request_hash -> entry
+        self._buckets: Dict[Tuple, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._warmed = False
+
+        self.stats: Dict[str, float] = {
+            'lookups': 0,
+            'matches': 0,
+            'candidates_checked': 0,
+            'candidates_rejected': 0,
+            'candidates_rejected_exact': 0,
+            'skipped_short': 0,
+            'indexed': 0,
+            'evicted': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Indice
+    # ------------------------------------------------------------------
+
+    def _band_keys(self, scope: Scope, sig: List[int]) -> List[Tuple]:
+        return [(scope, band, tuple(sig[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+    def add(self, request_hash: str, message: str, scope: Scope, subject: Optional[str] = None):
+        """Indicizza una domanda salvata in cache"""
+        feature_set, exact = _split(message)
+        if len(feature_set) < MIN_FEATURES:
+            return
+        bands = self._band_keys(scope, signature(feature_set))
+
+        with self._lock:
+            self._discard(request_hash)
+            self._entries[request_hash] = _Entry(scope, subject, feature_set, exact, bands)
+            for key in bands:
+                self._buckets[key].add(request_hash)
+            self.stats['indexed'] += 1
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.stats['evicted'] += 1
+
+    def _discard(self, request_hash: str):
+        entry = self._entries.pop(request_hash, None)
+        if entry is None:
+            return
+        for key in entry.bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(request_hash)
+                if not bucket:
+                    del self._buckets[key]
+
+    def remove(self, request_hash: str):
+        with self._lock:
+            self._discard(request_hash)
+
+    def match(self, message: str, scope: Scope, subject: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """(request_hash, similarità) della domanda in cache più simile, se sopra soglia"""
+        self._ensure_warm()
+        self.stats['lookups'] += 1
+
+        feature_set, exact = _split(message)
+        if len(feature_set) < MIN_FEATURES:
+            self.stats['skipped_short'] += 1
+            return None
+        bands = self._band_keys(scope, signature(feature_set))
+
+        best: Optional[Tuple[str, float]] = None
+        with self._lock:
+            candidates: Set[str] = set()
+            for key in bands:
+                candidates.update(self._buckets.get(key, ()))
+
+            for request_hash in candidates:
+                entry = self._entries[request_hash]
+                if subject and entry.subject and subject != entry.subject:
+                    continue
+                self.stats['candidates_checked'] += 1
+                if exact != entry.exact:
+                    self.stats['candidates_rejected_exact'] += 1
+                    continue
+                similarity = jaccard(feature_set, entry.features)
+                if similarity < self.threshold:
+                    self.stats['candidates_rejected'] += 1
+                    continue
+                if best is None or similarity > best[1]:
+                    best = (request_hash, similarity)
+
+            if best is not None:
+                self._entries.move_to_end(best[0])
+                self.stats['matches'] += 1
+        return best
+
+    # ------------------------------------------------------------------
+    # Caricamento iniziale
+    # ------------------------------------------------------------------
+
+    def _ensure_warm(self):
+        if self._warmed:
+            return
+        with self._lock:
+            if self._warmed:
+                return
+            self._warmed = True
+        try:
+            rows = db_manager.query('''
+                SELECT request_hash, user_context_hash, subject, message
+                FROM ai_response_cache
+                ORDER BY last_accessed DESC
+                LIMIT %s
+            ''', (self.warm_rows,)) or []
+            for row in reversed(rows):
+                self.add(row['request_hash'], row['message'] or '',
+                         row['user_context_hash'] or '', row.get('subject'))
+        except Exception as e:
+            logger.warning(
+                event_type='ai_semantic_index_warm_failed',
+                domain='ai',
+                error=str(e)
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['hit_rate'] = round(stats['matches'] / stats['lookups'] * 100, 1) if stats['lookups'] else 0.0
+        stats['entries'] = len(self._entries)
+        stats['threshold'] = self.threshold
+        return stats
+
+
+semantic_cache_index = SemanticCacheIndex(
+    threshold=config.AI_SEMANTIC_THRESHOLD,
+    max_entries=config.AI_SEMANTIC_MAX_ENTRIES,
+)
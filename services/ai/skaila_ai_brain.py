@@ -9,6 +9,7 @@ from typing import Dict, List, Any, Optional
 import random
 from database_manager import db_manager
 from gamification import gamification_system
+from services.ai.subjects import SUBJECT_KEYWORDS, detect_subject
 
 class SKAJLABrain:
     """Cervello decisionale del chatbot SKAJLA"""
@@ -21,21 +22,7 @@ class SKAJLABrain:
         self.subjects = ['matematica', 'italiano', 'storia', 'scienze', 'inglese', 'fisica', 'chimica', 'geografia']
 
         # Pattern di riconoscimento per materie
-        self.subject_keywords = {
-            'matematica': ['matematica', 'algebra', 'geometria', 'calcolo', 'equazione', 'numero',
-                          'frazione', 'derivata', 'integrale', 'teorema', 'dimostrazione'],
-            'italiano': ['italiano', 'grammatica', 'letteratura', 'poesia', 'romanzo', 'analisi',
-                        'verbo', 'soggetto', 'predicato', 'complemento'],
-            'storia': ['storia', 'guerra', 'impero', 'rivoluzione', 'antichità', 'medioevo',
-                      'rinascimento', 'illuminismo', 'evento storico'],
-            'scienze': ['scienze', 'biologia', 'chimica', 'fisica', 'cellula', 'atomo',
-                       'molecola', 'energia', 'forza'],
-            'inglese': ['inglese', 'english', 'grammar', 'vocabulary', 'verb', 'tense'],
-            'fisica': ['fisica', 'forza', 'energia', 'velocità', 'accelerazione', 'newton',
-                      'gravità', 'movimento'],
-            'chimica': ['chimica', 'molecola', 'atomo', 'reazione', 'elemento', 'composto'],
-            'geografia': ['geografia', 'continente', 'capitale', 'nazione', 'fiume', 'monte']
-        }
+        self.subject_keywords = SUBJECT_KEYWORDS
 
         # Sentiment keywords
         self.sentiment_keywords = {
@@ -311,13 +298,7 @@ class SKAJLABrain:
 
     def _detect_subject(self, message: str) -> Optional[str]:
         """Rileva materia dal messaggio"""
-        message_lower = message.lower()
-
-        for subject, keywords in self.subject_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return subject
-
-        return None
+        return detect_subject(message)
 
     def _detect_sentiment(self, message: str) -> List[str]:
         """Rileva sentiment dal messaggio"""
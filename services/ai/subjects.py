@@ -0,0 +1,33 @@
+"""
+SKAJLA - Materie
+Parole chiave per riconoscere la materia di un messaggio (AI Brain, cache AI)
+"""
+
+from typing import Optional
+
+SUBJECT_KEYWORDS = {
+    'matematica': ['matematica', 'algebra', 'geometria', 'calcolo', 'equazione', 'numero',
+                  'frazione', 'derivata', 'integrale', 'teorema', 'dimostrazione'],
+    'italiano': ['italiano', 'grammatica', 'letteratura', 'poesia', 'romanzo', 'analisi',
+                'verbo', 'soggetto', 'predicato', 'complemento'],
+    'storia': ['storia', 'guerra', 'impero', 'rivoluzione', 'antichità', 'medioevo',
+              'rinascimento', 'illuminismo', 'evento storico'],
+    'scienze': ['scienze', 'biologia', 'chimica', 'fisica', 'cellula', 'atomo',
+               'molecola', 'energia', 'forza'],
+    'inglese': ['inglese', 'english', 'grammar', 'vocabulary', 'verb', 'tense'],
+    'fisica': ['fisica', 'forza', 'energia', 'velocità', 'accelerazione', 'newton',
+              'gravità', 'movimento'],
+    'chimica': ['chimica', 'molecola', 'atomo', 'reazione', 'elemento', 'composto'],
+    'geografia': ['geografia', 'continente', 'capitale', 'nazione', 'fiume', 'monte']
+}
+
+
+def detect_subject(message: str) -> Optional[str]:
+    """Rileva materia dal messaggio (prima materia con una parola chiave presente)"""
+    message_lower = message.lower()
+
+    for subject, keywords in SUBJECT_KEYWORDS.items():
+        if any(keyword in message_lower for keyword in keywords):
+            return subject
+
+    return None
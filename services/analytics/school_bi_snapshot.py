@@ -0,0 +1,312 @@
+"""
+SKAJLA - School BI Snapshot
+Organigramma, KPI scuola e statistiche classi della dashboard BI calcolati
+da poche query raggruppate per scuola (non una query per classe e per
+studente) e tenuti in uno snapshot per scuola con TTL.
+
+Le medie e i tassi sono pre-aggregati per studente o per classe prima di
+essere combinati: voti e presenze non vengono mai uniti nella stessa JOIN
+(che moltiplicava le righe e falsava medie e percentuali).
+
+Snapshot:
+    bi:snapshot:{scuola_id}   JSON su Redis (condiviso tra i worker), con
+                              fallback in-process se Redis non è attivo
+
+Voti e presenze scritti dal registro invalidano lo snapshot della scuola.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import config
+from database_manager import db_manager
+from services.redis_service import redis_manager
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+
+def _num(value: Any, digits: int = 2) -> Optional[float]:
+    """Decimal/None -> float arrotondato (serializzabile in JSON)"""
+    if value is None:
+        return None
+    return round(float(value), digits)
+
+
+def _rate(present: Any, total: Any) -> Optional[float]:
+    total = int(total or 0)
+    if not total:
+        return None
+    return int(present or 0) * 100.0 / total
+
+
+class SchoolBISnapshot:
+    """Aggregati BI per scuola + cache con TTL e invalidazione"""
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._local: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'redis_errors': 0,
+            'last_build_ms': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # API usata dalle route
+    # ------------------------------------------------------------------
+
+    def get_organization_tree(self, school_id: int) -> Dict[str, Any]:
+        return self.get(school_id)['tree']
+
+    def get_school_kpi(self, school_id: int) -> Dict[str, Any]:
+        return self.get(school_id)['kpi']
+
+    def get_classes_statistics(self, school_id: int) -> List[Dict[str, Any]]:
+        return self.get(school_id)['classes']
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+
+    def _redis_key(self, school_id: int) -> str:
+        return f"bi:snapshot:{int(school_id)}"
+
+    def _redis_call(self, fn):
+        if not redis_manager.use_redis:
+            return None
+        try:
+            return fn(redis_manager.redis_client)
+        except Exception as e:
+            self.stats['redis_errors'] += 1
+            logger.warning(
+                event_type='bi_snapshot_redis_error',
+                domain='bi_dashboard',
+                error=str(e)
+            )
+            return None
+
+    def get(self, school_id: int) -> Dict[str, Any]:
+        """Snapshot della scuola (ricalcolato se assente o scaduto)"""
+        school_id = int(school_id)
+
+        if redis_manager.use_redis:
+            stored = self._redis_call(lambda r: r.get(self._redis_key(school_id)))
+            if stored:
+                self.stats['hits'] += 1
+                return json.loads(stored)
+        else:
+            with self._lock:
+                item = self._local.get(school_id)
+            if item and time.time() < item[1]:
+                self.stats['hits'] += 1
+                return item[0]
+
+        self.stats['misses'] += 1
+        snapshot = self.build(school_id)
+
+        if redis_manager.use_redis:
+            payload = json.dumps(snapshot)
+            self._redis_call(lambda r: r.setex(self._redis_key(school_id), self.ttl, payload))
+        else:
+            with self._lock:
+                self._local[school_id] = (snapshot, time.time() + self.ttl)
+        return snapshot
+
+    def invalidate(self, school_id: Optional[int]):
+        """Da chiamare dopo scritture su voti o presenze della scuola"""
+        if school_id is None:
+            return
+        school_id = int(school_id)
+        with self._lock:
+            self._local.pop(school_id, None)
+        self.stats['invalidations'] += 1
+        self._redis_call(lambda r: r.delete(self._redis_key(school_id)))
+
+    def invalidate_student(self, student_id: int):
+        """Invalida lo snapshot della scuola dello studente"""
+        row = db_manager.query('SELECT scuola_id FROM utenti WHERE id = %s', (student_id,), one=True)
+        if row:
+            self.invalidate(row['scuola_id'])
+
+    # ------------------------------------------------------------------
+    # Calcolo
+    # ------------------------------------------------------------------
+
+    def build(self, school_id: int) -> Dict[str, Any]:
+        """Organigramma, KPI e statistiche classi da sette query raggruppate"""
+        start = time.perf_counter()
+        data = db_manager.query_many({
+            'scuola': ('''
+                SELECT nome FROM scuole WHERE id = %s
+            ''', (school_id,), True),
+            'studenti': ('''
+                SELECT id, nome, cognome, classe, attivo
+                FROM utenti
+                WHERE scuola_id = %s AND ruolo = 'studente'
+                ORDER BY classe, cognome, nome
+            ''', (school_id,)),
+            'conteggi': ('''
+                SELECT
+                    COUNT(CASE WHEN ruolo = 'studente' THEN 1 END) as totale_studenti,
+                    COUNT(CASE WHEN ruolo = 'professore' THEN 1 END) as totale_professori,
+                    COUNT(DISTINCT classe) as totale_classi
+                FROM utenti
+                WHERE scuola_id = %s AND attivo = true
+            ''', (school_id,), True),
+            # Voti per studente (storico completo)
+            'voti_studenti': ('''
+                SELECT
+                    rv.student_id,
+                    ROUND(AVG(rv.voto), 2) as media_voti,
+                    COUNT(DISTINCT rv.date) as giorni_voti,
+                    SUM(rv.voto) as somma_voti,
+                    COUNT(*) as numero_voti
+                FROM registro_voti rv
+                JOIN utenti u ON rv.student_id = u.id
+                WHERE u.scuola_id = %s AND u.ruolo = 'studente'
+                GROUP BY rv.student_id
+            ''', (school_id,)),
+            # Presenze per classe (storico completo)
+            'presenze_classi': ('''
+                SELECT
+                    u.classe,
+                    COUNT(*) as totale,
+                    COUNT(CASE WHEN rp.status = 'presente' THEN 1 END) as presenti
+                FROM registro_presenze rp
+                JOIN utenti u ON rp.student_id = u.id
+                WHERE u.scuola_id = %s AND u.ruolo = 'studente' AND u.classe IS NOT NULL
+                GROUP BY u.classe
+            ''', (school_id,)),
+            # Ultimi 30 giorni: voti e presenze per classe (presenze anche senza classe per il KPI)
+            'voti_classi_30g': ('''
+                SELECT
+                    u.classe,
+                    ROUND(AVG(rv.voto), 2) as media_classe,
+                    COUNT(*) as voti_registrati
+                FROM registro_voti rv
+                JOIN utenti u ON rv.student_id = u.id
+                WHERE u.scuola_id = %s AND u.ruolo = 'studente' AND u.classe IS NOT NULL
+                    AND rv.date >= CURRENT_DATE - INTERVAL '30 days'
+                GROUP BY u.classe
+            ''', (school_id,)),
+            'presenze_classi_30g': ('''
+                SELECT
+                    u.classe,
+                    COUNT(*) as totale,
+                    COUNT(CASE WHEN rp.status = 'presente' THEN 1 END) as presenti
+                FROM registro_presenze rp
+                JOIN utenti u ON rp.student_id = u.id
+                WHERE u.scuola_id = %s AND rp.date >= CURRENT_DATE - INTERVAL '30 days'
+                GROUP BY u.classe
+            ''', (school_id,)),
+        })
+
+        studenti = data['studenti'] or []
+        voti_studenti = {row['student_id']: row for row in data['voti_studenti'] or []}
+        presenze_classi = {row['classe']: row for row in data['presenze_classi'] or []}
+        voti_30g = {row['classe']: row for row in data['voti_classi_30g'] or []}
+        presenze_30g = data['presenze_classi_30g'] or []
+        presenze_30g_map = {row['classe']: row for row in presenze_30g}
+
+        # Studenti raggruppati per classe (ordine: classe, cognome, nome)
+        per_classe: Dict[str, List[Dict[str, Any]]] = {}
+        for studente in studenti:
+            if studente['classe'] is not None:
+                per_classe.setdefault(studente['classe'], []).append(studente)
+
+        scuola = data['scuola'] or {}
+        tree = {
+            'name': scuola.get('nome'),
+            'type': 'scuola',
+            'id': school_id,
+            'children': []
+        }
+        classes = []
+
+        for classe_name in sorted(per_classe):
+            membri = per_classe[classe_name]
+            somma = sum(float(voti_studenti[s['id']]['somma_voti'] or 0)
+                        for s in membri if s['id'] in voti_studenti)
+            numero = sum(int(voti_studenti[s['id']]['numero_voti'] or 0)
+                         for s in membri if s['id'] in voti_studenti)
+            presenze = presenze_classi.get(classe_name, {})
+
+            classe_node = {
+                'name': f'Classe {classe_name}',
+                'type': 'classe',
+                'id': classe_name,
+                'stats': {
+                    'studenti': len(membri),
+                    'media_voti': _num(somma / numero) if numero else None,
+                    'presenze_perc': _num(_rate(presenze.get('presenti'), presenze.get('totale')))
+                },
+                'children': []
+            }
+
+            # Livello 2: Studenti (solo nomi, privacy)
+            for studente in membri:
+                voti = voti_studenti.get(studente['id'], {})
+                classe_node['children'].append({
+                    'name': f"{studente['nome']} {(studente['cognome'] or ' ')[0]}.",
+                    'type': 'studente',
+                    'id': studente['id'],
+                    'stats': {
+                        'media_voti': _num(voti.get('media_voti')),
+                        'giorni_voti': int(voti.get('giorni_voti') or 0)
+                    }
+                })
+
+            tree['children'].append(classe_node)
+
+            voti_classe = voti_30g.get(classe_name, {})
+            presenze_classe = presenze_30g_map.get(classe_name, {})
+            classes.append({
+                'classe': classe_name,
+                'studenti_count': len(membri),
+                'media_classe': _num(voti_classe.get('media_classe')),
+                'voti_registrati': int(voti_classe.get('voti_registrati') or 0),
+                'tasso_presenze': _num(_rate(presenze_classe.get('presenti'), presenze_classe.get('totale')))
+            })
+
+        # KPI: media scuola = media delle medie degli studenti attivi
+        medie_studenti = [
+            float(voti_studenti[s['id']]['somma_voti']) / int(voti_studenti[s['id']]['numero_voti'])
+            for s in studenti
+            if s['attivo'] and s['id'] in voti_studenti and voti_studenti[s['id']]['numero_voti']
+        ]
+        conteggi = data['conteggi'] or {}
+        kpi = {
+            'totale_studenti': int(conteggi.get('totale_studenti') or 0),
+            'totale_professori': int(conteggi.get('totale_professori') or 0),
+            'totale_classi': int(conteggi.get('totale_classi') or 0),
+            'media_generale_scuola': _num(sum(medie_studenti) / len(medie_studenti)) if medie_studenti else None,
+            'tasso_presenze': round(_rate(
+                sum(int(row['presenti'] or 0) for row in presenze_30g),
+                sum(int(row['totale'] or 0) for row in presenze_30g)
+            ) or 0, 1)
+        }
+
+        self.stats['last_build_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return {
+            'tree': tree,
+            'kpi': kpi,
+            'classes': classes,
+            'built_at': time.time(),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0.0
+        stats['local_size'] = len(self._local)
+        stats['backend'] = 'redis' if redis_manager.use_redis else 'local'
+        return stats
+
+
+school_bi_snapshot = SchoolBISnapshot(ttl=config.BI_SNAPSHOT_TTL)
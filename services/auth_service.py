@@ -4,14 +4,14 @@ Logica business per autenticazione e sicurezza
 """
 
 import os
-import bcrypt
 import hashlib
-import time
-import json
-from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, session, render_template
+from flask import request, session, render_template, has_request_context, jsonify, flash
 from services.database.database_manager import db_manager
+from services.security.login_rate_limiter import SlidingWindowLimiter
+from services.security.login_audit import login_audit
+from services.security.password_hasher import password_hasher
+from config import config
 from shared.validators.input_validators import validator, sql_protector
 from shared.logging.structured_logger import auth_logger, security_logger
 
@@ -41,6 +41,7 @@ class SecuritySettings:
     """Security configuration constants"""
     MAX_LOGIN_ATTEMPTS = 5
     LOGIN_LOCKOUT_DURATION = 900
+    MAX_IP_FAILURES = 10
 
 
 class AuthService:
@@ -48,6 +49,7 @@ class AuthService:
     def __init__(self):
         self.max_attempts = SecuritySettings.MAX_LOGIN_ATTEMPTS
         self.lockout_duration = SecuritySettings.LOGIN_LOCKOUT_DURATION
+        self.max_ip_failures = SecuritySettings.MAX_IP_FAILURES
         
         # ✅ SECURITY FIX: Use Redis for persistent, distributed login tracking
         # Uses REDIS_URL environment variable for production compatibility (no localhost)
@@ -83,13 +85,12 @@ class AuthService:
                 message='REDIS_URL not set - using database-backed session storage (production-safe)'
             )
         
-        # Fallback to in-memory (for development without Redis)
-        self.login_attempts = {}
+        # Finestra scorrevole per email e per IP (in-memory senza Redis)
+        self.limiter = SlidingWindowLimiter(self.redis_client, prefix='login_attempts')
 
     def hash_password(self, password: str) -> str:
-        """Hash password con bcrypt"""
-        return bcrypt.hashpw(password.encode('utf-8'),
-                             bcrypt.gensalt()).decode('utf-8')
+        """Hash password con bcrypt (su thread nativo, non blocca l'hub eventlet)"""
+        return password_hasher.hash(password)
 
     def verify_password(self, password: str, hashed: str) -> bool:
         """
@@ -101,7 +102,7 @@ class AuthService:
         """
         try:
             # Primary: bcrypt verification (secure)
-            is_valid = bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+            is_valid = password_hasher.check(password, hashed)
             
             if is_valid:
                 logger.debug(
@@ -126,7 +127,7 @@ class AuthService:
             is_valid = hashlib.sha256(password.encode()).hexdigest() == hashed
             
             if is_valid:
-                # TODO: Trigger async password migration to bcrypt
+                # Migrazione a bcrypt al login con PASSWORD_REHASH_ON_LOGIN
                 logger.warning(
                     event_type='legacy_password_detected',
                     domain='security',
@@ -146,123 +147,48 @@ class AuthService:
             )
             return False
 
+    def _client_ip(self) -> str:
+        """IP del client come visto dal proxy fidato (ProxyFix in main.py)"""
+        if not has_request_context():
+            return 'unknown'
+        return request.remote_addr or 'unknown'
+
     def is_locked_out(self, email: str) -> bool:
-        """Controlla se account è bloccato (Redis or in-memory)"""
-        key = f'login_attempts:{email}'
-        
-        # ✅ SECURITY FIX: Use Redis if available (persistent across workers)
-        if self.redis_client:
-            try:
-                attempts_json = self.redis_client.get(key)
-                if not attempts_json:
-                    return False
-                
-                attempts = json.loads(attempts_json)
-                if attempts['count'] >= self.max_attempts:
-                    return True  # Still in lockout (Redis TTL will handle expiry)
-                return False
-            except Exception as e:
-                logger.warning(
-                    event_type='redis_read_failed',
-                    domain='authentication',
-                    error=str(e),
-                    message='Redis read failed - falling back to in-memory'
-                )
-        
-        # Fallback: in-memory (development)
-        if email not in self.login_attempts:
-            return False
+        """Controlla se account è bloccato (tentativi falliti negli ultimi 15 minuti)"""
+        return self.limiter.count(f'email:{email}', self.lockout_duration) >= self.max_attempts
 
-        attempts = self.login_attempts[email]
-        if attempts['count'] >= self.max_attempts:
-            time_diff = time.time() - attempts['last_attempt']
-            return time_diff < self.lockout_duration
+    def lockout_remaining(self, email: str) -> float:
+        """Secondi prima che l'account esca dal blocco (0 se non bloccato)"""
+        return self.limiter.retry_after(f'email:{email}', self.max_attempts, self.lockout_duration)
 
-        return False
+    def is_ip_rate_limited(self, ip_address: str) -> bool:
+        """Troppi tentativi falliti dallo stesso IP negli ultimi 15 minuti"""
+        return self.limiter.count(f'ip:{ip_address}', self.lockout_duration) >= self.max_ip_failures
 
     def record_failed_attempt(self, email: str):
-        """Registra tentativo fallito (Redis or in-memory)"""
-        key = f'login_attempts:{email}'
-        
-        # ✅ SECURITY FIX: Use Redis if available (persistent across workers)
-        if self.redis_client:
-            try:
-                attempts_json = self.redis_client.get(key)
-                if not attempts_json:
-                    data = {
-                        'count': 1,
-                        'locked_at': datetime.now().isoformat(),
-                        'ip': request.remote_addr if request else 'unknown'
-                    }
-                else:
-                    data = json.loads(attempts_json)
-                    data['count'] += 1
-                
-                # Store with TTL = lockout_duration
-                self.redis_client.setex(
-                    key,
-                    self.lockout_duration,
-                    json.dumps(data)
-                )
-                
-                logger.warning(
-                    event_type='failed_login_attempt',
-                    domain='authentication',
-                    email=email,
-                    attempt_count=data['count'],
-                    ip=data['ip'],
-                    message=f'Failed login attempt ({data["count"]}/{self.max_attempts})'
-                )
-            except Exception as e:
-                logger.warning(
-                    event_type='redis_write_failed',
-                    domain='authentication',
-                    error=str(e),
-                    message='Redis write failed - falling back to in-memory'
-                )
-                # Fall through to in-memory
-        
-        # Fallback: in-memory (development)
-        if email not in self.login_attempts:
-            self.login_attempts[email] = {'count': 0, 'last_attempt': 0}
-
-        self.login_attempts[email]['count'] += 1
-        self.login_attempts[email]['last_attempt'] = time.time()
+        """Registra tentativo fallito (per email e per IP)"""
+        ip = self._client_ip()
+        count = self.limiter.hit(f'email:{email}', self.lockout_duration)
+        self.limiter.hit(f'ip:{ip}', self.lockout_duration)
         
         logger.warning(
             event_type='failed_login_attempt',
             domain='authentication',
             email=email,
-            attempt_count=self.login_attempts[email]['count'],
-            ip=request.remote_addr if request else 'unknown',
-            message=f'Failed login attempt ({self.login_attempts[email]["count"]}/{self.max_attempts})'
+            attempt_count=count,
+            ip=ip,
+            message=f'Failed login attempt ({count}/{self.max_attempts})'
         )
 
     def reset_attempts(self, email: str):
-        """Reset tentativi dopo login riuscito (Redis or in-memory)"""
-        key = f'login_attempts:{email}'
-        
-        # ✅ SECURITY FIX: Clear from Redis if available
-        if self.redis_client:
-            try:
-                self.redis_client.delete(key)
-            except Exception as e:
-                logger.warning(
-                    event_type='redis_delete_failed',
-                    domain='authentication',
-                    error=str(e),
-                    message='Redis delete failed - clearing from in-memory'
-                )
-        
-        # Clear from in-memory
-        if email in self.login_attempts:
-            del self.login_attempts[email]
+        """Reset tentativi dopo login riuscito"""
+        self.limiter.reset(f'email:{email}')
             
         logger.info(
             event_type='successful_login',
             domain='authentication',
             email=email,
-            ip=request.remote_addr if request else 'unknown'
+            ip=self._client_ip()
         )
 
     def authenticate_user(self, email: str, password: str):
@@ -279,6 +205,8 @@ class AuthService:
         if self.is_locked_out(email):
             return None
 
+        # Connessione rilasciata prima di bcrypt: una raffica di login in coda
+        # su password_hasher non deve trattenere connessioni del pool
         with db_manager.get_connection() as conn:
             cursor = conn.cursor()
             if db_manager.db_type == 'postgresql':
@@ -300,51 +228,65 @@ class AuthService:
 
             user = cursor.fetchone()
 
-            if user and self.verify_password(password, user[3]):
-                self.reset_attempts(email)
+        if not (user and self.verify_password(password, user[3])):
+            self.record_failed_attempt(email)
+            self.log_login_attempt(email, False, self._client_ip())
+            return None
 
-                # Aggiorna ultimo accesso
-                if db_manager.db_type == 'postgresql':
-                    cursor.execute(
-                        '''
-                        UPDATE utenti 
-                        SET ultimo_accesso = CURRENT_TIMESTAMP 
-                        WHERE id = %s
-                    ''', (user[0], ))
-                else:
-                    cursor.execute(
-                        '''
-                        UPDATE utenti 
-                        SET ultimo_accesso = CURRENT_TIMESTAMP 
-                        WHERE id = %s
-                    ''', (user[0], ))
-                conn.commit()
+        self.reset_attempts(email)
+        self.log_login_attempt(email, True, self._client_ip())
 
-                session['user_id'] = user[0]
-                session['username'] = user[1]
-                session['nome'] = user[4]
-                session['cognome'] = user[5]
-                session['ruolo'] = user[7]
-                session['classe'] = user[6] or ''
-                session['school_id'] = user[10]  # FIX: Aggiungi school_id
-                session.permanent = True
+        # Rehash al costo configurato (o da SHA-256 legacy) con la password in chiaro
+        new_hash = None
+        if config.PASSWORD_REHASH_ON_LOGIN and password_hasher.needs_rehash(user[3]):
+            new_hash = password_hasher.hash(password)
 
-                return {
-                    'id': user[0],
-                    'username': user[1],
-                    'email': user[2],
-                    'nome': user[4],
-                    'cognome': user[5],
-                    'classe': user[6],
-                    'ruolo': user[7],
-                    'avatar': user[9] or 'default.jpg',
-                    'scuola_id': user[10],
-                    'classe_id': user[11],
-                    'force_password_change': user[12] if len(user) > 12 else False
-                }
-            else:
-                self.record_failed_attempt(email)
-                return None
+        placeholder = '%s' if db_manager.db_type == 'postgresql' else '?'
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            if new_hash:
+                cursor.execute(
+                    f'UPDATE utenti SET password_hash = {placeholder} WHERE id = {placeholder}',
+                    (new_hash, user[0])
+                )
+                logger.info(
+                    event_type='password_rehashed',
+                    domain='authentication',
+                    user_id=user[0],
+                    rounds=password_hasher.rounds
+                )
+
+            # Aggiorna ultimo accesso
+            cursor.execute(
+                f'''
+                UPDATE utenti 
+                SET ultimo_accesso = CURRENT_TIMESTAMP 
+                WHERE id = {placeholder}
+            ''', (user[0], ))
+            conn.commit()
+
+        session['user_id'] = user[0]
+        session['username'] = user[1]
+        session['nome'] = user[4]
+        session['cognome'] = user[5]
+        session['ruolo'] = user[7]
+        session['classe'] = user[6] or ''
+        session['school_id'] = user[10]  # FIX: Aggiungi school_id
+        session.permanent = True
+
+        return {
+            'id': user[0],
+            'username': user[1],
+            'email': user[2],
+            'nome': user[4],
+            'cognome': user[5],
+            'classe': user[6],
+            'ruolo': user[7],
+            'avatar': user[9] or 'default.jpg',
+            'scuola_id': user[10],
+            'classe_id': user[11],
+            'force_password_change': user[12] if len(user) > 12 else False
+        }
 
     def create_user(self,
                     username: str,
@@ -439,83 +381,29 @@ class AuthService:
             return {'success': False, 'message': f'Errore: {str(e)}'}
 
     def rate_limit_login(self, f):
-        """Rate limiting per login"""
+        """Rate limiting per login (tentativi falliti per IP, senza query)"""
 
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            client_ip = request.environ.get('HTTP_X_FORWARDED_FOR',
-                                            request.remote_addr)
-
-            with db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-
-                # Crea tabella se non esiste
-                if db_manager.db_type == 'postgresql':
-                    cursor.execute('''
-                        CREATE TABLE IF NOT EXISTS login_attempts (
-                            id SERIAL PRIMARY KEY,
-                            email TEXT,
-                            ip_address TEXT,
-                            user_agent TEXT,
-                            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            success BOOLEAN
-                        )
-                    ''')
-
-                    cursor.execute(
-                        '''
-                        SELECT COUNT(*) FROM login_attempts 
-                        WHERE ip_address = %s AND timestamp > NOW() - INTERVAL '15 minutes'
-                    ''', (client_ip, ))
-                else:
-                    cursor.execute('''
-                        CREATE TABLE IF NOT EXISTS login_attempts (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            email TEXT,
-                            ip_address TEXT,
-                            user_agent TEXT,
-                            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            success BOOLEAN
-                        )
-                    ''')
-
-                    cursor.execute(
-                        '''
-                        SELECT COUNT(*) FROM login_attempts 
-                        WHERE ip_address = %s AND timestamp > CURRENT_TIMESTAMP - INTERVAL '15 minutes'
-                    ''', (client_ip, ))
-
-                recent_attempts = cursor.fetchone()[0]
-
-                if recent_attempts >= 10:
-                    return render_template(
-                        'login.html',
-                        error=
-                        'Troppi tentativi di login. Riprova tra 15 minuti.')
+            if request.method == 'POST' and self.is_ip_rate_limited(self._client_ip()):
+                message = 'Troppi tentativi di login. Riprova tra 15 minuti.'
+                if request.is_json:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Troppi tentativi',
+                        'message': message
+                    }), 429
+                flash(f'⚠️ {message}', 'error')
+                return render_template('login.html'), 429
 
             return f(*args, **kwargs)
 
         return decorated_function
 
     def log_login_attempt(self, email, success, ip_address):
-        """Log tentativi di login"""
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            if db_manager.db_type == 'postgresql':
-                cursor.execute(
-                    '''
-                    INSERT INTO login_attempts (email, success, ip_address, user_agent)
-                    VALUES (%s, %s, %s, %s)
-                ''', (email, success, ip_address,
-                      request.headers.get('User-Agent', '')))
-            else:
-                cursor.execute(
-                    '''
-                    INSERT INTO login_attempts (email, success, ip_address, user_agent)
-                    VALUES (%s, %s, %s, %s)
-                ''', (email, success, ip_address,
-                      request.headers.get('User-Agent', '')))
-            conn.commit()
+        """Log tentativi di login (scritto in background a blocchi)"""
+        user_agent = request.headers.get('User-Agent', '') if has_request_context() else ''
+        login_audit.submit(email, success, ip_address, user_agent)
 
     def require_auth(self, f):
         """Decorator per route protette"""
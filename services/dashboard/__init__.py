@@ -3,5 +3,6 @@ SKAJLA Dashboard Services
 """
 
 from .dashboard_service import dashboard_service, DashboardService
+from .student_read_model import student_dashboard, StudentDashboardReadModel
 
-__all__ = ['dashboard_service', 'DashboardService']
+__all__ = ['dashboard_service', 'DashboardService', 'student_dashboard', 'StudentDashboardReadModel']
@@ -0,0 +1,391 @@
+"""
+SKAJLA - Student Dashboard Read Model
+Aggregati precalcolati per studente letti dalle dashboard studente e
+genitore con una sola lookup per chiave primaria.
+
+    student_dashboard_model   una riga per studente: voti recenti, medie per
+                              materia, media generale, trend 90 giorni,
+                              statistiche e ultime presenze, attività 7 giorni
+
+voti e presenze non hanno uno scrittore nell'applicazione (arrivano da
+import e strumenti esterni): su PostgreSQL un trigger su entrambe le tabelle
+azzera refreshed_at della riga dello studente, che viene ricalcolata alla
+lettura successiva. L'assegnazione XP segna invece lo studente come
+"sporco": un thread in background ricalcola a batch le righe già
+materializzate, coalescendo più eventi dello stesso studente. Le righe
+mancanti o più vecchie di STUDENT_DASHBOARD_MAX_AGE vengono calcolate alla
+lettura.
+
+scripts/rebuild_student_dashboards.py popola o riallinea tutte le righe.
+"""
+
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config import config
+from database_manager import db_manager
+from shared.background_flusher import BackgroundFlusher
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+RECENT_GRADES = 15       # la dashboard studente ne mostra 10, quella genitore 15
+RECENT_ATTENDANCE = 10
+TREND_DAYS = 90
+ACTIVITY_DAYS = 7
+
+EMPTY_MEDIA = {'media_generale': 0, 'totale_voti': 0}
+EMPTY_PRESENZE = {
+    'giorni_totali': 0, 'presenze': 0, 'assenze': 0,
+    'giustificate': 0, 'ritardi': 0
+}
+
+
+# Tabelle sorgente con trigger di invalidazione (colonna studente_id)
+SOURCE_TABLES = ('voti', 'presenze')
+
+INVALIDATE_FUNCTION = '''
+    CREATE OR REPLACE FUNCTION student_dashboard_invalidate() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE student_dashboard_model SET refreshed_at = 0 WHERE student_id = OLD.studente_id;
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            UPDATE student_dashboard_model SET refreshed_at = 0 WHERE student_id = NEW.studente_id;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+'''
+
+
+# ----------------------------------------------------------------------
+# Serializzazione: date e Decimal tornano con il loro tipo (i template
+# usano strftime e formattano le medie come le restituisce PostgreSQL)
+# ----------------------------------------------------------------------
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    raise TypeError(f'Tipo non serializzabile: {type(value).__name__}')
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if '$dt' in obj:
+            return datetime.fromisoformat(obj['$dt'])
+        if '$date' in obj:
+            return date.fromisoformat(obj['$date'])
+        if '$dec' in obj:
+            return Decimal(obj['$dec'])
+    return obj
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except (TypeError, ValueError):
+        return None
+
+
+class StudentDashboardReadModel(BackgroundFlusher):
+    """Righe precalcolate per studente + refresher in background"""
+
+    def __init__(self):
+        super().__init__('student_dashboard', 'dashboard', config.STUDENT_DASHBOARD_REFRESH_INTERVAL)
+        self.max_age: float = config.STUDENT_DASHBOARD_MAX_AGE
+
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+        self.stats.update({
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'marked_dirty': 0,
+            'refreshed': 0,
+            'refresh_failures': 0,
+        })
+
+    def init_schema(self) -> bool:
+        """Crea la tabella del read model e i trigger sulle tabelle sorgente"""
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS student_dashboard_model (
+                        student_id INTEGER PRIMARY KEY,
+                        scuola_id INTEGER,
+                        payload TEXT NOT NULL,
+                        refreshed_at DOUBLE PRECISION NOT NULL,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                if db_manager.db_type == 'postgresql':
+                    cursor.execute(INVALIDATE_FUNCTION)
+                    for table in SOURCE_TABLES:
+                        cursor.execute('''
+                            SELECT to_regclass(%s) IS NOT NULL,
+                                   EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = %s)
+                        ''', (table, f'{table}_student_dashboard'))
+                        table_exists, trigger_exists = cursor.fetchone()
+                        if table_exists and not trigger_exists:
+                            cursor.execute(f'''
+                                CREATE TRIGGER {table}_student_dashboard
+                                AFTER INSERT OR UPDATE OR DELETE ON {table}
+                                FOR EACH ROW EXECUTE FUNCTION student_dashboard_invalidate()
+                            ''')
+                conn.commit()
+            self._schema_ready = True
+            return True
+        except Exception as e:
+            logger.error(
+                event_type='student_dashboard_init_failed',
+                domain='dashboard',
+                error=str(e)
+            )
+            return False
+
+    # ------------------------------------------------------------------
+    # Lettura
+    # ------------------------------------------------------------------
+
+    def get(self, student_id: int, school_id: int) -> Dict[str, Any]:
+        """
+        Aggregati dello studente per la dashboard. Una lookup per chiave;
+        ricalcola solo se la riga manca, è di un'altra scuola o è scaduta.
+        """
+        row = None
+        try:
+            row = db_manager.query('''
+                SELECT scuola_id, payload, refreshed_at
+                FROM student_dashboard_model
+                WHERE student_id = %s
+            ''', (student_id,), one=True)
+        except Exception as e:
+            logger.warning(
+                event_type='student_dashboard_read_failed',
+                domain='dashboard',
+                student_id=student_id,
+                error=str(e)
+            )
+
+        if row and row['scuola_id'] == school_id:
+            if time.time() - float(row['refreshed_at']) <= self.max_age:
+                self.stats['hits'] += 1
+                return self._view(json.loads(row['payload'], object_hook=_decode))
+            self.stats['stale'] += 1
+        else:
+            self.stats['misses'] += 1
+
+        return self._view(self.refresh(student_id, school_id))
+
+    def _view(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Applica le finestre temporali (trend e attività) alla data di oggi"""
+        today = date.today()
+        trend_from = today - timedelta(days=TREND_DAYS)
+        activity_from = today - timedelta(days=ACTIVITY_DAYS)
+
+        payload['voti_trend'] = [
+            v for v in payload.get('voti_trend', [])
+            if (_as_date(v.get('data')) or today) >= trend_from
+        ]
+        payload['daily_analytics'] = [
+            d for d in payload.get('daily_analytics', [])
+            if (_as_date(d.get('date')) or today) >= activity_from
+        ]
+        return payload
+
+    # ------------------------------------------------------------------
+    # Calcolo
+    # ------------------------------------------------------------------
+
+    def compute(self, student_id: int, school_id: int) -> Dict[str, Any]:
+        """Aggregati dello studente dalle tabelle sorgente (una fan-out)"""
+        data = db_manager.query_many({
+            'voti': ('''
+                SELECT materia, voto, tipo_valutazione, data, note
+                FROM voti
+                WHERE studente_id = %s AND scuola_id = %s
+                ORDER BY data DESC
+                LIMIT %s
+            ''', (student_id, school_id, RECENT_GRADES)),
+            'medie_materie': ('''
+                SELECT materia,
+                       ROUND(AVG(voto)::numeric, 2) as media,
+                       COUNT(*) as num_voti,
+                       MAX(data) as ultimo_voto
+                FROM voti
+                WHERE studente_id = %s AND scuola_id = %s
+                GROUP BY materia
+                ORDER BY materia
+            ''', (student_id, school_id)),
+            'media_generale': ('''
+                SELECT ROUND(AVG(voto)::numeric, 2) as media_generale,
+                       COUNT(*) as totale_voti
+                FROM voti
+                WHERE studente_id = %s AND scuola_id = %s
+            ''', (student_id, school_id), True),
+            'voti_trend': ('''
+                SELECT data, voto, materia
+                FROM voti
+                WHERE studente_id = %s AND scuola_id = %s
+                AND data >= CURRENT_DATE - INTERVAL '90 days'
+                ORDER BY data ASC
+            ''', (student_id, school_id)),
+            'presenze_stats': ('''
+                SELECT
+                    COUNT(*) as giorni_totali,
+                    SUM(CASE WHEN presente = true THEN 1 ELSE 0 END) as presenze,
+                    SUM(CASE WHEN presente = false THEN 1 ELSE 0 END) as assenze,
+                    SUM(CASE WHEN giustificato = true THEN 1 ELSE 0 END) as giustificate,
+                    SUM(CASE WHEN ritardo > 0 THEN 1 ELSE 0 END) as ritardi
+                FROM presenze
+                WHERE studente_id = %s AND scuola_id = %s
+            ''', (student_id, school_id), True),
+            'ultime_presenze': ('''
+                SELECT data, presente, giustificato, ritardo, note
+                FROM presenze
+                WHERE studente_id = %s AND scuola_id = %s
+                ORDER BY data DESC
+                LIMIT %s
+            ''', (student_id, school_id, RECENT_ATTENDANCE)),
+            'daily_analytics': ('''
+                SELECT date, quizzes_completed, messages_sent, ai_interactions, xp_earned
+                FROM daily_analytics
+                WHERE user_id = %s AND date >= CURRENT_DATE - INTERVAL '7 days'
+                ORDER BY date DESC
+                LIMIT 5
+            ''', (student_id,)),
+        })
+
+        return {
+            'voti': data['voti'] or [],
+            'medie_materie': data['medie_materie'] or [],
+            'media_generale': data['media_generale'] or dict(EMPTY_MEDIA),
+            'voti_trend': data['voti_trend'] or [],
+            'presenze_stats': data['presenze_stats'] or dict(EMPTY_PRESENZE),
+            'ultime_presenze': data['ultime_presenze'] or [],
+            'daily_analytics': data['daily_analytics'] or [],
+        }
+
+    def refresh(self, student_id: int, school_id: int) -> Dict[str, Any]:
+        """Ricalcola e salva la riga dello studente"""
+        payload = self.compute(student_id, school_id)
+        try:
+            db_manager.execute('''
+                INSERT INTO student_dashboard_model (student_id, scuola_id, payload, refreshed_at, updated_at)
+                VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (student_id) DO UPDATE SET
+                    scuola_id = excluded.scuola_id,
+                    payload = excluded.payload,
+                    refreshed_at = excluded.refreshed_at,
+                    updated_at = excluded.updated_at
+            ''', (student_id, school_id, json.dumps(payload, default=_encode), time.time()))
+            self.stats['refreshed'] += 1
+        except Exception as e:
+            self.stats['refresh_failures'] += 1
+            logger.warning(
+                event_type='student_dashboard_refresh_failed',
+                domain='dashboard',
+                student_id=student_id,
+                error=str(e)
+            )
+        return payload
+
+    # ------------------------------------------------------------------
+    # Aggiornamenti incrementali
+    # ------------------------------------------------------------------
+
+    def mark_dirty(self, student_ids: Iterable[Any]):
+        """Segna gli studenti da ricalcolare (chiamato dopo l'assegnazione XP)"""
+        ids = set()
+        for student_id in student_ids:
+            try:
+                ids.add(int(student_id))
+            except (TypeError, ValueError):
+                continue
+        if not ids:
+            return
+
+        self._ensure_started()
+        with self._lock:
+            self._dirty.update(ids)
+            self.stats['marked_dirty'] += len(ids)
+
+    def flush(self) -> int:
+        """Ricalcola subito gli studenti segnati che hanno già una riga"""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            if not dirty:
+                return 0
+
+            refreshed = 0
+            try:
+                with self._measure():
+                    ids = sorted(dirty)
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    rows = db_manager.query(f'''
+                        SELECT student_id, scuola_id FROM student_dashboard_model
+                        WHERE student_id IN ({placeholders})
+                    ''', tuple(ids)) or []
+                    # Le righe non ancora materializzate si calcolano alla prima lettura
+                    for row in rows:
+                        self.refresh(row['student_id'], row['scuola_id'])
+                        refreshed += 1
+            except Exception as e:
+                self.stats['refresh_failures'] += 1
+                with self._lock:
+                    self._dirty.update(dirty)
+                logger.error(
+                    event_type='student_dashboard_flush_failed',
+                    domain='dashboard',
+                    error=str(e),
+                    exc_info=True
+                )
+            return refreshed
+
+    def rebuild(self, student_ids: Optional[List[int]] = None) -> int:
+        """Backfill: materializza (o riallinea) le righe degli studenti attivi"""
+        if not self._schema_ready:
+            self.init_schema()
+
+        sql = '''
+            SELECT id, scuola_id FROM utenti
+            WHERE ruolo = 'studente' AND attivo = true AND scuola_id IS NOT NULL
+        '''
+        params: tuple = ()
+        if student_ids:
+            sql += f" AND id IN ({', '.join(['%s'] * len(student_ids))})"
+            params = tuple(student_ids)
+
+        rebuilt = 0
+        for student in db_manager.query(sql + ' ORDER BY id', params) or []:
+            self.refresh(student['id'], student['scuola_id'])
+            rebuilt += 1
+        return rebuilt
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.flusher_stats()
+        with self._lock:
+            stats['pending_refresh'] = len(self._dirty)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0.0
+        return stats
+
+
+student_dashboard = StudentDashboardReadModel()
@@ -95,6 +95,11 @@ class KeepAliveService:
                 WHERE timestamp < %s
             ''', (cutoff_date,))
 
+            from services.messaging.message_history import history_buffer
+            from services.messaging.chat_summary import chat_summary
+            history_buffer.clear()
+            chat_summary.rebuild()
+
             print("🧹 Cleanup storage completato")
         except Exception as e:
             print(f"⚠️ Errore cleanup storage: {e}")
@@ -1,13 +1,18 @@
 import os
 import sqlite3
 import psycopg2
+import psycopg2.extensions
 import psycopg2.pool
 import eventlet
 from eventlet import Queue
 import time
+import threading
 from contextlib import contextmanager
 from typing import Optional, Union, Any, List, Dict, Tuple
 
+from config import config
+from services.database.statement_cache import StatementCache, StatementEntry
+
 # Error handling framework
 from shared.error_handling import (
     DatabaseError,
@@ -30,6 +35,30 @@ class CursorProxy:
         """Truthy solo se rowcount > 0 (per compatibilità ON CONFLICT)"""
         return self.rowcount > 0
 
+class FanOutResult(dict):
+    """Risultati di query_many per nome, con i tempi di ogni query in ms"""
+    def __init__(self):
+        super().__init__()
+        self.timings: Dict[str, float] = {}
+        self.total_ms: float = 0.0
+        self.parallel: bool = False
+
+
+def _eventlet_wait_callback(conn, timeout=-1):
+    """Wait callback psycopg2: durante l'I/O cede il controllo all'hub eventlet"""
+    from eventlet.hubs import trampoline
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+        if state == psycopg2.extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f"Bad result from poll: {state!r}")
+
+
 class DatabaseManager:
     """Gestione database scalabile con supporto PostgreSQL e SQLite"""
 
@@ -38,6 +67,26 @@ class DatabaseManager:
         self.pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
         self.sqlite_pool: Optional[Any] = None
 
+        # Liveness tracking: validazione solo dopo idle, riciclo a fine vita
+        self.validate_after_idle: float = config.DB_POOL_VALIDATE_AFTER_IDLE
+        self.max_connection_lifetime: float = config.DB_POOL_MAX_LIFETIME
+        self._conn_meta: Dict[int, Dict[str, Any]] = {}
+        self._pool_lock = threading.Lock()
+        self._pool_metrics: Dict[str, float] = self._empty_pool_metrics()
+
+        # Unit of work: connessione/transazione condivisa per request o greenlet
+        # (threading.local è greenlet-local con eventlet.monkey_patch)
+        self._scope = threading.local()
+
+        # Cache LRU delle query adattate + prepared statement server-side (opt-in)
+        self.statement_cache = StatementCache(max_size=config.DB_STATEMENT_CACHE_SIZE)
+        self.prepared_statements_enabled: bool = config.DB_PREPARED_STATEMENTS
+        self.prepare_threshold: int = config.DB_PREPARE_THRESHOLD
+
+        # Fan-out di query indipendenti (query_many) su green thread
+        self.green_queries: bool = False
+        self.fanout_max_concurrency: int = config.DB_FANOUT_CONCURRENCY
+
         try:
             if self.db_type == 'postgresql':
                 self.setup_postgresql_pool()
@@ -92,6 +141,8 @@ class DatabaseManager:
         if endpoint_id:
             combined_options = f'endpoint={endpoint_id} {combined_options}'
 
+        self._enable_green_psycopg()
+
         try:
             self.pool = psycopg2.pool.ThreadedConnectionPool(
                 minconn=10,  # Minimo 10 connessioni ready
@@ -121,6 +172,24 @@ class DatabaseManager:
             )
             raise
 
+    def _enable_green_psycopg(self):
+        """
+        Rende psycopg2 cooperativo con eventlet se il processo è monkey-patched:
+        mentre una query attende il database gli altri greenlet proseguono,
+        e query_many può eseguire più query in parallelo.
+        """
+        if self.green_queries or not config.DB_GREEN_QUERIES:
+            return
+        if not eventlet.patcher.is_monkey_patched('socket'):
+            return
+        psycopg2.extensions.set_wait_callback(_eventlet_wait_callback)
+        self.green_queries = True
+        logger.info(
+            event_type='postgres_green_queries_enabled',
+            domain='database',
+            message='psycopg2 wait callback eventlet attivo'
+        )
+
     def setup_sqlite_pool(self):
         """Connection pool SQLite ottimizzato"""
         class SQLitePool:
@@ -231,36 +300,231 @@ class DatabaseManager:
                 )
             finally:
                 self.pool = None
+                with self._pool_lock:
+                    self._conn_meta.clear()
+                    self._pool_metrics['pool_recreations'] += 1
             self.setup_postgresql_pool()
 
+    @staticmethod
+    def _empty_pool_metrics() -> Dict[str, float]:
+        return {
+            'checkouts': 0,
+            'checkout_wait_total_ms': 0.0,
+            'checkout_wait_max_ms': 0.0,
+            'validations': 0,
+            'validations_skipped': 0,
+            'validation_failures': 0,
+            'validation_total_ms': 0.0,
+            'recycled_max_lifetime': 0,
+            'discarded_broken': 0,
+            'pool_recreations': 0,
+            'uow_scopes': 0,
+            'uow_reused_calls': 0,
+            'uow_rollbacks': 0,
+            'prepared_created': 0,
+            'prepared_executions': 0,
+            'prepare_failures': 0,
+            'fanout_batches': 0,
+            'fanout_parallel_batches': 0,
+            'fanout_queries': 0,
+            'fanout_saved_ms': 0.0,
+        }
+
+    def _checkout_postgres(self):
+        """
+        Preleva una connessione dal pool validandola solo se necessario.
+
+        Il SELECT 1 viene eseguito solo se la connessione è rimasta inattiva
+        oltre `validate_after_idle` secondi; le connessioni più vecchie di
+        `max_connection_lifetime` vengono chiuse e sostituite.
+        """
+        while True:
+            wait_start = time.perf_counter()
+            conn = self.pool.getconn()
+            wait_ms = (time.perf_counter() - wait_start) * 1000
+            now = time.monotonic()
+
+            with self._pool_lock:
+                metrics = self._pool_metrics
+                metrics['checkouts'] += 1
+                metrics['checkout_wait_total_ms'] += wait_ms
+                metrics['checkout_wait_max_ms'] = max(metrics['checkout_wait_max_ms'], wait_ms)
+                meta = self._conn_meta.get(id(conn))
+                if meta is None:
+                    # Connessione nuova (o appena creata dal pool)
+                    meta = {'created_at': now, 'last_used': now}
+                    self._conn_meta[id(conn)] = meta
+                    needs_validation = False
+                    expired = False
+                else:
+                    needs_validation = now - meta['last_used'] >= self.validate_after_idle
+                    expired = now - meta['created_at'] >= self.max_connection_lifetime
+
+            if conn.closed or expired:
+                # Connessione chiusa lato client o a fine vita: sostituiscila
+                self._discard_connection(conn, 'recycled_max_lifetime' if expired else 'discarded_broken')
+                continue
+
+            if needs_validation:
+                validation_start = time.perf_counter()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                    cursor.close()
+                    # Evita di lasciare una transazione aperta per il solo ping
+                    conn.rollback()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    with self._pool_lock:
+                        self._pool_metrics['validation_failures'] += 1
+                    self._discard_connection(conn, 'discarded_broken')
+                    raise
+                finally:
+                    with self._pool_lock:
+                        self._pool_metrics['validations'] += 1
+                        self._pool_metrics['validation_total_ms'] += (time.perf_counter() - validation_start) * 1000
+            else:
+                with self._pool_lock:
+                    self._pool_metrics['validations_skipped'] += 1
+
+            return conn
+
+    def _release_postgres(self, conn):
+        """Restituisce la connessione al pool aggiornando last_used"""
+        with self._pool_lock:
+            meta = self._conn_meta.get(id(conn))
+            if meta is not None:
+                meta['last_used'] = time.monotonic()
+        self.pool.putconn(conn)
+        if conn.closed:
+            # Oltre minconn il pool chiude la connessione invece di tenerla
+            with self._pool_lock:
+                self._conn_meta.pop(id(conn), None)
+
+    def _discard_connection(self, conn, reason: str):
+        """Chiude definitivamente una connessione del pool"""
+        with self._pool_lock:
+            self._conn_meta.pop(id(conn), None)
+            if reason in self._pool_metrics:
+                self._pool_metrics[reason] += 1
+        try:
+            self.pool.putconn(conn, close=True)
+        except Exception as putconn_error:
+            # Log error but continue - connection is already dead
+            logger.debug(
+                event_type='failed_connection_cleanup',
+                domain='database',
+                error=str(putconn_error),
+                message='Error closing failed connection (expected)'
+            )
+
+    @property
+    def pool_stats(self) -> Dict[str, Any]:
+        """Metriche del pool: attese di checkout, validazioni e riciclo connessioni"""
+        with self._pool_lock:
+            metrics = dict(self._pool_metrics)
+            tracked = list(self._conn_meta.values())
+
+        now = time.monotonic()
+        checkouts = metrics['checkouts'] or 0
+        metrics['checkout_wait_avg_ms'] = round(metrics['checkout_wait_total_ms'] / checkouts, 3) if checkouts else 0.0
+        metrics['validation_rate'] = round(metrics['validations'] / checkouts, 4) if checkouts else 0.0
+        metrics['tracked_connections'] = len(tracked)
+        metrics['oldest_connection_age_s'] = round(max((now - m['created_at'] for m in tracked), default=0.0), 1)
+        metrics['validate_after_idle_s'] = self.validate_after_idle
+        metrics['max_connection_lifetime_s'] = self.max_connection_lifetime
+        metrics['db_type'] = self.db_type
+        metrics['statement_cache'] = self.statement_cache.get_stats()
+        metrics['prepared_statements_enabled'] = self.prepared_statements_enabled
+        metrics['green_queries'] = self.green_queries
+        return metrics
+
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Unit of work opt-in: una sola connessione e una sola transazione per
+        l'intero handler (Flask request o evento Socket.IO).
+
+        Tutte le chiamate db_manager.query/execute/get_connection eseguite
+        nello scope riusano la connessione vincolata, senza checkout né
+        commit propri; il commit avviene una volta sola all'uscita.
+        Semantica tutto-o-niente: se una chiamata interna fallisce, anche se
+        l'eccezione viene gestita dal chiamante, la transazione viene annullata.
+
+        Usabile come context manager o decoratore:
+
+            with db_manager.unit_of_work():
+                ...
+
+            @db_manager.unit_of_work()
+            def handler(): ...
+        """
+        scope = self._scope
+        if getattr(scope, 'conn', None) is not None:
+            # Scope annidato: riusa la transazione già aperta
+            yield scope.conn
+            return
+
+        with self.get_connection() as conn:
+            scope.conn = conn
+            scope.failed = False
+            with self._pool_lock:
+                self._pool_metrics['uow_scopes'] += 1
+            try:
+                yield conn
+                if scope.failed:
+                    # Una chiamata interna è fallita: nessun commit parziale
+                    conn.rollback()
+                    with self._pool_lock:
+                        self._pool_metrics['uow_rollbacks'] += 1
+                    logger.warning(
+                        event_type='unit_of_work_rolled_back',
+                        domain='database',
+                        message='Unit of work annullata per errore in una query interna'
+                    )
+            finally:
+                scope.conn = None
+                scope.failed = False
+
+    def in_unit_of_work(self) -> bool:
+        """True se il greenlet corrente ha una unit of work attiva"""
+        return getattr(self._scope, 'conn', None) is not None
+
     @contextmanager
     def get_connection(self):
         """Context manager per gestione automatica connessioni con retry atomico per Neon sleep"""
+        bound_conn = getattr(self._scope, 'conn', None)
+        if bound_conn is not None:
+            # Dentro una unit of work: niente checkout, niente commit
+            with self._pool_lock:
+                self._pool_metrics['uow_reused_calls'] += 1
+            try:
+                yield bound_conn
+            except Exception:
+                self._scope.failed = True
+                raise
+            return
+
         if self.db_type == 'postgresql':
             max_retries = 8  # Più tentativi per gestire Neon sleep
             retry_count = 0
             conn = None
             last_error = None
+            yielded = False
 
             while retry_count < max_retries:
                 conn = None
                 try:
-                    # Ottieni connessione dal pool
-                    conn = self.pool.getconn()
-
-                    # TEST ATOMICO: Verifica connessione subito prima dell'uso
-                    # Questo garantisce che sia valida nel momento esatto della query
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT 1')
-                    cursor.fetchone()
-                    cursor.close()
+                    # Ottieni connessione dal pool (SELECT 1 solo dopo idle prolungato)
+                    conn = self._checkout_postgres()
 
-                    # Connessione verificata - procedi con operazione utente
+                    # Connessione pronta - procedi con operazione utente
+                    yielded = True
                     yield conn
                     conn.commit()
 
                     # Restituisci connessione al pool
-                    self.pool.putconn(conn)
+                    self._release_postgres(conn)
                     return  # Success
 
                 except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
@@ -279,18 +543,14 @@ class DatabaseManager:
 
                     # IMPORTANTE: Chiudi connessione fallita
                     if conn:
-                        try:
-                            self.pool.putconn(conn, close=True)
-                        except Exception as putconn_error:
-                            # Log error but continue - connection is already dead
-                            logger.debug(
-                                event_type='failed_connection_cleanup',
-                                domain='database',
-                                error=str(putconn_error),
-                                message='Error closing failed connection (expected)'
-                            )
+                        self._discard_connection(conn, 'discarded_broken')
                         conn = None
 
+                    # Errore durante l'operazione utente: il context manager
+                    # non può ri-eseguire il blocco, quindi propaga l'errore
+                    if yielded:
+                        raise
+
                     # Ricrea pool SOLO se errore di connessione/SSL
                     if any(keyword in error_msg for keyword in ['ssl', 'connection', 'closed', 'eof', 'timeout']):
                         logger.warning(
@@ -339,7 +599,7 @@ class DatabaseManager:
                     if conn:
                         try:
                             conn.rollback()
-                            self.pool.putconn(conn)
+                            self._release_postgres(conn)
                         except Exception as cleanup_error:
                             logger.warning(
                                 event_type='connection_cleanup_failed',
@@ -392,9 +652,91 @@ class DatabaseManager:
             adapted_query = query.replace('%s', '?')
             return adapted_query, params
 
+    def _statement(self, sql: str, params: Optional[Tuple], for_execute: bool = False) -> StatementEntry:
+        """Query adattata dalla cache LRU (placeholder + RETURNING id calcolati una volta sola)"""
+        key = (self.db_type, sql, bool(params), for_execute)
+        entry = self.statement_cache.get(key)
+        if entry is not None:
+            return entry
+
+        adapted_sql, _ = self._adapt_params(sql, params)
+
+        # PostgreSQL: Aggiungi RETURNING id SOLO se sicuro
+        returning_added = False
+        if for_execute and self.db_type == 'postgresql':
+            upper_sql = adapted_sql.strip().upper()
+            if upper_sql.startswith('INSERT'):
+                # Aggiungi RETURNING id SOLO se:
+                # 1. Non ha già RETURNING
+                # 2. Non ha ON CONFLICT (potrebbe non inserire)
+                if 'RETURNING' not in upper_sql and 'ON CONFLICT' not in upper_sql:
+                    # Rimuovi eventuale punto e virgola finale
+                    clean_sql = adapted_sql.rstrip().rstrip(';')
+                    adapted_sql = f"{clean_sql} RETURNING id"
+                    returning_added = True
+
+        entry = StatementEntry(adapted_sql, returning_added=returning_added)
+        if self.db_type != 'postgresql':
+            entry.name = None
+        return self.statement_cache.put(key, entry)
+
+    def _execute_statement(self, conn, cursor, entry: StatementEntry, params: Optional[Tuple]):
+        """Esegue la query, via EXECUTE se preparata lato server su questa connessione"""
+        if (self.prepared_statements_enabled and entry.name and params
+                and not isinstance(params, dict)
+                and len(params) == entry.param_count
+                and entry.uses >= self.prepare_threshold
+                and self._ensure_prepared(conn, cursor, entry)):
+            placeholders = ', '.join(['%s'] * entry.param_count)
+            cursor.execute(f"EXECUTE {entry.name} ({placeholders})", tuple(params))
+            with self._pool_lock:
+                self._pool_metrics['prepared_executions'] += 1
+            return
+        cursor.execute(entry.sql, params or ())
+
+    def _ensure_prepared(self, conn, cursor, entry: StatementEntry) -> bool:
+        """PREPARE della query sulla connessione (una volta per connessione)"""
+        with self._pool_lock:
+            meta = self._conn_meta.get(id(conn))
+            if meta is None:
+                return False
+            prepared = meta.setdefault('prepared', set())
+            if entry.name in prepared:
+                return True
+
+        try:
+            # Savepoint: un PREPARE fallito non deve abortire la transazione
+            cursor.execute(
+                f"SAVEPOINT skj_prepare; "
+                f"PREPARE {entry.name} AS {entry.prepare_sql}; "
+                f"RELEASE SAVEPOINT skj_prepare"
+            )
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT skj_prepare")
+            if 'already exists' in str(e).lower():
+                with self._pool_lock:
+                    prepared.add(entry.name)
+                return True
+            # Query non preparabile: non riprovare
+            entry.name = None
+            with self._pool_lock:
+                self._pool_metrics['prepare_failures'] += 1
+            logger.debug(
+                event_type='prepare_statement_failed',
+                domain='database',
+                error=str(e)[:200],
+                sql=entry.sql[:100]
+            )
+            return False
+
+        with self._pool_lock:
+            prepared.add(entry.name)
+            self._pool_metrics['prepared_created'] += 1
+        return True
+
     def query(self, sql: str, params: Optional[Tuple] = None, one: bool = False, many: bool = True) -> Union[Optional[Dict[str, Any]], List[Dict[str, Any]], List[Any]]:
         """Wrapper unificato per SELECT con risultati dict-like"""
-        adapted_sql, adapted_params = self._adapt_params(sql, params)
+        entry = self._statement(sql, params)
 
         with self.get_connection() as conn:
             if self.db_type == 'postgresql':
@@ -405,7 +747,7 @@ class DatabaseManager:
                 # SQLite ha già Row factory configurata
                 cursor = conn.cursor()
 
-            cursor.execute(adapted_sql, adapted_params or ())
+            self._execute_statement(conn, cursor, entry, params)
 
             if one:
                 result = cursor.fetchone()
@@ -416,34 +758,81 @@ class DatabaseManager:
             else:
                 return cursor.fetchall()
 
+    def query_many(self, queries: Dict[str, Tuple], max_concurrency: Optional[int] = None) -> FanOutResult:
+        """
+        Fan-out di query indipendenti: ognuna su una propria connessione del
+        pool, in green thread concorrenti (al più max_concurrency alla volta).
+        La latenza complessiva tende a quella della query più lenta.
+
+            results = db_manager.query_many({
+                'voti': (sql, params),
+                'media': (sql, params, True),   # one=True
+            })
+            results['voti'], results.timings['voti']
+
+        Le query vengono eseguite in sequenza su SQLite, dentro una unit of
+        work (devono vedere la stessa transazione) o se psycopg2 non è
+        cooperativo con eventlet. Un errore viene rilanciato solo dopo che
+        tutte le query sono terminate.
+        """
+        result = FanOutResult()
+        errors: Dict[str, Exception] = {}
+        start = time.perf_counter()
+
+        def run(name: str, spec: Tuple):
+            sql = spec[0]
+            params = spec[1] if len(spec) > 1 else None
+            one = spec[2] if len(spec) > 2 else False
+            query_start = time.perf_counter()
+            try:
+                result[name] = self.query(sql, params, one=one)
+            except Exception as e:
+                errors[name] = e
+            finally:
+                result.timings[name] = round((time.perf_counter() - query_start) * 1000, 2)
+
+        concurrency = min(max_concurrency or self.fanout_max_concurrency, len(queries))
+        result.parallel = (
+            self.db_type == 'postgresql' and self.green_queries
+            and concurrency > 1 and not self.in_unit_of_work()
+        )
+        if result.parallel:
+            pool = eventlet.GreenPool(concurrency)
+            for name, spec in queries.items():
+                pool.spawn_n(run, name, spec)
+            pool.waitall()
+        else:
+            for name, spec in queries.items():
+                run(name, spec)
+
+        result.total_ms = round((time.perf_counter() - start) * 1000, 2)
+        with self._pool_lock:
+            metrics = self._pool_metrics
+            metrics['fanout_batches'] += 1
+            metrics['fanout_queries'] += len(queries)
+            if result.parallel:
+                metrics['fanout_parallel_batches'] += 1
+                metrics['fanout_saved_ms'] += max(sum(result.timings.values()) - result.total_ms, 0.0)
+
+        for name in queries:
+            if name in errors:
+                raise errors[name]
+        return result
+
     def execute(self, sql: str, params: Optional[Tuple] = None) -> Union[CursorProxy, int, Any]:
         """Wrapper unificato per INSERT/UPDATE/DELETE con supporto RETURNING id intelligente"""
-        adapted_sql, adapted_params = self._adapt_params(sql, params)
+        entry = self._statement(sql, params, for_execute=True)
 
         with self.get_connection() as conn:
             cursor = conn.cursor()
 
-            # PostgreSQL: Aggiungi RETURNING id SOLO se sicuro
-            returning_added = False
-            if self.db_type == 'postgresql':
-                if adapted_sql.strip().upper().startswith('INSERT'):
-                    # Aggiungi RETURNING id SOLO se:
-                    # 1. Non ha già RETURNING
-                    # 2. Non ha ON CONFLICT (potrebb not inserire)
-                    if ('RETURNING' not in adapted_sql.upper() and 
-                        'ON CONFLICT' not in adapted_sql.upper()):
-                        # Rimuovi eventuale punto e virgola finale
-                        clean_sql = adapted_sql.rstrip().rstrip(';')
-                        adapted_sql = f"{clean_sql} RETURNING id"
-                        returning_added = True
-
-            cursor.execute(adapted_sql, adapted_params or ())
+            self._execute_statement(conn, cursor, entry, params)
 
             # Restituisce CursorProxy per compatibilità con lastrowid
             if self.db_type == 'postgresql':
-                if adapted_sql.strip().upper().startswith('INSERT'):
+                if entry.is_insert:
                     # Se abbiamo aggiunto RETURNING, fetch il risultato
-                    if returning_added or 'RETURNING' in adapted_sql.upper():
+                    if entry.returning_added or entry.has_returning:
                         try:
                             result = cursor.fetchone()
                             if result:
@@ -0,0 +1,127 @@
+"""
+SKAJLA - Statement Cache
+LRU delle query adattate (placeholder PostgreSQL/SQLite, RETURNING id) e
+nomi dei prepared statement server-side per le query più frequenti.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Solo queste istruzioni possono essere usate con PREPARE
+PREPARABLE_COMMANDS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+class StatementEntry:
+    """Query già adattata e metadati per l'eventuale PREPARE"""
+
+    __slots__ = (
+        'sql', 'is_insert', 'has_returning', 'returning_added',
+        'name', 'prepare_sql', 'param_count', 'uses'
+    )
+
+    def __init__(self, sql: str, returning_added: bool = False):
+        upper_sql = sql.strip().upper()
+        self.sql: str = sql
+        self.is_insert: bool = upper_sql.startswith('INSERT')
+        self.has_returning: bool = 'RETURNING' in upper_sql
+        self.returning_added: bool = returning_added
+        self.uses: int = 0
+
+        # Versione con $1..$n per PREPARE (None se non preparabile)
+        self.name: Optional[str] = None
+        self.prepare_sql: Optional[str] = None
+        self.param_count: int = 0
+
+        if upper_sql.startswith(PREPARABLE_COMMANDS):
+            positional = to_positional_sql(sql)
+            if positional is not None:
+                self.prepare_sql, self.param_count = positional
+                digest = hashlib.md5(sql.encode('utf-8')).hexdigest()[:16]
+                self.name = f"skj_{digest}"
+
+
+def to_positional_sql(sql: str):
+    """
+    Converte i placeholder psycopg2 (%s) in parametri posizionali ($1..$n).
+
+    Ritorna (sql, numero_parametri) oppure None se la query usa parametri
+    nominali (%(name)s) o formati non supportati.
+    """
+    out = []
+    count = 0
+    i = 0
+    length = len(sql)
+    while i < length:
+        char = sql[i]
+        if char == '%' and i + 1 < length:
+            nxt = sql[i + 1]
+            if nxt == 's':
+                count += 1
+                out.append(f"${count}")
+                i += 2
+                continue
+            if nxt == '%':
+                # %% è un % letterale per psycopg2: PREPARE viene inviato senza parametri
+                out.append('%')
+                i += 2
+                continue
+            return None
+        out.append(char)
+        i += 1
+    return ''.join(out), count
+
+
+class StatementCache:
+    """
+    Cache LRU thread-safe keyed sul testo SQL originale.
+
+    Evita di ripetere l'adattamento dei placeholder ad ogni chiamata e tiene
+    il conteggio d'uso per decidere quando preparare la query lato server.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[tuple, StatementEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[StatementEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry.uses += 1
+            return entry
+
+    def put(self, key: tuple, entry: StatementEntry) -> StatementEntry:
+        with self._lock:
+            entry.uses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0.0,
+            }
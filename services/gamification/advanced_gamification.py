@@ -394,9 +394,13 @@ class AdvancedGamificationManager:
                         ON CONFLICT (codice) DO NOTHING
                     ''', (badge['codice'], badge['nome'], badge['descrizione'], 
                           badge['rarita'], json.dumps(badge['condizioni']), badge['reward_xp']))
-                
-                logger.info(f"Seeded {len(default_badges)} default badges")
-                return True
+            
+            # Recompile badge rules (here and, via Redis, on other workers)
+            from services.gamification.badge_rule_index import badge_rule_index
+            badge_rule_index.invalidate()
+            
+            logger.info(f"Seeded {len(default_badges)} default badges")
+            return True
                 
         except Exception as e:
             logger.error(f"Error seeding badges: {e}")
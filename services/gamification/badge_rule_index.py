@@ -0,0 +1,234 @@
+"""
+Badge Rule Index - Precompiled badge conditions for XPManagerV2
+Conditions from badges_v2 are decoded once and indexed by the stat they
+depend on, so an award only evaluates the rules whose thresholds were
+just crossed instead of scanning every locked badge.
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.gamification.advanced_gamification import RANK_ORDER
+from services.redis_service import redis_manager
+from shared.error_handling.structured_logger import get_logger
+
+logger = get_logger(__name__)
+
+VERSION_KEY = 'gamification:badges:version'
+
+
+def _rank_index(rango: Optional[str]) -> int:
+    return RANK_ORDER.index(rango) if rango in RANK_ORDER else 0
+
+
+def stat_value(user_stats: Dict[str, Any], key: str):
+    """Comparable value of a stat ('rango' is compared by rank order)"""
+    if key == 'rango':
+        return _rank_index(user_stats.get('rango'))
+    return user_stats.get(key) or 0
+
+
+class BadgeRule:
+    """Compiled badge: all conditions must hold to unlock it"""
+
+    __slots__ = ('badge_id', 'codice', 'nome', 'bit', 'conditions')
+
+    def __init__(self, badge_id: int, codice: str, nome: str, bit: int, condizioni: Dict[str, Any]):
+        self.badge_id = badge_id
+        self.codice = codice
+        self.nome = nome
+        self.bit = bit
+        self.conditions: List[Tuple[str, Any]] = [
+            (key, _rank_index(value) if key == 'rango' else value)
+            for key, value in condizioni.items()
+        ]
+
+    def matches(self, user_stats: Dict[str, Any]) -> bool:
+        return all(stat_value(user_stats, key) >= threshold for key, threshold in self.conditions)
+
+
+class BadgeRuleIndex:
+    """
+    Rules indexed by stat and sorted by threshold, plus a per-user LRU of
+    unlocked-badge bitmaps and the last stats seen for that user.
+
+    The index is rebuilt on invalidate() (and on other workers through the
+    Redis version key), or after RELOAD_INTERVAL as a safety net.
+    """
+
+    RELOAD_INTERVAL = 600
+    VERSION_CHECK_INTERVAL = 30
+    USER_CACHE_SIZE = 20000
+
+    def __init__(self):
+        self._rules: List[BadgeRule] = []
+        self._by_stat: Dict[str, Tuple[List[Any], List[BadgeRule]]] = {}
+        self._loaded_at = 0.0
+        self._version_checked_at = 0.0
+        self._version: Optional[str] = None
+        self._stale = True
+        self._users: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            'reloads': 0,
+            'checks': 0,
+            'full_scans': 0,
+            'rules_evaluated': 0,
+        }
+
+    # =========================================================================
+    # INDEX
+    # =========================================================================
+
+    def invalidate(self):
+        """Call after badges_v2 changes; other workers reload via Redis"""
+        self._stale = True
+        if redis_manager.use_redis:
+            try:
+                redis_manager.redis_client.incr(VERSION_KEY)
+            except Exception as e:
+                logger.warning(f"Badge index version bump failed: {e}")
+
+    def _needs_reload(self) -> bool:
+        now = time.time()
+        if self._stale or now - self._loaded_at > self.RELOAD_INTERVAL:
+            return True
+        if redis_manager.use_redis and now - self._version_checked_at > self.VERSION_CHECK_INTERVAL:
+            self._version_checked_at = now
+            try:
+                return redis_manager.redis_client.get(VERSION_KEY) != self._version
+            except Exception:
+                return False
+        return False
+
+    def ensure_loaded(self, cursor):
+        if not self._needs_reload():
+            return
+
+        version = None
+        if redis_manager.use_redis:
+            try:
+                version = redis_manager.redis_client.get(VERSION_KEY)
+            except Exception:
+                pass
+
+        cursor.execute('SELECT id, codice, nome, condizioni FROM badges_v2 ORDER BY id')
+        rules = []
+        for badge_id, codice, nome, condizioni in cursor.fetchall():
+            if isinstance(condizioni, str):
+                condizioni = json.loads(condizioni)
+            rules.append(BadgeRule(badge_id, codice, nome, len(rules), condizioni or {}))
+
+        by_stat: Dict[str, List[Tuple[Any, BadgeRule]]] = {}
+        for rule in rules:
+            for key, threshold in rule.conditions:
+                by_stat.setdefault(key, []).append((threshold, rule))
+        compiled = {}
+        for key, entries in by_stat.items():
+            entries.sort(key=lambda entry: entry[0])
+            compiled[key] = ([t for t, _ in entries], [r for _, r in entries])
+
+        with self._lock:
+            self._rules = rules
+            self._by_stat = compiled
+            # Bit positions may have changed
+            self._users.clear()
+            self._version = version
+            self._loaded_at = self._version_checked_at = time.time()
+            self._stale = False
+            self.stats['reloads'] += 1
+
+        logger.info(f"Badge rule index loaded: {len(rules)} rules, {len(compiled)} stats")
+
+    # =========================================================================
+    # CANDIDATES
+    # =========================================================================
+
+    def _user_entry(self, cursor, user_id: int) -> Tuple[Dict[str, Any], bool]:
+        """Cached (unlocked bitmap, last stats); True if it was just loaded"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+                return entry, False
+
+        cursor.execute('SELECT badge_id FROM user_badges_v2 WHERE user_id = %s', (user_id,))
+        unlocked_ids = {row[0] for row in cursor.fetchall()}
+        mask = 0
+        for rule in self._rules:
+            if rule.badge_id in unlocked_ids:
+                mask |= 1 << rule.bit
+
+        entry = {'unlocked': mask, 'stats': None}
+        with self._lock:
+            self._users[user_id] = entry
+            while len(self._users) > self.USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+        return entry, True
+
+    def candidates(self, cursor, user_id: int, user_stats: Dict[str, Any]) -> List[BadgeRule]:
+        """
+        Locked rules satisfied by user_stats, checking only crossed thresholds.
+        The cache is not touched: call apply() once the badge INSERTs commit.
+        """
+        self.ensure_loaded(cursor)
+        self.stats['checks'] += 1
+
+        entry, fresh = self._user_entry(cursor, user_id)
+        previous = entry['stats']
+
+        if fresh or previous is None:
+            # First check for this user in this worker: evaluate every rule once
+            self.stats['full_scans'] += 1
+            to_check = self._rules
+        else:
+            seen = set()
+            to_check = []
+            for key, (thresholds, rules) in self._by_stat.items():
+                old, new = stat_value(previous, key), stat_value(user_stats, key)
+                if new <= old:
+                    continue
+                # Rules with old < threshold <= new
+                lo = bisect.bisect_right(thresholds, old)
+                hi = bisect.bisect_right(thresholds, new)
+                for rule in rules[lo:hi]:
+                    if rule.bit not in seen:
+                        seen.add(rule.bit)
+                        to_check.append(rule)
+
+        unlocked = entry['unlocked']
+        self.stats['rules_evaluated'] += len(to_check)
+        return [
+            rule for rule in to_check
+            if not unlocked & (1 << rule.bit) and rule.matches(user_stats)
+        ]
+
+    def apply(self, updates: List[Tuple[int, Dict[str, Any], List[BadgeRule]]]):
+        """
+        After commit: remember the stats each check saw and the badges it
+        unlocked. On rollback the caller skips this, so the next check
+        compares against the previous stats and retries the same badges.
+        """
+        with self._lock:
+            for user_id, user_stats, rules in updates:
+                entry = self._users.get(user_id)
+                if entry is None:
+                    continue
+                entry['stats'] = dict(user_stats)
+                for rule in rules:
+                    entry['unlocked'] |= 1 << rule.bit
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['rules'] = len(self._rules)
+        stats['indexed_stats'] = len(self._by_stat)
+        stats['cached_users'] = len(self._users)
+        return stats
+
+
+# Shared by every XPManagerV2 instance in the worker
+badge_rule_index = BadgeRuleIndex()
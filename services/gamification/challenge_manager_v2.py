@@ -3,7 +3,9 @@ Challenge Manager V2 - Manages daily, weekly, and class challenges
 Adapted for SKAJLA's DatabaseManager pattern
 """
 
+import hashlib
 import json
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import random
@@ -384,49 +386,188 @@ class ChallengeManagerV2:
     # GLOBAL ASSIGNMENT (for scheduler)
     # =========================================================================
     
-    def assegna_sfide_giornaliere_globale(self):
-        """Assign daily challenges to all users (run at midnight)"""
+    ACTIVE_USERS_SQL = '''
+        SELECT user_id FROM user_gamification_v2
+        WHERE ultimo_accesso > CURRENT_TIMESTAMP - INTERVAL '7 days'
+    '''
+    
+    # Rows per INSERT/commit in the bulk jobs
+    BULK_CHUNK_SIZE = 5000
+    
+    def assegna_sfide_giornaliere_globale(self) -> Dict:
+        """
+        Assign daily challenges to all users (run at midnight)
+        
+        Set-based: one query finds the active users without today's
+        challenge, the challenge is picked in Python with a hash of
+        (day, user_id) and rows are written with chunked execute_values.
+        Re-running the job on the same day is a no-op.
+        """
+        started = time.perf_counter()
+        day_key = datetime.now().strftime('%Y-%m-%d')
+        
         try:
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Get all active users (logged in last 7 days)
                 cursor.execute('''
-                    SELECT DISTINCT user_id FROM user_gamification_v2
-                    WHERE ultimo_accesso > CURRENT_TIMESTAMP - INTERVAL '7 days'
+                    SELECT id, obiettivi FROM challenges_v2
+                    WHERE tipo = 'giornaliera' AND attiva = TRUE
+                    ORDER BY id
+                ''')
+                challenges = [(row[0], self._initial_progress(row[1])) for row in cursor.fetchall()]
+                
+                cursor.execute(f'''
+                    SELECT a.user_id FROM ({self.ACTIVE_USERS_SQL}) a
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM user_challenges_v2 uc
+                        JOIN challenges_v2 c ON uc.challenge_id = c.id
+                        WHERE uc.user_id = a.user_id AND c.tipo = 'giornaliera'
+                        AND uc.assegnata_at::date = CURRENT_DATE
+                    )
+                    ORDER BY a.user_id
                 ''')
-                
                 users = [row[0] for row in cursor.fetchall()]
-                
-                for user_id in users:
-                    self.assegna_sfida_giornaliera(user_id)
-                
-                logger.info(f"Daily challenges assigned to {len(users)} users")
-                
+            
+            if not challenges:
+                logger.info("No active daily challenges to assign")
+                return {'success': False, 'message': 'Nessuna sfida disponibile'}
+            
+            rows = []
+            for user_id in users:
+                challenge_id, progresso = challenges[self._pick(day_key, user_id) % len(challenges)]
+                rows.append((user_id, challenge_id, progresso))
+            
+            inserted = self._bulk_insert_user_challenges(rows, 'daily')
+            elapsed = round(time.perf_counter() - started, 2)
+            logger.info(f"Daily challenges assigned to {inserted} users in {elapsed}s")
+            return {'success': True, 'users': len(users), 'assigned': inserted, 'elapsed_s': elapsed}
+            
         except Exception as e:
             logger.error(f"Error in global daily challenge assignment: {e}")
+            return {'success': False, 'message': str(e)}
     
-    def assegna_sfide_settimanali_globale(self):
-        """Assign weekly challenges to all users (run on Monday)"""
+    def assegna_sfide_settimanali_globale(self) -> Dict:
+        """
+        Assign weekly challenges to all users (run on Monday)
+        
+        Old uncompleted weekly challenges are removed with one DELETE,
+        then each active user gets one challenge per difficulty they do
+        not have yet this week, picked with a hash of (week, user_id,
+        difficulty) among the challenges not already assigned to them.
+        """
+        started = time.perf_counter()
+        week_key = datetime.now().strftime('%G-W%V')
+        
         try:
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # Get all active users
-                cursor.execute('''
-                    SELECT DISTINCT user_id FROM user_gamification_v2
-                    WHERE ultimo_accesso > CURRENT_TIMESTAMP - INTERVAL '7 days'
+                # Clean old uncompleted weekly challenges
+                cursor.execute(f'''
+                    DELETE FROM user_challenges_v2 uc
+                    USING challenges_v2 c
+                    WHERE uc.challenge_id = c.id AND c.tipo = 'settimanale'
+                    AND uc.completato = FALSE
+                    AND uc.assegnata_at < date_trunc('week', CURRENT_DATE)
+                    AND uc.user_id IN ({self.ACTIVE_USERS_SQL})
                 ''')
+                removed = cursor.rowcount
                 
+                cursor.execute('''
+                    SELECT id, difficolta, obiettivi FROM challenges_v2
+                    WHERE tipo = 'settimanale' AND attiva = TRUE
+                    ORDER BY id
+                ''')
+                by_difficulty: Dict[str, List[tuple]] = {}
+                challenge_difficulty: Dict[int, str] = {}
+                for challenge_id, difficolta, obiettivi in cursor.fetchall():
+                    by_difficulty.setdefault(difficolta, []).append(
+                        (challenge_id, self._initial_progress(obiettivi))
+                    )
+                    challenge_difficulty[challenge_id] = difficolta
+                
+                cursor.execute(self.ACTIVE_USERS_SQL + ' ORDER BY user_id')
                 users = [row[0] for row in cursor.fetchall()]
                 
-                for user_id in users:
-                    self.assegna_sfide_settimanali(user_id)
-                
-                logger.info(f"Weekly challenges assigned to {len(users)} users")
-                
+                # Weekly challenges each active user already has
+                cursor.execute(f'''
+                    SELECT uc.user_id, uc.challenge_id FROM user_challenges_v2 uc
+                    JOIN challenges_v2 c ON uc.challenge_id = c.id
+                    WHERE c.tipo = 'settimanale'
+                    AND uc.assegnata_at >= date_trunc('week', CURRENT_DATE)
+                    AND uc.user_id IN ({self.ACTIVE_USERS_SQL})
+                ''')
+                assigned: Dict[int, set] = {}
+                for user_id, challenge_id in cursor.fetchall():
+                    assigned.setdefault(user_id, set()).add(challenge_id)
+            
+            rows = []
+            for user_id in users:
+                current = assigned.get(user_id, set())
+                have = {challenge_difficulty.get(cid) for cid in current}
+                for difficolta in ['facile', 'media', 'difficile']:
+                    if difficolta in have:
+                        continue
+                    candidates = [c for c in by_difficulty.get(difficolta, []) if c[0] not in current]
+                    if not candidates:
+                        continue
+                    challenge_id, progresso = candidates[
+                        self._pick(week_key, user_id, difficolta) % len(candidates)
+                    ]
+                    rows.append((user_id, challenge_id, progresso))
+            
+            inserted = self._bulk_insert_user_challenges(rows, 'weekly')
+            elapsed = round(time.perf_counter() - started, 2)
+            logger.info(
+                f"Weekly challenges assigned: {inserted} challenges to {len(users)} users "
+                f"({removed} expired removed) in {elapsed}s"
+            )
+            return {
+                'success': True,
+                'users': len(users),
+                'assigned': inserted,
+                'removed': removed,
+                'elapsed_s': elapsed
+            }
+            
         except Exception as e:
             logger.error(f"Error in global weekly challenge assignment: {e}")
+            return {'success': False, 'message': str(e)}
+    
+    @staticmethod
+    def _pick(*parts) -> int:
+        """Deterministic pseudo-random number for a (period, user, ...) key"""
+        key = ':'.join(str(p) for p in parts)
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+    
+    @staticmethod
+    def _initial_progress(obiettivi) -> str:
+        if isinstance(obiettivi, str):
+            obiettivi = json.loads(obiettivi)
+        return json.dumps({k: 0 for k in (obiettivi or {}).keys()})
+    
+    def _bulk_insert_user_challenges(self, rows: List[tuple], label: str) -> int:
+        """Insert (user_id, challenge_id, progresso) rows in committed chunks"""
+        from psycopg2.extras import execute_values
+        
+        total = len(rows)
+        done = 0
+        started = time.perf_counter()
+        for start in range(0, total, self.BULK_CHUNK_SIZE):
+            chunk = rows[start:start + self.BULK_CHUNK_SIZE]
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                execute_values(cursor, '''
+                    INSERT INTO user_challenges_v2 (user_id, challenge_id, progresso)
+                    VALUES %s
+                ''', chunk, page_size=len(chunk))
+            done += len(chunk)
+            logger.info(
+                f"Bulk {label} challenge assignment: {done}/{total} rows "
+                f"({round(time.perf_counter() - started, 2)}s)"
+            )
+        return done
 
 
 # Singleton instance
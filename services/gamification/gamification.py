@@ -9,6 +9,7 @@ from typing import Dict, List, Any, Tuple
 import random
 from services.gamification.gamification_config import XPConfig, LevelConfig, BadgeConfig, StreakConfig
 from services.database.database_manager import db_manager
+from services.dashboard.student_read_model import student_dashboard
 from shared.error_handling.structured_logger import get_logger
 
 logger = get_logger(__name__)
@@ -211,6 +212,9 @@ class SKAJLAGamification:
                 ''', (user_id, today, xp_amount, xp_amount))
                 
                 conn.commit()
+
+            # Attività giornaliera cambiata: riallinea la dashboard studente
+            student_dashboard.mark_dirty([user_id])
             
             logger.info(
                 event_type='xp_awarded',
@@ -0,0 +1,270 @@
+"""
+Leaderboard Engine - Redis sorted sets for gamification leaderboards
+One ZSET per period (daily, weekly, monthly, seasonal, lifetime) for each
+school and each class, kept in sync by XPManagerV2._update_leaderboard.
+Top-N, user position and nearby positions are O(log n); callers fall back
+to the SQL queries on leaderboards_v2 whenever the engine returns None.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from services.database.database_manager import db_manager
+from services.redis_service import redis_manager
+from shared.error_handling.structured_logger import get_logger
+
+logger = get_logger(__name__)
+
+# Leaderboard type -> leaderboards_v2 column
+PERIOD_COLUMNS = {
+    'giornaliera': 'xp_giornaliero',
+    'settimanale': 'xp_settimanale',
+    'mensile': 'xp_mensile',
+    'stagionale': 'xp_stagionale',
+    'lifetime': 'xp_lifetime'
+}
+
+
+class LeaderboardEngine:
+    """
+    Redis ZSET leaderboards scoped by school and class.
+
+    A school is served from Redis only after a rebuild has marked it ready;
+    the ready flag expires daily so the sets are periodically reconciled
+    with leaderboards_v2 (class changes, lost increments).
+    """
+
+    READY_TTL = 86400
+    REBUILD_LOCK_TTL = 120
+    SCOPE_CACHE_TTL = 600
+
+    def __init__(self):
+        self._scope_cache: Dict[int, Tuple[Optional[int], Optional[str], float]] = {}
+        self.stats: Dict[str, int] = {
+            'redis_reads': 0,
+            'sql_fallbacks': 0,
+            'increments': 0,
+            'rebuilds': 0,
+            'redis_errors': 0,
+        }
+
+    @property
+    def available(self) -> bool:
+        return redis_manager.use_redis
+
+    # =========================================================================
+    # KEYS & SCOPE
+    # =========================================================================
+
+    @staticmethod
+    def _key(tipo: str, school_id: int, classe: Optional[str] = None) -> str:
+        if classe:
+            return f"lb:{tipo}:c:{school_id}:{classe}"
+        return f"lb:{tipo}:s:{school_id}"
+
+    @staticmethod
+    def _ready_key(school_id: int) -> str:
+        return f"lb:ready:{school_id}"
+
+    def get_user_scope(self, user_id: int) -> Tuple[Optional[int], Optional[str]]:
+        """(scuola_id, classe) of the user, cached for SCOPE_CACHE_TTL"""
+        cached = self._scope_cache.get(user_id)
+        if cached and time.time() - cached[2] < self.SCOPE_CACHE_TTL:
+            return cached[0], cached[1]
+
+        row = db_manager.query('''
+            SELECT scuola_id, classe FROM utenti WHERE id = %s
+        ''', (user_id,), one=True)
+        school_id = row['scuola_id'] if row else None
+        classe = (row['classe'] or None) if row else None
+        self._scope_cache[user_id] = (school_id, classe, time.time())
+        return school_id, classe
+
+    def _redis_error(self, error: Exception):
+        self.stats['redis_errors'] += 1
+        logger.warning(f"Leaderboard Redis error: {error}")
+
+    # =========================================================================
+    # WRITES
+    # =========================================================================
+
+    def record(self, user_id: int, amount: int):
+        """Add XP to every period ZSET of the user's school and class"""
+        self.record_many({user_id: amount})
+
+    def record_many(self, deltas: Dict[int, int]):
+        if not self.available or not deltas:
+            return
+        try:
+            pipe = redis_manager.redis_client.pipeline()
+            for user_id, amount in deltas.items():
+                school_id, classe = self.get_user_scope(user_id)
+                if school_id is None or not amount:
+                    continue
+                for tipo in PERIOD_COLUMNS:
+                    pipe.zincrby(self._key(tipo, school_id), amount, str(user_id))
+                    if classe:
+                        pipe.zincrby(self._key(tipo, school_id, classe), amount, str(user_id))
+            pipe.execute()
+            self.stats['increments'] += len(deltas)
+        except Exception as e:
+            self._redis_error(e)
+
+    def reset_period(self, tipo: str):
+        """Drop every ZSET of a period (after the SQL reset of its column)"""
+        if not self.available:
+            return
+        try:
+            r = redis_manager.redis_client
+            keys = list(r.scan_iter(match=f"lb:{tipo}:*", count=500))
+            for start in range(0, len(keys), 500):
+                r.delete(*keys[start:start + 500])
+        except Exception as e:
+            self._redis_error(e)
+
+    # =========================================================================
+    # READS (None -> use the SQL fallback)
+    # =========================================================================
+
+    def _ready(self, school_id: Optional[int]) -> bool:
+        if not self.available or school_id is None:
+            return False
+        try:
+            if redis_manager.redis_client.exists(self._ready_key(school_id)):
+                return True
+        except Exception as e:
+            self._redis_error(e)
+            return False
+        self.rebuild_async(school_id)
+        return False
+
+    def get_top(self, tipo: str, school_id: Optional[int], classe: Optional[str],
+                limit: int) -> Optional[List[Tuple[int, int]]]:
+        """[(user_id, xp)] best first"""
+        if not self._ready(school_id):
+            self.stats['sql_fallbacks'] += 1
+            return None
+        try:
+            rows = redis_manager.redis_client.zrevrange(
+                self._key(tipo, school_id, classe), 0, max(limit, 1) - 1, withscores=True
+            )
+            self.stats['redis_reads'] += 1
+            return [(int(member), int(score)) for member, score in rows]
+        except Exception as e:
+            self._redis_error(e)
+            self.stats['sql_fallbacks'] += 1
+            return None
+
+    def get_position(self, tipo: str, school_id: Optional[int], classe: Optional[str],
+                     user_id: int) -> Optional[Tuple[int, int]]:
+        """(position, xp); ties share the position like COUNT(*) + 1 in SQL"""
+        if not self._ready(school_id):
+            return None
+        try:
+            r = redis_manager.redis_client
+            key = self._key(tipo, school_id, classe)
+            score = r.zscore(key, str(user_id))
+            user_xp = int(score) if score is not None else 0
+            position = r.zcount(key, f"({user_xp}", '+inf') + 1
+            return position, user_xp
+        except Exception as e:
+            self._redis_error(e)
+            return None
+
+    def get_nearby(self, tipo: str, school_id: Optional[int], classe: Optional[str],
+                   user_xp: int, count: int = 2) -> Optional[Tuple[list, list]]:
+        """(above, below): closest `count` users with more / less XP"""
+        if not self._ready(school_id):
+            return None
+        try:
+            r = redis_manager.redis_client
+            key = self._key(tipo, school_id, classe)
+            above = r.zrangebyscore(key, f"({user_xp}", '+inf', start=0, num=count, withscores=True)
+            below = r.zrevrangebyscore(key, f"({user_xp}", '-inf', start=0, num=count, withscores=True)
+            return (
+                [(int(m), int(s)) for m, s in above],
+                [(int(m), int(s)) for m, s in below]
+            )
+        except Exception as e:
+            self._redis_error(e)
+            return None
+
+    # =========================================================================
+    # REBUILD
+    # =========================================================================
+
+    def rebuild_async(self, school_id: int):
+        """Rebuild a school in the background (one worker at a time)"""
+        try:
+            acquired = redis_manager.redis_client.set(
+                f"lb:rebuilding:{school_id}", '1', nx=True, ex=self.REBUILD_LOCK_TTL
+            )
+        except Exception as e:
+            self._redis_error(e)
+            return
+        if acquired:
+            threading.Thread(target=self.rebuild, args=(school_id,), daemon=True).start()
+
+    def rebuild(self, school_id: Optional[int] = None) -> int:
+        """
+        Rebuild the ZSETs from leaderboards_v2 for one school (or all).
+        Returns the number of users loaded.
+        """
+        if not self.available:
+            return 0
+
+        if school_id is None:
+            schools = db_manager.query('''
+                SELECT DISTINCT scuola_id FROM utenti WHERE scuola_id IS NOT NULL
+            ''')
+            return sum(self.rebuild(row['scuola_id']) for row in schools)
+
+        columns = ', '.join(f"l.{col}" for col in PERIOD_COLUMNS.values())
+        rows = db_manager.query(f'''
+            SELECT l.user_id, ut.classe, {columns}
+            FROM leaderboards_v2 l
+            JOIN utenti ut ON l.user_id = ut.id
+            WHERE ut.scuola_id = %s
+        ''', (school_id,))
+
+        boards: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            member = str(row['user_id'])
+            for tipo, col in PERIOD_COLUMNS.items():
+                xp = row[col] or 0
+                boards.setdefault(self._key(tipo, school_id), {})[member] = xp
+                if row['classe']:
+                    boards.setdefault(self._key(tipo, school_id, row['classe']), {})[member] = xp
+
+        try:
+            r = redis_manager.redis_client
+            stale = set(r.scan_iter(match=f"lb:*:c:{school_id}:*", count=500))
+            stale.update(self._key(tipo, school_id) for tipo in PERIOD_COLUMNS)
+            pipe = r.pipeline()
+            for key, members in boards.items():
+                pipe.delete(f"{key}:rebuild")
+                pipe.zadd(f"{key}:rebuild", members)
+                pipe.rename(f"{key}:rebuild", key)
+                stale.discard(key)
+            if stale:
+                pipe.delete(*stale)
+            pipe.set(self._ready_key(school_id), '1', ex=self.READY_TTL)
+            pipe.delete(f"lb:rebuilding:{school_id}")
+            pipe.execute()
+        except Exception as e:
+            self._redis_error(e)
+            return 0
+
+        self.stats['rebuilds'] += 1
+        logger.info(f"Leaderboard ZSETs rebuilt for school {school_id}: {len(rows)} users")
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self.stats)
+        stats['backend'] = 'redis' if self.available else 'sql'
+        return stats
+
+
+# Singleton instance
+leaderboard_engine = LeaderboardEngine()
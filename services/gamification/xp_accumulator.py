@@ -0,0 +1,416 @@
+"""
+XP Accumulator - Write-behind mode for XPManagerV2.assegna_xp
+Keeps daily per-source counters and XP totals in Redis (or memory) and
+flushes aggregated deltas to PostgreSQL in periodic batches.
+"""
+
+import json
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+from services.database.database_manager import db_manager
+from services.gamification.advanced_gamification import RANK_ORDER, calcola_rango
+from services.gamification.badge_rule_index import badge_rule_index
+from services.gamification.leaderboard_engine import leaderboard_engine
+from services.redis_service import redis_manager
+from shared.background_flusher import BackgroundFlusher
+from shared.error_handling.structured_logger import get_logger
+
+logger = get_logger(__name__)
+
+# Stats that can be incremented through the accumulator (interpolated in SQL)
+ACCUMULATED_STATS = (
+    'messaggi_inviati', 'chatbot_interazioni', 'compagni_aiutati',
+    'reactions_ricevute', 'quiz_completati', 'quiz_perfetti'
+)
+
+
+def _rank_index(rango: Optional[str]) -> int:
+    return RANK_ORDER.index(rango) if rango in RANK_ORDER else 0
+
+
+class XPAccumulator(BackgroundFlusher):
+    """
+    Write-behind accumulator for XP awards.
+
+    Counters are incremented atomically (Redis HINCRBY/INCRBY, or a lock in
+    memory mode), so each rank threshold is crossed by exactly one award and
+    the rank-up notification is queued once. Badge checks run once per user
+    per flush, and a badge notification is only written when the badge row
+    is actually inserted.
+    """
+
+    TOTAL_KEY_TTL = 86400
+    DAILY_KEY_TTL = 2 * 86400
+    # Memory mode: reload the total from the DB after this many seconds
+    LOCAL_TOTAL_TTL = 300
+
+    def __init__(self):
+        super().__init__('xp_accumulator', 'gamification', config.XP_FLUSH_INTERVAL)
+        # The flush SQL is PostgreSQL-only (execute_values, ANY, FOR UPDATE)
+        self.enabled: bool = config.XP_WRITE_BEHIND and db_manager.db_type == 'postgresql'
+        if config.XP_WRITE_BEHIND and not self.enabled:
+            logger.warning(
+                event_type='xp_write_behind_disabled',
+                domain='gamification',
+                db_type=db_manager.db_type,
+                message='XP_WRITE_BEHIND requires PostgreSQL; XP is written synchronously'
+            )
+        self.max_pending: int = config.XP_FLUSH_MAX_PENDING
+        self.multiplier_ttl: int = config.XP_MULTIPLIER_CACHE_TTL
+        self.manager = None
+
+        self._lock = threading.Lock()
+
+        # Pending deltas (swapped out at every flush)
+        self._pending_xp: Dict[int, int] = defaultdict(int)
+        self._pending_stats: Dict[Tuple[int, str], int] = defaultdict(int)
+        self._pending_logs: List[tuple] = []
+        self._pending_rank_ups: List[Tuple[int, str]] = []
+
+        # Memory mode state
+        self._totals: Dict[int, Dict[str, float]] = {}
+        self._daily: Dict[Tuple[int, str, str], int] = {}
+        self._multipliers: Dict[int, Tuple[float, float]] = {}
+
+        self.stats.update({
+            'awards': 0,
+            'rejected_daily_limit': 0,
+            'rank_ups': 0,
+            'badges_unlocked': 0,
+            'flushes': 0,
+            'flushed_awards': 0,
+            'flush_failures': 0,
+            'redis_errors': 0,
+        })
+
+    def attach(self, manager):
+        """Bind the XPManagerV2 whose helpers are used at flush time"""
+        if self.manager is None:
+            self.manager = manager
+
+    # =========================================================================
+    # AWARD (hot path)
+    # =========================================================================
+
+    def award(self, user_id: int, amount: int, source: str, description: str,
+              metadata: Optional[Dict], check_limits: bool, apply_multipliers: bool) -> Dict:
+        """Reserve XP against the counters and queue the write; no DB round trip"""
+        self._ensure_started()
+
+        base_amount = amount
+        if apply_multipliers:
+            amount = int(amount * self._get_multiplier(user_id))
+
+        limit = self.manager._get_daily_limit(source) if check_limits else None
+        if limit and not self._reserve_daily(user_id, source, base_amount, amount, limit):
+            self.stats['rejected_daily_limit'] += 1
+            return {
+                'success': False,
+                'message': 'Limite giornaliero raggiunto per questa categoria',
+                'xp_assegnati': 0
+            }
+
+        new_total = self._increment_total(user_id, amount)
+        old_rank = calcola_rango(new_total - amount)
+        nuovo_rango = calcola_rango(new_total)
+        rank_up = nuovo_rango != old_rank
+
+        with self._lock:
+            self._pending_xp[user_id] += amount
+            self._pending_logs.append((
+                user_id, amount, source, description,
+                json.dumps(metadata or {}), datetime.now()
+            ))
+            if rank_up:
+                self._pending_rank_ups.append((user_id, nuovo_rango))
+                self.stats['rank_ups'] += 1
+            self.stats['awards'] += 1
+            pending = len(self._pending_logs)
+
+        if pending >= self.max_pending:
+            self.wake()
+
+        return {
+            'success': True,
+            'xp_assegnati': amount,
+            'xp_totale': new_total,
+            'rango': nuovo_rango,
+            'rank_up': rank_up,
+            'nuovo_rango': nuovo_rango if rank_up else None,
+            'queued': True
+        }
+
+    def increment_stat(self, user_id: int, stat_name: str):
+        """Queue a stat increment (applied before badge checks at flush time)"""
+        if stat_name not in ACCUMULATED_STATS:
+            raise ValueError(f"Unsupported stat: {stat_name}")
+        self._ensure_started()
+        with self._lock:
+            self._pending_stats[(user_id, stat_name)] += 1
+
+    def _reserve_daily(self, user_id: int, source: str, base_amount: int,
+                       amount: int, limit: int) -> bool:
+        """
+        Atomically add `amount` to today's counter for the source.
+
+        Same rule as _check_daily_limit: XP already earned today plus the
+        un-multiplied amount must not exceed the limit.
+        """
+        day = date.today().strftime('%Y%m%d')
+
+        if redis_manager.use_redis:
+            try:
+                r = redis_manager.redis_client
+                key = f"xp:daily:{user_id}:{day}"
+                if not r.hexists(key, source):
+                    r.hsetnx(key, source, self._load_daily_total(user_id, source))
+                    r.expire(key, self.DAILY_KEY_TTL)
+                new_value = r.hincrby(key, source, amount)
+                if new_value - amount + base_amount > limit:
+                    r.hincrby(key, source, -amount)
+                    return False
+                return True
+            except Exception as e:
+                self._redis_error(e)
+
+        key = (user_id, source, day)
+        with self._lock:
+            loaded = key in self._daily
+        seed = 0 if loaded else self._load_daily_total(user_id, source)
+        with self._lock:
+            current = self._daily.setdefault(key, seed)
+            if current + base_amount > limit:
+                return False
+            self._daily[key] = current + amount
+            return True
+
+    def _increment_total(self, user_id: int, amount: int) -> int:
+        """Add `amount` to the user's running total and return the new value"""
+        if redis_manager.use_redis:
+            try:
+                r = redis_manager.redis_client
+                key = f"xp:total:{user_id}"
+                if not r.exists(key):
+                    r.set(key, self._load_total(user_id), nx=True, ex=self.TOTAL_KEY_TTL)
+                pipe = r.pipeline()
+                pipe.incrby(key, amount)
+                pipe.expire(key, self.TOTAL_KEY_TTL)
+                return int(pipe.execute()[0])
+            except Exception as e:
+                self._redis_error(e)
+
+        now = time.time()
+        with self._lock:
+            entry = self._totals.get(user_id)
+            stale = entry is None or (
+                now - entry['loaded_at'] > self.LOCAL_TOTAL_TTL and not self._pending_xp.get(user_id)
+            )
+        if stale:
+            loaded = self._load_total(user_id)
+            with self._lock:
+                entry = self._totals.get(user_id)
+                if entry is None or not self._pending_xp.get(user_id):
+                    entry = {'xp': loaded, 'loaded_at': now}
+                    self._totals[user_id] = entry
+        with self._lock:
+            entry = self._totals[user_id]
+            entry['xp'] += amount
+            return int(entry['xp'])
+
+    def _get_multiplier(self, user_id: int) -> float:
+        now = time.time()
+        cached = self._multipliers.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+        with db_manager.get_connection() as conn:
+            multiplier = self.manager._get_multiplier(conn.cursor(), user_id)
+        self._multipliers[user_id] = (multiplier, now + self.multiplier_ttl)
+        return multiplier
+
+    # =========================================================================
+    # SEEDING
+    # =========================================================================
+
+    def _load_total(self, user_id: int) -> int:
+        """DB total plus deltas this worker has not flushed yet"""
+        row = db_manager.query('''
+            SELECT xp_totale FROM user_gamification_v2 WHERE user_id = %s
+        ''', (user_id,), one=True)
+        with self._lock:
+            pending = self._pending_xp.get(user_id, 0)
+        return ((row['xp_totale'] or 0) if row else 0) + pending
+
+    def _load_daily_total(self, user_id: int, source: str) -> int:
+        row = db_manager.query('''
+            SELECT COALESCE(SUM(amount), 0) AS total FROM xp_logs
+            WHERE user_id = %s AND source = %s AND created_at::date = CURRENT_DATE
+        ''', (user_id, source), one=True)
+        with self._lock:
+            pending = sum(log[1] for log in self._pending_logs
+                          if log[0] == user_id and log[2] == source)
+        return int(row['total'] if row else 0) + pending
+
+    # =========================================================================
+    # FLUSH
+    # =========================================================================
+
+    def flush(self) -> int:
+        """Write all pending deltas; returns the number of awards flushed"""
+        with self._flush_lock:
+            with self._lock:
+                xp = dict(self._pending_xp)
+                stats = dict(self._pending_stats)
+                logs = self._pending_logs
+                rank_ups = self._pending_rank_ups
+                if not (xp or stats or logs):
+                    return 0
+                self._pending_xp = defaultdict(int)
+                self._pending_stats = defaultdict(int)
+                self._pending_logs = []
+                self._pending_rank_ups = []
+
+            badge_updates: List = []
+            try:
+                with self._measure(), db_manager.get_connection() as conn:
+                    self._write(conn.cursor(), xp, stats, logs, rank_ups, badge_updates)
+            except Exception as e:
+                self._requeue(xp, stats, logs, rank_ups)
+                self.stats['flush_failures'] += 1
+                logger.error(
+                    event_type='xp_flush_failed',
+                    domain='gamification',
+                    message=f'Failed to flush XP deltas: {e}',
+                    pending_awards=len(logs),
+                    exc_info=True
+                )
+                return 0
+
+            leaderboard_engine.record_many(xp)
+            badge_rule_index.apply(badge_updates)
+            self._prune_daily()
+            self.stats['flushes'] += 1
+            self.stats['flushed_awards'] += len(logs)
+            return len(logs)
+
+    def _write(self, cursor, xp: Dict[int, int], stats: Dict[Tuple[int, str], int],
+               logs: List[tuple], rank_ups: List[Tuple[int, str]], badge_updates: List):
+        from psycopg2.extras import execute_values
+
+        users = sorted(set(xp) | {user_id for user_id, _ in stats})
+        execute_values(cursor, '''
+            INSERT INTO user_gamification_v2 (user_id) VALUES %s
+            ON CONFLICT (user_id) DO NOTHING
+        ''', [(u,) for u in users])
+        execute_values(cursor, '''
+            INSERT INTO leaderboards_v2 (user_id) VALUES %s
+            ON CONFLICT (user_id) DO NOTHING
+        ''', [(u,) for u in users])
+
+        by_stat: Dict[str, List[tuple]] = defaultdict(list)
+        for (user_id, stat_name), n in stats.items():
+            by_stat[stat_name].append((user_id, n))
+        for stat_name, rows in by_stat.items():
+            execute_values(cursor, f'''
+                UPDATE user_gamification_v2 AS g
+                SET {stat_name} = g.{stat_name} + v.n, updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(user_id, n)
+                WHERE g.user_id = v.user_id
+            ''', rows)
+
+        # Lock the rows and compute the new rank from the flushed totals
+        cursor.execute('''
+            SELECT user_id, xp_totale, rango_max_raggiunto FROM user_gamification_v2
+            WHERE user_id = ANY(%s)
+            ORDER BY user_id
+            FOR UPDATE
+        ''', (users,))
+        profiles = {}
+        for user_id, xp_totale, rango_max in cursor.fetchall():
+            new_total = (xp_totale or 0) + xp.get(user_id, 0)
+            rango = calcola_rango(new_total)
+            if _rank_index(rango) > _rank_index(rango_max):
+                rango_max = rango
+            profiles[user_id] = (new_total, rango, rango_max)
+
+        if xp:
+            rows = [(u, delta, profiles[u][1], profiles[u][2]) for u, delta in xp.items() if u in profiles]
+            execute_values(cursor, '''
+                UPDATE user_gamification_v2 AS g
+                SET xp_totale = g.xp_totale + v.delta,
+                    xp_stagionale = g.xp_stagionale + v.delta,
+                    xp_settimanale = g.xp_settimanale + v.delta,
+                    xp_giornaliero = g.xp_giornaliero + v.delta,
+                    rango = v.rango, rango_max_raggiunto = v.rango_max,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(user_id, delta, rango, rango_max)
+                WHERE g.user_id = v.user_id
+            ''', rows)
+            execute_values(cursor, '''
+                UPDATE leaderboards_v2 AS l
+                SET xp_giornaliero = l.xp_giornaliero + v.delta,
+                    xp_settimanale = l.xp_settimanale + v.delta,
+                    xp_mensile = l.xp_mensile + v.delta,
+                    xp_stagionale = l.xp_stagionale + v.delta,
+                    xp_lifetime = l.xp_lifetime + v.delta,
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(user_id, delta)
+                WHERE l.user_id = v.user_id
+            ''', list(xp.items()))
+
+        if logs:
+            execute_values(cursor, '''
+                INSERT INTO xp_logs (user_id, amount, source, description, metadata, created_at)
+                VALUES %s
+            ''', logs)
+
+        for user_id, nuovo_rango in rank_ups:
+            self.manager._create_rank_up_notification(cursor, user_id, nuovo_rango)
+
+        for user_id, (new_total, rango, _) in profiles.items():
+            unlocked = self.manager._check_badge_unlocks(cursor, user_id, new_total, rango, badge_updates)
+            self.stats['badges_unlocked'] += len(unlocked)
+
+    def _requeue(self, xp, stats, logs, rank_ups):
+        """Put a failed batch back in front of the pending deltas"""
+        with self._lock:
+            for user_id, delta in xp.items():
+                self._pending_xp[user_id] += delta
+            for key, n in stats.items():
+                self._pending_stats[key] += n
+            self._pending_logs = logs + self._pending_logs
+            self._pending_rank_ups = rank_ups + self._pending_rank_ups
+
+    def _prune_daily(self):
+        today = date.today().strftime('%Y%m%d')
+        with self._lock:
+            for key in [k for k in self._daily if k[2] != today]:
+                del self._daily[key]
+            now = time.time()
+            for user_id in [u for u, (_, exp) in self._multipliers.items() if exp <= now]:
+                del self._multipliers[user_id]
+
+    def _redis_error(self, error: Exception):
+        self.stats['redis_errors'] += 1
+        logger.warning(
+            event_type='xp_accumulator_redis_error',
+            domain='gamification',
+            error=str(error)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.flusher_stats()
+        with self._lock:
+            stats['pending_awards'] = len(self._pending_logs)
+            stats['pending_users'] = len(self._pending_xp)
+        stats['enabled'] = self.enabled
+        stats['backend'] = 'redis' if redis_manager.use_redis else 'memory'
+        return stats
+
+
+# Shared by every XPManagerV2 instance in the worker
+xp_accumulator = XPAccumulator()
@@ -10,6 +10,9 @@ from services.database.database_manager import db_manager
 from services.gamification.advanced_gamification import (
     XP_CONFIG, RANK_CONFIG, RANK_ORDER, calcola_rango, xp_per_prossimo_rango
 )
+from services.gamification.badge_rule_index import badge_rule_index
+from services.gamification.leaderboard_engine import leaderboard_engine
+from services.gamification.xp_accumulator import xp_accumulator
 from shared.error_handling.structured_logger import get_logger
 
 logger = get_logger(__name__)
@@ -20,6 +23,8 @@ class XPManagerV2:
     
     def __init__(self):
         self.xp_config = XP_CONFIG
+        self.accumulator = xp_accumulator
+        self.accumulator.attach(self)
     
     # =========================================================================
     # CORE XP ASSIGNMENT
@@ -42,7 +47,26 @@ class XPManagerV2:
         
         Returns:
             dict with operation info
+        
+        With XP_WRITE_BEHIND enabled the award is reserved against the
+        accumulator counters and written by the next batch flush; the
+        result then carries 'queued': True and no 'badges_unlocked'.
         """
+        if self.accumulator.enabled:
+            try:
+                return self.accumulator.award(
+                    user_id, amount, source, description, metadata,
+                    check_limits, apply_multipliers
+                )
+            except Exception as e:
+                logger.error(f"Error queueing XP: {e}")
+                return {
+                    'success': False,
+                    'message': str(e),
+                    'xp_assegnati': 0
+                }
+        
+        badge_updates: List = []
         try:
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
@@ -139,11 +163,16 @@ class XPManagerV2:
                     self._create_rank_up_notification(cursor, user_id, nuovo_rango)
                 
                 # Check for badge unlocks
-                badges_unlocked = self._check_badge_unlocks(cursor, user_id, new_xp_totale, nuovo_rango)
+                badges_unlocked = self._check_badge_unlocks(cursor, user_id, new_xp_totale, nuovo_rango,
+                                                            badge_updates)
                 if badges_unlocked:
                     result['badges_unlocked'] = badges_unlocked
-                
-                return result
+            
+            # Caches only after the commit: a rollback must not leave XP in the
+            # leaderboard or badges marked as unlocked
+            leaderboard_engine.record(user_id, amount)
+            badge_rule_index.apply(badge_updates)
+            return result
                 
         except Exception as e:
             logger.error(f"Error assigning XP: {e}")
@@ -462,20 +491,27 @@ class XPManagerV2:
         
         xp_today = cursor.fetchone()[0]
         
+        limit = self._get_daily_limit(source)
+        if limit:
+            return (xp_today + amount) <= limit
+        
+        return True
+    
+    def _get_daily_limit(self, source: str) -> Optional[int]:
+        """Daily XP cap for a source (None if unlimited)"""
         limits = {
             'messaggio': self.xp_config['max_xp_messaggi'],
             'chatbot': self.xp_config['max_xp_chatbot'],
             'quiz': self.xp_config['max_xp_quiz']
         }
-        
-        limit = limits.get(source)
-        if limit:
-            return (xp_today + amount) <= limit
-        
-        return True
+        return limits.get(source)
     
     def _apply_multipliers(self, cursor, user_id: int, amount: int) -> int:
         """Apply active multipliers (power-ups, events)"""
+        return int(amount * self._get_multiplier(cursor, user_id))
+    
+    def _get_multiplier(self, cursor, user_id: int) -> float:
+        """Combined multiplier of active power-ups and events"""
         multiplier = 1.0
         
         # Check for active power-ups
@@ -502,10 +538,10 @@ class XPManagerV2:
             if row[0] and row[0] > 1.0:
                 multiplier *= row[0]
         
-        return int(amount * multiplier)
+        return multiplier
     
     def _update_leaderboard(self, cursor, user_id: int, amount: int):
-        """Update leaderboard entry"""
+        """Update leaderboard entry (the Redis leaderboard is updated by the caller after commit)"""
         cursor.execute('''
             UPDATE leaderboards_v2 
             SET xp_giornaliero = xp_giornaliero + %s,
@@ -519,6 +555,10 @@ class XPManagerV2:
     
     def _increment_stat(self, user_id: int, stat_name: str):
         """Increment a user statistic"""
+        if self.accumulator.enabled:
+            self.accumulator.increment_stat(user_id, stat_name)
+            return
+        
         try:
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
@@ -540,8 +580,13 @@ class XPManagerV2:
               f"Congratulazioni! Hai raggiunto il rango {nuovo_rango}!",
               json.dumps({'rango': nuovo_rango, 'icon': rango_config.get('icon', '🎖️')})))
     
-    def _check_badge_unlocks(self, cursor, user_id: int, xp_totale: int, rango: str) -> List:
-        """Check and unlock badges based on current stats"""
+    def _check_badge_unlocks(self, cursor, user_id: int, xp_totale: int, rango: str,
+                             index_updates: List) -> List:
+        """
+        Check and unlock badges based on current stats.
+        Appends the badge index update to index_updates: the caller passes
+        it to badge_rule_index.apply() after the transaction commits.
+        """
         unlocked = []
         
         # Get user stats
@@ -566,46 +611,29 @@ class XPManagerV2:
             'rango': rango
         }
         
-        # Get available badges not yet unlocked
-        cursor.execute('''
-            SELECT id, codice, nome, condizioni, reward_xp FROM badges_v2
-            WHERE id NOT IN (SELECT badge_id FROM user_badges_v2 WHERE user_id = %s)
-        ''', (user_id,))
-        
-        for badge_row in cursor.fetchall():
-            badge_id, codice, nome, condizioni, reward_xp = badge_row
+        # Only locked badges whose thresholds were just crossed
+        candidates = badge_rule_index.candidates(cursor, user_id, user_stats)
+        index_updates.append((user_id, user_stats, candidates))
+        for rule in candidates:
+            # Unlock the badge
+            cursor.execute('''
+                INSERT INTO user_badges_v2 (user_id, badge_id)
+                VALUES (%s, %s) ON CONFLICT DO NOTHING
+            ''', (user_id, rule.badge_id))
             
-            if isinstance(condizioni, str):
-                condizioni = json.loads(condizioni)
+            # Already unlocked by a concurrent award: notify only once
+            if cursor.rowcount == 0:
+                continue
             
-            # Check if all conditions are met
-            unlocked_badge = True
-            for key, value in condizioni.items():
-                if key == 'rango':
-                    # Special handling for rank conditions
-                    if rango != value and RANK_ORDER.index(rango) < RANK_ORDER.index(value):
-                        unlocked_badge = False
-                        break
-                elif user_stats.get(key, 0) < value:
-                    unlocked_badge = False
-                    break
+            # Create notification
+            cursor.execute('''
+                INSERT INTO gamification_notifications (user_id, tipo, titolo, messaggio, data)
+                VALUES (%s, 'badge', %s, %s, %s)
+            ''', (user_id, f"Badge Sbloccato: {rule.nome}!",
+                  f"Hai sbloccato il badge {rule.nome}!",
+                  json.dumps({'badge_id': rule.badge_id, 'codice': rule.codice})))
             
-            if unlocked_badge:
-                # Unlock the badge
-                cursor.execute('''
-                    INSERT INTO user_badges_v2 (user_id, badge_id)
-                    VALUES (%s, %s) ON CONFLICT DO NOTHING
-                ''', (user_id, badge_id))
-                
-                # Create notification
-                cursor.execute('''
-                    INSERT INTO gamification_notifications (user_id, tipo, titolo, messaggio, data)
-                    VALUES (%s, 'badge', %s, %s, %s)
-                ''', (user_id, f"Badge Sbloccato: {nome}!",
-                      f"Hai sbloccato il badge {nome}!",
-                      json.dumps({'badge_id': badge_id, 'codice': codice})))
-                
-                unlocked.append({'id': badge_id, 'codice': codice, 'nome': nome})
+            unlocked.append({'id': rule.badge_id, 'codice': rule.codice, 'nome': rule.nome})
         
         return unlocked
     
@@ -615,6 +643,8 @@ class XPManagerV2:
     
     def reset_xp_giornaliero(self):
         """Reset daily XP for all users (run at midnight)"""
+        if self.accumulator.enabled:
+            self.accumulator.flush()
         try:
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
@@ -624,12 +654,15 @@ class XPManagerV2:
                 cursor.execute('''
                     UPDATE leaderboards_v2 SET xp_giornaliero = 0
                 ''')
-                logger.info("Daily XP reset completed")
+            leaderboard_engine.reset_period('giornaliera')
+            logger.info("Daily XP reset completed")
         except Exception as e:
             logger.error(f"Error resetting daily XP: {e}")
     
     def reset_xp_settimanale(self):
         """Reset weekly XP for all users (run on Monday midnight)"""
+        if self.accumulator.enabled:
+            self.accumulator.flush()
         try:
             with db_manager.get_connection() as conn:
                 cursor = conn.cursor()
@@ -639,7 +672,8 @@ class XPManagerV2:
                 cursor.execute('''
                     UPDATE leaderboards_v2 SET xp_settimanale = 0
                 ''')
-                logger.info("Weekly XP reset completed")
+            leaderboard_engine.reset_period('settimanale')
+            logger.info("Weekly XP reset completed")
         except Exception as e:
             logger.error(f"Error resetting weekly XP: {e}")
 
@@ -0,0 +1,262 @@
+"""
+SKAJLA - Chat Summary
+Contatori materializzati per l'hub messaggistica: numero messaggi, ultimo
+messaggio (data, anteprima, mittente) e messaggi non letti per utente.
+
+    chat_summary   una riga per chat, aggiornata a ogni messaggio inviato
+    chat_letture   una riga per (chat, utente): quanti messaggi ha già letto
+                   e fino a quale id ha segnato tutto come letto
+
+I non letti sono `message_count - letti_count`: l'invio di un messaggio
+costa un upsert indipendentemente dal numero di membri della chat (più il
+"segna tutto come letto" del mittente, scritto a batch da read_receipts),
+e l'hub legge O(chat) righe senza aggregare su messaggi.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from database_manager import db_manager
+from services.messaging.read_receipts import read_receipts
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+PREVIEW_LENGTH = 120
+
+# Colonne e join per le query dell'hub (parametro: utente corrente)
+SUMMARY_COLUMNS = '''
+    COALESCE(s.message_count, 0) as message_count,
+    s.last_message_at as ultimo_messaggio,
+    s.last_message_preview as anteprima,
+    CASE WHEN COALESCE(s.message_count, 0) > COALESCE(l.letti_count, 0)
+         THEN COALESCE(s.message_count, 0) - COALESCE(l.letti_count, 0)
+         ELSE 0 END as non_letti
+'''
+
+# Upsert multi-riga dei riepiloghi (rebuild)
+UPSERT_SUMMARY = '''
+    INSERT INTO chat_summary (chat_id, message_count, last_message_id, last_message_at,
+                              last_message_preview, last_sender_id, updated_at)
+    VALUES %s
+    ON CONFLICT (chat_id) DO UPDATE SET
+        message_count = excluded.message_count,
+        last_message_id = excluded.last_message_id,
+        last_message_at = excluded.last_message_at,
+        last_message_preview = excluded.last_message_preview,
+        last_sender_id = excluded.last_sender_id,
+        updated_at = excluded.updated_at
+'''
+
+SHIFT_READS = '''
+    UPDATE chat_letture
+    SET letti_count = CASE WHEN letti_count > %s THEN letti_count - %s ELSE 0 END
+    WHERE chat_id = %s
+'''
+
+SUMMARY_JOINS = '''
+    LEFT JOIN chat_summary s ON s.chat_id = c.id
+    LEFT JOIN chat_letture l ON l.chat_id = c.id AND l.utente_id = %s
+'''
+
+
+def _preview(contenuto: Optional[str], tipo: Optional[str] = None) -> str:
+    if tipo and tipo != 'testo' and not contenuto:
+        return '📎 Allegato'
+    text = ' '.join((contenuto or '').split())
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + '…'
+
+
+class ChatSummaryService:
+    """Manutenzione incrementale dei contatori per chat e per utente"""
+
+    def init_schema(self) -> bool:
+        """Crea le tabelle e, al primo avvio, popola i contatori dallo storico"""
+        try:
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_summary (
+                        chat_id INTEGER PRIMARY KEY,
+                        message_count INTEGER DEFAULT 0,
+                        last_message_id INTEGER,
+                        last_message_at TIMESTAMP,
+                        last_message_preview TEXT,
+                        last_sender_id INTEGER,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS chat_letture (
+                        chat_id INTEGER,
+                        utente_id INTEGER,
+                        letti_count INTEGER DEFAULT 0,
+                        ultimo_letto_id INTEGER DEFAULT 0,
+                        ultima_lettura TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (chat_id, utente_id)
+                    )
+                ''')
+                db_manager.safe_alter_table(
+                    cursor,
+                    'ALTER TABLE chat_letture ADD COLUMN ultimo_letto_id INTEGER DEFAULT 0',
+                    'chat_letture',
+                    'ultimo_letto_id'
+                )
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS messaggi_letti (
+                        messaggio_id INTEGER,
+                        utente_id INTEGER,
+                        letto_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (messaggio_id, utente_id)
+                    )
+                ''')
+                conn.commit()
+
+            populated = db_manager.query('SELECT chat_id FROM chat_summary LIMIT 1', one=True)
+            if not populated:
+                # Primo avvio: lo storico esistente conta come già letto
+                self.rebuild(mark_read=True)
+            return True
+        except Exception as e:
+            logger.error(
+                event_type='chat_summary_init_failed',
+                domain='messaging',
+                error=str(e)
+            )
+            return False
+
+    # ------------------------------------------------------------------
+    # Aggiornamenti incrementali
+    # ------------------------------------------------------------------
+
+    def record_message(self, chat_id: int, sender_id: int, message_id: int,
+                       contenuto: Optional[str], tipo: Optional[str] = None):
+        """
+        Nuovo messaggio: contatore +1, ultimo messaggio, mittente allineato.
+        Un errore viene solo loggato: il messaggio è già salvato e
+        scripts/rebuild_chat_summaries.py riallinea i contatori.
+        """
+        try:
+            db_manager.execute('''
+                INSERT INTO chat_summary (chat_id, message_count, last_message_id, last_message_at,
+                                          last_message_preview, last_sender_id, updated_at)
+                VALUES (%s, 1, %s, CURRENT_TIMESTAMP, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    message_count = chat_summary.message_count + 1,
+                    last_message_id = excluded.last_message_id,
+                    last_message_at = excluded.last_message_at,
+                    last_message_preview = excluded.last_message_preview,
+                    last_sender_id = excluded.last_sender_id,
+                    updated_at = excluded.updated_at
+            ''', (chat_id, message_id, _preview(contenuto, tipo), sender_id))
+
+            # Chi scrive ha visto la conversazione fino al proprio messaggio
+            read_receipts.submit_all(chat_id, sender_id)
+        except Exception as e:
+            logger.warning(
+                event_type='chat_summary_update_failed',
+                domain='messaging',
+                chat_id=chat_id,
+                error=str(e)
+            )
+
+    # ------------------------------------------------------------------
+    # Ricostruzione
+    # ------------------------------------------------------------------
+
+    def rebuild(self, chat_ids: Optional[Iterable[int]] = None, mark_read: bool = False) -> int:
+        """
+        Ricalcola i contatori da messaggi (tutte le chat o solo `chat_ids`).
+
+        Se il numero di messaggi cambia (es. pulizia dei messaggi vecchi) i
+        letti_count vengono traslati della stessa quantità, così i non letti
+        restano invariati. Con mark_read=True i membri senza riga in
+        chat_letture partono con tutto lo storico già letto.
+        Ritorna il numero di chat aggiornate.
+        """
+        where, params = '', ()
+        if chat_ids is not None:
+            chat_ids = list(chat_ids)
+            if not chat_ids:
+                return 0
+            where = f"WHERE chat_id IN ({', '.join(['%s'] * len(chat_ids))})"
+            params = tuple(chat_ids)
+
+        counts = db_manager.query(f'''
+            SELECT chat_id, COUNT(*) as message_count, MAX(id) as last_message_id
+            FROM messaggi
+            {where}
+            GROUP BY chat_id
+        ''', params) or []
+        previous = {
+            row['chat_id']: row['message_count'] or 0
+            for row in db_manager.query(f'''
+                SELECT chat_id, message_count FROM chat_summary {where}
+            ''', params) or []
+        }
+
+        last_messages: Dict[int, Dict[str, Any]] = {}
+        last_ids = [row['last_message_id'] for row in counts]
+        for start in range(0, len(last_ids), 1000):
+            chunk = last_ids[start:start + 1000]
+            for row in db_manager.query(f'''
+                SELECT id, chat_id, timestamp, contenuto, tipo, utente_id
+                FROM messaggi WHERE id IN ({', '.join(['%s'] * len(chunk))})
+            ''', tuple(chunk)) or []:
+                last_messages[row['chat_id']] = row
+
+        rows: List[tuple] = []
+        for row in counts:
+            last = last_messages.get(row['chat_id'], {})
+            rows.append((
+                row['chat_id'], row['message_count'], last.get('id'), last.get('timestamp'),
+                _preview(last.get('contenuto'), last.get('tipo')) if last else None,
+                last.get('utente_id')
+            ))
+        counted = {row[0] for row in rows}
+        # Chat con riepilogo ma senza più messaggi
+        rows.extend((chat_id, 0, None, None, None, None) for chat_id in previous if chat_id not in counted)
+
+        # Messaggi rimossi per chat: i letti_count vengono traslati della stessa quantità
+        shifts = [
+            (previous[chat_id] - message_count, previous[chat_id] - message_count, chat_id)
+            for chat_id, message_count, *_ in rows
+            if previous.get(chat_id, message_count) != message_count
+        ]
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            if db_manager.db_type == 'postgresql':
+                from psycopg2.extras import execute_values
+
+                execute_values(cursor, UPSERT_SUMMARY, rows,
+                               template='(%s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)')
+                cursor.executemany(SHIFT_READS, shifts)
+            else:
+                cursor.executemany(
+                    UPSERT_SUMMARY.replace('VALUES %s', 'VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)'),
+                    rows
+                )
+                cursor.executemany(SHIFT_READS.replace('%s', '?'), shifts)
+
+            if mark_read:
+                sql = f'''
+                    INSERT INTO chat_letture (chat_id, utente_id, letti_count, ultimo_letto_id, ultima_lettura)
+                    SELECT pc.chat_id, pc.utente_id, s.message_count, COALESCE(s.last_message_id, 0),
+                           CURRENT_TIMESTAMP
+                    FROM partecipanti_chat pc
+                    JOIN chat_summary s ON s.chat_id = pc.chat_id
+                    WHERE 1 = 1 {where.replace('WHERE chat_id', 'AND pc.chat_id')}
+                    ON CONFLICT (chat_id, utente_id) DO NOTHING
+                '''
+                cursor.execute(sql if db_manager.db_type == 'postgresql' else sql.replace('%s', '?'), params)
+            conn.commit()
+
+        logger.info(
+            event_type='chat_summary_rebuilt',
+            domain='messaging',
+            chats=len(rows)
+        )
+        return len(rows)
+
+
+chat_summary = ChatSummaryService()
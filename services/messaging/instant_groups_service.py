@@ -4,6 +4,7 @@ Gestione gruppi istantanei con scadenza e auto-cleanup
 """
 
 from database_manager import db_manager
+from services.messaging.membership_cache import membership_cache
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import logging
@@ -355,8 +356,10 @@ class InstantGroupsService:
             """, (chat_id, user_id))
             
             conn.commit()
-            logger.info(f"Utente {user_id} unito a gruppo {chat_id}")
-            return True
+        
+        membership_cache.invalidate_member(chat_id, user_id)
+        logger.info(f"Utente {user_id} unito a gruppo {chat_id}")
+        return True
     
     @staticmethod
     def leave_instant_group(chat_id: int, user_id: int) -> bool:
@@ -381,8 +384,10 @@ class InstantGroupsService:
             """, (chat_id, user_id))
             
             conn.commit()
-            logger.info(f"Utente {user_id} ha lasciato gruppo {chat_id}")
-            return True
+        
+        membership_cache.invalidate_member(chat_id, user_id)
+        logger.info(f"Utente {user_id} ha lasciato gruppo {chat_id}")
+        return True
     
     @staticmethod
     def delete_instant_group(chat_id: int, user_id: int) -> bool:
@@ -414,8 +419,10 @@ class InstantGroupsService:
             """, (chat_id,))
             
             conn.commit()
-            logger.info(f"Gruppo istantaneo {chat_id} eliminato da utente {user_id}")
-            return True
+        
+        membership_cache.invalidate_chat(chat_id)
+        logger.info(f"Gruppo istantaneo {chat_id} eliminato da utente {user_id}")
+        return True
     
     @staticmethod
     def cleanup_expired_groups() -> int:
@@ -447,6 +454,8 @@ class InstantGroupsService:
                 """)
                 
                 conn.commit()
+                for group in expired:
+                    membership_cache.invalidate_chat(group[0])
                 logger.info(f"Eliminati {len(expired)} gruppi scaduti")
                 return len(expired)
             
@@ -476,6 +485,9 @@ class InstantGroupsService:
             deleted = cursor.fetchall()
             conn.commit()
             
+            for group in deleted:
+                membership_cache.invalidate_chat(group[0])
+            
             if deleted:
                 logger.info(f"Eliminati {len(deleted)} gruppi inattivi")
             
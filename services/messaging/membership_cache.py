@@ -0,0 +1,298 @@
+"""
+SKAJLA - Chat Membership Cache
+Cache a due livelli (LRU in-process davanti a Redis) per i controlli che
+ogni evento Socket.IO esegue: appartenenza chat -> scuola e utente -> chat.
+
+Chiavi Redis:
+    mc:members:{chat_id}  hash  user_id -> "1" (solo membri confermati)
+    mc:tenant:{chat_id}   string scuola_id della chat
+    mc:version:{chat_id}  contatore incrementato a ogni invalidazione
+    mc:invalidate         canale pub/sub, messaggio = "chat_id" o "chat_id:user_id"
+
+I risultati negativi restano solo nell'LRU locale con TTL breve, così un
+utente aggiunto da un percorso non instrumentato non resta bloccato.
+
+Write-back: la versione della chat (su Redis e la generazione locale) viene
+letta prima della query e il risultato viene salvato solo se nel frattempo
+non c'è stata un'invalidazione. Una lettura iniziata prima che l'uscita da
+una chat fosse confermata non può quindi riscrivere il membro rimosso. Le
+invalidazioni vengono pubblicate e ogni worker scarta le sue voci locali.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import config
+from database_manager import db_manager
+from services.redis_service import redis_manager
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+_MISSING = object()
+
+CHANNEL = 'mc:invalidate'
+
+# HSET + EXPIRE solo se la versione della chat è quella letta prima della query
+STORE_MEMBER_SCRIPT = """
+    if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[2], ARGV[2], '1')
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return 1
+"""
+
+
+class MembershipCache:
+    """LRU locale (TTL breve, per worker) + Redis (condiviso, invalidato esplicitamente)"""
+
+    NEGATIVE_TTL = 30
+
+    def __init__(self, max_size: int = 20000, local_ttl: int = 30, redis_ttl: int = 600):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        # Incrementata a ogni invalidazione: un caricamento iniziato prima non viene salvato
+        self._generation: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._subscriber_started = False
+        self.stats: Dict[str, int] = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'db_loads': 0,
+            'invalidations': 0,
+            'remote_invalidations': 0,
+            'stale_writes_skipped': 0,
+            'redis_errors': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # LRU locale
+    # ------------------------------------------------------------------
+
+    def _local_get(self, key: tuple):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return _MISSING
+            value, expires_at = item
+            if time.time() >= expires_at:
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            self.stats['local_hits'] += 1
+            return value
+
+    def _local_set(self, key: tuple, value: Any, ttl: int, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and self._generation.get(key[1], 0) != generation:
+                self.stats['stale_writes_skipped'] += 1
+                return
+            self._local[key] = (value, time.time() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def _redis_call(self, fn, *args):
+        if not redis_manager.use_redis:
+            return None
+        try:
+            return fn(redis_manager.redis_client, *args)
+        except Exception as e:
+            self.stats['redis_errors'] += 1
+            logger.warning(
+                event_type='membership_cache_redis_error',
+                domain='messaging',
+                error=str(e)
+            )
+            return None
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def is_member(self, chat_id: int, user_id: int) -> bool:
+        """True se user_id partecipa alla chat"""
+        self._ensure_subscriber()
+        key = ('m', int(chat_id), int(user_id))
+        cached = self._local_get(key)
+        if cached is not _MISSING:
+            return cached
+
+        with self._lock:
+            generation = self._generation.get(int(chat_id), 0)
+        redis_key = f"mc:members:{int(chat_id)}"
+        version_key = f"mc:version:{int(chat_id)}"
+
+        def _read(r):
+            pipe = r.pipeline()
+            pipe.hget(redis_key, str(int(user_id)))
+            pipe.get(version_key)
+            return pipe.execute()
+        stored, version = self._redis_call(_read) or (None, None)
+        if stored == '1':
+            self.stats['redis_hits'] += 1
+            self._local_set(key, True, self.local_ttl, generation)
+            return True
+
+        self.stats['db_loads'] += 1
+        row = db_manager.query('''
+            SELECT 1 FROM partecipanti_chat
+            WHERE chat_id = %s AND utente_id = %s
+        ''', (chat_id, user_id), one=True)
+        is_member = row is not None
+
+        if is_member:
+            self._local_set(key, True, self.local_ttl, generation)
+            stored = self._redis_call(lambda r: r.eval(
+                STORE_MEMBER_SCRIPT, 2, version_key, redis_key,
+                version or '', str(int(user_id)), self.redis_ttl
+            ))
+            if stored == 0:
+                self.stats['stale_writes_skipped'] += 1
+        else:
+            self._local_set(key, False, self.NEGATIVE_TTL, generation)
+
+        return is_member
+
+    def get_chat_school(self, chat_id: int) -> Optional[int]:
+        """scuola_id della chat (None se la chat non esiste)"""
+        key = ('t', int(chat_id))
+        cached = self._local_get(key)
+        if cached is not _MISSING:
+            return cached
+
+        redis_key = f"mc:tenant:{int(chat_id)}"
+        stored = self._redis_call(lambda r: r.get(redis_key))
+        if stored:
+            self.stats['redis_hits'] += 1
+            school_id = int(stored)
+            self._local_set(key, school_id, self.local_ttl)
+            return school_id
+
+        self.stats['db_loads'] += 1
+        row = db_manager.query('''
+            SELECT scuola_id FROM chat WHERE id = %s
+        ''', (chat_id,), one=True)
+        school_id = row['scuola_id'] if row else None
+
+        if school_id is not None:
+            self._local_set(key, school_id, self.local_ttl)
+            self._redis_call(lambda r: r.setex(redis_key, self.redis_ttl, str(school_id)))
+        else:
+            self._local_set(key, None, self.NEGATIVE_TTL)
+
+        return school_id
+
+    def chat_in_school(self, chat_id: int, school_id: Optional[int]) -> bool:
+        """True se la chat appartiene alla scuola indicata"""
+        if school_id is None:
+            return False
+        chat_school = self.get_chat_school(chat_id)
+        try:
+            return chat_school is not None and int(chat_school) == int(school_id)
+        except (TypeError, ValueError):
+            return False
+
+    # ------------------------------------------------------------------
+    # Invalidazione
+    # ------------------------------------------------------------------
+
+    def invalidate_member(self, chat_id: int, user_id: int):
+        """Da chiamare (dopo il commit) quando un partecipante viene aggiunto o rimosso"""
+        chat_id, user_id = int(chat_id), int(user_id)
+        self._drop(chat_id, user_id)
+        self.stats['invalidations'] += 1
+
+        def _invalidate(r):
+            pipe = r.pipeline()
+            pipe.incr(f"mc:version:{chat_id}")
+            pipe.expire(f"mc:version:{chat_id}", self.redis_ttl)
+            pipe.hdel(f"mc:members:{chat_id}", str(user_id))
+            pipe.publish(CHANNEL, f"{chat_id}:{user_id}")
+            pipe.execute()
+        self._redis_call(_invalidate)
+
+    def invalidate_chat(self, chat_id: int):
+        """Da chiamare quando una chat viene eliminata o cambia scuola"""
+        chat_id = int(chat_id)
+        self._drop(chat_id)
+        self.stats['invalidations'] += 1
+
+        def _invalidate(r):
+            pipe = r.pipeline()
+            pipe.incr(f"mc:version:{chat_id}")
+            pipe.expire(f"mc:version:{chat_id}", self.redis_ttl)
+            pipe.delete(f"mc:members:{chat_id}", f"mc:tenant:{chat_id}")
+            pipe.publish(CHANNEL, str(chat_id))
+            pipe.execute()
+        self._redis_call(_invalidate)
+
+    def _drop(self, chat_id: int, user_id: Optional[int] = None):
+        """Scarta le voci locali (di un membro o di tutta la chat)"""
+        with self._lock:
+            self._generation[chat_id] = self._generation.get(chat_id, 0) + 1
+            if user_id is not None:
+                self._local.pop(('m', chat_id, user_id), None)
+                return
+            for key in [k for k in self._local if k[1] == chat_id]:
+                del self._local[key]
+
+    def clear(self):
+        with self._lock:
+            for chat_id in {k[1] for k in self._local}:
+                self._generation[chat_id] = self._generation.get(chat_id, 0) + 1
+            self._local.clear()
+
+    def _ensure_subscriber(self):
+        if self._subscriber_started or not redis_manager.use_redis:
+            return
+        with self._lock:
+            if self._subscriber_started:
+                return
+            self._subscriber_started = True
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        """Thread sottoscritto al canale di invalidazione (si riconnette da solo)"""
+        while True:
+            try:
+                pubsub = redis_manager.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Messaggi persi durante la disconnessione: si riparte da cache vuota
+                self.clear()
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    try:
+                        chat_id, _, user_id = str(message['data']).partition(':')
+                        self._drop(int(chat_id), int(user_id) if user_id else None)
+                        self.stats['remote_invalidations'] += 1
+                    except (TypeError, ValueError):
+                        continue
+                time.sleep(1)
+            except Exception as e:
+                self.stats['redis_errors'] += 1
+                logger.warning(
+                    event_type='membership_cache_subscriber_error',
+                    domain='messaging',
+                    error=str(e)
+                )
+                time.sleep(5)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['local_size'] = len(self._local)
+        stats['backend'] = 'redis+local' if redis_manager.use_redis else 'local'
+        return stats
+
+
+membership_cache = MembershipCache(
+    max_size=config.MEMBERSHIP_CACHE_MAX_ITEMS,
+    local_ttl=config.MEMBERSHIP_CACHE_LOCAL_TTL,
+    redis_ttl=config.MEMBERSHIP_CACHE_REDIS_TTL
+)
@@ -0,0 +1,294 @@
+"""
+SKAJLA - Chat Message History
+Paginazione keyset (before_id / after_id) sull'indice (chat_id, timestamp DESC)
+e ring buffer in memoria degli ultimi N messaggi per chat.
+
+Il buffer viene scritto da handle_send_message (write-through): aprire una
+chat "calda" non richiede query al database. Tra worker diversi la
+freschezza è verificata con la chiave Redis `chat:last_msg:{chat_id}`
+(id dell'ultimo messaggio); senza Redis gunicorn usa un solo worker e il
+buffer locale è autorevole entro CHAT_HISTORY_LOCAL_TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from config import config
+from database_manager import db_manager
+from services.redis_service import redis_manager
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+MAX_PAGE_SIZE = 200
+
+HISTORY_SELECT = '''
+    SELECT m.*, u.nome, u.cognome, u.username, u.ruolo,
+           m.timestamp as data_invio
+    FROM messaggi m
+    JOIN utenti u ON m.utente_id = u.id
+    WHERE m.chat_id = %s
+'''
+
+# Posizione del messaggio cursore: (timestamp, id) per un ordinamento stabile
+CURSOR_ROW = '(SELECT c.timestamp, c.id FROM messaggi c WHERE c.id = %s AND c.chat_id = %s)'
+
+
+class ChatHistoryBuffer:
+    """Ring buffer per chat (deque con maxlen) in una LRU di chat"""
+
+    LAST_ID_TTL = 86400
+
+    # Restituisce l'id precedente e lo sostituisce solo se il nuovo è maggiore:
+    # lettura e scrittura atomiche, così due worker non si scavalcano
+    SET_LAST_ID_SCRIPT = """
+        local previous = redis.call('GET', KEYS[1])
+        if not previous or tonumber(ARGV[1]) > tonumber(previous) then
+            redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+        end
+        return previous
+    """
+
+    def __init__(self, capacity: int = 100, max_chats: int = 2000, local_ttl: int = 60):
+        self.capacity = capacity
+        self.max_chats = max_chats
+        self.local_ttl = local_ttl
+        self._chats: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'appends': 0,
+            'discarded': 0,
+            'warmups': 0,
+        }
+
+    @staticmethod
+    def _last_id_key(chat_id: int) -> str:
+        return f"chat:last_msg:{chat_id}"
+
+    def _remote_last_id(self, chat_id: int) -> Optional[int]:
+        if not redis_manager.use_redis:
+            return None
+        try:
+            value = redis_manager.redis_client.get(self._last_id_key(chat_id))
+            return int(value) if value else None
+        except Exception:
+            return None
+
+    def _fresh_entry(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """Entry del buffer se ancora allineata all'ultimo messaggio della chat"""
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self._chats.move_to_end(chat_id)
+
+        newest_id = entry['messages'][-1]['id'] if entry['messages'] else None
+        remote_id = self._remote_last_id(chat_id)
+        if remote_id is not None:
+            fresh = remote_id == newest_id
+        else:
+            fresh = time.time() - entry['checked_at'] < self.local_ttl
+
+        if not fresh:
+            self.stats['stale'] += 1
+            self.invalidate(chat_id)
+            return None
+        entry['checked_at'] = time.time()
+        self.stats['hits'] += 1
+        return entry
+
+    # ------------------------------------------------------------------
+    # Letture
+    # ------------------------------------------------------------------
+
+    def get_latest(self, chat_id: int, limit: int) -> Optional[Dict[str, Any]]:
+        """Ultimi min(limit, capacity) messaggi; has_more se ce ne sono di più vecchi"""
+        entry = self._fresh_entry(chat_id)
+        if entry is None:
+            return None
+        with self._lock:
+            messages = list(entry['messages'])
+        page = messages[-limit:]
+        return {
+            'messages': page,
+            'has_more': len(messages) > limit or not entry['complete'],
+        }
+
+    def get_after(self, chat_id: int, after_id: int, limit: int) -> Optional[Dict[str, Any]]:
+        entry = self._fresh_entry(chat_id)
+        if entry is None:
+            return None
+        with self._lock:
+            messages = list(entry['messages'])
+        ids = [m['id'] for m in messages]
+        if after_id in ids:
+            newer = messages[ids.index(after_id) + 1:]
+        elif entry['complete'] or (ids and after_id > ids[-1]):
+            newer = [m for m in messages if m['id'] > after_id]
+        else:
+            return None
+        return {'messages': newer[:limit], 'has_more': len(newer) > limit}
+
+    # ------------------------------------------------------------------
+    # Scritture
+    # ------------------------------------------------------------------
+
+    def warm(self, chat_id: int, messages_asc: List[Dict[str, Any]], complete: bool):
+        entry = {
+            'messages': deque(messages_asc[-self.capacity:], maxlen=self.capacity),
+            'complete': complete,
+            'checked_at': time.time(),
+        }
+        with self._lock:
+            self._chats[chat_id] = entry
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+            self.stats['warmups'] += 1
+
+    def record_message(self, chat_id: int, message_id: int, message: Optional[Dict[str, Any]] = None):
+        """
+        Write-through di un nuovo messaggio.
+
+        Aggiorna l'id dell'ultimo messaggio su Redis (gli altri worker
+        scartano il loro buffer) e lo accoda al buffer locale solo se questo
+        era allineato, cioè se l'id precedente su Redis è il più recente del
+        buffer; altrimenti il buffer locale viene scartato.
+        """
+        previous_id = None
+        verified = not redis_manager.use_redis
+        if redis_manager.use_redis:
+            try:
+                previous = redis_manager.redis_client.eval(
+                    self.SET_LAST_ID_SCRIPT, 1, self._last_id_key(chat_id),
+                    message_id, self.LAST_ID_TTL
+                )
+                previous_id = int(previous) if previous else None
+                verified = True
+            except Exception as e:
+                logger.warning(
+                    event_type='chat_history_redis_error',
+                    domain='messaging',
+                    error=str(e)
+                )
+
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None:
+                return
+            newest_id = entry['messages'][-1]['id'] if entry['messages'] else None
+            aligned = (
+                message is not None
+                and verified
+                and (newest_id is None or message_id > newest_id)
+                and (not redis_manager.use_redis or previous_id == newest_id)
+            )
+            if not aligned:
+                del self._chats[chat_id]
+                self.stats['discarded'] += 1
+                return
+            if len(entry['messages']) == self.capacity:
+                entry['complete'] = False
+            entry['messages'].append(message)
+            self.stats['appends'] += 1
+
+    def invalidate(self, chat_id: int):
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._chats.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['chats'] = len(self._chats)
+        stats['capacity'] = self.capacity
+        return stats
+
+
+history_buffer = ChatHistoryBuffer(
+    capacity=config.CHAT_HISTORY_BUFFER_SIZE,
+    max_chats=config.CHAT_HISTORY_MAX_CHATS,
+    local_ttl=config.CHAT_HISTORY_LOCAL_TTL
+)
+
+
+def get_chat_history(chat_id: int, before_id: Optional[int] = None,
+                     after_id: Optional[int] = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    Pagina di messaggi in ordine cronologico (dal più vecchio al più recente).
+
+    - nessun cursore: ultimi `limit` messaggi (dal ring buffer se caldo;
+      oltre la capacità del buffer solo la parte più vecchia viene dal DB)
+    - before_id: i `limit` messaggi precedenti a before_id (scroll indietro)
+    - after_id: i `limit` messaggi successivi ad after_id (polling/riconnessione)
+
+    `has_more` indica se esistono altri messaggi nella direzione richiesta.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    if before_id is None and after_id is None:
+        cached = history_buffer.get_latest(chat_id, limit)
+        if cached is not None:
+            missing = limit - len(cached['messages'])
+            if missing > 0 and cached['has_more'] and cached['messages']:
+                older = _page_before(chat_id, cached['messages'][0]['id'], missing)
+                return {
+                    'messages': older['messages'] + cached['messages'],
+                    'has_more': older['has_more'],
+                }
+            return cached
+        # Carica abbastanza righe da riempire anche il buffer
+        fetch = max(limit, history_buffer.capacity)
+        rows = db_manager.query(HISTORY_SELECT + '''
+            ORDER BY m.timestamp DESC, m.id DESC
+            LIMIT %s
+        ''', (chat_id, fetch + 1)) or []
+        complete = len(rows) <= fetch
+        rows = rows[:fetch]
+        rows.reverse()
+        history_buffer.warm(chat_id, rows, complete and len(rows) <= history_buffer.capacity)
+        return {'messages': rows[-limit:], 'has_more': len(rows) > limit or not complete}
+
+    if after_id is not None:
+        cached = history_buffer.get_after(chat_id, after_id, limit)
+        if cached is not None:
+            return cached
+        rows = db_manager.query(HISTORY_SELECT + f'''
+            AND (m.timestamp, m.id) > {CURSOR_ROW}
+            ORDER BY m.timestamp ASC, m.id ASC
+            LIMIT %s
+        ''', (chat_id, after_id, chat_id, limit + 1)) or []
+        return {'messages': rows[:limit], 'has_more': len(rows) > limit}
+
+    return _page_before(chat_id, before_id, limit)
+
+
+def _page_before(chat_id: int, before_id: int, limit: int) -> Dict[str, Any]:
+    """I `limit` messaggi precedenti a before_id, in ordine cronologico"""
+    rows = db_manager.query(HISTORY_SELECT + f'''
+        AND (m.timestamp, m.id) < {CURSOR_ROW}
+        ORDER BY m.timestamp DESC, m.id DESC
+        LIMIT %s
+    ''', (chat_id, before_id, chat_id, limit + 1)) or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return {'messages': rows, 'has_more': has_more}
+
+
+def page_cursors(page: Dict[str, Any]) -> Dict[str, Any]:
+    """Cursori per la pagina successiva/precedente"""
+    messages = page['messages']
+    return {
+        'has_more': page['has_more'],
+        'before_id': messages[0]['id'] if messages else None,
+        'after_id': messages[-1]['id'] if messages else None,
+    }
@@ -0,0 +1,242 @@
+"""
+SKAJLA - Read Receipts Writer
+Ricevute di lettura coalescenti per (chat, utente) e scritte in background.
+
+handle_mark_messages_read accoda gli id e ritorna subito; il flusher
+scrive tutte le ricevute in sospeso con un solo INSERT multi-riga su una
+sola connessione e aggiorna chat_letture (non letti dell'hub) con il
+numero di ricevute effettivamente nuove.
+
+"Segna tutto come letto" è un'unica INSERT ... SELECT sui messaggi della
+chat successivi al punto di lettura (chat_letture.ultimo_letto_id), quindi
+non rilegge lo storico già segnato.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Set, Tuple
+
+from config import config
+from database_manager import db_manager
+from shared.background_flusher import BackgroundFlusher
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+# Id accettati per singolo evento mark_messages_read
+MAX_IDS_PER_EVENT = 500
+
+Key = Tuple[int, int]  # (chat_id, utente_id)
+
+
+def _adapt(sql: str) -> str:
+    """Placeholder per il cursore grezzo (SQLite usa ?)"""
+    return sql if db_manager.db_type == 'postgresql' else sql.replace('%s', '?')
+
+
+class ReadReceiptWriter(BackgroundFlusher):
+    """Buffer per (chat, utente) + flusher in background"""
+
+    def __init__(self):
+        super().__init__('read_receipts', 'messaging', config.READ_RECEIPTS_FLUSH_INTERVAL)
+        self.max_pending: int = config.READ_RECEIPTS_MAX_PENDING
+
+        self._pending: Dict[Key, Set[int]] = defaultdict(set)
+        self._pending_all: Set[Key] = set()
+        self._pending_count = 0
+        self._lock = threading.Lock()
+
+        self.stats.update({
+            'submitted': 0,
+            'coalesced': 0,
+            'mark_all': 0,
+            'written': 0,
+            'failed': 0,
+        })
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def submit(self, chat_id: int, user_id: int, message_ids: Iterable[Any]):
+        """Accoda le ricevute per i messaggi indicati"""
+        ids = set()
+        for msg_id in list(message_ids)[:MAX_IDS_PER_EVENT]:
+            try:
+                ids.add(int(msg_id))
+            except (TypeError, ValueError):
+                continue
+        if not ids:
+            return
+
+        self._ensure_started()
+        key = (int(chat_id), int(user_id))
+        with self._lock:
+            pending = self._pending[key]
+            before = len(pending)
+            pending.update(ids)
+            added = len(pending) - before
+            self._pending_count += added
+            self.stats['submitted'] += len(ids)
+            self.stats['coalesced'] += len(ids) - added
+            full = self._pending_count >= self.max_pending
+        if full:
+            self.wake()
+
+    def submit_all(self, chat_id: int, user_id: int):
+        """Accoda "segna tutto come letto" (assorbe le ricevute singole in sospeso)"""
+        self._ensure_started()
+        key = (int(chat_id), int(user_id))
+        with self._lock:
+            self._pending_count -= len(self._pending.pop(key, ()))
+            self._pending_all.add(key)
+            self.stats['mark_all'] += 1
+
+    # ------------------------------------------------------------------
+    # Flusher
+    # ------------------------------------------------------------------
+
+    def _swap(self) -> Tuple[Dict[Key, Set[int]], Set[Key]]:
+        with self._lock:
+            pending, pending_all = self._pending, self._pending_all
+            self._pending = defaultdict(set)
+            self._pending_all = set()
+            self._pending_count = 0
+        return pending, pending_all
+
+    def flush(self):
+        """Scrive subito tutte le ricevute in sospeso"""
+        with self._flush_lock:
+            pending, pending_all = self._swap()
+            if not pending and not pending_all:
+                return
+
+            try:
+                with self._measure(), db_manager.get_connection() as conn:
+                    cursor = conn.cursor()
+                    written = self._write_receipts(cursor, pending)
+                    written += self._write_mark_all(cursor, pending_all)
+                self.stats['written'] += written
+            except Exception as e:
+                self.stats['failed'] += sum(len(ids) for ids in pending.values()) + len(pending_all)
+                self._requeue(pending, pending_all)
+                logger.error(
+                    event_type='read_receipts_flush_failed',
+                    domain='messaging',
+                    error=str(e),
+                    exc_info=True
+                )
+
+    def _requeue(self, pending: Dict[Key, Set[int]], pending_all: Set[Key]):
+        with self._lock:
+            for key, ids in pending.items():
+                if key not in self._pending_all and key not in pending_all:
+                    before = len(self._pending[key])
+                    self._pending[key].update(ids)
+                    self._pending_count += len(self._pending[key]) - before
+            self._pending_all.update(pending_all)
+
+    def _write_receipts(self, cursor, pending: Dict[Key, Set[int]]) -> int:
+        """
+        Ricevute puntuali: solo messaggi della chat, non propri e successivi
+        al punto di lettura (quelli precedenti sono già contati in letti_count)
+        """
+        if not pending:
+            return 0
+
+        new_reads: Dict[Key, int] = defaultdict(int)
+        if db_manager.db_type == 'postgresql':
+            from psycopg2.extras import execute_values
+
+            rows = [(msg_id, user_id, chat_id)
+                    for (chat_id, user_id), ids in pending.items() for msg_id in ids]
+            inserted = execute_values(cursor, '''
+                INSERT INTO messaggi_letti (messaggio_id, utente_id, letto_at)
+                SELECT m.id, v.utente_id, CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(messaggio_id, utente_id, chat_id)
+                JOIN messaggi m ON m.id = v.messaggio_id
+                               AND m.chat_id = v.chat_id
+                               AND m.utente_id != v.utente_id
+                LEFT JOIN chat_letture cl ON cl.chat_id = v.chat_id AND cl.utente_id = v.utente_id
+                WHERE m.id > COALESCE(cl.ultimo_letto_id, 0)
+                ON CONFLICT (messaggio_id, utente_id) DO NOTHING
+                RETURNING messaggio_id, utente_id
+            ''', rows, page_size=len(rows), fetch=True)
+
+            chat_of = {(msg_id, user_id): chat_id for msg_id, user_id, chat_id in rows}
+            for msg_id, user_id in inserted:
+                new_reads[(chat_of[(msg_id, user_id)], user_id)] += 1
+
+            execute_values(cursor, '''
+                INSERT INTO chat_letture (chat_id, utente_id, letti_count, ultima_lettura)
+                VALUES %s
+                ON CONFLICT (chat_id, utente_id) DO UPDATE SET
+                    letti_count = chat_letture.letti_count + excluded.letti_count,
+                    ultima_lettura = excluded.ultima_lettura
+            ''', [(chat_id, user_id, n) for (chat_id, user_id), n in new_reads.items()],
+                template='(%s, %s, %s, CURRENT_TIMESTAMP)')
+        else:
+            for (chat_id, user_id), ids in pending.items():
+                placeholders = ', '.join(['?'] * len(ids))
+                cursor.execute(f'''
+                    INSERT INTO messaggi_letti (messaggio_id, utente_id, letto_at)
+                    SELECT m.id, ?, CURRENT_TIMESTAMP
+                    FROM messaggi m
+                    WHERE m.chat_id = ? AND m.utente_id != ? AND m.id IN ({placeholders})
+                    AND m.id > COALESCE((
+                        SELECT ultimo_letto_id FROM chat_letture
+                        WHERE chat_id = ? AND utente_id = ?
+                    ), 0)
+                    ON CONFLICT (messaggio_id, utente_id) DO NOTHING
+                ''', (user_id, chat_id, user_id, *ids, chat_id, user_id))
+                if cursor.rowcount > 0:
+                    new_reads[(chat_id, user_id)] = cursor.rowcount
+
+            cursor.executemany('''
+                INSERT INTO chat_letture (chat_id, utente_id, letti_count, ultima_lettura)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (chat_id, utente_id) DO UPDATE SET
+                    letti_count = chat_letture.letti_count + excluded.letti_count,
+                    ultima_lettura = excluded.ultima_lettura
+            ''', [(chat_id, user_id, n) for (chat_id, user_id), n in new_reads.items()])
+
+        return sum(new_reads.values())
+
+    def _write_mark_all(self, cursor, pending_all: Set[Key]) -> int:
+        """Una INSERT ... SELECT per (chat, utente) a partire dal punto di lettura"""
+        written = 0
+        for chat_id, user_id in pending_all:
+            cursor.execute(_adapt('''
+                INSERT INTO messaggi_letti (messaggio_id, utente_id, letto_at)
+                SELECT m.id, %s, CURRENT_TIMESTAMP
+                FROM messaggi m
+                WHERE m.chat_id = %s AND m.utente_id != %s
+                AND m.id > COALESCE((
+                    SELECT ultimo_letto_id FROM chat_letture
+                    WHERE chat_id = %s AND utente_id = %s
+                ), 0)
+                ON CONFLICT (messaggio_id, utente_id) DO NOTHING
+            '''), (user_id, chat_id, user_id, chat_id, user_id))
+            written += max(cursor.rowcount, 0)
+
+            cursor.execute(_adapt('''
+                INSERT INTO chat_letture (chat_id, utente_id, letti_count, ultimo_letto_id, ultima_lettura)
+                SELECT %s, %s, COALESCE(MAX(s.message_count), 0),
+                       COALESCE(MAX(s.last_message_id), 0), CURRENT_TIMESTAMP
+                FROM chat_summary s WHERE s.chat_id = %s
+                ON CONFLICT (chat_id, utente_id) DO UPDATE SET
+                    letti_count = excluded.letti_count,
+                    ultimo_letto_id = excluded.ultimo_letto_id,
+                    ultima_lettura = excluded.ultima_lettura
+            '''), (chat_id, user_id, chat_id))
+        return written
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.flusher_stats()
+        with self._lock:
+            stats['pending_receipts'] = self._pending_count
+            stats['pending_mark_all'] = len(self._pending_all)
+        return stats
+
+
+read_receipts = ReadReceiptWriter()
@@ -0,0 +1,103 @@
+"""
+SKAJLA - Socket.IO Emit Metrics
+Latenza degli emit verso le stanze (chat_*, school_*, user_*, class_*).
+
+Con la message queue Redis attiva un emit verso una stanza è una PUBLISH
+sul canale Socket.IO: la latenza misurata qui include il round trip verso
+Redis, quindi un aumento indica un broker lento o saturo.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from flask_socketio import emit
+
+# Soglie (ms) dell'istogramma per tipo di stanza
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500)
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {
+        'count': 0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+    }
+
+
+class SocketEmitMetrics:
+    """Statistiche per tipo di stanza e per le stanze più recenti (LRU limitata)"""
+
+    MAX_ROOMS = 500
+
+    def __init__(self):
+        self.message_queue: Optional[str] = None
+        self._by_kind: Dict[str, Dict[str, Any]] = {}
+        self._by_room: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def room_kind(room: str) -> str:
+        return room.split('_', 1)[0] if '_' in room else room
+
+    def record(self, room: str, elapsed_ms: float):
+        bucket = len(LATENCY_BUCKETS_MS)
+        for idx, limit in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= limit:
+                bucket = idx
+                break
+
+        with self._lock:
+            kind_stats = self._by_kind.setdefault(self.room_kind(room), _empty_stats())
+            room_stats = self._by_room.get(room)
+            if room_stats is None:
+                room_stats = self._by_room[room] = _empty_stats()
+                while len(self._by_room) > self.MAX_ROOMS:
+                    self._by_room.popitem(last=False)
+            else:
+                self._by_room.move_to_end(room)
+
+            for stats in (kind_stats, room_stats):
+                stats['count'] += 1
+                stats['total_ms'] += elapsed_ms
+                stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+                stats['buckets'][bucket] += 1
+
+    @staticmethod
+    def _summary(stats: Dict[str, Any]) -> Dict[str, Any]:
+        labels = [f"le_{limit}ms" for limit in LATENCY_BUCKETS_MS] + ['le_inf']
+        return {
+            'count': stats['count'],
+            'avg_ms': round(stats['total_ms'] / stats['count'], 3) if stats['count'] else 0.0,
+            'max_ms': round(stats['max_ms'], 3),
+            'histogram': dict(zip(labels, stats['buckets'])),
+        }
+
+    def get_stats(self, top_rooms: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            by_kind = {kind: self._summary(s) for kind, s in self._by_kind.items()}
+            slowest = sorted(
+                self._by_room.items(),
+                key=lambda item: item[1]['total_ms'] / max(item[1]['count'], 1),
+                reverse=True
+            )[:top_rooms]
+            rooms = {room: self._summary(s) for room, s in slowest}
+        return {
+            'message_queue': self.message_queue or 'local',
+            'by_kind': by_kind,
+            'slowest_rooms': rooms,
+        }
+
+
+socket_emit_metrics = SocketEmitMetrics()
+
+
+def emit_room(event: str, data: Any, to: str, **kwargs):
+    """emit() verso una stanza con misura della latenza"""
+    start = time.perf_counter()
+    try:
+        return emit(event, data, to=to, **kwargs)
+    finally:
+        socket_emit_metrics.record(to, (time.perf_counter() - start) * 1000)
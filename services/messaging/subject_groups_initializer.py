@@ -4,6 +4,7 @@ Automatically creates predefined subject-based chat groups for classes
 """
 
 from services.database.database_manager import DatabaseManager
+from services.messaging.membership_cache import membership_cache
 
 db_manager = DatabaseManager()
 
@@ -118,6 +119,7 @@ def add_student_to_subject_groups(user_id: int, school_id: int, classe: str) ->
                     INSERT INTO partecipanti_chat (chat_id, utente_id, joined_at)
                     VALUES (%s, %s, CURRENT_TIMESTAMP)
                 ''', (group['id'], user_id))
+                membership_cache.invalidate_member(group['id'], user_id)
                 print(f"✅ Studente {user_id} aggiunto a gruppo: {group['nome']}")
             else:
                 print(f"ℹ️ Studente {user_id} già nel gruppo: {group['nome']}")
@@ -44,6 +44,10 @@ class RedisManager:
             self.use_redis = False
             logger.error(f"⚠️ Redis generic error: {e}")
 
+    def get_url(self):
+        """URL Redis (usato come message queue di Socket.IO)"""
+        return f"redis://{config.REDIS_HOST}:{config.REDIS_PORT}/{config.REDIS_DB}"
+
     # ================== GENERIC CACHE ==================
 
     def get(self, key):
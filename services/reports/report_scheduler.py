@@ -44,11 +44,21 @@ class ReportScheduler:
             replace_existing=True
         )
         
+        # Punteggi di rischio studenti: ogni notte alle 02:30 (letti dalla dashboard early-warning)
+        self.scheduler.add_job(
+            self.precompute_risk_scores,
+            CronTrigger(hour=2, minute=30),
+            id='nightly_risk_scores',
+            name='Precalcolo Rischio Studenti',
+            replace_existing=True
+        )
+        
         self.scheduler.start()
         print("✅ Report Scheduler avviato")
         print(f"   📧 Email destinatario: {self.recipient_email}")
         print(f"   📅 Report settimanale: Ogni venerdì alle 18:00")
         print(f"   📅 Report mensile: Ultimo giorno del mese alle 18:00")
+        print(f"   📅 Rischio studenti: Ogni notte alle 02:30")
     
     def send_weekly_report(self):
         """Genera e invia report settimanale"""
@@ -108,6 +118,15 @@ class ReportScheduler:
         except Exception as e:
             print(f"❌ Errore send_monthly_report: {e}")
     
+    def precompute_risk_scores(self):
+        """Precalcola i punteggi di rischio di tutte le scuole"""
+        try:
+            from services.ai.risk_engine import risk_engine
+            summary = risk_engine.precompute_all()
+            print(f"✅ Rischio studenti precalcolato: {summary['students']} studenti in {summary['schools']} scuole")
+        except Exception as e:
+            print(f"❌ Errore precompute_risk_scores: {e}")
+    
     def _render_report_html(self, report_data):
         """Renderizza template HTML del report"""
         try:
@@ -0,0 +1,181 @@
+"""
+SKAJLA - Feature Flag Cache
+Feature flag delle scuole tenuti in un dizionario per processo: i controlli
+di require_feature e has_feature costano una lookup e non interrogano il DB.
+
+Invalidazione:
+    features:version:{scuola_id}   contatore incrementato a ogni modifica
+    features:invalidate            canale pub/sub, messaggio = scuola_id
+
+enable_feature/disable_feature/toggle_feature incrementano la versione e
+pubblicano sul canale; ogni worker ha un thread sottoscritto che scarta le
+voci della scuola. Se un messaggio va perso (riconnessione) la versione su
+Redis viene ricontrollata ogni FEATURE_FLAGS_RECHECK_INTERVAL secondi. Senza
+Redis la cache è solo locale e le voci scadono dopo lo stesso intervallo.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import config
+from services.redis_service import redis_manager
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+CHANNEL = 'features:invalidate'
+
+
+class FeatureFlagCache:
+    """school_id -> flag, per namespace (school_features, moduli di scuole)"""
+
+    def __init__(self, recheck_interval: float = 30.0):
+        self.recheck_interval = recheck_interval
+        # (namespace, school_id) -> (flags, versione redis, ultimo controllo)
+        self._entries: Dict[Tuple[str, int], Tuple[Dict[str, Any], Optional[str], float]] = {}
+        # Incrementata a ogni invalidazione: un caricamento iniziato prima non viene salvato
+        self._generation: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._subscriber_started = False
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'invalidations': 0,
+            'remote_invalidations': 0,
+            'version_reloads': 0,
+            'redis_errors': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Lettura
+    # ------------------------------------------------------------------
+
+    def get(self, namespace: str, school_id: int,
+            loader: Callable[[int], Dict[str, Any]]) -> Dict[str, Any]:
+        """Flag della scuola; loader(school_id) solo al primo accesso o dopo un'invalidazione"""
+        school_id = int(school_id)
+        key = (namespace, school_id)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            flags, version, checked_at = entry
+            if time.time() - checked_at < self.recheck_interval:
+                self.stats['hits'] += 1
+                return flags
+            if redis_manager.use_redis:
+                current = self._version(school_id)
+                if current == version:
+                    self._entries[key] = (flags, version, time.time())
+                    self.stats['hits'] += 1
+                    return flags
+                self.stats['version_reloads'] += 1
+
+        self.stats['misses'] += 1
+        self._ensure_subscriber()
+        with self._lock:
+            generation = self._generation.get(school_id, 0)
+        version = self._version(school_id) if redis_manager.use_redis else None
+
+        flags = loader(school_id)
+
+        with self._lock:
+            if self._generation.get(school_id, 0) == generation:
+                self._entries[key] = (flags, version, time.time())
+        return flags
+
+    def _version(self, school_id: int) -> Optional[str]:
+        try:
+            return redis_manager.redis_client.get(f'features:version:{school_id}')
+        except Exception as e:
+            self.stats['redis_errors'] += 1
+            logger.warning(
+                event_type='feature_flags_redis_error',
+                domain='school',
+                error=str(e)
+            )
+            return None
+
+    # ------------------------------------------------------------------
+    # Invalidazione
+    # ------------------------------------------------------------------
+
+    def invalidate(self, school_id: int):
+        """Da chiamare dopo ogni modifica ai flag della scuola (tutti i worker)"""
+        school_id = int(school_id)
+        self._drop(school_id)
+        self.stats['invalidations'] += 1
+
+        if not redis_manager.use_redis:
+            return
+        try:
+            pipe = redis_manager.redis_client.pipeline()
+            pipe.incr(f'features:version:{school_id}')
+            pipe.publish(CHANNEL, str(school_id))
+            pipe.execute()
+        except Exception as e:
+            self.stats['redis_errors'] += 1
+            logger.warning(
+                event_type='feature_flags_publish_failed',
+                domain='school',
+                school_id=school_id,
+                error=str(e)
+            )
+
+    def _drop(self, school_id: int):
+        with self._lock:
+            self._generation[school_id] = self._generation.get(school_id, 0) + 1
+            for key in [k for k in self._entries if k[1] == school_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            for school_id in {k[1] for k in self._entries}:
+                self._generation[school_id] = self._generation.get(school_id, 0) + 1
+            self._entries.clear()
+
+    def _ensure_subscriber(self):
+        if self._subscriber_started or not redis_manager.use_redis:
+            return
+        with self._lock:
+            if self._subscriber_started:
+                return
+            self._subscriber_started = True
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        """Thread sottoscritto al canale di invalidazione (si riconnette da solo)"""
+        while True:
+            try:
+                pubsub = redis_manager.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                # Messaggi persi durante la disconnessione: si riparte da cache vuota
+                self.clear()
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    try:
+                        self._drop(int(message['data']))
+                        self.stats['remote_invalidations'] += 1
+                    except (TypeError, ValueError):
+                        continue
+                time.sleep(1)
+            except Exception as e:
+                self.stats['redis_errors'] += 1
+                logger.warning(
+                    event_type='feature_flags_subscriber_error',
+                    domain='school',
+                    error=str(e)
+                )
+                time.sleep(5)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0.0
+        stats['entries'] = len(self._entries)
+        stats['backend'] = 'redis' if redis_manager.use_redis else 'local'
+        return stats
+
+
+feature_flag_cache = FeatureFlagCache(recheck_interval=config.FEATURE_FLAGS_RECHECK_INTERVAL)
@@ -6,9 +6,17 @@ Sistema completo per gestione presenze, voti, note, calendario lezioni
 from typing import Dict, List, Optional, Tuple, Any, Union
 from datetime import datetime, date, timedelta
 from database_manager import db_manager, CursorProxy
+from services.analytics.school_bi_snapshot import school_bi_snapshot
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
 
 class RegistroElettronico:
     """Sistema registro elettronico"""
+
+    def __init__(self):
+        self._attendance_index_checked = False
+        self._attendance_upsert_ready = False
     
     # ========== PRESENZE ==========
     
@@ -21,7 +29,7 @@ class RegistroElettronico:
             return {'error': f'Status non valido. Usa: {", ".join(valid_statuses)}'}
         
         # Get student class
-        student = db_manager.query('SELECT classe FROM utenti WHERE id = %s', (student_id,) or [], one=True)
+        student = db_manager.query('SELECT classe, scuola_id FROM utenti WHERE id = %s', (student_id,) or [], one=True)
         if not student:
             return {'error': 'Studente non trovato'}
         
@@ -51,11 +59,102 @@ class RegistroElettronico:
                 ON CONFLICT (student_id, absence_date) DO NOTHING
             ''', (student_id, date))
         
+        school_bi_snapshot.invalidate(student.get('scuola_id'))
         return {'success': True, 'status': status}
     
     def mark_class_attendance(self, class_name: str, date: date, teacher_id: int,
                              attendance_list: List[Dict]) -> Dict:
-        """Segna presenze per tutta la classe"""
+        """
+        Segna presenze per tutta la classe.
+
+        Studenti e classe validati con una sola query; appello scritto con un
+        unico INSERT ... ON CONFLICT multi-riga e giustificazioni delle assenze
+        inserite nella stessa transazione.
+        """
+        if not self._ensure_attendance_upsert():
+            return self._mark_class_attendance_each(class_name, date, teacher_id, attendance_list)
+
+        errors = []
+        valid_statuses = ['presente', 'assente', 'ritardo', 'uscita_anticipata']
+
+        student_ids = list(dict.fromkeys(
+            record['student_id'] for record in attendance_list
+            if record.get('status') in valid_statuses
+        ))
+        students = {}
+        if student_ids:
+            rows = db_manager.query(
+                f"SELECT id, classe, scuola_id FROM utenti WHERE id IN ({', '.join(['%s'] * len(student_ids))})",
+                tuple(student_ids)
+            ) or []
+            students = {row['id']: row for row in rows}
+
+        # Un record per studente (l'ultimo vince, come con le chiamate singole)
+        roll: Dict[int, Tuple] = {}
+        marked = 0
+        for record in attendance_list:
+            student_id = record['student_id']
+            status = record.get('status')
+            student = students.get(student_id)
+
+            if status not in valid_statuses:
+                error = f'Status non valido. Usa: {", ".join(valid_statuses)}'
+            elif not student:
+                error = 'Studente non trovato'
+            elif student.get('classe') != class_name:
+                error = f'Studente non appartiene alla classe {class_name}'
+            else:
+                roll[student_id] = (student_id, class_name, date, status, record.get('note'), teacher_id)
+                marked += 1
+                continue
+
+            errors.append(f"Student {student_id}: {error}")
+
+        if roll:
+            rows = list(roll.values())
+            absent = [(row[0], date) for row in rows if row[3] == 'assente']
+
+            upsert = '''
+                INSERT INTO registro_presenze
+                (student_id, class, date, status, note, teacher_id)
+                VALUES %s
+                ON CONFLICT (student_id, date) DO UPDATE SET
+                    status = excluded.status,
+                    note = excluded.note,
+                    teacher_id = excluded.teacher_id
+            '''
+            justify = '''
+                INSERT INTO registro_assenze_giustificate (student_id, absence_date)
+                VALUES %s
+                ON CONFLICT (student_id, absence_date) DO NOTHING
+            '''
+
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                if db_manager.db_type == 'postgresql':
+                    from psycopg2.extras import execute_values
+                    execute_values(cursor, upsert, rows, page_size=len(rows))
+                    if absent:
+                        execute_values(cursor, justify, absent, page_size=len(absent))
+                else:
+                    cursor.executemany(upsert.replace('VALUES %s', 'VALUES (?, ?, ?, ?, ?, ?)'), rows)
+                    if absent:
+                        cursor.executemany(justify.replace('VALUES %s', 'VALUES (?, ?)'), absent)
+                conn.commit()
+
+            for school_id in {students[sid].get('scuola_id') for sid in roll}:
+                school_bi_snapshot.invalidate(school_id)
+
+        return {
+            'success': True,
+            'marked': marked,
+            'total': len(attendance_list),
+            'errors': errors
+        }
+
+    def _mark_class_attendance_each(self, class_name: str, date: date, teacher_id: int,
+                                    attendance_list: List[Dict]) -> Dict:
+        """Percorso per singolo studente (senza vincolo unico su registro_presenze)"""
         
         marked = 0
         errors = []
@@ -80,6 +179,34 @@ class RegistroElettronico:
             'total': len(attendance_list),
             'errors': errors
         }
+
+    def init_schema(self) -> bool:
+        """
+        Vincolo unico (student_id, date) su registro_presenze, richiesto
+        dall'upsert multi-riga dell'appello. Se esistono righe duplicate la
+        creazione fallisce e l'appello resta sul percorso per singolo studente.
+        """
+        self._attendance_index_checked = True
+        try:
+            db_manager.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_registro_presenze_student_date
+                ON registro_presenze(student_id, date)
+            ''')
+            self._attendance_upsert_ready = True
+        except Exception as e:
+            self._attendance_upsert_ready = False
+            logger.warning(
+                event_type='attendance_unique_index_failed',
+                domain='registro',
+                message='Bulk class attendance disabled, using per-student writes',
+                error=str(e)
+            )
+        return self._attendance_upsert_ready
+
+    def _ensure_attendance_upsert(self) -> bool:
+        if not self._attendance_index_checked:
+            return self.init_schema()
+        return self._attendance_upsert_ready
     
     def get_student_attendance(self, student_id: int, start_date: Optional[date] = None,
                                end_date: Optional[date] = None) -> List[Dict[str, Any]]:
@@ -164,6 +291,7 @@ class RegistroElettronico:
         elif hasattr(result, 'lastrowid'):
             grade_id = result.lastrowid or 0
         
+        school_bi_snapshot.invalidate_student(student_id)
         return {
             'success': True,
             'grade_id': grade_id,
@@ -5,6 +5,7 @@ Gestisce abilitazione/disabilitazione moduli per singola scuola
 """
 
 from database_manager import db_manager
+from services.school.feature_flag_cache import feature_flag_cache
 from typing import Dict, List, Optional
 
 class SchoolFeaturesManager:
@@ -82,34 +83,40 @@ class SchoolFeaturesManager:
             print(f"⚠️ Errore init features table: {e}")
     
     def get_school_features(self, school_id: int) -> Dict[str, bool]:
-        """Ottieni feature abilitate per una scuola"""
+        """Ottieni feature abilitate per una scuola (dalla cache dei feature flag)"""
         try:
-            features = db_manager.query('''
-                SELECT feature_name, enabled
-                FROM school_features
-                WHERE school_id = %s
-            ''', (school_id,))
-            
-            # Se non ci sono impostazioni, usa default
-            if not features:
-                return {k: v['default'] for k, v in self.AVAILABLE_FEATURES.items()}
-            
-            feature_dict = {f['feature_name']: f['enabled'] for f in features}
-            
-            # Aggiungi feature mancanti con default
-            for feature_name, feature_data in self.AVAILABLE_FEATURES.items():
-                if feature_name not in feature_dict:
-                    feature_dict[feature_name] = feature_data['default']
-            
-            return feature_dict
-            
+            return dict(feature_flag_cache.get('school_features', school_id, self._load_school_features))
         except Exception as e:
             print(f"⚠️ Errore get_school_features: {e}")
             return {k: True for k in self.AVAILABLE_FEATURES.keys()}
     
+    def _load_school_features(self, school_id: int) -> Dict[str, bool]:
+        features = db_manager.query('''
+            SELECT feature_name, enabled
+            FROM school_features
+            WHERE school_id = %s
+        ''', (school_id,))
+        
+        # Se non ci sono impostazioni, usa default
+        if not features:
+            return {k: v['default'] for k, v in self.AVAILABLE_FEATURES.items()}
+        
+        feature_dict = {f['feature_name']: f['enabled'] for f in features}
+        
+        # Aggiungi feature mancanti con default
+        for feature_name, feature_data in self.AVAILABLE_FEATURES.items():
+            if feature_name not in feature_dict:
+                feature_dict[feature_name] = feature_data['default']
+        
+        return feature_dict
+    
     def is_feature_enabled(self, school_id: int, feature_name: str) -> bool:
         """Verifica se una feature è abilitata"""
-        features = self.get_school_features(school_id)
+        try:
+            features = feature_flag_cache.get('school_features', school_id, self._load_school_features)
+        except Exception as e:
+            print(f"⚠️ Errore get_school_features: {e}")
+            return feature_name in self.AVAILABLE_FEATURES
         return features.get(feature_name, False)
     
     def enable_feature(self, school_id: int, feature_name: str, admin_id: int) -> bool:
@@ -126,6 +133,7 @@ class SchoolFeaturesManager:
                 ''', (school_id, feature_name, admin_id, admin_id))
                 
                 conn.commit()
+                feature_flag_cache.invalidate(school_id)
                 print(f"✅ Feature '{feature_name}' abilitata per scuola {school_id}")
                 return True
         except Exception as e:
@@ -146,6 +154,7 @@ class SchoolFeaturesManager:
                 ''', (school_id, feature_name, admin_id, admin_id))
                 
                 conn.commit()
+                feature_flag_cache.invalidate(school_id)
                 print(f"🚫 Feature '{feature_name}' disabilitata per scuola {school_id}")
                 return True
         except Exception as e:
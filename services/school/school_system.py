@@ -3,6 +3,7 @@
 
 from database_manager import db_manager
 from performance_cache import user_cache, invalidate_user_cache
+from services.school.feature_flag_cache import feature_flag_cache
 import secrets
 import string
 
@@ -1325,11 +1326,7 @@ class SchoolSystem:
             # Use whitelisted column name (safe from SQL injection)
             column_name = ALLOWED_FEATURE_COLUMNS[feature_name]
             
-            school = db_manager.query(
-                f'SELECT {column_name} FROM scuole WHERE id = %s',
-                (school_id,),
-                one=True
-            )
+            school = feature_flag_cache.get('modules', school_id, self._load_school_modules)
             
             if school:
                 return bool(school.get(column_name, False))
@@ -1356,11 +1353,7 @@ class SchoolSystem:
             dict: Dizionario con tutti i moduli e il loro stato
         """
         try:
-            school = db_manager.query('''
-                SELECT modulo_gamification, modulo_chatbot, modulo_registro, 
-                       modulo_materiali, modulo_connect, modulo_analytics
-                FROM scuole WHERE id = %s
-            ''', (school_id,), one=True)
+            school = feature_flag_cache.get('modules', school_id, self._load_school_modules)
             
             if school:
                 return {
@@ -1400,6 +1393,15 @@ class SchoolSystem:
                 'analytics': False
             }
     
+    def _load_school_modules(self, school_id):
+        """Colonne modulo_* della scuola ({} se la scuola non esiste)"""
+        school = db_manager.query('''
+            SELECT modulo_gamification, modulo_chatbot, modulo_registro, 
+                   modulo_materiali, modulo_connect, modulo_analytics
+            FROM scuole WHERE id = %s
+        ''', (school_id,), one=True)
+        return dict(school) if school else {}
+    
     def toggle_feature(self, school_id, feature_name, enabled):
         """
         Attiva/disattiva un modulo per una scuola
@@ -1435,6 +1437,7 @@ class SchoolSystem:
                 f'UPDATE scuole SET {column_name} = %s WHERE id = %s',
                 (enabled, school_id)
             )
+            feature_flag_cache.invalidate(school_id)
             
             action = 'attivato' if enabled else 'disattivato'
             return {
@@ -0,0 +1,126 @@
+"""
+SKAJLA - Login Audit Writer
+Righe di audit dei login (login_attempts) accodate in memoria e scritte in
+background con un solo INSERT multi-riga: il percorso di login non fa
+round trip aggiuntivi verso il database.
+
+La tabella viene creata una volta sola, al primo flush.
+"""
+
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from config import config
+from database_manager import db_manager
+from shared.background_flusher import BackgroundFlusher
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+# (email, success, ip_address, user_agent, timestamp)
+AuditRow = Tuple[str, bool, str, str, datetime]
+
+
+class LoginAuditWriter(BackgroundFlusher):
+    """Buffer dei tentativi di login + flusher in background"""
+
+    def __init__(self):
+        super().__init__('login_audit', 'authentication', config.LOGIN_AUDIT_FLUSH_INTERVAL)
+        self.max_pending: int = config.LOGIN_AUDIT_MAX_PENDING
+
+        self._pending: List[AuditRow] = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+        self.stats.update({
+            'submitted': 0,
+            'written': 0,
+            'failed': 0,
+        })
+
+    def submit(self, email: str, success: bool, ip_address: str, user_agent: str = ''):
+        """Accoda un tentativo di login"""
+        self._ensure_started()
+        with self._lock:
+            self._pending.append((email, bool(success), ip_address, user_agent or '', datetime.now()))
+            self.stats['submitted'] += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.wake()
+
+    # ------------------------------------------------------------------
+    # Flusher
+    # ------------------------------------------------------------------
+
+    def _init_schema(self, cursor):
+        if db_manager.db_type == 'postgresql':
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS login_attempts (
+                    id SERIAL PRIMARY KEY,
+                    email TEXT,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    success BOOLEAN
+                )
+            ''')
+        else:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS login_attempts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    success BOOLEAN
+                )
+            ''')
+
+    def flush(self):
+        """Scrive subito tutti i tentativi in sospeso"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+
+            try:
+                with self._measure(), db_manager.get_connection() as conn:
+                    cursor = conn.cursor()
+                    if not self._schema_ready:
+                        self._init_schema(cursor)
+                    insert = '''
+                        INSERT INTO login_attempts (email, success, ip_address, user_agent, timestamp)
+                        VALUES %s
+                    '''
+                    if db_manager.db_type == 'postgresql':
+                        from psycopg2.extras import execute_values
+                        execute_values(cursor, insert, rows, page_size=len(rows))
+                    else:
+                        cursor.executemany(insert.replace('VALUES %s', 'VALUES (?, ?, ?, ?, ?)'), rows)
+                    conn.commit()
+                self._schema_ready = True
+                self.stats['written'] += len(rows)
+            except Exception as e:
+                self.stats['failed'] += len(rows)
+                self._requeue(rows)
+                logger.error(
+                    event_type='login_audit_flush_failed',
+                    domain='authentication',
+                    error=str(e),
+                    exc_info=True
+                )
+
+    def _requeue(self, rows: List[AuditRow]):
+        """Rimette in coda le righe non scritte (le più vecchie oltre il limite vanno perse)"""
+        with self._lock:
+            self._pending = self._requeue_front(rows, self._pending, self.max_pending * 10)
+
+    def get_stats(self) -> Dict[str, float]:
+        stats = self.flusher_stats()
+        stats['pending'] = len(self._pending)
+        return stats
+
+
+login_audit = LoginAuditWriter()
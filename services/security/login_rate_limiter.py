@@ -0,0 +1,162 @@
+"""
+SKAJLA - Sliding Window Rate Limiter
+Finestra scorrevole per i tentativi di login, per email e per IP.
+
+Redis:   sorted set per chiave (score = timestamp dell'evento), condiviso
+         tra i worker; ZREMRANGEBYSCORE + ZADD + ZCARD in una pipeline
+Fallback: deque di timestamp per chiave nel processo
+"""
+
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+# Oltre questo numero di chiavi locali si eliminano quelle senza eventi recenti
+MAX_LOCAL_KEYS = 10000
+
+
+class SlidingWindowLimiter:
+    """Conta gli eventi di una chiave negli ultimi `window` secondi"""
+
+    def __init__(self, redis_client=None, prefix: str = 'ratelimit'):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self._events: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'resets': 0,
+            'redis_errors': 0,
+        }
+
+    def _key(self, key: str) -> str:
+        return f'{self.prefix}:{key}'
+
+    def _redis_failed(self, operation: str, error: Exception):
+        self.stats['redis_errors'] += 1
+        logger.warning(
+            event_type='rate_limiter_redis_error',
+            domain='authentication',
+            operation=operation,
+            error=str(error),
+            message='Redis rate limiter unavailable - falling back to in-memory'
+        )
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def hit(self, key: str, window: float) -> int:
+        """Registra un evento e ritorna gli eventi nella finestra (incluso questo)"""
+        self.stats['hits'] += 1
+        now = time.time()
+
+        if self.redis_client:
+            try:
+                redis_key = self._key(key)
+                pipe = self.redis_client.pipeline()
+                pipe.zremrangebyscore(redis_key, 0, now - window)
+                pipe.zadd(redis_key, {f'{now:.6f}:{secrets.token_hex(4)}': now})
+                pipe.zcard(redis_key)
+                pipe.expire(redis_key, int(window) + 1)
+                return int(pipe.execute()[2])
+            except Exception as e:
+                self._redis_failed('hit', e)
+
+        with self._lock:
+            if len(self._events) > MAX_LOCAL_KEYS:
+                self._sweep(now, window)
+            events = self._events.setdefault(key, deque())
+            self._prune(events, now, window)
+            events.append(now)
+            return len(events)
+
+    def count(self, key: str, window: float) -> int:
+        """Eventi della chiave negli ultimi `window` secondi"""
+        now = time.time()
+
+        if self.redis_client:
+            try:
+                return int(self.redis_client.zcount(self._key(key), now - window, '+inf'))
+            except Exception as e:
+                self._redis_failed('count', e)
+
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0
+            self._prune(events, now, window)
+            if not events:
+                del self._events[key]
+                return 0
+            return len(events)
+
+    def retry_after(self, key: str, limit: int, window: float) -> float:
+        """Secondi prima che la chiave torni sotto `limit` eventi (0 se già sotto)"""
+        now = time.time()
+        oldest: Optional[float] = None
+
+        if self.redis_client:
+            try:
+                redis_key = self._key(key)
+                count = int(self.redis_client.zcount(redis_key, now - window, '+inf'))
+                if count < limit:
+                    return 0.0
+                entries = self.redis_client.zrangebyscore(
+                    redis_key, now - window, '+inf',
+                    start=count - limit, num=1, withscores=True
+                )
+                if entries:
+                    oldest = float(entries[0][1])
+            except Exception as e:
+                self._redis_failed('retry_after', e)
+
+        if oldest is None:
+            with self._lock:
+                events = self._events.get(key)
+                if not events:
+                    return 0.0
+                self._prune(events, now, window)
+                if len(events) < limit:
+                    return 0.0
+                oldest = events[len(events) - limit]
+
+        return max(0.0, oldest + window - now)
+
+    def reset(self, key: str):
+        """Azzera la chiave (es. dopo un login riuscito)"""
+        self.stats['resets'] += 1
+        if self.redis_client:
+            try:
+                self.redis_client.delete(self._key(key))
+            except Exception as e:
+                self._redis_failed('reset', e)
+
+        with self._lock:
+            self._events.pop(key, None)
+
+    # ------------------------------------------------------------------
+    # Fallback in memoria
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _prune(events: Deque[float], now: float, window: float):
+        cutoff = now - window
+        while events and events[0] <= cutoff:
+            events.popleft()
+
+    def _sweep(self, now: float, window: float):
+        for key in [k for k, events in self._events.items() if not events or events[-1] <= now - window]:
+            del self._events[key]
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['local_keys'] = len(self._events)
+        stats['backend'] = 'redis' if self.redis_client else 'local'
+        return stats
@@ -0,0 +1,146 @@
+"""
+SKAJLA - Password Hasher
+bcrypt eseguito fuori dall'hub eventlet.
+
+bcrypt è codice C CPU-bound: chiamato direttamente in un worker eventlet
+blocca l'hub (e tutti i socket del worker) per 100-250 ms a verifica. Se il
+processo è monkey-patched, hash e verifiche vanno sul pool di thread nativi
+di eventlet.tpool; un semaforo limita le operazioni contemporanee a
+PASSWORD_HASH_WORKERS e le altre attendono in coda (greenlet sospesi).
+Senza eventlet (script, test) bcrypt viene chiamato direttamente.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import bcrypt
+
+from config import config
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+
+def _offload_available() -> bool:
+    try:
+        import eventlet.patcher
+        return eventlet.patcher.is_monkey_patched('thread')
+    except Exception:
+        return False
+
+
+class PasswordHasher:
+    """hashpw/checkpw su thread nativi con coda limitata e metriche"""
+
+    def __init__(self, rounds: int = 12, workers: int = 4):
+        self.rounds = rounds
+        self.workers = max(1, workers)
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self._offload: Optional[bool] = None
+        self._queued = 0
+        self._in_flight = 0
+        self.stats: Dict[str, float] = {
+            'hashes': 0,
+            'checks': 0,
+            'errors': 0,
+            'max_queue_depth': 0,
+            'total_wait_ms': 0.0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def hash(self, password: str, rounds: Optional[int] = None) -> str:
+        """bcrypt hash con il costo configurato"""
+        salt = bcrypt.gensalt(rounds=rounds or self.rounds)
+        hashed = self._run('hashes', bcrypt.hashpw, password.encode('utf-8'), salt)
+        return hashed.decode('utf-8')
+
+    def check(self, password: str, hashed: str) -> bool:
+        """bcrypt.checkpw (ValueError se l'hash non è bcrypt)"""
+        return self._run('checks', bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True se l'hash non è bcrypt o ha un costo diverso da quello configurato"""
+        parts = (hashed or '').split('$')
+        if len(parts) < 4 or parts[1] not in ('2a', '2b', '2y'):
+            return True
+        try:
+            return int(parts[2]) != self.rounds
+        except ValueError:
+            return True
+
+    # ------------------------------------------------------------------
+    # Dispatch
+    # ------------------------------------------------------------------
+
+    def _run(self, counter: str, fn: Callable, *args) -> Any:
+        if self._offload is None:
+            self._offload = _offload_available()
+
+        start = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queued)
+
+        acquired = False
+        try:
+            self._slots.acquire()
+            acquired = True
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._queued -= 1
+                self._in_flight += 1
+
+            if self._offload:
+                from eventlet import tpool
+                return tpool.execute(fn, *args)
+            return fn(*args)
+        except ValueError:
+            raise
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(
+                event_type='password_hash_error',
+                domain='authentication',
+                operation=counter,
+                error=str(e),
+                exc_info=True
+            )
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                if acquired:
+                    self._in_flight -= 1
+                    self.stats['total_wait_ms'] += waited * 1000
+                else:
+                    self._queued -= 1
+                self.stats[counter] += 1
+                self.stats['total_ms'] += elapsed
+                self.stats['max_ms'] = max(self.stats['max_ms'], elapsed)
+            if acquired:
+                self._slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        operations = stats['hashes'] + stats['checks']
+        stats['avg_ms'] = round(stats['total_ms'] / operations, 2) if operations else 0.0
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / operations, 2) if operations else 0.0
+        stats['total_ms'] = round(stats['total_ms'], 2)
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 2)
+        stats['max_ms'] = round(stats['max_ms'], 2)
+        stats['queue_depth'] = self._queued
+        stats['in_flight'] = self._in_flight
+        stats['workers'] = self.workers
+        stats['rounds'] = self.rounds
+        stats['offload'] = 'eventlet.tpool' if self._offload else 'inline'
+        return stats
+
+
+password_hasher = PasswordHasher(rounds=config.BCRYPT_ROUNDS, workers=config.PASSWORD_HASH_WORKERS)
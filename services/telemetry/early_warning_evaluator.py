@@ -0,0 +1,280 @@
+"""
+SKAJLA Incremental Early-Warning Evaluator
+Contatori rolling per utente (bucket giornalieri su 7 giorni) al posto della
+COUNT/AVG su behavioral_telemetry ad ogni evento di apprendimento.
+
+I contatori vivono in memoria e, se Redis è disponibile, in hash Redis
+(`ew:{user_id}:{YYYYMMDD}`) condivisi tra i worker. Il database viene
+toccato solo quando la soglia viene superata e l'alert deve essere creato.
+"""
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.database.database_manager import db_manager
+from services.redis_service import redis_manager
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+# Campi di ogni bucket: eventi di struggle e somme per le medie
+BUCKET_FIELDS = ('count', 'sum_duration', 'n_duration', 'sum_accuracy', 'n_accuracy')
+
+
+class EarlyWarningEvaluator:
+    """
+    Valuta le condizioni di early warning in O(1) per evento.
+
+    Ogni evento di struggle incrementa il bucket del giorno; la valutazione
+    somma gli ultimi WINDOW_DAYS bucket (finestra a granularità giornaliera).
+    """
+
+    WINDOW_DAYS = 7
+    STRUGGLE_THRESHOLD = 5
+    # Dopo questo intervallo si ricontrolla sul DB se l'alert è ancora attivo
+    ACTIVE_ALERT_TTL = 3600
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._buckets: Dict[int, Dict[str, Dict[str, float]]] = {}
+        self._active_alerts: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            'events_recorded': 0,
+            'evaluations': 0,
+            'threshold_crossings': 0,
+            'alerts_created': 0,
+            'redis_errors': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Aggiornamento contatori
+    # ------------------------------------------------------------------
+
+    def record(
+        self,
+        user_id: int,
+        struggle: bool,
+        duration_seconds: Optional[float],
+        accuracy_score: Optional[float],
+        when: Optional[datetime] = None
+    ):
+        """Aggiorna il bucket del giorno (solo gli eventi di struggle contano)"""
+        if not struggle:
+            return
+
+        day = (when or datetime.now()).strftime('%Y%m%d')
+        delta = {
+            'count': 1,
+            'sum_duration': float(duration_seconds) if duration_seconds is not None else 0.0,
+            'n_duration': 1 if duration_seconds is not None else 0,
+            'sum_accuracy': float(accuracy_score) if accuracy_score is not None else 0.0,
+            'n_accuracy': 1 if accuracy_score is not None else 0,
+        }
+
+        with self._lock:
+            user_buckets = self._buckets.setdefault(user_id, {})
+            bucket = user_buckets.setdefault(day, dict.fromkeys(BUCKET_FIELDS, 0))
+            for field, value in delta.items():
+                bucket[field] += value
+            self._prune(user_buckets)
+            self.stats['events_recorded'] += 1
+
+        if redis_manager.use_redis:
+            try:
+                key = self._redis_key(user_id, day)
+                pipe = redis_manager.redis_client.pipeline()
+                for field, value in delta.items():
+                    if value:
+                        pipe.hincrbyfloat(key, field, value)
+                pipe.expire(key, (self.WINDOW_DAYS + 1) * 86400)
+                pipe.execute()
+            except Exception as e:
+                self.stats['redis_errors'] += 1
+                logger.warning(
+                    event_type='early_warning_redis_error',
+                    domain='telemetry',
+                    error=str(e)
+                )
+
+    def _prune(self, user_buckets: Dict[str, Dict[str, float]]):
+        window = set(self._window_days())
+        for day in [d for d in user_buckets if d not in window]:
+            del user_buckets[day]
+
+    def _window_days(self) -> List[str]:
+        today = date.today()
+        return [(today - timedelta(days=offset)).strftime('%Y%m%d') for offset in range(self.WINDOW_DAYS)]
+
+    @staticmethod
+    def _redis_key(user_id: int, day: str) -> str:
+        return f"ew:{user_id}:{day}"
+
+    # ------------------------------------------------------------------
+    # Valutazione
+    # ------------------------------------------------------------------
+
+    def get_window_totals(self, user_id: int) -> Dict[str, Any]:
+        """Evidence sugli ultimi 7 giorni: struggle_count, avg_time, avg_accuracy"""
+        totals = dict.fromkeys(BUCKET_FIELDS, 0.0)
+        days = self._window_days()
+
+        buckets = None
+        if redis_manager.use_redis:
+            try:
+                pipe = redis_manager.redis_client.pipeline()
+                for day in days:
+                    pipe.hgetall(self._redis_key(user_id, day))
+                buckets = pipe.execute()
+            except Exception as e:
+                self.stats['redis_errors'] += 1
+                logger.warning(
+                    event_type='early_warning_redis_error',
+                    domain='telemetry',
+                    error=str(e)
+                )
+
+        if buckets is None:
+            with self._lock:
+                user_buckets = self._buckets.get(user_id, {})
+                buckets = [dict(user_buckets[day]) for day in days if day in user_buckets]
+
+        for bucket in buckets:
+            for field in BUCKET_FIELDS:
+                totals[field] += float(bucket.get(field, 0) or 0)
+
+        return {
+            'struggle_count': int(totals['count']),
+            'avg_time': round(totals['sum_duration'] / totals['n_duration'], 2) if totals['n_duration'] else None,
+            'avg_accuracy': round(totals['sum_accuracy'] / totals['n_accuracy'], 2) if totals['n_accuracy'] else None,
+        }
+
+    def evaluate(self, user_id: int, subject: Optional[str]) -> bool:
+        """Crea l'alert se la soglia è superata; ritorna True se l'alert è stato creato"""
+        self.stats['evaluations'] += 1
+        evidence = self.get_window_totals(user_id)
+        if evidence['struggle_count'] < self.STRUGGLE_THRESHOLD:
+            return False
+
+        self.stats['threshold_crossings'] += 1
+        now = time.time()
+        with self._lock:
+            known_active = self._active_alerts.get(user_id)
+            if known_active and now - known_active < self.ACTIVE_ALERT_TTL:
+                return False
+
+        # Soglia superata: solo ora si interroga il database
+        existing = db_manager.query('''
+            SELECT id FROM early_warning_alerts
+            WHERE user_id = %s
+              AND alert_type = 'struggle_pattern'
+              AND status = 'active'
+            LIMIT 1
+        ''', (user_id,), one=True)
+
+        with self._lock:
+            self._active_alerts[user_id] = now
+        if existing:
+            return False
+
+        self.engine._create_early_warning_alert(
+            user_id=user_id,
+            alert_type='struggle_pattern',
+            subject=subject or 'generale',
+            evidence={
+                'struggle_count': evidence['struggle_count'],
+                'avg_time': evidence['avg_time'],
+                'avg_accuracy': evidence['avg_accuracy'] if evidence['avg_accuracy'] is not None else 100.0,
+            }
+        )
+        self.stats['alerts_created'] += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # Ricostruzione da storico
+    # ------------------------------------------------------------------
+
+    def rebuild_from_history(self, user_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Ricostruisce i contatori dagli ultimi 7 giorni di behavioral_telemetry.
+
+        Da eseguire dopo un riavvio senza Redis (o dopo un flush di Redis).
+        Ritorna il numero di utenti ricostruiti.
+        """
+        if db_manager.db_type == 'postgresql':
+            since_clause = "timestamp >= CURRENT_DATE - INTERVAL '%s days'" % (self.WINDOW_DAYS - 1)
+            day_expr = "TO_CHAR(timestamp, 'YYYYMMDD')"
+            struggle_clause = "struggle_indicator = TRUE"
+        else:
+            since_clause = "timestamp >= date('now', '-%s days')" % (self.WINDOW_DAYS - 1)
+            day_expr = "strftime('%Y%m%d', timestamp)"
+            struggle_clause = "struggle_indicator = 1"
+
+        params: tuple = ()
+        user_filter = ''
+        if user_ids:
+            user_ids = list(user_ids)
+            user_filter = f"AND user_id IN ({', '.join(['%s'] * len(user_ids))})"
+            params = tuple(user_ids)
+
+        rows = db_manager.query(f'''
+            SELECT user_id,
+                   {day_expr} AS day,
+                   COUNT(*) AS count,
+                   COALESCE(SUM(duration_seconds), 0) AS sum_duration,
+                   COUNT(duration_seconds) AS n_duration,
+                   COALESCE(SUM(accuracy_score), 0) AS sum_accuracy,
+                   COUNT(accuracy_score) AS n_accuracy
+            FROM behavioral_telemetry
+            WHERE {struggle_clause}
+              AND {since_clause}
+              {user_filter}
+            GROUP BY user_id, {day_expr}
+        ''', params)
+
+        rebuilt: Dict[int, Dict[str, Dict[str, float]]] = {}
+        for row in rows:
+            rebuilt.setdefault(row['user_id'], {})[row['day']] = {
+                field: float(row[field] or 0) for field in BUCKET_FIELDS
+            }
+
+        with self._lock:
+            if user_ids is None:
+                self._buckets = rebuilt
+            else:
+                for user_id in user_ids:
+                    self._buckets[user_id] = rebuilt.get(user_id, {})
+
+        if redis_manager.use_redis:
+            try:
+                pipe = redis_manager.redis_client.pipeline()
+                for user_id, days in rebuilt.items():
+                    for day in self._window_days():
+                        pipe.delete(self._redis_key(user_id, day))
+                    for day, bucket in days.items():
+                        key = self._redis_key(user_id, day)
+                        pipe.hset(key, mapping=bucket)
+                        pipe.expire(key, (self.WINDOW_DAYS + 1) * 86400)
+                pipe.execute()
+            except Exception as e:
+                self.stats['redis_errors'] += 1
+                logger.warning(
+                    event_type='early_warning_redis_error',
+                    domain='telemetry',
+                    error=str(e)
+                )
+
+        logger.info(
+            event_type='early_warning_counters_rebuilt',
+            domain='telemetry',
+            users=len(rebuilt)
+        )
+        return len(rebuilt)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['tracked_users'] = len(self._buckets)
+        stats['backend'] = 'redis' if redis_manager.use_redis else 'memory'
+        return stats
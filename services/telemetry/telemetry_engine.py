@@ -10,6 +10,7 @@ from services.database.database_manager import db_manager
 import json
 import hashlib
 import secrets
+import time
 
 from shared.error_handling import (
     DatabaseError,
@@ -46,9 +47,18 @@ class TelemetryEngine:
         }
     }
     
+    # Cache user -> scuola_id (cambia raramente)
+    SCHOOL_CACHE_TTL = 600
+    
     def __init__(self):
         """Initialize telemetry engine and create tables if needed"""
+        self._school_cache: Dict[int, tuple] = {}
         self._init_tables()
+        
+        from services.telemetry.telemetry_pipeline import TelemetryPipeline
+        from services.telemetry.early_warning_evaluator import EarlyWarningEvaluator
+        self.pipeline = TelemetryPipeline(self)
+        self.early_warning = EarlyWarningEvaluator(self)
         logger.info(
             event_type='telemetry_engine_initialized',
             domain='telemetry',
@@ -360,8 +370,28 @@ class TelemetryEngine:
             accuracy_score: Performance score (0-100)
         
         Returns:
-            event_id: ID of created telemetry event
+            event_id: ID of created telemetry event (or queue sequence number
+            when the async pipeline is enabled, 0 if the event was dropped)
         """
+        if self.pipeline.enabled:
+            struggle = self._detect_struggle(
+                event_type=event_type,
+                duration=duration_seconds,
+                accuracy=accuracy_score,
+                context=context
+            )
+            event_id = self.pipeline.submit(
+                user_id=user_id,
+                event_type=event_type,
+                context=context,
+                duration_seconds=duration_seconds,
+                accuracy_score=accuracy_score,
+                struggle=struggle
+            )
+            if event_id:
+                self.early_warning.record(user_id, struggle, duration_seconds, accuracy_score)
+            return event_id
+        
         try:
             session_id = context.get('session_id') or self._get_or_create_session(user_id, context.get('device_type', 'desktop'))
             
@@ -398,6 +428,7 @@ class TelemetryEngine:
             event_id = result.lastrowid if result.lastrowid else 0
             
             self._update_session_metrics(session_id)
+            self.early_warning.record(user_id, struggle, duration_seconds, accuracy_score)
             
             # CRITICAL: Always check early warning conditions for learning events
             if event_type in ['task_submit', 'quiz_answer', 'task_start']:
@@ -470,16 +501,37 @@ class TelemetryEngine:
         return categories.get(event_type, 'other')
     
     def _get_user_school(self, user_id: int) -> Optional[int]:
-        """Get user's school ID"""
-        try:
-            user = db_manager.query(
-                'SELECT scuola_id FROM utenti WHERE id = %s',
-                (user_id,),
-                one=True
-            )
-            return user['scuola_id'] if user else None
-        except Exception:
-            return None
+        """Get user's school ID (cached)"""
+        return self._get_user_schools([user_id]).get(user_id)
+    
+    def _get_user_schools(self, user_ids) -> Dict[int, Optional[int]]:
+        """Resolve school IDs for many users with one query, using the cache"""
+        now = time.time()
+        schools: Dict[int, Optional[int]] = {}
+        missing = []
+        for user_id in user_ids:
+            cached = self._school_cache.get(user_id)
+            if cached and now - cached[1] < self.SCHOOL_CACHE_TTL:
+                schools[user_id] = cached[0]
+            else:
+                missing.append(user_id)
+        
+        if missing:
+            try:
+                placeholders = ', '.join(['%s'] * len(missing))
+                rows = db_manager.query(
+                    f'SELECT id, scuola_id FROM utenti WHERE id IN ({placeholders})',
+                    tuple(missing)
+                )
+                found = {row['id']: row['scuola_id'] for row in rows}
+            except Exception:
+                return schools
+            
+            for user_id in missing:
+                schools[user_id] = found.get(user_id)
+                self._school_cache[user_id] = (schools[user_id], now)
+        
+        return schools
     
     def _get_or_create_session(self, user_id: int, device_type: str) -> str:
         """
@@ -538,47 +590,12 @@ class TelemetryEngine:
     
     def _check_early_warning_conditions(self, user_id: int, subject: Optional[str]):
         """
-        Analyze recent telemetry to determine if early warning alert needed
-        Works even when subject is None/missing
+        Evaluate early warning conditions from the incremental counters
+        (no 7-day aggregate scan; the database is queried only when the
+        struggle threshold is crossed). Works even when subject is None/missing
         """
         try:
-            # CRITICAL: Use simplified query that works with or without subject
-            recent_struggles = db_manager.query('''
-                SELECT 
-                    COUNT(*) as struggle_count,
-                    AVG(duration_seconds) as avg_time,
-                    AVG(accuracy_score) as avg_accuracy
-                FROM behavioral_telemetry
-                WHERE user_id = %s
-                  AND struggle_indicator = TRUE
-                  AND timestamp >= CURRENT_TIMESTAMP - INTERVAL '7 days'
-            ''', (user_id,), one=True) if db_manager.db_type == 'postgresql' else None
-            
-            if not recent_struggles:
-                return
-            
-            struggle_count = recent_struggles.get('struggle_count', 0)
-            avg_accuracy = recent_struggles.get('avg_accuracy', 100.0) or 100.0
-            
-            # Trigger alert if significant struggle pattern detected
-            if struggle_count >= 5:
-                # Check if alert already exists for this user (prevent duplicates)
-                existing = db_manager.query('''
-                    SELECT id FROM early_warning_alerts
-                    WHERE user_id = %s
-                      AND alert_type = 'struggle_pattern'
-                      AND status = 'active'
-                    LIMIT 1
-                ''', (user_id,), one=True)
-                
-                if not existing:
-                    self._create_early_warning_alert(
-                        user_id=user_id,
-                        alert_type='struggle_pattern',
-                        subject=subject or 'generale',
-                        evidence=recent_struggles
-                    )
-                        
+            self.early_warning.evaluate(user_id, subject)
         except Exception as e:
             logger.error(
                 event_type='early_warning_check_failed',
@@ -0,0 +1,400 @@
+"""
+SKAJLA Telemetry Ingestion Pipeline
+Coda in-process limitata + flusher in background per gli eventi di telemetria.
+
+Gli eventi vengono scritti a blocchi con INSERT multi-riga su una sola
+connessione, gli aggiornamenti delle sessioni vengono aggregati per
+session_id e la scuola dell'utente viene risolta dalla cache dell'engine.
+Così la telemetria non compete più con la chat per il pool di connessioni.
+
+Gli id ritornati da submit() sono già confermati al client, quindi un batch
+fallito non viene scartato: su errori transitori del DB (connessione,
+lock) torna in coda, entro un limite; su errori nei dati si riscrive una
+riga alla volta e si perde solo la riga rifiutata.
+"""
+
+import itertools
+import json
+import queue
+import secrets
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import config
+from services.database.database_manager import db_manager
+from shared.background_flusher import BackgroundFlusher
+from shared.error_handling import (
+    DatabaseConnectionError,
+    DatabaseTransientError,
+    get_logger,
+    map_exception,
+)
+
+logger = get_logger(__name__)
+
+# Eventi che richiedono la valutazione early-warning dopo il flush
+EARLY_WARNING_EVENTS = ('task_submit', 'quiz_answer', 'task_start')
+
+
+def _is_transient(error: Exception) -> bool:
+    """Errore che passa da solo ritentando (connessione, pool, lock)"""
+    try:
+        from psycopg2.pool import PoolError
+        if isinstance(error, PoolError):
+            return True
+    except ImportError:
+        pass
+    return isinstance(map_exception(error), (DatabaseTransientError, DatabaseConnectionError))
+
+
+class TelemetryPipeline(BackgroundFlusher):
+    """
+    Ingestione asincrona a batch per TelemetryEngine.track_event.
+
+    Backpressure: se la coda è piena submit() attende al massimo
+    `enqueue_timeout` secondi, poi scarta l'evento (contatore `dropped`)
+    e ritorna 0, così il client ritenta come per un errore di scrittura.
+    """
+
+    def __init__(self, engine):
+        super().__init__('telemetry', 'telemetry', config.TELEMETRY_FLUSH_INTERVAL)
+        self.engine = engine
+        self.enabled: bool = config.TELEMETRY_ASYNC
+        self.batch_size: int = config.TELEMETRY_BATCH_SIZE
+        self.enqueue_timeout: float = config.TELEMETRY_ENQUEUE_TIMEOUT
+        self.implicit_session_ttl: int = 1800
+
+        self._queue: queue.Queue = queue.Queue(maxsize=config.TELEMETRY_QUEUE_SIZE)
+        self._sequence = itertools.count(1)
+
+        # Eventi di batch falliti per errori transitori, riscritti per primi
+        self._retry: List[Dict[str, Any]] = []
+        self._retry_lock = threading.Lock()
+        self.max_retry: int = self.batch_size * 10
+
+        # Sessioni implicite per utente (eventi senza session_id dal client)
+        self._implicit_sessions: Dict[int, Dict[str, Any]] = {}
+        self._pending_sessions: Dict[str, Dict[str, Any]] = {}
+        self._sessions_lock = threading.Lock()
+
+        self.stats.update({
+            'enqueued': 0,
+            'flushed': 0,
+            'failed': 0,
+            'requeued': 0,
+            'rejected': 0,
+            'sessions_created': 0,
+            'session_updates_coalesced': 0,
+            'last_batch_size': 0,
+        })
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        user_id: int,
+        event_type: str,
+        context: Dict[str, Any],
+        duration_seconds: Optional[int],
+        accuracy_score: Optional[float],
+        struggle: bool
+    ) -> int:
+        """Accoda un evento; ritorna un id progressivo (>0) o 0 se scartato"""
+        self._ensure_started()
+
+        session_id = context.get('session_id') or self._implicit_session(
+            user_id, context.get('device_type', 'desktop')
+        )
+
+        event = {
+            'user_id': user_id,
+            'event_type': event_type,
+            'event_category': self.engine._categorize_event(event_type),
+            'session_id': session_id,
+            'duration_seconds': duration_seconds,
+            'context_json': json.dumps(context),
+            'accuracy_score': accuracy_score,
+            'struggle': struggle,
+            'device_type': context.get('device_type', 'desktop'),
+            'subject': context.get('subject'),
+            'timestamp': datetime.now(),
+        }
+
+        try:
+            self._queue.put(event, block=True, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            logger.warning(
+                event_type='telemetry_event_dropped',
+                domain='telemetry',
+                message='Telemetry queue full, event dropped',
+                user_id=user_id,
+                queue_size=self._queue.qsize()
+            )
+            return 0
+
+        self.stats['enqueued'] += 1
+        return next(self._sequence)
+
+    def _implicit_session(self, user_id: int, device_type: str) -> str:
+        """Riusa una sessione per utente invece di crearne una per evento"""
+        now = time.time()
+        with self._sessions_lock:
+            current = self._implicit_sessions.get(user_id)
+            if current and now - current['last_seen'] < self.implicit_session_ttl:
+                current['last_seen'] = now
+                return current['session_id']
+
+            session_id = f"session_{user_id}_{int(now)}_{secrets.token_hex(4)}"
+            self._implicit_sessions[user_id] = {'session_id': session_id, 'last_seen': now}
+            self._pending_sessions[session_id] = {
+                'user_id': user_id,
+                'device_type': device_type,
+                'started_at': datetime.now(),
+            }
+            return session_id
+
+    # ------------------------------------------------------------------
+    # Flusher
+    # ------------------------------------------------------------------
+
+    def _flush_cycle(self) -> bool:
+        """Raccoglie eventi fino a batch_size o flush_interval e li scrive"""
+        batch = self._drain(block_timeout=self.flush_interval)
+        # False: DB non disponibile, il batch è tornato in coda
+        return not batch or self._write_batch(batch)
+
+    def _drain(self, block_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        with self._retry_lock:
+            batch: List[Dict[str, Any]] = self._retry[:self.batch_size]
+            del self._retry[:self.batch_size]
+        if batch:
+            block_timeout = None
+        deadline = time.monotonic() + (block_timeout or 0)
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(block=True, timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Scrive subito tutti gli eventi in coda (shutdown, test, job)"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            if not self._write_batch(batch):
+                return
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        """Scrive il batch; False se è tornato in coda per un errore transitorio"""
+        with self._flush_lock, self._measure():
+            with self._sessions_lock:
+                new_sessions = self._pending_sessions
+                self._pending_sessions = {}
+
+            schools = self.engine._get_user_schools({e['user_id'] for e in batch})
+            complete = True
+            try:
+                self._write(batch, schools, new_sessions)
+                written = batch
+                self.stats['flushed'] += len(batch)
+                self.stats['sessions_created'] += len(new_sessions)
+            except Exception as e:
+                self.stats['failed'] += len(batch)
+                transient = _is_transient(e)
+                logger.error(
+                    event_type='telemetry_batch_failed',
+                    domain='telemetry',
+                    message=f'Failed to flush telemetry batch: {e}',
+                    batch_size=len(batch),
+                    transient=transient,
+                    error=str(e),
+                    exc_info=True
+                )
+                if transient:
+                    self._requeue_sessions(new_sessions)
+                    self._requeue(batch)
+                    return False
+                written, complete = self._write_each(batch, schools, new_sessions)
+            finally:
+                self.stats['last_batch_size'] = len(batch)
+
+        self._run_early_warning_checks(written)
+        return complete
+
+    def _write(self, batch: List[Dict[str, Any]], schools: Dict[int, Optional[int]],
+               new_sessions: Dict[str, Dict[str, Any]]):
+        """Sessioni, eventi e contatori delle sessioni in una sola transazione"""
+        session_counts: Dict[str, int] = defaultdict(int)
+        for event in batch:
+            if event['session_id']:
+                session_counts[event['session_id']] += 1
+
+        with db_manager.get_connection() as conn:
+            cursor = conn.cursor()
+            if db_manager.db_type == 'postgresql':
+                self._write_postgresql(cursor, batch, schools, new_sessions, session_counts)
+            else:
+                self._write_sqlite(cursor, batch, schools, new_sessions, session_counts)
+
+        self.stats['session_updates_coalesced'] += len(batch) - len(session_counts)
+
+    def _write_each(self, batch: List[Dict[str, Any]], schools: Dict[int, Optional[int]],
+                    new_sessions: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Errore nei dati: una transazione per riga, si scartano solo le righe
+        rifiutate. Ritorna (eventi scritti, False se il resto è tornato in coda).
+        """
+        if new_sessions:
+            try:
+                self._write([], schools, new_sessions)
+                self.stats['sessions_created'] += len(new_sessions)
+            except Exception as e:
+                if _is_transient(e):
+                    self._requeue_sessions(new_sessions)
+                    self._requeue(batch)
+                    return [], False
+                logger.error(
+                    event_type='telemetry_sessions_rejected',
+                    domain='telemetry',
+                    sessions=len(new_sessions),
+                    error=str(e)
+                )
+
+        written: List[Dict[str, Any]] = []
+        for index, event in enumerate(batch):
+            try:
+                self._write([event], schools, {})
+                written.append(event)
+            except Exception as e:
+                if _is_transient(e):
+                    self._requeue(batch[index:])
+                    self.stats['flushed'] += len(written)
+                    return written, False
+                self.stats['rejected'] += 1
+                logger.error(
+                    event_type='telemetry_event_rejected',
+                    domain='telemetry',
+                    user_id=event['user_id'],
+                    event_type_value=event['event_type'],
+                    error=str(e)
+                )
+        self.stats['flushed'] += len(written)
+        return written, True
+
+    def _requeue(self, events: List[Dict[str, Any]]):
+        """Rimette in testa gli eventi non scritti (i più vecchi oltre il limite vanno persi)"""
+        with self._retry_lock:
+            self._retry = self._requeue_front(events, self._retry, self.max_retry)
+            self.stats['requeued'] += len(events)
+
+    def _requeue_sessions(self, new_sessions: Dict[str, Dict[str, Any]]):
+        """Le sessioni non scritte verranno ritentate al prossimo batch"""
+        with self._sessions_lock:
+            new_sessions.update(self._pending_sessions)
+            self._pending_sessions = new_sessions
+
+    def _write_postgresql(self, cursor, batch, schools, new_sessions, session_counts):
+        from psycopg2.extras import execute_values
+
+        if new_sessions:
+            execute_values(cursor, '''
+                INSERT INTO telemetry_sessions (session_id, user_id, device_type, started_at)
+                VALUES %s
+                ON CONFLICT (session_id) DO NOTHING
+            ''', [
+                (sid, s['user_id'], s['device_type'], s['started_at'])
+                for sid, s in new_sessions.items()
+            ])
+
+        if not batch:
+            return
+
+        execute_values(cursor, '''
+            INSERT INTO behavioral_telemetry (
+                user_id, scuola_id, event_type, event_category,
+                session_id, duration_seconds, context_data,
+                accuracy_score, struggle_indicator, device_type, timestamp
+            ) VALUES %s
+        ''', [self._event_row(e, schools) for e in batch], page_size=self.batch_size)
+
+        if session_counts:
+            execute_values(cursor, '''
+                UPDATE telemetry_sessions AS ts
+                SET total_events = ts.total_events + v.n,
+                    ended_at = CURRENT_TIMESTAMP
+                FROM (VALUES %s) AS v(session_id, n)
+                WHERE ts.session_id = v.session_id
+            ''', list(session_counts.items()))
+
+    def _write_sqlite(self, cursor, batch, schools, new_sessions, session_counts):
+        if new_sessions:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO telemetry_sessions (session_id, user_id, device_type, started_at)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (sid, s['user_id'], s['device_type'], s['started_at'])
+                for sid, s in new_sessions.items()
+            ])
+
+        cursor.executemany('''
+            INSERT INTO behavioral_telemetry (
+                user_id, scuola_id, event_type, event_category,
+                session_id, duration_seconds, context_data,
+                accuracy_score, struggle_indicator, device_type, timestamp
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [self._event_row(e, schools) for e in batch])
+
+        cursor.executemany('''
+            UPDATE telemetry_sessions
+            SET total_events = total_events + ?,
+                ended_at = CURRENT_TIMESTAMP
+            WHERE session_id = ?
+        ''', [(n, sid) for sid, n in session_counts.items()])
+
+    @staticmethod
+    def _event_row(event: Dict[str, Any], schools: Dict[int, Optional[int]]) -> tuple:
+        return (
+            event['user_id'],
+            schools.get(event['user_id']),
+            event['event_type'],
+            event['event_category'],
+            event['session_id'],
+            event['duration_seconds'],
+            event['context_json'],
+            event['accuracy_score'],
+            event['struggle'],
+            event['device_type'],
+            event['timestamp'],
+        )
+
+    def _run_early_warning_checks(self, batch: List[Dict[str, Any]]):
+        """Una sola valutazione early-warning per utente per batch"""
+        to_check: Dict[int, Optional[str]] = {}
+        for event in batch:
+            accuracy = event['accuracy_score']
+            if (event['event_type'] in EARLY_WARNING_EVENTS or event['struggle']
+                    or (accuracy is not None and accuracy < 50)):
+                to_check[event['user_id']] = event['subject'] or to_check.get(event['user_id'])
+
+        for user_id, subject in to_check.items():
+            self.engine._check_early_warning_conditions(user_id, subject)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.flusher_stats()
+        stats['enabled'] = self.enabled
+        stats['queue_depth'] = self._queue.qsize()
+        stats['retry_depth'] = len(self._retry)
+        stats['queue_capacity'] = self._queue.maxsize
+        return stats
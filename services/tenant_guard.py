@@ -5,6 +5,7 @@ Sistema centralizzato per garantire isolamento multi-tenant tra scuole
 
 from flask import session
 from database_manager import db_manager
+from services.messaging.membership_cache import membership_cache
 
 
 class TenantGuardException(Exception):
@@ -82,12 +83,16 @@ def verify_chat_belongs_to_school(chat_id, school_id=None):
     if school_id is None:
         school_id = get_current_school_id()
     
-    result = db_manager.query('''
-        SELECT 1 FROM chat 
-        WHERE id = %s AND scuola_id = %s
-    ''', (chat_id, school_id), one=True)
-    
-    return result is not None
+    # Cache LRU + Redis: niente query per evento Socket.IO
+    return membership_cache.chat_in_school(chat_id, school_id)
+
+
+def verify_chat_membership(chat_id, user_id):
+    """
+    Verifica che un utente partecipi a una chat (cache LRU + Redis)
+    Returns: True se l'utente è partecipante, False altrimenti
+    """
+    return membership_cache.is_member(chat_id, user_id)
 
 
 def verify_user_belongs_to_school(user_id, school_id=None):
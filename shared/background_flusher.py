@@ -0,0 +1,160 @@
+"""
+SKAJLA - Background Flusher
+Base comune dei writer che accodano in memoria e scrivono a blocchi in
+background (audit login, telemetria, XP, ricevute di lettura, read model
+dashboard, hit della cache AI).
+
+Il thread daemon parte al primo uso e chiama flush() ogni flush_interval
+secondi, o subito dopo wake() quando la coda è piena. All'uscita del
+processo stop() ferma il thread, ne attende la fine e scrive quanto resta.
+Le sottoclassi implementano flush() sotto self._flush_lock e usano
+_measure() e _requeue_front() per tempi e rimessa in coda dopo un errore.
+"""
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from shared.error_handling import get_logger
+
+logger = get_logger(__name__)
+
+
+class BackgroundFlusher:
+    """Thread di flush periodico + arresto ordinato + metriche comuni"""
+
+    # Secondi concessi al thread per terminare il flush in corso allo shutdown
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, name: str, domain: str, flush_interval: float):
+        self.flusher_name = name
+        self.flusher_domain = domain
+        self.flush_interval = flush_interval
+
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self.stats: Dict[str, Any] = {
+            'batches': 0,
+            'dropped': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Da implementare
+    # ------------------------------------------------------------------
+
+    def flush(self) -> Any:
+        """Scrive subito tutto quanto è in sospeso"""
+        raise NotImplementedError
+
+    def _flush_cycle(self) -> bool:
+        """Un giro del thread; False se il backend non è disponibile"""
+        self._wakeup.wait(self.flush_interval)
+        self._wakeup.clear()
+        self.flush()
+        return True
+
+    # ------------------------------------------------------------------
+    # Ciclo di vita
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._running:
+            return
+        with self._start_lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._flush_loop, name=f'{self.flusher_name}-flusher', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.stop)
+            logger.info(
+                event_type='background_flusher_started',
+                domain=self.flusher_domain,
+                flusher=self.flusher_name,
+                flush_interval=self.flush_interval
+            )
+
+    def wake(self):
+        """Anticipa il prossimo flush (coda piena)"""
+        self._wakeup.set()
+
+    def _flush_loop(self):
+        while self._running:
+            try:
+                available = self._flush_cycle()
+            except Exception as e:
+                available = False
+                logger.error(
+                    event_type='background_flush_failed',
+                    domain=self.flusher_domain,
+                    flusher=self.flusher_name,
+                    error=str(e),
+                    exc_info=True
+                )
+            if not available and self._running:
+                # Si attende prima di ritentare invece di girare a vuoto
+                time.sleep(self.flush_interval)
+
+    def stop(self):
+        """Ferma il thread e scrive quanto resta (registrato con atexit)"""
+        self._running = False
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.STOP_TIMEOUT)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(
+                event_type='background_flush_on_stop_failed',
+                domain=self.flusher_domain,
+                flusher=self.flusher_name,
+                error=str(e)
+            )
+
+    # ------------------------------------------------------------------
+    # Helper per le sottoclassi
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _measure(self) -> Iterator[None]:
+        """Conta il batch e ne registra la durata in last_flush_ms"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stats['batches'] += 1
+            self.stats['last_flush_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _requeue_front(self, failed: List[Any], pending: List[Any], limit: int) -> List[Any]:
+        """
+        Rimette `failed` davanti a `pending` (chiamato con il lock della coda).
+        Oltre `limit` elementi i più vecchi vanno persi e contati in `dropped`.
+        """
+        merged = failed + pending
+        overflow = len(merged) - limit
+        if overflow > 0:
+            del merged[:overflow]
+            self.stats['dropped'] += overflow
+            logger.error(
+                event_type='background_requeue_overflow',
+                domain=self.flusher_domain,
+                flusher=self.flusher_name,
+                dropped=overflow
+            )
+        return merged
+
+    def flusher_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['running'] = self._running
+        return stats
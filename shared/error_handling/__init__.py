@@ -36,6 +36,7 @@ from .exceptions import (
     AIServiceError,
     AIQuotaExceededError,
     AIResponseError,
+    AIOverloadedError,
     FileStorageError,
     FileValidationError,
     FileUploadError,
@@ -75,6 +76,7 @@ __all__ = [
     'AIServiceError',
     'AIQuotaExceededError',
     'AIResponseError',
+    'AIOverloadedError',
     'FileStorageError',
     'FileValidationError',
     'FileUploadError',
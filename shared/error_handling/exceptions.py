@@ -165,6 +165,17 @@ class AIResponseError(AIServiceError):
         )
 
 
+class AIOverloadedError(AIServiceError):
+    """Too many outstanding AI calls in this worker - request shed"""
+    def __init__(self, retry_after: float = 5.0, context: Optional[Dict] = None):
+        super().__init__(
+            "AI call shed: worker queue full",
+            display_message="SKAJLA Coach è molto richiesto in questo momento. Riprova tra qualche secondo.",
+            context={**(context or {}), 'retry_after': retry_after}
+        )
+        self.retry_after = retry_after
+
+
 # ============================================================================
 # FILE STORAGE ERRORS
 # ============================================================================
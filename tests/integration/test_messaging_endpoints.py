@@ -2,6 +2,8 @@
 Integration tests for Messaging Endpoints
 """
 import pytest
+from unittest.mock import patch
+from services.messaging.message_history import history_buffer
 
 class TestMessagingEndpoints:
     """Test messaging and chat functionality"""
@@ -26,3 +28,28 @@ class TestMessagingEndpoints:
         response = client.get('/api/messaging/rooms')
         # Should require auth
         assert response.status_code in [302, 401, 403, 404]
+    
+    def test_hot_chat_history_served_from_buffer(self, client):
+        """Test the second open of a chat reads the ring buffer, not the DB"""
+        with client.session_transaction() as session:
+            session['user_id'] = 1
+            session['ruolo'] = 'studente'
+            session['scuola_id'] = 1
+        
+        rows = [{
+            'id': message_id, 'contenuto': f'msg {message_id}', 'timestamp': '2024-01-01 10:00:00',
+            'utente_id': 1, 'nome': 'Test', 'cognome': 'User'
+        } for message_id in range(30, 0, -1)]
+        history_buffer.clear()
+        
+        with patch('routes.messaging_routes.verify_chat_membership', return_value=True), \
+             patch('routes.messaging_routes.get_current_school_id', return_value=1), \
+             patch('services.messaging.message_history.redis_manager.use_redis', False), \
+             patch('services.messaging.message_history.db_manager.query', return_value=rows) as query:
+            first = client.get('/api/chat/messages/42')
+            second = client.get('/api/chat/messages/42')
+        
+        assert first.status_code == 200
+        assert second.get_json()['messages'] == first.get_json()['messages']
+        assert query.call_count == 1
+        history_buffer.clear()
@@ -0,0 +1,35 @@
+"""
+Unit tests for the semantic AI cache index
+"""
+import pytest
+from services.ai.semantic_cache import SemanticCacheIndex
+
+class TestSemanticCacheIndex:
+    """Test near-duplicate matching of cached AI questions"""
+
+    @pytest.fixture
+    def index(self):
+        index = SemanticCacheIndex(threshold=0.7)
+        index._warmed = True  # no DB warm-up
+        return index
+
+    def test_rephrased_question_matches(self, index):
+        """Test the same question with different wording hits the cache"""
+        index.add('h1', "come si fa un'equazione di secondo grado?", 'ctx')
+
+        match = index.match('come risolvo equazioni di secondo grado', 'ctx')
+
+        assert match is not None
+        assert match[0] == 'h1'
+
+    def test_different_exponent_misses(self, index):
+        """Test x^2 and x^3 are different exercises"""
+        index.add('h1', 'Qual è la derivata di x^2?', 'ctx')
+
+        assert index.match('Qual è la derivata di x^3?', 'ctx') is None
+
+    def test_different_numbers_miss(self, index):
+        """Test the same problem with another radius is not served from cache"""
+        index.add('h1', "Calcola l'area di un cerchio di raggio 5 cm", 'ctx')
+
+        assert index.match("Calcola l'area di un cerchio di raggio 8 cm", 'ctx') is None
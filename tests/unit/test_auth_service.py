@@ -1,8 +1,12 @@
 """
 Unit tests for Authentication Service
 """
+import time
+
 import pytest
 from services.auth_service import auth_service
+from services.security.login_rate_limiter import SlidingWindowLimiter
+from services.security.password_hasher import PasswordHasher
 
 class TestAuthService:
     """Test authentication service functionality"""
@@ -23,6 +27,14 @@ class TestAuthService:
         
         assert auth_service.verify_password("WrongPassword", hashed) is False
     
+    def test_needs_rehash_on_cost_change_and_legacy_hash(self):
+        """Test rehash is requested for other bcrypt costs and SHA-256 hashes"""
+        hasher = PasswordHasher(rounds=12)
+        
+        assert hasher.needs_rehash('$2b$12$' + 'a' * 53) is False
+        assert hasher.needs_rehash('$2b$10$' + 'a' * 53) is True
+        assert hasher.needs_rehash('5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8') is True
+    
     def test_lockout_after_max_attempts(self):
         """Test account lockout after max failed attempts"""
         email = "test@example.com"
@@ -45,3 +57,32 @@ class TestAuthService:
         auth_service.reset_attempts(email)
         
         assert auth_service.is_locked_out(email) is False
+    
+    def test_sliding_window_expires_old_attempts(self):
+        """Test attempts outside the window no longer count"""
+        limiter = SlidingWindowLimiter()
+        
+        assert limiter.hit('ip:10.0.0.1', 0.2) == 1
+        assert limiter.hit('ip:10.0.0.1', 0.2) == 2
+        assert limiter.retry_after('ip:10.0.0.1', 2, 0.2) > 0
+        
+        time.sleep(0.25)
+        assert limiter.count('ip:10.0.0.1', 0.2) == 0
+        assert limiter.retry_after('ip:10.0.0.1', 2, 0.2) == 0
+    
+    def test_client_ip_ignores_spoofed_forwarded_for(self):
+        """Test the IP comes from the trusted proxy hop, not the client-set entry"""
+        from flask import Flask
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        
+        app = Flask(__name__)
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+        app.add_url_rule('/ip', 'ip', auth_service._client_ip)
+        
+        response = app.test_client().get(
+            '/ip',
+            headers={'X-Forwarded-For': '203.0.113.7, 198.51.100.20'},
+            environ_base={'REMOTE_ADDR': '127.0.0.1'}
+        )
+        
+        assert response.get_data(as_text=True) == '198.51.100.20'
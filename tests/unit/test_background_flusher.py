@@ -0,0 +1,50 @@
+"""
+Unit tests for the shared background flusher
+"""
+import threading
+from shared.background_flusher import BackgroundFlusher
+
+class ListFlusher(BackgroundFlusher):
+    """Minimal writer that moves pending items to `written`"""
+
+    def __init__(self):
+        super().__init__('test', 'test', flush_interval=0.01)
+        self.pending = []
+        self.written = []
+        self.lock = threading.Lock()
+
+    def submit(self, item):
+        self._ensure_started()
+        with self.lock:
+            self.pending.append(item)
+
+    def flush(self):
+        with self._flush_lock, self._measure():
+            with self.lock:
+                items, self.pending = self.pending, []
+            self.written.extend(items)
+
+class TestBackgroundFlusher:
+    """Test thread lifecycle and requeue shared by the background writers"""
+
+    def test_stop_writes_pending_and_stops_thread(self):
+        """Test stop() joins the thread and flushes what is left"""
+        flusher = ListFlusher()
+        flusher.submit(1)
+        thread = flusher._thread
+
+        flusher.submit(2)
+        flusher.stop()
+
+        assert not thread.is_alive()
+        assert flusher.written == [1, 2]
+        assert flusher.flusher_stats()['running'] is False
+
+    def test_requeue_front_drops_oldest_over_limit(self):
+        """Test failed items go back in front and overflow is counted"""
+        flusher = ListFlusher()
+
+        merged = flusher._requeue_front([1, 2, 3], [4, 5], limit=4)
+
+        assert merged == [2, 3, 4, 5]
+        assert flusher.stats['dropped'] == 1
@@ -3,6 +3,7 @@ Unit tests for Database Manager
 """
 import pytest
 from database_manager import db_manager
+from services.database.statement_cache import StatementCache, StatementEntry, to_positional_sql
 
 class TestDatabaseManager:
     """Test database manager functionality"""
@@ -47,3 +48,58 @@ class TestDatabaseManager:
             assert db_manager.pool is not None
         else:
             assert db_manager.sqlite_pool is not None
+
+    def test_pool_stats_exposed(self):
+        """Test pool metrics track checkouts and validations"""
+        stats = db_manager.pool_stats
+        for key in ('checkouts', 'checkout_wait_avg_ms', 'validations',
+                    'validations_skipped', 'recycled_max_lifetime'):
+            assert key in stats
+        assert stats['db_type'] == db_manager.db_type
+
+    def test_unit_of_work_reuses_connection(self):
+        """Test calls inside a unit of work share one connection"""
+        with db_manager.unit_of_work() as conn:
+            assert db_manager.in_unit_of_work()
+            with db_manager.get_connection() as inner:
+                assert inner is conn
+        assert not db_manager.in_unit_of_work()
+
+    def test_query_many_returns_named_results(self):
+        """Test fan-out returns one result per name with per-query timings"""
+        results = db_manager.query_many({
+            'one': ('SELECT 1 as value', None, True),
+            'many': ('SELECT 2 as value', None),
+        })
+        assert results['one']['value'] == 1
+        assert results['many'][0]['value'] == 2
+        assert set(results.timings) == {'one', 'many'}
+        assert 'fanout_batches' in db_manager.pool_stats
+
+
+class TestStatementCache:
+    """Test adapted-statement LRU and PREPARE conversion"""
+
+    def test_positional_conversion(self):
+        """Test %s placeholders become $n and %% becomes a literal %"""
+        sql, count = to_positional_sql("SELECT * FROM chat WHERE id = %s AND nome LIKE '%%a' AND scuola_id = %s")
+        assert sql == "SELECT * FROM chat WHERE id = $1 AND nome LIKE '%a' AND scuola_id = $2"
+        assert count == 2
+
+    def test_named_params_not_preparable(self):
+        """Test named parameters disable server-side PREPARE"""
+        assert to_positional_sql("SELECT * FROM utenti WHERE id = %(id)s") is None
+        assert StatementEntry("SELECT * FROM utenti WHERE id = %(id)s").name is None
+
+    def test_lru_eviction_and_counters(self):
+        """Test hit/miss counters and LRU eviction"""
+        cache = StatementCache(max_size=2)
+        cache.put(('a',), StatementEntry("SELECT 1"))
+        cache.put(('b',), StatementEntry("SELECT 2"))
+        assert cache.get(('a',)) is not None
+        cache.put(('c',), StatementEntry("SELECT 3"))
+        assert cache.get(('b',)) is None
+        stats = cache.get_stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['evictions'] == 1
@@ -49,3 +49,83 @@ class TestGamificationSystem:
         assert len(titles) > 0
         assert 1 in titles
         assert isinstance(titles[1], str)
+
+
+class TestXPAccumulator:
+    """Test write-behind XP accumulator (memory mode)"""
+    
+    def test_rank_up_queued_once(self, monkeypatch):
+        """Crossing a rank threshold queues exactly one rank-up"""
+        from services.gamification.xp_accumulator import XPAccumulator
+        from services.gamification.xp_manager_v2 import xp_manager_v2
+        
+        accumulator = XPAccumulator()
+        accumulator.attach(xp_manager_v2)
+        monkeypatch.setattr(accumulator, '_ensure_started', lambda: None)
+        monkeypatch.setattr(accumulator, '_load_total', lambda user_id: 0)
+        
+        results = [
+            accumulator.award(1, 60, 'sfida', '', None, check_limits=False, apply_multipliers=False)
+            for _ in range(10)
+        ]
+        
+        assert results[-1]['xp_totale'] == 600
+        # 0 -> 600 XP crosses Cadetto (200) and Cavaliere (600) once each
+        assert sum(1 for r in results if r['rank_up']) == 2
+        assert [rango for _, rango in accumulator._pending_rank_ups] == ['Cadetto', 'Cavaliere']
+        assert accumulator._pending_xp[1] == 600
+
+
+class TestBadgeRuleIndex:
+    """Test precompiled badge rules"""
+    
+    class FakeCursor:
+        def __init__(self, badges, unlocked=()):
+            self.badges = badges
+            self.unlocked = unlocked
+            self.rows = []
+        
+        def execute(self, sql, params=None):
+            self.rows = self.badges if 'FROM badges_v2' in sql else [(b,) for b in self.unlocked]
+        
+        def fetchall(self):
+            return self.rows
+    
+    def test_only_crossed_thresholds_evaluated(self):
+        """After the first full scan only rules crossed by the change are checked"""
+        from services.gamification.badge_rule_index import BadgeRuleIndex
+        
+        cursor = self.FakeCursor([
+            (1, 'chiacchierone', 'Chiacchierone', '{"messaggi_inviati": 100}'),
+            (2, 'helper', 'Helper', {'compagni_aiutati': 10}),
+            (3, 'cavaliere', 'Cavaliere', {'rango': 'Cavaliere'}),
+        ])
+        index = BadgeRuleIndex()
+        stats = {'messaggi_inviati': 99, 'compagni_aiutati': 0, 'rango': 'Germoglio'}
+        
+        assert index.candidates(cursor, 1, stats) == []
+        index.apply([(1, stats, [])])
+        assert index.stats['full_scans'] == 1
+        
+        stats = dict(stats, messaggi_inviati=100)
+        unlocked = index.candidates(cursor, 1, stats)
+        assert [r.codice for r in unlocked] == ['chiacchierone']
+        assert index.stats['rules_evaluated'] == 4
+        index.apply([(1, stats, unlocked)])
+        
+        stats = dict(stats, rango='Guardiano')
+        assert [r.codice for r in index.candidates(cursor, 1, stats)] == ['cavaliere']
+    
+    def test_rolled_back_unlock_is_retried(self):
+        """A badge whose INSERT rolled back (no apply) stays a candidate"""
+        from services.gamification.badge_rule_index import BadgeRuleIndex
+        
+        cursor = self.FakeCursor([(1, 'chiacchierone', 'Chiacchierone', {'messaggi_inviati': 100})])
+        index = BadgeRuleIndex()
+        index.candidates(cursor, 1, {'messaggi_inviati': 99})
+        index.apply([(1, {'messaggi_inviati': 99}, [])])
+        
+        stats = {'messaggi_inviati': 100}
+        assert [r.codice for r in index.candidates(cursor, 1, stats)] == ['chiacchierone']
+        # Transaction rolled back: apply() is never called
+        assert [r.codice for r in index.candidates(cursor, 1, stats)] == ['chiacchierone']
@@ -0,0 +1,68 @@
+"""
+Unit tests for Gemini chatbot streaming and XP awarding
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from services.ai.gemini_chatbot import gemini_chatbot
+
+def _stream(*texts, error=None):
+    """Yield Gemini-like chunks, then optionally fail mid-stream"""
+    for text in texts:
+        yield MagicMock(text=text)
+    if error:
+        raise error
+
+class TestStreamXP:
+    """Test XP is awarded only for streams that complete"""
+
+    @pytest.fixture
+    def chatbot(self):
+        client = MagicMock()
+        with patch.object(gemini_chatbot, 'client', client), \
+             patch.object(gemini_chatbot, 'gemini_available', True), \
+             patch.object(gemini_chatbot, '_get_gamification_context', return_value={}), \
+             patch.object(gemini_chatbot, '_award_chat_xp', return_value={'xp_assegnati': 5}) as award:
+            yield gemini_chatbot, client, award
+
+    def test_interrupted_stream_awards_no_xp(self, chatbot):
+        """Test a stream that fails after the first chunk earns no XP"""
+        bot, client, award = chatbot
+        client.models.generate_content_stream.return_value = _stream(
+            'La derivata ', error=ConnectionError('stream reset')
+        )
+        chunks = []
+
+        result = bot.stream_response('derivata di x^2', 1, chunks.append, user_name='Anna')
+
+        assert result['complete'] is False
+        assert result['response'] == 'La derivata '
+        assert chunks == ['La derivata ']
+        assert bot.award_stream(1, 'derivata di x^2', result) is None
+        award.assert_not_called()
+
+    def test_client_disconnect_awards_no_xp(self, chatbot):
+        """Test a client that goes away mid-stream earns no XP"""
+        bot, client, award = chatbot
+        client.models.generate_content_stream.return_value = _stream('uno ', 'due ')
+
+        def on_chunk(text):
+            raise ConnectionAbortedError('client disconnected')
+
+        result = bot.stream_response('conta', 1, on_chunk, user_name='Anna')
+
+        assert result['complete'] is False
+        assert bot.award_stream(1, 'conta', result) is None
+        award.assert_not_called()
+
+    def test_complete_stream_awards_xp(self, chatbot):
+        """Test a stream that completes normally earns XP"""
+        bot, client, award = chatbot
+        client.models.generate_content_stream.return_value = _stream('2x', ' è la risposta')
+
+        result = bot.stream_response('derivata di x^2', 1, lambda text: None, user_name='Anna')
+
+        assert result['complete'] is True
+        reward = bot.award_stream(1, 'derivata di x^2', result)
+
+        assert reward['xp_awarded'] == 5
+        award.assert_called_once()
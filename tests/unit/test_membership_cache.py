@@ -0,0 +1,106 @@
+"""
+Unit tests for the chat membership cache
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from services.messaging.membership_cache import MembershipCache
+
+class FakeRedis:
+    """In-memory stand-in for the commands the membership cache uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.published = []
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key) or 0) + 1)
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def eval(self, script, numkeys, version_key, members_key, version, field, ttl):
+        if (self.get(version_key) or '') != version:
+            return 0
+        self.hset(members_key, field, '1')
+        return 1
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.calls]
+
+class TestMembershipCache:
+    """Test removed members never stay authorized through the cache"""
+
+    @pytest.fixture
+    def redis(self):
+        fake = FakeRedis()
+        manager = MagicMock(use_redis=True, redis_client=fake)
+        with patch('services.messaging.membership_cache.redis_manager', manager), \
+             patch.object(MembershipCache, '_ensure_subscriber'):
+            yield fake
+
+    def test_member_cached_after_db_load(self, redis):
+        """Test a confirmed member is served from cache on the next lookup"""
+        cache = MembershipCache()
+        with patch('services.messaging.membership_cache.db_manager.query', return_value={'1': 1}) as query:
+            assert cache.is_member(7, 3) is True
+            assert cache.is_member(7, 3) is True
+
+        assert query.call_count == 1
+        assert redis.hget('mc:members:7', '3') == '1'
+
+    def test_leave_during_lookup_is_not_written_back(self, redis):
+        """Test a DB read that raced a leave does not re-authorize the user"""
+        cache = MembershipCache()
+
+        def read_then_leave(*args, **kwargs):
+            # The row is read, then the leave commits and invalidates
+            cache.invalidate_member(7, 3)
+            return {'1': 1}
+
+        with patch('services.messaging.membership_cache.db_manager.query', side_effect=read_then_leave):
+            cache.is_member(7, 3)
+
+        assert redis.hget('mc:members:7', '3') is None
+        with patch('services.messaging.membership_cache.db_manager.query', return_value=None):
+            assert cache.is_member(7, 3) is False
+
+    def test_invalidation_is_published(self, redis):
+        """Test other workers are told to drop their local entries"""
+        cache = MembershipCache()
+        with patch('services.messaging.membership_cache.db_manager.query', return_value={'1': 1}):
+            cache.is_member(7, 3)
+
+        cache.invalidate_member(7, 3)
+
+        assert ('mc:invalidate', '7:3') in redis.published
+        assert redis.hget('mc:members:7', '3') is None
@@ -0,0 +1,66 @@
+"""
+Unit tests for the chat history ring buffer
+"""
+import pytest
+from unittest.mock import MagicMock, patch
+from services.messaging.message_history import ChatHistoryBuffer
+
+class FakeRedis:
+    """In-memory stand-in for the last-message-id script"""
+
+    def __init__(self):
+        self.data = {}
+
+    def eval(self, script, numkeys, key, message_id, ttl):
+        previous = self.data.get(key)
+        if previous is None or int(message_id) > int(previous):
+            self.data[key] = str(message_id)
+        return previous
+
+    def get(self, key):
+        return self.data.get(key)
+
+class TestChatHistoryBuffer:
+    """Test write-through keeps the buffer aligned across workers"""
+
+    @pytest.fixture
+    def redis(self):
+        fake = FakeRedis()
+        manager = MagicMock(use_redis=True, redis_client=fake)
+        with patch('services.messaging.message_history.redis_manager', manager):
+            yield fake
+
+    def _warm(self, buffer, redis, ids):
+        buffer.warm(1, [{'id': i} for i in ids], complete=True)
+        redis.data[buffer._last_id_key(1)] = str(ids[-1])
+
+    def test_aligned_message_is_appended(self, redis):
+        """Test a message following the buffer's newest id is served from the buffer"""
+        buffer = ChatHistoryBuffer(capacity=10)
+        self._warm(buffer, redis, [9, 10])
+
+        buffer.record_message(1, 11, {'id': 11})
+
+        assert [m['id'] for m in buffer.get_latest(1, 10)['messages']] == [9, 10, 11]
+
+    def test_message_from_other_worker_discards_buffer(self, redis):
+        """Test a gap left by another worker's write drops the local buffer"""
+        worker_a = ChatHistoryBuffer(capacity=10)
+        worker_b = ChatHistoryBuffer(capacity=10)
+        self._warm(worker_a, redis, [9, 10])
+
+        worker_b.record_message(1, 11, {'id': 11})
+        worker_a.record_message(1, 12, {'id': 12})
+
+        assert worker_a.get_latest(1, 10) is None
+        assert redis.get(worker_a._last_id_key(1)) == '12'
+
+    def test_out_of_order_message_discards_buffer(self, redis):
+        """Test an id not newer than the buffer's newest is never appended"""
+        buffer = ChatHistoryBuffer(capacity=10)
+        self._warm(buffer, redis, [9, 10])
+
+        buffer.record_message(1, 8, {'id': 8})
+
+        assert buffer.get_latest(1, 10) is None
+        assert redis.get(buffer._last_id_key(1)) == '10'
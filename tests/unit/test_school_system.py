@@ -3,6 +3,7 @@ Unit tests for School System
 """
 import pytest
 from school_system import school_system
+from services.school.feature_flag_cache import FeatureFlagCache
 
 class TestSchoolSystem:
     """Test school multi-tenant functionality"""
@@ -34,3 +35,24 @@ class TestSchoolSystem:
         for role in valid_roles:
             assert isinstance(role, str)
             assert len(role) > 0
+
+
+class TestFeatureFlagCache:
+    """Test per-process feature flag cache"""
+    
+    def test_cached_until_invalidated(self):
+        """Test flags are loaded once and reloaded after invalidation"""
+        cache = FeatureFlagCache(recheck_interval=60)
+        loads = []
+        
+        def loader(school_id):
+            loads.append(school_id)
+            return {'gamification': len(loads) == 1}
+        
+        assert cache.get('school_features', 1, loader)['gamification'] is True
+        assert cache.get('school_features', 1, loader)['gamification'] is True
+        assert loads == [1]
+        
+        cache.invalidate(1)
+        assert cache.get('school_features', 1, loader)['gamification'] is False
+        assert loads == [1, 1]